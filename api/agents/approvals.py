@@ -0,0 +1,224 @@
+"""
+Approval Store
+Fila de aprovação do Gerente indexada por id.
+
+- ordem: prioridade, depois prazo (SLA), depois chegada
+- índices ordenados globais, por cliente e por agente: o próximo item é
+  o primeiro do índice e as páginas são fatias
+- aprovar/rejeitar por id e aprovação em lote por filtro
+- decididos ficam só nos contadores e num histórico curto
+"""
+
+import time
+import uuid
+from bisect import bisect_left, insort
+from collections import deque
+from itertools import count
+from typing import Deque, Dict, List, Optional, Tuple, Union
+
+
+# Nome -> nível (menor é mais urgente)
+PRIORITIES = {"urgent": 0, "high": 1, "normal": 2, "low": 3}
+
+# Prazo padrão de decisão por nível (segundos)
+DEFAULT_SLA = {0: 3600.0, 1: 4 * 3600.0, 2: 24 * 3600.0, 3: 72 * 3600.0}
+
+ALL = "*"
+
+
+def parse_priority(priority: Union[int, str, None]) -> int:
+    if priority is None:
+        return PRIORITIES["normal"]
+    if isinstance(priority, str):
+        if priority not in PRIORITIES:
+            raise ValueError(f"Prioridade inválida: {priority}")
+        return PRIORITIES[priority]
+    return max(0, min(int(priority), max(PRIORITIES.values())))
+
+
+class ApprovalStore:
+    """
+    Uso:
+        approvals = ApprovalStore()
+        item = approvals.add({"title": "Post Black Friday", "client_id": "acme", "priority": "high"})
+        approvals.first()                      # mais urgente
+        approvals.decide(item["id"], "approved")
+        page = approvals.query(client_id="acme", offset=0, limit=20)
+    """
+
+    def __init__(self, sla: Optional[Dict[int, float]] = None, history_size: int = 1000):
+        self.sla = sla or DEFAULT_SLA
+        self.items: Dict[str, dict] = {}
+        # ("*" | "client:<id>" | "agent:<id>") -> lista ordenada de chaves
+        self._indexes: Dict[str, list] = {}
+        self._keys: Dict[str, tuple] = {}
+        self._seq = count()
+        self.decided: Dict[str, int] = {"approved": 0, "rejected": 0}
+        self.history: Deque[dict] = deque(maxlen=history_size)
+
+    def add(self, item: dict, now: Optional[float] = None) -> dict:
+        """
+        Coloca uma cópia do item na fila (id, prioridade e prazo são
+        completados); o dict de quem chamou não muda.
+        """
+        now = time.time() if now is None else now
+        item = dict(item)
+        item.setdefault("id", f"item_{uuid.uuid4().hex[:12]}")
+        item["priority"] = parse_priority(item.get("priority"))
+        item.setdefault("created_at", now)
+        item.setdefault("due_at", item["created_at"] + self.sla[item["priority"]])
+        item["status"] = "pending"
+        if item["id"] in self.items:
+            self._unindex(item["id"])
+        self.items[item["id"]] = item
+        self._index(item)
+        return item
+
+    def get(self, item_id: str) -> Optional[dict]:
+        return self.items.get(item_id)
+
+    def lookup(self, item_id: str) -> Optional[dict]:
+        """Item pendente ou decidido recentemente (histórico)"""
+        item = self.items.get(item_id)
+        if item is None:
+            item = next((h for h in reversed(self.history) if h["id"] == item_id), None)
+        return item
+
+    def first(self, client_id: Optional[str] = None, agent_id: Optional[str] = None) -> Optional[dict]:
+        """Item mais urgente (do cliente/agente, se informado)"""
+        keys = self._indexes.get(self._index_name(client_id, agent_id))
+        return self.items[keys[0][-1]] if keys else None
+
+    def decide(self, item_id: str, status: str, reason: Optional[str] = None, now: Optional[float] = None) -> Optional[dict]:
+        """Aprova ou rejeita o item; None se ele não estiver pendente"""
+        if status not in self.decided:
+            raise ValueError("status deve ser 'approved' ou 'rejected'")
+        item = self.items.pop(item_id, None)
+        if item is None:
+            return None
+        self._unindex(item_id)
+        item["status"] = status
+        item["decided_at"] = time.time() if now is None else now
+        if reason:
+            item["rejection_reason"] = reason
+        self.decided[status] += 1
+        self.history.append(item)
+        return item
+
+    def record(self, item: dict, status: str, reason: Optional[str] = None, now: Optional[float] = None) -> dict:
+        """Registra um item decidido sem passar pela fila (política automática)"""
+        if status not in self.decided:
+            raise ValueError("status deve ser 'approved' ou 'rejected'")
+        if item.get("id") in self.items:
+            return self.decide(item["id"], status, reason, now)
+        item = dict(item)
+        item.setdefault("id", f"item_{uuid.uuid4().hex[:12]}")
+        item["status"] = status
+        item["decided_at"] = time.time() if now is None else now
+        if reason:
+            item["rejection_reason"] = reason
+        self.decided[status] += 1
+        self.history.append(item)
+        return item
+
+    def select(
+        self,
+        client_id: Optional[str] = None,
+        agent_id: Optional[str] = None,
+        item_type: Optional[str] = None,
+        max_priority: Optional[int] = None,
+        limit: Optional[int] = None
+    ) -> List[str]:
+        """Ids pendentes que passam no filtro, em ordem de urgência"""
+        keys = self._indexes.get(self._index_name(client_id, agent_id), [])
+        if max_priority is not None:
+            # Índice começa pela prioridade: corta no primeiro nível acima
+            keys = keys[:bisect_left(keys, (max_priority + 1,))]
+        ids = []
+        for key in keys:
+            item = self.items[key[-1]]
+            if client_id and agent_id and item.get("client_id") != client_id:
+                continue
+            if item_type and item.get("type") != item_type:
+                continue
+            ids.append(key[-1])
+            if limit and len(ids) >= limit:
+                break
+        return ids
+
+    def query(
+        self,
+        client_id: Optional[str] = None,
+        agent_id: Optional[str] = None,
+        offset: int = 0,
+        limit: int = 50
+    ) -> dict:
+        """Página de pendentes, do mais urgente para o menos"""
+        if client_id and agent_id:
+            ids = self.select(client_id, agent_id)
+            total = len(ids)
+            page = ids[offset:offset + limit]
+        else:
+            keys = self._indexes.get(self._index_name(client_id, agent_id), [])
+            total = len(keys)
+            page = [key[-1] for key in keys[offset:offset + limit]]
+        return {
+            "total": total,
+            "offset": offset,
+            "limit": limit,
+            "items": [self.items[item_id] for item_id in page]
+        }
+
+    def count_overdue(self, now: Optional[float] = None) -> int:
+        now = time.time() if now is None else now
+        return sum(1 for item in self.items.values() if item["due_at"] < now)
+
+    def get_stats(self) -> dict:
+        by_priority = {name: 0 for name in PRIORITIES}
+        names = {level: name for name, level in PRIORITIES.items()}
+        for item in self.items.values():
+            by_priority[names[item["priority"]]] += 1
+        return {
+            "pending": len(self.items),
+            **self.decided,
+            "overdue": self.count_overdue(),
+            "by_priority": by_priority
+        }
+
+    # ============== Índices ==============
+
+    @staticmethod
+    def _index_name(client_id: Optional[str], agent_id: Optional[str]) -> str:
+        # Com os dois filtros, o índice do agente (menor) é percorrido filtrando o cliente
+        if agent_id:
+            return f"agent:{agent_id}"
+        if client_id:
+            return f"client:{client_id}"
+        return ALL
+
+    def _names(self, item: dict) -> List[str]:
+        names = [ALL]
+        if item.get("client_id"):
+            names.append(f"client:{item['client_id']}")
+        if item.get("agent_id"):
+            names.append(f"agent:{item['agent_id']}")
+        return names
+
+    def _index(self, item: dict):
+        key: Tuple = (item["priority"], item["due_at"], next(self._seq), item["id"])
+        self._keys[item["id"]] = (key, self._names(item))
+        for name in self._names(item):
+            insort(self._indexes.setdefault(name, []), key)
+
+    def _unindex(self, item_id: str):
+        key, names = self._keys.pop(item_id)
+        for name in names:
+            keys = self._indexes.get(name, [])
+            position = bisect_left(keys, key)
+            if position < len(keys) and keys[position] == key:
+                keys.pop(position)
+            if not keys:
+                self._indexes.pop(name, None)
+
+    def __len__(self) -> int:
+        return len(self.items)
@@ -3,32 +3,60 @@ Base Agent Class
 Classe base para todos os agentes de IA.
 """
 
-from typing import Optional, List, Dict, Any
+from typing import Optional, List, Dict, Any, Callable, Tuple
 from datetime import datetime
+from functools import partial
+import asyncio
 import os
+import time
 
-try:
-    from openai import OpenAI
-except ImportError:
-    OpenAI = None
+from metrics.registry import LLM_REQUEST_DURATION, LLM_REQUESTS, LLM_TOKENS
+from usage.tracker import usage_tracker
+from llm.client import get_client, AsyncOpenAI
+from llm.deadline import current_deadline
+from llm.errors import (
+    LLMError, LLMRateLimitError, LLMTimeoutError, LLMUnavailableError, DeadlineExceededError
+)
+from llm.hedging import latency_tracker, hedged_call
+from llm.rate_limit import rate_limiter
+from llm.router import model_router
+from llm.scheduler import llm_scheduler, current_priority, NEAR_REAL_TIME
+from .prompts import PROMPT_CACHE_MIN_TOKENS, PromptLibrary, PromptPrefix
+
+# Prazo total de uma chamada de LLM, incluindo esperas e retentativas
+LLM_CALL_TIMEOUT = float(os.getenv("LLM_CALL_TIMEOUT", "60"))
+# Modelo de quem não escolheu um (e não usa roteamento)
+DEFAULT_MODEL = "gpt-4-turbo"
 
 
 class AgentConfig:
     """Configuração de um agente"""
     def __init__(
         self,
-        model: str = "gpt-4-turbo",
+        model: Optional[str] = None,
         temperature: float = 0.7,
-        max_tokens: int = 1000
+        max_tokens: int = 1000,
+        hedge: bool = False,
+        hedge_model: Optional[str] = None,
+        routing: Optional[bool] = None
     ):
-        self.model = model
+        self.model = model or DEFAULT_MODEL
         self.temperature = temperature
         self.max_tokens = max_tokens
+        # Dispara uma segunda chamada (hedge_model ou o mesmo) após o p95 do modelo
+        self.hedge = hedge
+        self.hedge_model = hedge_model
+        # Com roteamento o modelo vem do ModelRouter; sem ele, vale `model`.
+        # Sem valor explícito, só roteia quem não escolheu um modelo.
+        self.routing = model is None if routing is None else routing
 
 
 class Agent:
     """Classe base para todos os agentes"""
     
+    # Prioridade no scheduler de LLM quando o contexto não define outra
+    default_priority = NEAR_REAL_TIME
+    
     def __init__(
         self,
         id: str,
@@ -51,6 +79,14 @@ class Agent:
         self.messages_history: List[Dict[str, str]] = []
         self.tasks_completed = 0
         self.pending_approvals: List[dict] = []
+        # Callback opcional para persistir mensagens (ex: SQLiteStore.append_message)
+        self.message_sink: Optional[Callable] = None
+        # Prefixos estáveis das tarefas (cache de prompt do provedor)
+        self.prompts = PromptLibrary()
+        self.prompt_usage = {"calls": 0, "prompt_tokens": 0, "cached_tokens": 0}
+        # Base de conhecimento dos clientes (KnowledgeBase), opcional
+        self.knowledge = None
+        self.knowledge_top_k = 3
         
     def to_dict(self) -> dict:
         """Converte agente para dicionário"""
@@ -66,7 +102,10 @@ class Agent:
             "tasks_completed": self.tasks_completed,
             "config": {
                 "model": self.config.model,
-                "temperature": self.config.temperature
+                "temperature": self.config.temperature,
+                "hedge": self.config.hedge,
+                "hedge_model": self.config.hedge_model,
+                "routing": self.config.routing
             }
         }
     
@@ -80,38 +119,176 @@ class Agent:
         })
         
         # Tenta usar OpenAI
-        api_key = os.getenv("OPENAI_API_KEY")
-        
-        if api_key and OpenAI:
-            try:
-                client = OpenAI(api_key=api_key)
-                
-                messages = [
-                    {"role": "system", "content": self.system_prompt}
-                ] + self.messages_history[-10:]  # Últimas 10 mensagens
-                
-                response = client.chat.completions.create(
-                    model=self.config.model,
-                    messages=messages,
-                    temperature=self.config.temperature,
-                    max_tokens=self.config.max_tokens
-                )
-                
-                assistant_message = response.choices[0].message.content
-                
-                self.messages_history.append({
-                    "role": "assistant",
-                    "content": assistant_message
-                })
-                
-                return assistant_message
-                
-            except Exception as e:
-                return f"Erro ao processar: {str(e)}"
+        if self._llm_available():
+            # Falhas (LLMError, BudgetExceededError) sobem tipadas para quem chamou
+            assistant_message = await self._reply(self.messages_history[-10:])  # Últimas 10 mensagens
+            
+            self.messages_history.append({
+                "role": "assistant",
+                "content": assistant_message
+            })
+            
+            return assistant_message
         
         # Fallback se não tiver API key
         return self._generate_fallback_response(message)
     
+    async def run_task(self, prefix: PromptPrefix, request: str) -> str:
+        """
+        Tarefa avulsa, sem histórico: o prefixo estável vai antes e só o
+        pedido muda, então o provedor reaproveita o início do prompt.
+        """
+        if not self._llm_available():
+            return self._generate_fallback_response(request)
+        return await self._reply([
+            {"role": "system", "content": prefix.text},
+            {"role": "user", "content": request}
+        ])
+    
+    def _references(self, client_id: Optional[str], query: str, sources: Tuple[str, ...]) -> str:
+        """
+        Trechos do cliente mais parecidos com o pedido. Mudam a cada pedido:
+        vão junto com ele, depois do prefixo estável.
+        """
+        if self.knowledge is None or not client_id:
+            return ""
+        snippets = self.knowledge.retrieve(client_id, query, self.knowledge_top_k, sources)
+        if not snippets:
+            return ""
+        lines = "\n".join(f"- {snippet}" for snippet in snippets)
+        return f"\nReferências do cliente (siga o estilo, não copie):\n{lines}\n"
+    
+    def get_prompt_cache_stats(self) -> dict:
+        """Prefixos montados e quanto da entrada veio do cache do provedor"""
+        prompt_tokens = self.prompt_usage["prompt_tokens"]
+        stats = self.prompts.get_stats()
+        # O início do prompt é o system prompt do agente seguido do prefixo
+        head = len(self.system_prompt) // 4
+        for prefix in stats["prefixes"]:
+            prefix["cacheable"] = head + prefix["tokens"] >= PROMPT_CACHE_MIN_TOKENS
+        return {
+            **stats,
+            **self.prompt_usage,
+            "cached_ratio": round(self.prompt_usage["cached_tokens"] / prompt_tokens, 4) if prompt_tokens else 0.0
+        }
+    
+    def _llm_available(self) -> bool:
+        return bool(os.getenv("OPENAI_API_KEY")) and AsyncOpenAI is not None
+    
+    async def _reply(self, history: List[Dict[str, str]]) -> str:
+        """Resposta do modelo para o histórico dado (roteamento + escalonamento)"""
+        messages = [{"role": "system", "content": self.system_prompt}] + history
+        route = model_router.route(self, messages)
+        assistant_message = await self._complete(messages, model=route.model)
+        
+        # Resposta insegura de um modelo barato: refaz no tier acima
+        escalation = model_router.escalate(self, route, assistant_message)
+        if escalation:
+            assistant_message = await self._complete(messages, model=escalation.model)
+        return assistant_message
+    
+    async def _complete(self, messages: List[Dict[str, str]], model: Optional[str] = None) -> str:
+        """Chama o modelo e registra latência, resultado, tokens e custo"""
+        # O orçamento do cliente pode trocar o modelo ou bloquear a chamada
+        model = usage_tracker.resolve_model(self.client_id, model or self.config.model)
+        labels = {"agent_id": self.id, "client_id": self.client_id, "model": model}
+        
+        # O prazo do contexto (requisição, mensagem) vale se for menor que o da chamada
+        deadline = time.monotonic() + LLM_CALL_TIMEOUT
+        if current_deadline() is not None:
+            deadline = min(deadline, current_deadline())
+        
+        # Estimativa grosseira (~4 caracteres por token) + teto da resposta
+        estimated = sum(len(m["content"]) for m in messages) // 4 + self.config.max_tokens
+        try:
+            ticket = await asyncio.wait_for(
+                llm_scheduler.acquire(current_priority(self.default_priority), self.client_id, estimated),
+                timeout=deadline - time.monotonic()
+            )
+        except asyncio.TimeoutError:
+            LLM_REQUESTS.inc(outcome="timeout", **labels)
+            raise DeadlineExceededError(f"Prazo esgotado na fila do scheduler ({model})", model)
+        
+        actual_tokens = None
+        start = time.perf_counter()
+        try:
+            primary = partial(self._call_model, model, messages, estimated, deadline)
+            hedge_delay = latency_tracker.percentile(model) if self.config.hedge else None
+            if hedge_delay is not None and time.monotonic() + hedge_delay < deadline:
+                hedge_model = self.config.hedge_model or model
+                backup = partial(self._call_model, hedge_model, messages, estimated, deadline)
+                response, model = await hedged_call(primary, backup, hedge_delay, model)
+            else:
+                response, model = await primary()
+            usage = getattr(response, "usage", None)
+            if usage:
+                actual_tokens = usage.total_tokens
+        except LLMError as e:
+            LLM_REQUESTS.inc(outcome=self._error_outcome(e), **labels)
+            raise
+        except Exception as e:
+            LLM_REQUESTS.inc(outcome="error", **labels)
+            raise LLMError(str(e), model) from e
+        finally:
+            LLM_REQUEST_DURATION.observe(time.perf_counter() - start, **labels)
+            llm_scheduler.release(ticket, actual_tokens)
+        
+        # Tokens e custo vão para o modelo que de fato respondeu
+        labels["model"] = model
+        LLM_REQUESTS.inc(outcome="success", **labels)
+        if usage:
+            details = getattr(usage, "prompt_tokens_details", None)
+            cached = getattr(details, "cached_tokens", None) or 0
+            LLM_TOKENS.inc(usage.prompt_tokens, direction="input", **labels)
+            LLM_TOKENS.inc(usage.completion_tokens, direction="output", **labels)
+            if cached:
+                LLM_TOKENS.inc(cached, direction="cached_input", **labels)
+            self.prompt_usage["calls"] += 1
+            self.prompt_usage["prompt_tokens"] += usage.prompt_tokens
+            self.prompt_usage["cached_tokens"] += cached
+            usage_tracker.record_completion(
+                self.client_id, self.id, model, usage.prompt_tokens, usage.completion_tokens, cached
+            )
+        
+        return response.choices[0].message.content
+    
+    async def _call_model(
+        self,
+        model: str,
+        messages: List[Dict[str, str]],
+        estimated: int,
+        deadline: float
+    ) -> Tuple[Any, str]:
+        """Uma chamada (com limite e retentativas); retorna (resposta, modelo)"""
+        client = get_client(os.getenv("OPENAI_API_KEY"))
+        
+        def request(timeout: Optional[float]):
+            return client.chat.completions.with_raw_response.create(
+                model=model,
+                messages=messages,
+                temperature=self.config.temperature,
+                max_tokens=self.config.max_tokens,
+                timeout=timeout
+            )
+        
+        start = time.monotonic()
+        response = await rate_limiter.call(model, estimated, request, deadline=deadline)
+        latency_tracker.observe(model, time.monotonic() - start)
+        usage = getattr(response, "usage", None)
+        if usage:
+            rate_limiter.refund(model, estimated - usage.total_tokens)
+        return response, model
+    
+    @staticmethod
+    def _error_outcome(error: LLMError) -> str:
+        if isinstance(error, LLMRateLimitError):
+            return "rate_limited"
+        if isinstance(error, LLMTimeoutError):
+            return "timeout"
+        if isinstance(error, LLMUnavailableError):
+            return "unavailable"
+        return "error"
+    
     def _generate_fallback_response(self, message: str) -> str:
         """Resposta de fallback quando não há API configurada"""
         responses = {
@@ -122,6 +299,18 @@ class Agent:
         }
         return responses.get(self.type, f"[{self.name}] Mensagem recebida. Configure a API Key da OpenAI.")
     
+    def _record_message(self, conversation_id: str, role: str, content: str, phone: Optional[str] = None):
+        """Envia mensagem para o sink de persistência, se configurado"""
+        if self.message_sink:
+            self.message_sink(
+                conversation_id,
+                role,
+                content,
+                phone=phone,
+                agent_id=self.id,
+                client_id=self.client_id
+            )
+    
     def clear_history(self):
         """Limpa histórico de mensagens"""
         self.messages_history = []
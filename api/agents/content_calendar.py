@@ -0,0 +1,286 @@
+"""
+Content Calendar
+Geração em lote do calendário de posts de um cliente.
+
+- o período vira slots (dia + tema, temas em rodízio)
+- cada post é gerado com contexto isolado (SocialMediaAgent.generate_post),
+  em paralelo, sob um limite global de concorrência (todas as execuções
+  dividem o mesmo limite) e na classe batch do scheduler de LLM
+- cada post pronto é gravado na hora e emitido para quem acompanha
+- slots que falharam (ou que ficaram sem post por reinício) são refeitos
+  com resume(); os já prontos não são gerados de novo
+"""
+
+import asyncio
+import contextvars
+import time
+import uuid
+from datetime import date, timedelta
+from typing import AsyncIterator, Callable, Dict, List, Optional
+
+from llm.scheduler import priority_scope, BATCH
+from metrics.registry import registry
+
+
+CALENDAR_POSTS = registry.counter(
+    "agencyzen_calendar_posts_total",
+    "Posts de calendário gerados (result=ok|failed)",
+    ("result",)
+)
+
+# Estados em que a execução não anda mais sozinha
+FINISHED = ("completed", "partial", "cancelled", "interrupted")
+
+
+def plan_slots(
+    start: date,
+    end: date,
+    topics: List[str],
+    posts_per_day: int = 1,
+    weekdays: Optional[List[int]] = None
+) -> List[dict]:
+    """Slots do período (inclusive), com os temas em rodízio"""
+    slots = []
+    day = start
+    while day <= end:
+        if weekdays is None or day.weekday() in weekdays:
+            for n in range(posts_per_day):
+                topic = topics[len(slots) % len(topics)]
+                slots.append({"id": f"{day.isoformat()}#{n}", "date": day.isoformat(), "topic": topic})
+        day += timedelta(days=1)
+    return slots
+
+
+class CalendarPlanner:
+    """
+    Uso:
+        planner = CalendarPlanner(store, concurrency=8)
+        run = await planner.start(agent, "acme", date(2026, 11, 1), date(2026, 11, 30), ["promo", "dica"])
+        async for event in planner.stream(run["id"]):
+            ...  # {"type": "post" | "error" | "done", ...}
+        await planner.resume(run["id"], agent)  # refaz só os slots sem post
+    """
+
+    def __init__(
+        self,
+        store,
+        concurrency: int = 8,
+        max_attempts: int = 2,
+        retry_delay: float = 1.0,
+        max_slots: int = 1000,
+        on_post: Optional[Callable[[dict], None]] = None,
+        owner: str = "",
+        poll_interval: float = 1.0
+    ):
+        self.store = store
+        self.concurrency = concurrency
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self.max_slots = max_slots
+        # Chamado com cada post pronto (ex.: enviar para aprovação)
+        self.on_post = on_post
+        self.owner = owner
+        self.poll_interval = poll_interval
+
+        self._semaphore = asyncio.Semaphore(concurrency)
+        # Execuções rodando neste worker
+        self.runs: Dict[str, dict] = {}
+        self._posts: Dict[str, Dict[str, dict]] = {}
+        self._tasks: Dict[str, asyncio.Task] = {}
+        self._subscribers: Dict[str, List[asyncio.Queue]] = {}
+
+    async def recover(self, owner_alive: Optional[Callable[[str], bool]] = None):
+        """Execuções que ficaram "running" sem dono vivo passam a "interrupted" (retomáveis)"""
+        for owner, run in await self.store.list_running_calendar_runs():
+            if owner == self.owner or not owner_alive or not owner_alive(owner):
+                run["status"] = "interrupted"
+                await self.store.save_calendar_run(run, owner)
+
+    async def stop(self):
+        tasks = list(self._tasks.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def start(
+        self,
+        agent,
+        client_id: Optional[str],
+        start: date,
+        end: date,
+        topics: List[str],
+        posts_per_day: int = 1,
+        weekdays: Optional[List[int]] = None
+    ) -> dict:
+        if not topics:
+            raise ValueError("Informe ao menos um tema")
+        if end < start:
+            raise ValueError("Data final antes da inicial")
+        slots = plan_slots(start, end, topics, posts_per_day, weekdays)
+        if not slots:
+            raise ValueError("Nenhum dia do período atende ao filtro")
+        if len(slots) > self.max_slots:
+            raise ValueError(f"No máximo {self.max_slots} posts por execução")
+
+        run = {
+            "id": f"cal_{uuid.uuid4().hex[:12]}",
+            "client_id": client_id,
+            "agent_id": agent.id,
+            "start": start.isoformat(),
+            "end": end.isoformat(),
+            "slots": slots,
+            "errors": {},
+            "status": "running",
+            "created_at": time.time(),
+            "finished_at": None
+        }
+        await self._launch(run, agent, {})
+        return self._summary(run, {})
+
+    async def resume(self, run_id: str, agent) -> dict:
+        """Gera de novo só os slots sem post (falhas, cancelamento, reinício)"""
+        if run_id in self.runs:
+            raise ValueError("A execução ainda está rodando")
+        found = await self.store.get_calendar_run(run_id)
+        if not found:
+            raise KeyError(run_id)
+        run = found[1]
+        if run["status"] not in FINISHED:
+            raise ValueError("A execução ainda está rodando em outro worker")
+        posts = {post["slot_id"]: post for post in await self.store.list_calendar_posts(run_id)}
+        run.update(status="running", errors={}, finished_at=None)
+        await self._launch(run, agent, posts)
+        return self._summary(run, posts)
+
+    def cancel(self, run_id: str) -> bool:
+        """Cancela a execução se ela roda neste worker"""
+        task = self._tasks.get(run_id)
+        if not task:
+            return False
+        task.cancel()
+        return True
+
+    async def _launch(self, run: dict, agent, posts: Dict[str, dict]):
+        self.runs[run["id"]] = run
+        self._posts[run["id"]] = posts
+        await self.store.save_calendar_run(run, self.owner)
+        # Contexto vazio: a execução não herda o prazo da requisição que a iniciou
+        self._tasks[run["id"]] = contextvars.Context().run(asyncio.create_task, self._execute(run, agent))
+
+    async def _execute(self, run: dict, agent):
+        posts = self._posts[run["id"]]
+        pending = [slot for slot in run["slots"] if slot["id"] not in posts]
+        try:
+            await asyncio.gather(*(self._generate(run, agent, slot) for slot in pending))
+            run["status"] = "partial" if run["errors"] else "completed"
+        except asyncio.CancelledError:
+            run["status"] = "cancelled"
+        finally:
+            run["finished_at"] = time.time()
+            run["done"] = len(posts)
+            await self.store.save_calendar_run(run, self.owner)
+            self._emit(run["id"], {"type": "done", "run": self._summary(run, posts)})
+            self.runs.pop(run["id"], None)
+            self._posts.pop(run["id"], None)
+            self._tasks.pop(run["id"], None)
+            self._subscribers.pop(run["id"], None)
+
+    async def _generate(self, run: dict, agent, slot: dict):
+        async with self._semaphore:
+            for attempt in range(1, self.max_attempts + 1):
+                try:
+                    with priority_scope(BATCH):
+                        post = await agent.generate_post(slot["topic"], run["client_id"], date.fromisoformat(slot["date"]))
+                    break
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    if attempt == self.max_attempts:
+                        run["errors"][slot["id"]] = str(e)
+                        CALENDAR_POSTS.inc(result="failed")
+                        self._emit(run["id"], {"type": "error", "slot_id": slot["id"], "error": str(e)})
+                        return
+                    await asyncio.sleep(self.retry_delay * attempt)
+
+        post["slot_id"] = slot["id"]
+        post["calendar_id"] = run["id"]
+        if self.on_post:
+            self.on_post(post)
+        self._posts[run["id"]][slot["id"]] = post
+        await self.store.save_calendar_post(run["id"], slot["id"], post)
+        CALENDAR_POSTS.inc(result="ok")
+        self._emit(run["id"], {"type": "post", "slot_id": slot["id"], "post": post})
+
+    # ============== Consulta ==============
+
+    async def get(self, run_id: str, include_posts: bool = True) -> Optional[dict]:
+        if run_id in self.runs:
+            run, posts = self.runs[run_id], self._posts[run_id]
+        else:
+            found = await self.store.get_calendar_run(run_id)
+            if not found:
+                return None
+            run = found[1]
+            posts = {post["slot_id"]: post for post in await self.store.list_calendar_posts(run_id)}
+        summary = self._summary(run, posts)
+        if include_posts:
+            # Na ordem do calendário
+            summary["posts"] = [posts[slot["id"]] for slot in run["slots"] if slot["id"] in posts]
+        return summary
+
+    async def list(self, client_id: Optional[str] = None, limit: int = 100) -> List[dict]:
+        items = []
+        for _, run in await self.store.list_calendar_runs(client_id, limit):
+            if run["id"] in self.runs:
+                items.append(self._summary(self.runs[run["id"]], self._posts[run["id"]]))
+            else:
+                summary = {k: v for k, v in run.items() if k != "slots"}
+                items.append({**summary, "total": len(run["slots"]), "failed": len(run["errors"]), "local": False})
+        return items
+
+    def _summary(self, run: dict, posts: Dict[str, dict]) -> dict:
+        return {
+            **{k: v for k, v in run.items() if k != "slots"},
+            "total": len(run["slots"]),
+            "done": len(posts),
+            "failed": len(run["errors"]),
+            "local": run["id"] in self.runs
+        }
+
+    # ============== Streaming ==============
+
+    def _emit(self, run_id: str, event: dict):
+        for queue in self._subscribers.get(run_id, []):
+            queue.put_nowait(event)
+
+    async def stream(self, run_id: str) -> AsyncIterator[dict]:
+        """
+        Posts já prontos e depois os novos, na ordem em que terminam; acaba
+        com {"type": "done"}. Execução de outro worker é acompanhada pelo banco.
+        """
+        if run_id in self.runs:
+            queue: asyncio.Queue = asyncio.Queue()
+            # Inscreve antes de copiar: nada fica entre a cópia e o primeiro evento
+            self._subscribers.setdefault(run_id, []).append(queue)
+            for slot_id, post in list(self._posts[run_id].items()):
+                yield {"type": "post", "slot_id": slot_id, "post": post}
+            while True:
+                event = await queue.get()
+                yield event
+                if event["type"] == "done":
+                    return
+
+        seen = set()
+        while True:
+            run = await self.get(run_id)
+            if run is None:
+                return
+            for post in run["posts"]:
+                if post["slot_id"] not in seen:
+                    seen.add(post["slot_id"])
+                    yield {"type": "post", "slot_id": post["slot_id"], "post": post}
+            if run["status"] in FINISHED:
+                run.pop("posts")
+                yield {"type": "done", "run": run}
+                return
+            await asyncio.sleep(self.poll_interval)
@@ -0,0 +1,263 @@
+"""
+Intent Matcher
+Casamento local de intenções para responder mensagens triviais de
+WhatsApp (saudação, agradecimento, FAQ) sem chamar o LLM.
+
+1. frase exata (dicionário)          -> confiança 1.0
+2. sequência de frases conhecidas    -> 0.95 ("oi bom dia")
+3. frase parecida (erro de digitação) -> razão de similaridade
+4. FAQ do cliente: índice invertido por palavra-chave + similaridade
+
+Abaixo do limiar de confiança a mensagem segue para o LLM.
+"""
+
+import re
+import unicodedata
+import uuid
+from difflib import SequenceMatcher, get_close_matches
+from typing import Dict, List, Optional, Set
+
+from metrics.registry import registry
+
+
+INTENT_MATCHES = registry.counter(
+    "agencyzen_intent_matches_total",
+    "Mensagens por intenção e destino (outcome=answered|handoff)",
+    ("intent", "outcome")
+)
+
+# Frases por intenção -> script do WhatsAppAgent que responde
+DEFAULT_INTENTS = {
+    "greeting": {
+        "script": "greeting",
+        "phrases": [
+            "oi", "oie", "ola", "opa", "e ai", "eai", "bom dia", "boa tarde", "boa noite",
+            "tudo bem", "tudo bom", "como vai", "oi tudo bem", "ola tudo bem", "hello", "hi"
+        ]
+    },
+    "interest": {
+        "script": "qualification",
+        "phrases": [
+            "tenho interesse", "quero saber mais", "gostaria de saber mais",
+            "quero contratar", "gostaria de contratar", "quero mais informacoes",
+            "me interessei", "como funciona"
+        ]
+    },
+    "thanks": {
+        "script": "closing",
+        "phrases": [
+            "obrigado", "obrigada", "obg", "valeu", "muito obrigado", "muito obrigada",
+            "agradeco", "tchau", "ate mais", "ate logo", "falou"
+        ]
+    }
+}
+
+STOPWORDS = {
+    "a", "o", "as", "os", "de", "da", "do", "das", "dos", "e", "em", "no", "na", "nos", "nas",
+    "um", "uma", "para", "pra", "por", "com", "que", "qual", "quais", "se", "me", "eu", "voce",
+    "voces", "vc", "vcs", "tem", "ter", "ou", "ao", "sobre", "como", "mais"
+}
+
+
+def normalize(text: str, collapse_repeats: bool = False) -> str:
+    """Minúsculas, sem acentos nem pontuação e espaços simples"""
+    text = unicodedata.normalize("NFKD", text.lower())
+    text = "".join(c for c in text if not unicodedata.combining(c))
+    if collapse_repeats:
+        # "oiii", "bom diaa" -> "oi", "bom dia". Só para casar intenções: também
+        # junta letras dobradas legítimas ("carro" -> "caro")
+        text = re.sub(r"(\w)\1+", r"\1", text)
+    return " ".join(re.sub(r"[^\w\s]", " ", text).split())
+
+
+def keywords(text: str) -> Set[str]:
+    return {w for w in normalize(text, collapse_repeats=True).split() if w not in STOPWORDS and len(w) > 1}
+
+
+class IntentMatch:
+    """Resultado do casamento"""
+
+    def __init__(self, intent: str, confidence: float, source: str, script: Optional[str] = None, answer: Optional[str] = None):
+        self.intent = intent
+        self.confidence = confidence
+        self.source = source
+        self.script = script
+        self.answer = answer
+
+    def to_dict(self) -> dict:
+        return {
+            "intent": self.intent,
+            "confidence": round(self.confidence, 3),
+            "source": self.source,
+            "script": self.script
+        }
+
+
+class IntentMatcher:
+    """
+    Uso:
+        matcher = IntentMatcher()
+        matcher.add_faq("cliente_1", "Qual o horário?", "Das 9h às 18h.", ["horario", "funcionamento"])
+        match = matcher.match("bom diaa", client_id="cliente_1")
+        if match and match.confidence >= matcher.answer_threshold: ...
+    """
+
+    def __init__(
+        self,
+        intents: Optional[Dict[str, dict]] = None,
+        answer_threshold: float = 0.85,
+        fuzzy_cutoff: float = 0.8,
+        max_words: int = 8
+    ):
+        self.answer_threshold = answer_threshold
+        self.fuzzy_cutoff = fuzzy_cutoff
+        # Só mensagens curtas são candidatas a template; o resto vai ao LLM
+        self.max_words = max_words
+
+        self.intents = intents or DEFAULT_INTENTS
+        # client_id -> faq_id -> entrada
+        self.faq: Dict[str, Dict[str, dict]] = {}
+        # client_id -> palavra -> ids de FAQ
+        self._faq_index: Dict[str, Dict[str, Set[str]]] = {}
+        self.stats: Dict[str, int] = {"messages": 0, "answered": 0, "handoff": 0}
+        self.by_intent: Dict[str, int] = {}
+        self._compile()
+
+    def _compile(self):
+        """Pré-compila as frases das intenções"""
+        self._exact: Dict[str, str] = {}
+        self._sequences: Dict[str, re.Pattern] = {}
+        for intent, spec in self.intents.items():
+            phrases = sorted({normalize(p, collapse_repeats=True) for p in spec["phrases"]}, key=len, reverse=True)
+            for phrase in phrases:
+                self._exact[phrase] = intent
+            alternation = "|".join(re.escape(p) for p in phrases)
+            self._sequences[intent] = re.compile(rf"^(?:{alternation})(?: (?:{alternation}))*$")
+        self._phrases = list(self._exact)
+
+    # ============== FAQ ==============
+
+    def add_faq(
+        self,
+        client_id: Optional[str],
+        question: str,
+        answer: str,
+        keywords_list: Optional[List[str]] = None,
+        faq_id: Optional[str] = None
+    ) -> dict:
+        """Adiciona (ou substitui) uma pergunta frequente do cliente"""
+        client = client_id or ""
+        entry = {
+            "id": faq_id or f"faq_{uuid.uuid4().hex[:8]}",
+            "question": question,
+            "answer": answer,
+            "keywords": sorted({normalize(k, collapse_repeats=True) for k in keywords_list or [] if k.strip()} | keywords(question))
+        }
+        self.remove_faq(client_id, entry["id"])
+        self.faq.setdefault(client, {})[entry["id"]] = entry
+        index = self._faq_index.setdefault(client, {})
+        for word in entry["keywords"]:
+            index.setdefault(word, set()).add(entry["id"])
+        return entry
+
+    def remove_faq(self, client_id: Optional[str], faq_id: str) -> bool:
+        client = client_id or ""
+        entry = self.faq.get(client, {}).pop(faq_id, None)
+        if not entry:
+            return False
+        index = self._faq_index.get(client, {})
+        for word in entry["keywords"]:
+            ids = index.get(word)
+            if ids:
+                ids.discard(faq_id)
+                if not ids:
+                    del index[word]
+        return True
+
+    def list_faq(self, client_id: Optional[str]) -> List[dict]:
+        return list(self.faq.get(client_id or "", {}).values())
+
+    # ============== Casamento ==============
+
+    def match(self, message: str, client_id: Optional[str] = None) -> Optional[IntentMatch]:
+        """Melhor intenção para a mensagem (ou None)"""
+        text = normalize(message, collapse_repeats=True)
+        if not text:
+            return None
+
+        best = self._match_faq(text, client_id)
+        if len(text.split()) <= self.max_words:
+            intent_match = self._match_intent(text)
+            if intent_match and (not best or intent_match.confidence > best.confidence):
+                best = intent_match
+        return best
+
+    def record(self, match: Optional[IntentMatch], answered: bool):
+        """Contabiliza o destino da mensagem (taxa de acerto)"""
+        intent = match.intent if match else "none"
+        # FAQ entra agregada na métrica para não criar um label por pergunta
+        label = "faq" if intent.startswith("faq:") else intent
+        outcome = "answered" if answered else "handoff"
+        self.stats["messages"] += 1
+        self.stats[outcome] += 1
+        if answered:
+            self.by_intent[intent] = self.by_intent.get(intent, 0) + 1
+        INTENT_MATCHES.inc(intent=label, outcome=outcome)
+
+    def _match_intent(self, text: str) -> Optional[IntentMatch]:
+        intent = self._exact.get(text)
+        if intent:
+            return self._intent_result(intent, 1.0, "exact")
+
+        for intent, pattern in self._sequences.items():
+            if pattern.match(text):
+                return self._intent_result(intent, 0.95, "sequence")
+
+        close = get_close_matches(text, self._phrases, n=1, cutoff=self.fuzzy_cutoff)
+        if close:
+            ratio = SequenceMatcher(None, text, close[0]).ratio()
+            return self._intent_result(self._exact[close[0]], ratio, "fuzzy")
+        return None
+
+    def _intent_result(self, intent: str, confidence: float, source: str) -> IntentMatch:
+        return IntentMatch(intent, confidence, source, script=self.intents[intent].get("script"))
+
+    def _match_faq(self, text: str, client_id: Optional[str]) -> Optional[IntentMatch]:
+        client = client_id or ""
+        index = self._faq_index.get(client)
+        if not index:
+            return None
+
+        words = {w for w in text.split() if w not in STOPWORDS and len(w) > 1}
+        candidates: Dict[str, int] = {}
+        for word in words:
+            if word not in index:
+                # Variação da palavra-chave ("abrem" ~ "abre")
+                close = get_close_matches(word, index.keys(), n=1, cutoff=self.fuzzy_cutoff)
+                if not close:
+                    continue
+                word = close[0]
+            for faq_id in index[word]:
+                candidates[faq_id] = candidates.get(faq_id, 0) + 1
+        if not candidates:
+            return None
+
+        best = None
+        for faq_id, hits in candidates.items():
+            entry = self.faq[client][faq_id]
+            # Cobertura da mensagem pelas palavras-chave + semelhança com a pergunta
+            coverage = hits / max(len(words), 1)
+            similarity = SequenceMatcher(None, text, normalize(entry["question"], collapse_repeats=True)).ratio()
+            confidence = max(similarity, 0.6 * coverage + 0.4 * similarity)
+            if not best or confidence > best.confidence:
+                best = IntentMatch(f"faq:{faq_id}", confidence, "faq", answer=entry["answer"])
+        return best
+
+    def get_stats(self) -> dict:
+        messages = self.stats["messages"]
+        return {
+            **self.stats,
+            "match_rate": round(self.stats["answered"] / messages, 4) if messages else 0.0,
+            "by_intent": self.by_intent,
+            "answer_threshold": self.answer_threshold
+        }
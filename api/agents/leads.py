@@ -0,0 +1,167 @@
+"""
+Lead Store
+Leads de WhatsApp indexados por telefone, sem duplicatas.
+
+- uma entrada por telefone, com pontuação somada a cada mensagem de interesse
+- índices ordenados por pontuação e por recência, globais e por cliente
+- radicais de palavras-chave compilados num único regex (com peso por radical)
+- consultas paginadas
+"""
+
+import re
+import time
+from bisect import bisect_left, insort
+from typing import Dict, List, Optional, Tuple
+
+from .intents import normalize
+
+
+# Radical da palavra-chave -> peso na pontuação do lead. Casa do início de
+# uma palavra em diante: "valor" pega "valores", "interess" pega "interessado"
+DEFAULT_LEAD_KEYWORDS = {
+    "preço": 3,
+    "valor": 2,
+    "orçamento": 3,
+    "quanto custa": 3,
+    "contrat": 4,
+    "interess": 2
+}
+
+ALL_CLIENTS = "*"
+
+
+class LeadMatcher:
+    """Encontra palavras de interesse numa mensagem numa única passada"""
+
+    def __init__(self, keywords: Optional[Dict[str, float]] = None):
+        self.keywords = keywords or DEFAULT_LEAD_KEYWORDS
+        self._weights = {normalize(k): w for k, w in self.keywords.items()}
+        alternation = "|".join(re.escape(k) for k in sorted(self._weights, key=len, reverse=True))
+        # Só a borda inicial: plurais e flexões continuam casando
+        self._pattern = re.compile(rf"\b({alternation})\w*")
+
+    def match(self, message: str) -> Tuple[float, List[str]]:
+        """(pontuação, radicais encontrados) da mensagem"""
+        found = sorted(set(self._pattern.findall(normalize(message))))
+        return sum(self._weights[k] for k in found), found
+
+
+class LeadStore:
+    """
+    Uso:
+        leads = LeadStore()
+        lead = leads.record("5511999999999", "quanto custa?", client_id="cliente_1")
+        page = leads.query(client_id="cliente_1", order="score", limit=20)
+    """
+
+    def __init__(self, matcher: Optional[LeadMatcher] = None):
+        self.matcher = matcher or LeadMatcher()
+        self.leads: Dict[str, dict] = {}
+        # (cliente ou "*", "score"|"recent") -> lista ordenada de chaves
+        self._indexes: Dict[Tuple[str, str], list] = {}
+
+    def record(
+        self,
+        phone: str,
+        message: str,
+        client_id: Optional[str] = None,
+        agent_id: Optional[str] = None,
+        now: Optional[float] = None
+    ) -> Optional[dict]:
+        """Soma a mensagem ao lead do telefone; retorna o lead se ela indicou interesse"""
+        score, keywords = self.matcher.match(message)
+        if not keywords:
+            return None
+
+        now = now or time.time()
+        lead = self.leads.get(phone)
+        if lead is None:
+            lead = {
+                "phone": phone,
+                "client_id": client_id,
+                "agent_id": agent_id,
+                "score": 0.0,
+                "hits": 0,
+                "keywords": [],
+                "first_seen": now,
+                "last_seen": now,
+                "last_message": message
+            }
+        else:
+            self._unindex(lead)
+            lead = dict(lead)
+
+        lead["score"] += score
+        lead["hits"] += 1
+        lead["keywords"] = sorted(set(lead["keywords"]) | set(keywords))
+        lead["last_seen"] = now
+        lead["last_message"] = message
+        lead["qualified"] = True
+        self.leads[phone] = lead
+        self._index(lead)
+        return lead
+
+    def apply(self, lead: dict):
+        """Insere ou substitui um lead já consolidado (banco, outro worker)"""
+        current = self.leads.get(lead["phone"])
+        if current:
+            self._unindex(current)
+        self.leads[lead["phone"]] = lead
+        self._index(lead)
+
+    def get(self, phone: str) -> Optional[dict]:
+        return self.leads.get(phone)
+
+    def query(
+        self,
+        client_id: Optional[str] = None,
+        min_score: float = 0.0,
+        order: str = "score",
+        offset: int = 0,
+        limit: int = 50
+    ) -> dict:
+        """Página de leads do cliente (ou de todos), por pontuação ou recência"""
+        if order not in ("score", "recent"):
+            raise ValueError("order deve ser 'score' ou 'recent'")
+        keys = self._indexes.get((client_id or ALL_CLIENTS, order), [])
+
+        if not min_score:
+            total = len(keys)
+            page = keys[offset:offset + limit]
+        elif order == "score":
+            # Índice em ordem decrescente de pontuação: corta no primeiro abaixo do mínimo
+            total = bisect_left(keys, (-min_score, float("inf"), ""))
+            page = keys[offset:min(offset + limit, total)]
+        else:
+            matching = [k for k in keys if self.leads[k[-1]]["score"] >= min_score]
+            total = len(matching)
+            page = matching[offset:offset + limit]
+
+        return {
+            "total": total,
+            "offset": offset,
+            "limit": limit,
+            "items": [self.leads[key[-1]] for key in page]
+        }
+
+    def _keys(self, lead: dict) -> Dict[str, tuple]:
+        return {
+            "score": (-lead["score"], -lead["last_seen"], lead["phone"]),
+            "recent": (-lead["last_seen"], lead["phone"])
+        }
+
+    def _index(self, lead: dict):
+        for order, key in self._keys(lead).items():
+            for client in {ALL_CLIENTS, lead.get("client_id") or ALL_CLIENTS}:
+                insort(self._indexes.setdefault((client, order), []), key)
+
+    def _unindex(self, lead: dict):
+        for order, key in self._keys(lead).items():
+            for client in {ALL_CLIENTS, lead.get("client_id") or ALL_CLIENTS}:
+                keys = self._indexes.get((client, order), [])
+                position = bisect_left(keys, key)
+                if position < len(keys) and keys[position] == key:
+                    keys.pop(position)
+
+    def __len__(self) -> int:
+        return len(self.leads)
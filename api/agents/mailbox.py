@@ -0,0 +1,257 @@
+"""
+Mailbox Dispatcher
+Caixas de entrada por contato (estilo ator): as mensagens de um mesmo
+telefone são processadas estritamente em ordem, uma por vez, enquanto
+contatos diferentes rodam em paralelo até um limite global.
+
+Rajadas (várias mensagens em poucos segundos) podem ser agrupadas num
+único turno: a caixa espera `coalesce_window` sem mensagens novas antes
+de processar. Com `cancel_on_new`, uma mensagem que chega enquanto a
+resposta ainda está sendo gerada cancela a geração, que recomeça com
+tudo o que chegou.
+
+Caixas sem mensagens por `idle_timeout` segundos são removidas.
+"""
+
+import asyncio
+import contextvars
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Optional, Tuple
+
+from metrics.registry import QUEUE_DEPTH, registry
+
+
+MAILBOX_COALESCED = registry.counter(
+    "agencyzen_mailbox_coalesced_messages_total",
+    "Mensagens agrupadas no turno de uma mensagem anterior",
+    ("mailbox",)
+)
+
+MAILBOX_RESTARTS = registry.counter(
+    "agencyzen_mailbox_restarts_total",
+    "Gerações canceladas porque o contato mandou mais mensagens",
+    ("mailbox",)
+)
+
+
+class MailboxFullError(Exception):
+    """Contato com mensagens demais aguardando processamento"""
+
+
+class Mailbox:
+    """Fila de um contato"""
+
+    def __init__(self, key: str):
+        self.key = key
+        # (item, future, contexto de quem enviou)
+        self.queue: Deque[Tuple[Any, asyncio.Future, contextvars.Context]] = deque()
+        self.wakeup = asyncio.Event()
+        self.task: Optional[asyncio.Task] = None
+        self.last_active = time.monotonic()
+
+
+class MailboxDispatcher:
+    """
+    Uso:
+        dispatcher = MailboxDispatcher(handler, max_concurrency=64)
+        resposta = await dispatcher.submit("5511999999999", "oi")
+
+    `handler(key, items)` recebe os itens do turno (um, ou a rajada
+    agrupada) e roda no máximo uma vez por vez para cada key. Todos os
+    itens do turno recebem o mesmo resultado. `commit(key, items, result)`
+    (opcional, síncrono) roda só depois que o turno termina sem ser
+    cancelado: é onde ficam os efeitos colaterais. Se o handler falhar,
+    roda `on_error(key, items, error)` no lugar (também síncrono; um turno
+    cancelado e refeito não chama nenhum dos dois).
+    """
+
+    def __init__(
+        self,
+        handler: Callable[[str, List[Any]], Awaitable[Any]],
+        max_concurrency: int = 64,
+        idle_timeout: float = 60.0,
+        max_pending: int = 50,
+        name: str = "mailboxes",
+        commit: Optional[Callable[[str, List[Any], Any], None]] = None,
+        on_error: Optional[Callable[[str, List[Any], Exception], None]] = None,
+        coalesce_window: float = 0.0,
+        max_coalesce_wait: float = 10.0,
+        cancel_on_new: bool = False
+    ):
+        self.handler = handler
+        self.commit = commit
+        self.on_error = on_error
+        self.max_concurrency = max_concurrency
+        self.idle_timeout = idle_timeout
+        self.max_pending = max_pending
+        self.name = name
+        self.coalesce_window = coalesce_window
+        # Depois disso desde a primeira mensagem, o turno segue mesmo com mensagens novas
+        self.max_coalesce_wait = max_coalesce_wait
+        self.cancel_on_new = cancel_on_new
+        self.mailboxes: Dict[str, Mailbox] = {}
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._pending = 0
+        self._processing = 0
+
+    def submit(self, key: str, item: Any) -> asyncio.Future:
+        """Coloca o item na caixa do contato; o future resolve com o resultado do handler"""
+        mailbox = self.mailboxes.get(key)
+        if mailbox is None:
+            mailbox = Mailbox(key)
+            self.mailboxes[key] = mailbox
+            # Contexto vazio: o consumidor não herda nada de quem criou a caixa
+            mailbox.task = contextvars.Context().run(asyncio.create_task, self._run(mailbox))
+        if len(mailbox.queue) >= self.max_pending:
+            raise MailboxFullError(f"Contato {key} com {len(mailbox.queue)} mensagens na fila")
+
+        future = asyncio.get_running_loop().create_future()
+        # O handler roda no contexto de quem enviou (prazo, prioridade),
+        # não no da primeira mensagem que criou a caixa
+        mailbox.queue.append((item, future, contextvars.copy_context()))
+        mailbox.wakeup.set()
+        self._pending += 1
+        self._update_depth()
+        return future
+
+    async def _run(self, mailbox: Mailbox):
+        """Consome a caixa em ordem; encerra após ficar ociosa"""
+        try:
+            while True:
+                if not mailbox.queue:
+                    mailbox.wakeup.clear()
+                    try:
+                        await asyncio.wait_for(mailbox.wakeup.wait(), self.idle_timeout)
+                    except asyncio.TimeoutError:
+                        if not mailbox.queue:
+                            return
+                    continue
+
+                batch: list = []
+                # Sem janela nem cancelamento não há agrupamento: uma mensagem por turno
+                coalescing = self.coalesce_window > 0 or self.cancel_on_new
+                self._drain(mailbox, batch, None if coalescing else 1)
+                if not batch:
+                    continue
+                first_at = time.monotonic()
+                if self.coalesce_window > 0:
+                    await self._debounce(mailbox, batch, first_at)
+
+                async with self._semaphore:
+                    self._processing += 1
+                    self._update_depth()
+                    mailbox.last_active = time.monotonic()
+                    try:
+                        result = await self._process(mailbox, batch, first_at)
+                        for _, future, _ in batch:
+                            if not future.done():
+                                future.set_result(result)
+                    except asyncio.CancelledError:
+                        for _, future, _ in batch:
+                            future.cancel()
+                        raise
+                    except Exception as e:
+                        for _, future, _ in batch:
+                            if not future.done():
+                                future.set_exception(e)
+                    finally:
+                        self._processing -= 1
+                        self._update_depth()
+        finally:
+            if self.mailboxes.get(mailbox.key) is mailbox:
+                del self.mailboxes[mailbox.key]
+            for _, future, _ in mailbox.queue:
+                future.cancel()
+            self._pending -= len(mailbox.queue)
+            mailbox.queue.clear()
+            self._update_depth()
+
+    async def _process(self, mailbox: Mailbox, batch: list, first_at: float) -> Any:
+        """Roda o handler do turno; recomeça se chegarem mensagens durante a geração"""
+        while True:
+            items = [item for item, _, _ in batch]
+            # O turno responde à mensagem mais recente: usa o contexto dela
+            context = batch[-1][2]
+            task = context.run(asyncio.create_task, self.handler(mailbox.key, items))
+
+            restartable = self.cancel_on_new and time.monotonic() - first_at < self.max_coalesce_wait
+            if restartable:
+                mailbox.wakeup.clear()
+                waiter = asyncio.ensure_future(mailbox.wakeup.wait())
+                try:
+                    await asyncio.wait({task, waiter}, return_when=asyncio.FIRST_COMPLETED)
+                except asyncio.CancelledError:
+                    task.cancel()
+                    raise
+                finally:
+                    waiter.cancel()
+
+                if not task.done():
+                    # Contato mandou mais: descarta a resposta em andamento
+                    task.cancel()
+                    await asyncio.gather(task, return_exceptions=True)
+                    MAILBOX_RESTARTS.inc(mailbox=self.name)
+                    self._drain(mailbox, batch)
+                    if self.coalesce_window > 0:
+                        await self._debounce(mailbox, batch, first_at)
+                    continue
+
+            try:
+                result = await task
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                if self.on_error:
+                    self.on_error(mailbox.key, items, e)
+                raise
+            if len(batch) > 1:
+                MAILBOX_COALESCED.inc(len(batch) - 1, mailbox=self.name)
+            if self.commit:
+                self.commit(mailbox.key, items, result)
+            return result
+
+    async def _debounce(self, mailbox: Mailbox, batch: list, first_at: float):
+        """Espera a rajada acabar: `coalesce_window` sem mensagens novas (até o teto)"""
+        while True:
+            remaining = first_at + self.max_coalesce_wait - time.monotonic()
+            if remaining <= 0:
+                break
+            mailbox.wakeup.clear()
+            try:
+                await asyncio.wait_for(mailbox.wakeup.wait(), min(self.coalesce_window, remaining))
+            except asyncio.TimeoutError:
+                break
+            self._drain(mailbox, batch)
+        self._drain(mailbox, batch)
+
+    def _drain(self, mailbox: Mailbox, batch: list, limit: Optional[int] = None):
+        """Move o que está na fila para o turno, até `limit` itens (descarta envios cancelados)"""
+        while mailbox.queue and (limit is None or len(batch) < limit):
+            entry = mailbox.queue.popleft()
+            self._pending -= 1
+            if entry[1].cancelled():
+                # Quem enviou desistiu (ex: requisição encerrada)
+                continue
+            batch.append(entry)
+        self._update_depth()
+
+    async def close(self):
+        """Cancela os consumidores (shutdown)"""
+        tasks = [m.task for m in self.mailboxes.values() if m.task]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def _update_depth(self):
+        QUEUE_DEPTH.set(self._pending, queue=f"{self.name}_pending")
+        QUEUE_DEPTH.set(len(self.mailboxes), queue=f"{self.name}_active")
+
+    def get_stats(self) -> dict:
+        return {
+            "mailboxes": len(self.mailboxes),
+            "pending": self._pending,
+            "processing": self._processing,
+            "max_concurrency": self.max_concurrency,
+            "coalesce_window": self.coalesce_window
+        }
@@ -4,17 +4,35 @@ Agente Gerente Geral - aprova posts e anúncios.
 """
 
 from .base import Agent, AgentConfig
-from typing import Optional, List
+from .approvals import ApprovalStore
+from .policy import PolicyEngine
+from typing import Optional, List, Callable, Dict
+import re
 
 
 class ManagerAgent(Agent):
     """Agente Gerente que coordena e aprova"""
     
+    # Quantos pendentes o comando "pendentes" mostra por vez
+    PENDING_PAGE_SIZE = 10
+    
+    # Aprovação em massa pelo chat só com o comando exato ("aprovar todos")
+    BULK_APPROVAL = re.compile(r"^\s*(aprovar|approve)\s+(todos|all)\s*[.!]?\s*$", re.IGNORECASE)
+    
     def __init__(self, **kwargs):
         super().__init__(**kwargs)
-        self.approval_queue: List[dict] = []
-        self.approved_items: List[dict] = []
-        self.rejected_items: List[dict] = []
+        self._approvals = ApprovalStore()
+        # Política que decide antes da fila (None: tudo vai para revisão)
+        self.policy: Optional[PolicyEngine] = None
+        # Callback opcional chamado a cada mudança na fila: (evento, item)
+        self.on_queue_change: Optional[Callable] = None
+        # Callback opcional com os itens aprovados (ex.: base de conhecimento do cliente)
+        self.on_approved: Optional[Callable] = None
+    
+    @property
+    def approvals(self) -> ApprovalStore:
+        """Fila de aprovação (fica fora dos atributos públicos do agente)"""
+        return self._approvals
     
     async def process_message(self, message: str) -> str:
         """Processa mensagem com lógica de gerente"""
@@ -29,55 +47,182 @@ class ManagerAgent(Agent):
             return await self._handle_rejection(message)
         
         if "pendentes" in lower_msg or "fila" in lower_msg:
-            return self._show_pending()
+            return self._show_pending(self._page_from(lower_msg))
         
         # Processa normalmente
         return await super().process_message(message)
     
+    def _target(self, message: str) -> Optional[dict]:
+        """Item citado na mensagem pelo id; senão o mais urgente"""
+        for token in re.findall(r"[\w-]+", message):
+            if token in self.approvals.items:
+                return self.approvals.items[token]
+        return self.approvals.first()
+    
+    @staticmethod
+    def _page_from(message: str) -> int:
+        match = re.search(r"p[aá]gina\s+(\d+)", message)
+        return max(int(match.group(1)), 1) if match else 1
+    
     async def _handle_approval(self, message: str) -> str:
-        """Aprova um item da fila"""
-        if not self.approval_queue:
+        """Aprova o item citado (ou o mais urgente); "aprovar todos" aprova a fila inteira"""
+        if not self.approvals:
             return "Não há itens pendentes para aprovar."
         
-        item = self.approval_queue.pop(0)
-        item["status"] = "approved"
-        self.approved_items.append(item)
-        self.tasks_completed += 1
+        if self.BULK_APPROVAL.match(message):
+            approved = self.approve_many()
+            return f"✅ {len(approved)} itens aprovados."
+        if re.search(r"\b(todos|all)\b", message.lower()):
+            # Frase que só cita a fila inteira (pergunta, negação): não aprova nada
+            return "Para aprovar a fila inteira, envie exatamente \"aprovar todos\"."
         
+        item = self.approve(self._target(message)["id"])
         return f"✅ Aprovado: {item.get('title', 'Item')} do agente {item.get('agent_name', 'desconhecido')}"
     
     async def _handle_rejection(self, message: str) -> str:
-        """Rejeita um item da fila"""
-        if not self.approval_queue:
+        """Rejeita o item citado (ou o mais urgente)"""
+        if not self.approvals:
             return "Não há itens pendentes para rejeitar."
         
-        item = self.approval_queue.pop(0)
-        item["status"] = "rejected"
-        item["rejection_reason"] = message
-        self.rejected_items.append(item)
-        
+        item = self.reject(self._target(message)["id"], message)
         return f"❌ Rejeitado: {item.get('title', 'Item')}. Motivo enviado ao agente."
     
-    def _show_pending(self) -> str:
-        """Mostra itens pendentes"""
-        if not self.approval_queue:
+    def _show_pending(self, page: int = 1) -> str:
+        """Mostra uma página dos itens pendentes, do mais urgente"""
+        if not self.approvals:
             return "✨ Nenhum item pendente de aprovação!"
         
+        size = self.PENDING_PAGE_SIZE
+        result = self.approvals.query(offset=(page - 1) * size, limit=size)
         pending = []
-        for i, item in enumerate(self.approval_queue, 1):
-            pending.append(f"{i}. {item.get('title', 'Sem título')} - {item.get('type', 'post')} de {item.get('agent_name', '?')}")
+        for i, item in enumerate(result["items"], result["offset"] + 1):
+            pending.append(
+                f"{i}. [{item['id']}] {item.get('title', 'Sem título')} - "
+                f"{item.get('type', 'post')} de {item.get('agent_name', '?')}"
+            )
         
-        return f"📋 Itens pendentes ({len(self.approval_queue)}):\n" + "\n".join(pending)
+        text = f"📋 Itens pendentes ({result['total']}):\n" + "\n".join(pending)
+        if result["offset"] + size < result["total"]:
+            text += f"\n… peça \"pendentes página {page + 1}\" para ver mais."
+        return text
     
-    def add_to_queue(self, item: dict):
+    def add_to_queue(self, item: dict) -> dict:
         """Adiciona item para aprovação"""
-        self.approval_queue.append(item)
+        item = self.approvals.add(item)
+        self._notify("queued", item)
+        return item
+    
+    def review(self, items: List[dict]) -> Dict[str, int]:
+        """
+        Passa os itens pela política: os claros são aprovados ou rejeitados
+        na hora, só os duvidosos entram na fila.
+        """
+        if self.policy is None:
+            for item in items:
+                self.add_to_queue(item)
+            return {"approved": 0, "rejected": 0, "queued": len(items)}
+        
+        groups = self.policy.evaluate_many(items)
+        queued = [self.approvals.add(item) for item in groups["escalate"]]
+        decided = self._record_decisions(groups)
+        # Um evento só para o lote inteiro
+        self._notify("reviewed", {"queued": queued, "decided": decided})
+        return {"approved": len(groups["approve"]), "rejected": len(groups["reject"]), "queued": len(queued)}
+    
+    def review_pending(self, client_id: Optional[str] = None, agent_id: Optional[str] = None) -> Dict[str, int]:
+        """Reavalia a fila (ex.: depois de mudar as regras) e decide o que ficou claro"""
+        if self.policy is None:
+            return {"approved": 0, "rejected": 0, "queued": len(self.approvals)}
+        
+        pending = [self.approvals.items[i] for i in self.approvals.select(client_id, agent_id)]
+        groups = self.policy.evaluate_many(pending)
+        for item in groups["escalate"]:
+            # Continuam na fila com os motivos atualizados
+            self.approvals.items[item["id"]]["policy"] = item["policy"]
+        decided = self._record_decisions(groups)
+        if decided:
+            self._notify("reviewed", {"queued": [], "decided": decided})
+        return {"approved": len(groups["approve"]), "rejected": len(groups["reject"]), "queued": len(groups["escalate"])}
+    
+    def _record_decisions(self, groups: Dict[str, List[dict]]) -> List[dict]:
+        approved = [self.approvals.record(item, "approved") for item in groups["approve"]]
+        rejected = [
+            self.approvals.record(item, "rejected", "; ".join(item["policy"]["reasons"]))
+            for item in groups["reject"]
+        ]
+        self._approved(approved)
+        self.tasks_completed += len(approved)
+        return approved + rejected
+    
+    def approve(self, item_id: str) -> Optional[dict]:
+        """Aprova o item pelo id (None se não estiver pendente)"""
+        item = self.approvals.decide(item_id, "approved")
+        if item:
+            self.tasks_completed += 1
+            self._notify("approved", item)
+            self._approved([item])
+        return item
+    
+    def reject(self, item_id: str, reason: Optional[str] = None) -> Optional[dict]:
+        """Rejeita o item pelo id (None se não estiver pendente)"""
+        item = self.approvals.decide(item_id, "rejected", reason)
+        if item:
+            self._notify("rejected", item)
+        return item
+    
+    def approve_many(
+        self,
+        client_id: Optional[str] = None,
+        agent_id: Optional[str] = None,
+        item_type: Optional[str] = None,
+        max_priority: Optional[int] = None,
+        limit: Optional[int] = None
+    ) -> List[dict]:
+        """Aprova de uma vez os pendentes que passam no filtro"""
+        ids = self.approvals.select(client_id, agent_id, item_type, max_priority, limit)
+        approved = [self.approvals.decide(item_id, "approved") for item_id in ids]
+        if approved:
+            self.tasks_completed += len(approved)
+            # Um evento só para o lote inteiro
+            self._notify("approved_many", {"ids": ids})
+            self._approved(approved)
+        return approved
+    
+    def _notify(self, event: str, item: dict):
+        """Avisa o callback de mudança na fila, se houver"""
+        if self.on_queue_change:
+            self.on_queue_change(event, item)
+    
+    def _approved(self, items: List[dict]):
+        """Avisa quem aprende com o que foi aprovado (só no worker que decidiu)"""
+        if self.on_approved and items:
+            self.on_approved(items)
+    
+    def apply_queue_change(self, event: str, item: dict):
+        """Replica mudança feita por outro worker (sem notificar de novo)"""
+        if event == "queued":
+            self.approvals.add(item)
+        elif event == "reviewed":
+            for queued in item["queued"]:
+                self.approvals.add(queued)
+            for decided in item["decided"]:
+                self.approvals.record(decided, decided["status"], decided.get("rejection_reason"))
+                if decided["status"] == "approved":
+                    self.tasks_completed += 1
+        elif event == "approved_many":
+            decided = [i for i in item["ids"] if self.approvals.decide(i, "approved")]
+            self.tasks_completed += len(decided)
+        elif event in ("approved", "rejected"):
+            self.approvals.decide(item["id"], event, item.get("rejection_reason"))
+            if event == "approved":
+                self.tasks_completed += 1
     
     def get_stats(self) -> dict:
         """Retorna estatísticas do gerente"""
+        stats = self.approvals.get_stats()
+        if self.policy:
+            stats["policy"] = self.policy.get_stats()
         return {
-            "pending": len(self.approval_queue),
-            "approved": len(self.approved_items),
-            "rejected": len(self.rejected_items),
+            **stats,
             "total_processed": self.tasks_completed
         }
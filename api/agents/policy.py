@@ -0,0 +1,154 @@
+"""
+Approval Policy
+Regras por cliente que decidem posts e campanhas antes do Gerente.
+
+- tamanho do texto (mínimo/máximo), palavras proibidas, hashtags
+  obrigatórias e teto de orçamento diário
+- as regras são compiladas uma vez: palavras proibidas viram um único
+  regex, hashtags um conjunto
+- cada item sai aprovado, rejeitado ou escalado; só o que fica na faixa
+  de tolerância (`margin`) ou sem como verificar vai para revisão humana
+"""
+
+import re
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from metrics.registry import registry
+from .intents import normalize
+
+
+POLICY_DECISIONS = registry.counter(
+    "agencyzen_approval_policy_total",
+    "Itens avaliados pela política de aprovação (decision=approve|reject|escalate)",
+    ("decision",)
+)
+
+# Regras usadas por clientes sem regras próprias
+DEFAULT_CLIENT = "*"
+
+HASHTAG = re.compile(r"#(\w+)")
+# "ORÇAMENTO SUGERIDO: R$ 1.500,00", "Orçamento: 150"
+BUDGET = re.compile(r"or[çc]amento[^:\n]*:\s*(?:r\$)?\s*([\d.,]+)", re.IGNORECASE)
+
+
+def parse_money(text: str) -> Optional[float]:
+    """Valor em reais escrito no formato brasileiro ou com ponto decimal"""
+    text = text.strip(".,")
+    if not text:
+        return None
+    if "," in text:
+        text = text.replace(".", "").replace(",", ".")
+    elif text.count(".") == 1 and len(text.split(".")[1]) == 2:
+        pass
+    else:
+        text = text.replace(".", "")
+    try:
+        return float(text)
+    except ValueError:
+        return None
+
+
+class CompiledPolicy:
+    """Regras de um cliente, prontas para avaliar"""
+
+    def __init__(self, rules: dict):
+        self.rules = rules
+        self.min_length = rules.get("min_length")
+        self.max_length = rules.get("max_length")
+        self.max_budget = rules.get("max_budget")
+        self.margin = rules.get("margin", 0.1)
+        self.auto_approve = rules.get("auto_approve", True)
+        self.required_hashtags = {normalize(h.lstrip("#")) for h in rules.get("required_hashtags", [])}
+
+        banned = sorted({normalize(w) for w in rules.get("banned_words", []) if normalize(w)}, key=len, reverse=True)
+        self._banned = re.compile(rf"\b(?:{'|'.join(re.escape(w) for w in banned)})\b") if banned else None
+
+    def evaluate(self, item: dict) -> Tuple[str, List[str]]:
+        """(decisão, motivos) para o item"""
+        content = item.get("content") or ""
+        rejects: List[str] = []
+        escalates: List[str] = []
+
+        length = len(content.strip())
+        if self.min_length and length < self.min_length:
+            reason = f"texto curto ({length} < {self.min_length})"
+            (rejects if length < self.min_length * (1 - self.margin) else escalates).append(reason)
+        if self.max_length and length > self.max_length:
+            reason = f"texto longo ({length} > {self.max_length})"
+            (rejects if length > self.max_length * (1 + self.margin) else escalates).append(reason)
+
+        if self._banned:
+            found = sorted(set(self._banned.findall(normalize(content))))
+            if found:
+                rejects.append(f"palavras proibidas: {', '.join(found)}")
+
+        if self.required_hashtags:
+            present = {normalize(tag) for tag in HASHTAG.findall(content)}
+            missing = self.required_hashtags - present
+            if missing:
+                escalates.append(f"hashtags faltando: {', '.join('#' + t for t in sorted(missing))}")
+
+        if self.max_budget is not None and item.get("type") == "ad":
+            budget = item.get("budget")
+            if budget is None:
+                match = BUDGET.search(content)
+                budget = parse_money(match.group(1)) if match else None
+            if budget is None:
+                escalates.append("orçamento não identificado")
+            elif budget > self.max_budget * (1 + self.margin):
+                rejects.append(f"orçamento acima do teto (R$ {budget:g} > R$ {self.max_budget:g})")
+            elif budget > self.max_budget:
+                escalates.append(f"orçamento no limite (R$ {budget:g} > R$ {self.max_budget:g})")
+
+        if rejects:
+            return "reject", rejects + escalates
+        if escalates:
+            return "escalate", escalates
+        if not self.auto_approve:
+            return "escalate", ["aprovação automática desligada"]
+        return "approve", []
+
+
+class PolicyEngine:
+    """
+    Uso:
+        policy = PolicyEngine()
+        policy.set_rules("acme", {"max_length": 2200, "banned_words": ["grátis"],
+                                  "required_hashtags": ["#acme"], "max_budget": 200})
+        decision, reasons = policy.evaluate({"client_id": "acme", "type": "post", "content": "..."})
+        groups = policy.evaluate_many(items)  # {"approve": [...], "reject": [...], "escalate": [...]}
+    """
+
+    def __init__(self):
+        self.policies: Dict[str, CompiledPolicy] = {}
+        self.stats: Dict[str, int] = {"approve": 0, "reject": 0, "escalate": 0}
+
+    def set_rules(self, client_id: str, rules: dict):
+        self.policies[client_id] = CompiledPolicy(rules)
+
+    def remove_rules(self, client_id: str):
+        self.policies.pop(client_id, None)
+
+    def get_rules(self) -> Dict[str, dict]:
+        return {client_id: policy.rules for client_id, policy in self.policies.items()}
+
+    def evaluate(self, item: dict) -> Tuple[str, List[str]]:
+        policy = self.policies.get(item.get("client_id") or DEFAULT_CLIENT) or self.policies.get(DEFAULT_CLIENT)
+        if policy is None:
+            decision, reasons = "escalate", ["cliente sem política"]
+        else:
+            decision, reasons = policy.evaluate(item)
+        self.stats[decision] += 1
+        POLICY_DECISIONS.inc(decision=decision)
+        return decision, reasons
+
+    def evaluate_many(self, items: Iterable[dict]) -> Dict[str, List[dict]]:
+        """Avalia em lote; cada item sai copiado com `policy` (decisão e motivos)"""
+        groups: Dict[str, List[dict]] = {"approve": [], "reject": [], "escalate": []}
+        for item in items:
+            decision, reasons = self.evaluate(item)
+            groups[decision].append({**item, "policy": {"decision": decision, "reasons": reasons}})
+        return groups
+
+    def get_stats(self) -> dict:
+        return {**self.stats, "clients": len(self.policies)}
@@ -0,0 +1,134 @@
+"""
+Post Index
+Posts criados pelo agente de Social Media, indexados por cliente.
+
+- listagem por cliente (ou geral), mais novos primeiro, em páginas
+- temas num índice MinHash/LSH por cliente: pedido com tema quase igual
+  a um anterior encontra o post sem comparar com todos
+- status acompanha a decisão do Gerente (aprovados podem ser reaproveitados)
+- cada cliente guarda no máximo `max_per_client` posts (os mais antigos saem)
+"""
+
+from bisect import bisect_left
+from itertools import count
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from knowledge.minhash import LSHIndex, MinHasher
+
+
+ALL = "*"
+NO_CLIENT = ""
+
+
+class PostIndex:
+    """
+    Uso:
+        posts = PostIndex()
+        posts.add(post)
+        posts.similar("black friday promo", "acme")  # [(0.71, post), ...]
+        page = posts.query("acme", offset=0, limit=20)
+        posts.set_status(post["id"], "approved")
+    """
+
+    def __init__(self, max_per_client: int = 5000, hasher: Optional[MinHasher] = None):
+        self.max_per_client = max_per_client
+        self.hasher = hasher or MinHasher()
+        self.items: Dict[str, dict] = {}
+        # ("*" | client_id) -> lista ordenada de (seq, id), da mais antiga para a mais nova
+        self._indexes: Dict[str, List[Tuple[int, str]]] = {}
+        self._keys: Dict[str, Tuple[int, str]] = {}
+        self._topics: Dict[str, LSHIndex] = {}
+        self._seq = count()
+
+    def __len__(self) -> int:
+        return len(self.items)
+
+    def add(self, post: dict) -> dict:
+        client = post.get("client_id") or NO_CLIENT
+        if post["id"] in self.items:
+            self.remove(post["id"])
+        key = (next(self._seq), post["id"])
+        self.items[post["id"]] = post
+        self._keys[post["id"]] = key
+        for name in (ALL, client):
+            self._indexes.setdefault(name, []).append(key)
+        topics = self._topics.get(client)
+        if topics is None:
+            topics = self._topics[client] = LSHIndex(self.hasher)
+        topics.add(post["id"], post.get("topic") or post.get("title") or "")
+        # Passou do limite: sai o mais antigo do cliente
+        while len(self._indexes[client]) > self.max_per_client:
+            self.remove(self._indexes[client][0][1])
+        return post
+
+    def remove(self, post_id: str) -> bool:
+        post = self.items.pop(post_id, None)
+        if post is None:
+            return False
+        client = post.get("client_id") or NO_CLIENT
+        key = self._keys.pop(post_id)
+        for name in (ALL, client):
+            keys = self._indexes[name]
+            keys.pop(bisect_left(keys, key))
+            if not keys:
+                del self._indexes[name]
+        self._topics[client].remove(post_id)
+        if not len(self._topics[client]):
+            del self._topics[client]
+        return True
+
+    def get(self, post_id: str) -> Optional[dict]:
+        return self.items.get(post_id)
+
+    def set_status(self, post_id: str, status: str) -> bool:
+        post = self.items.get(post_id)
+        if post is None:
+            return False
+        post["status"] = status
+        return True
+
+    def similar(
+        self,
+        topic: str,
+        client_id: Optional[str] = None,
+        threshold: float = 0.5,
+        statuses: Optional[Iterable[str]] = None,
+        limit: int = 5
+    ) -> List[Tuple[float, dict]]:
+        """(similaridade, post) de temas parecidos do cliente, do mais parecido para o menos"""
+        topics = self._topics.get(client_id or NO_CLIENT)
+        if topics is None:
+            return []
+        allowed = set(statuses) if statuses is not None else None
+        results = []
+        for score, post_id in topics.query(topic, threshold):
+            post = self.items[post_id]
+            if allowed is None or post.get("status") in allowed:
+                results.append((round(score, 4), post))
+                if len(results) >= limit:
+                    break
+        return results
+
+    def query(
+        self,
+        client_id: Optional[str] = None,
+        offset: int = 0,
+        limit: int = 50,
+        status: Optional[str] = None
+    ) -> dict:
+        """Página de posts, mais novos primeiro (status filtra percorrendo o índice)"""
+        keys = self._indexes.get(ALL if client_id is None else client_id or NO_CLIENT, [])
+        if status:
+            ids = [post_id for _, post_id in reversed(keys) if self.items[post_id].get("status") == status]
+            total = len(ids)
+            page = ids[offset:offset + limit]
+        else:
+            total = len(keys)
+            end = max(total - offset, 0)
+            page = [post_id for _, post_id in reversed(keys[max(end - limit, 0):end])]
+        return {
+            "total": total,
+            "offset": offset,
+            "limit": limit,
+            "items": [self.items[post_id] for post_id in page]
+        }
@@ -0,0 +1,97 @@
+"""
+Prompt Prefixes
+Prefixos de prompt por cliente, montados uma vez e reaproveitados.
+
+O provedor reaproveita (cache) o começo idêntico de prompts longos e
+cobra menos por esses tokens. Por isso as tarefas de conteúdo mandam
+primeiro o que não muda e por último o que muda:
+
+    instruções do agente -> perfil do cliente + formato da tarefa -> pedido (tema, data)
+
+- cada prefixo é montado na primeira vez e devolvido igual (mesmo texto,
+  byte a byte) nas seguintes
+- mudar o perfil do cliente sobe a versão dele e descarta os prefixos antigos
+- o provedor só guarda em cache prompts a partir de PROMPT_CACHE_MIN_TOKENS:
+  por isso o prefixo leva todo o contexto estável da marca (cores, exemplos),
+  e as estatísticas mostram quais prefixos chegam lá
+"""
+
+import hashlib
+import time
+from typing import Callable, Dict, Optional, Tuple
+
+
+# Prefixos sem cliente (perfil vazio)
+NO_CLIENT = "*"
+# Menor prompt (tokens) que o provedor guarda em cache
+PROMPT_CACHE_MIN_TOKENS = 1024
+
+
+class PromptPrefix:
+    """Prefixo montado (não alterar: o texto precisa ficar idêntico entre chamadas)"""
+
+    __slots__ = ("task", "client_id", "version", "text", "digest", "created_at")
+
+    def __init__(self, task: str, client_id: str, version: int, text: str):
+        self.task = task
+        self.client_id = client_id
+        self.version = version
+        self.text = text
+        self.digest = hashlib.sha1(text.encode()).hexdigest()[:12]
+        self.created_at = time.time()
+
+    def to_dict(self) -> dict:
+        return {
+            "task": self.task,
+            "client_id": self.client_id,
+            "version": self.version,
+            "digest": self.digest,
+            "chars": len(self.text),
+            # Estimativa grosseira (4 caracteres por token), a mesma do escalonador
+            "tokens": len(self.text) // 4,
+            "created_at": self.created_at
+        }
+
+
+class PromptLibrary:
+    """
+    Uso:
+        prompts = PromptLibrary()
+        prefix = prompts.get("post", "acme", lambda: build_post_prefix(profile))
+        prompts.invalidate("acme")  # perfil mudou
+    """
+
+    def __init__(self):
+        self._prefixes: Dict[Tuple[str, str], PromptPrefix] = {}
+        self._versions: Dict[str, int] = {}
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, task: str, client_id: Optional[str], build: Callable[[], str]) -> PromptPrefix:
+        """Prefixo da tarefa para o cliente (montado com `build` só na primeira vez)"""
+        key = (task, client_id or NO_CLIENT)
+        prefix = self._prefixes.get(key)
+        if prefix is not None:
+            self.hits += 1
+            return prefix
+        self.misses += 1
+        prefix = PromptPrefix(task, key[1], self._versions.get(key[1], 1), build())
+        self._prefixes[key] = prefix
+        return prefix
+
+    def invalidate(self, client_id: Optional[str]):
+        """Descarta os prefixos do cliente; os próximos saem com versão nova"""
+        client = client_id or NO_CLIENT
+        self._versions[client] = self._versions.get(client, 1) + 1
+        for key in [k for k in self._prefixes if k[1] == client]:
+            del self._prefixes[key]
+
+    def version(self, client_id: Optional[str]) -> int:
+        return self._versions.get(client_id or NO_CLIENT, 1)
+
+    def get_stats(self) -> dict:
+        return {
+            "prefixes": [prefix.to_dict() for prefix in self._prefixes.values()],
+            "hits": self.hits,
+            "misses": self.misses
+        }
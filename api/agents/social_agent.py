@@ -4,15 +4,31 @@ Agente de criação de conteúdo e posts.
 """
 
 from .base import Agent, AgentConfig
+from .posts import PostIndex
+from .prompts import PromptPrefix
+from datetime import date
 from typing import Optional, List, Dict
+import uuid
+
+
+WEEKDAYS = ("segunda", "terça", "quarta", "quinta", "sexta", "sábado", "domingo")
 
 
 class SocialMediaAgent(Agent):
     """Agente especializado em Social Media"""
     
+    # Similaridade de tema (Jaccard) a partir da qual um post aprovado é
+    # reaproveitado sem gerar de novo, e a partir da qual um anterior é adaptado
+    REUSE_THRESHOLD = 0.8
+    ADAPT_THRESHOLD = 0.5
+    # Status (no PostIndex) dos posts que servem de base: aprovados e os ainda na fila do Gerente
+    REUSABLE_STATUSES = ("approved", "pending_approval")
+    
     def __init__(self, **kwargs):
         super().__init__(**kwargs)
-        self.posts_created: List[dict] = []
+        self.posts = PostIndex()
+        self.reuse_threshold = self.REUSE_THRESHOLD
+        self.adapt_threshold = self.ADAPT_THRESHOLD
         self.client_profiles: Dict[str, dict] = {}  # client_id -> profile
     
     def add_client_profile(self, client_id: str, profile: dict):
@@ -25,73 +41,132 @@ class SocialMediaAgent(Agent):
             "examples": profile.get("examples", []),
             "logo": profile.get("logo", "")
         }
+        # Os prefixos montados com o perfil antigo deixam de valer
+        self.prompts.invalidate(client_id)
     
-    async def create_post(self, topic: str, client_id: Optional[str] = None) -> dict:
-        """Cria um post para redes sociais"""
-        
-        # Pega perfil do cliente se existir
-        profile = self.client_profiles.get(client_id, {})
-        
-        # Monta prompt específico
-        prompt = f"""Crie um post para Instagram sobre: {topic}
-
-"""
-        if profile:
-            prompt += f"""
+    def _post_prefix(self, client_id: Optional[str]) -> PromptPrefix:
+        """Parte fixa do prompt de post do cliente: perfil completo da marca e formato de resposta"""
+        def build() -> str:
+            profile = self.client_profiles.get(client_id, {})
+            prefix = "Você cria posts para Instagram.\n"
+            if profile:
+                prefix += f"""
 Cliente: {profile.get('name', 'Genérico')}
 Tom de voz: {profile.get('tone_of_voice', 'Profissional e engajador')}
 Hashtags sugeridas: {', '.join(profile.get('hashtags', []))}
+Cores da marca: {', '.join(profile.get('colors', []))}
 
 Use o tom de voz do cliente e inclua as hashtags relevantes.
 """
-        
-        prompt += """
+                # Exemplos fixos do perfil: mesmo texto em todo post do cliente
+                examples = profile.get("examples", [])
+                if examples:
+                    prefix += "\nPosts de exemplo da marca:\n" + "\n".join(f"- {e}" for e in examples) + "\n"
+            prefix += """
 Retorne no formato:
 LEGENDA: [legenda engajadora com emojis]
 HASHTAGS: [hashtags relevantes]
 SUGESTÃO DE IMAGEM: [descrição da imagem ideal]
 """
-        
-        # Processa com IA
-        response = await self.process_message(prompt)
-        
-        post = {
+            return prefix
+        return self.prompts.get("post", client_id, build)
+    
+    def _image_prefix(self, client_id: Optional[str]) -> PromptPrefix:
+        """Parte fixa do prompt de imagem do cliente: cores da marca e instruções"""
+        def build() -> str:
+            colors = self.client_profiles.get(client_id, {}).get("colors", [])
+            prefix = "Crie um prompt para gerar uma imagem no estilo moderno para redes sociais.\n"
+            if colors:
+                prefix += f"Cores da marca: {', '.join(colors)}\n"
+            prefix += """
+O prompt deve ser em inglês, detalhado e otimizado para IA de geração de imagens.
+Retorne APENAS o prompt, sem explicações.
+"""
+            return prefix
+        return self.prompts.get("image", client_id, build)
+    
+    async def create_post(self, topic: str, client_id: Optional[str] = None, reuse: bool = False) -> dict:
+        """
+        Cria um post para redes sociais. Por padrão gera conteúdo novo e, se
+        houver post aprovado quase igual, o devolve em "suggestion". Com
+        `reuse`, tema quase igual a um post anterior do cliente reaproveita
+        o aprovado ou adapta o anterior em vez de gerar.
+        """
+        match = self.find_similar(topic, client_id)
+        if reuse and match:
+            score, previous = match
+            if score >= self.reuse_threshold and previous["status"] == "approved":
+                return self._reuse_post(previous, topic, score)
+            return await self._adapt_post(previous, topic, client_id, score)
+        post = await self.generate_post(topic, client_id)
+        if match and match[0] >= self.reuse_threshold and match[1]["status"] == "approved":
+            score, previous = match
+            post["suggestion"] = {"post_id": previous["id"], "similarity": score, "content": previous["content"]}
+        return post
+    
+    def find_similar(self, topic: str, client_id: Optional[str] = None) -> Optional[tuple]:
+        """(similaridade, post) mais parecido que pode servir de base, aprovados primeiro no empate"""
+        candidates = self.posts.similar(topic, client_id, self.adapt_threshold, self.REUSABLE_STATUSES)
+        if not candidates:
+            return None
+        return max(candidates, key=lambda c: (c[0], c[1]["status"] == "approved"))
+    
+    def _reuse_post(self, previous: dict, topic: str, score: float) -> dict:
+        """Mesmo conteúdo do post aprovado, sem chamar o modelo"""
+        post = self._new_post(topic, previous.get("client_id"), previous["content"])
+        post.update(origin="reused", source_post_id=previous["id"], similarity=score)
+        return self.posts.add(post)
+    
+    async def _adapt_post(self, previous: dict, topic: str, client_id: Optional[str], score: float) -> dict:
+        """Ajusta o post anterior ao tema novo (mesmo prefixo em cache do post)"""
+        prefix = self._post_prefix(client_id)
+        request = (
+            f"Adapte o post abaixo para o tema: {topic}\n"
+            "Mantenha o que servir e mude só o necessário.\n\n"
+            f"Post anterior:\n{previous['content']}\n"
+        )
+        post = self._new_post(topic, client_id, await self.run_task(prefix, request))
+        post.update(origin="adapted", source_post_id=previous["id"], similarity=score, prompt_version=prefix.version)
+        return self.posts.add(post)
+    
+    def _new_post(self, topic: str, client_id: Optional[str], content: str, publish_on: Optional[date] = None) -> dict:
+        return {
+            "id": f"post_{uuid.uuid4().hex[:12]}",
+            "type": "post",
+            "title": topic,
             "topic": topic,
             "client_id": client_id,
-            "content": response,
+            "agent_id": self.id,
+            "agent_name": self.name,
+            "publish_on": publish_on.isoformat() if publish_on else None,
+            "origin": "generated",
+            "content": content,
             "status": "pending_approval"
         }
+    
+    async def generate_post(self, topic: str, client_id: Optional[str] = None, publish_on: Optional[date] = None) -> dict:
+        """
+        Post com contexto isolado: não lê nem grava o histórico do agente,
+        então vários podem ser gerados em paralelo (calendário).
+        """
+        request = f"Crie um post para Instagram sobre: {topic}\n"
+        if publish_on:
+            request += f"Data de publicação: {publish_on.strftime('%d/%m/%Y')} ({WEEKDAYS[publish_on.weekday()]})\n"
+        request += self._references(client_id, topic, ("example", "post", "document"))
+        prefix = self._post_prefix(client_id)
+        response = await self.run_task(prefix, request)
         
-        self.posts_created.append(post)
-        
-        return post
+        post = self._new_post(topic, client_id, response, publish_on)
+        post["prompt_version"] = prefix.version
+        return self.posts.add(post)
     
     async def generate_image_prompt(self, description: str, client_id: Optional[str] = None) -> str:
         """Gera prompt otimizado para geração de imagem"""
-        
-        profile = self.client_profiles.get(client_id, {})
-        colors = profile.get("colors", [])
-        
-        prompt = f"""Crie um prompt para gerar uma imagem no estilo moderno para redes sociais.
-
-Descrição: {description}
-"""
-        if colors:
-            prompt += f"Cores da marca: {', '.join(colors)}\n"
-        
-        prompt += """
-O prompt deve ser em inglês, detalhado e otimizado para IA de geração de imagens.
-Retorne APENAS o prompt, sem explicações.
-"""
-        
-        response = await self.process_message(prompt)
-        return response
+        return await self.run_task(self._image_prefix(client_id), f"Descrição: {description}")
     
-    def get_posts(self, client_id: Optional[str] = None) -> List[dict]:
-        """Retorna posts criados"""
-        if client_id:
-            return [p for p in self.posts_created if p.get("client_id") == client_id]
-        return self.posts_created
+    def get_posts(self, client_id: Optional[str] = None, offset: int = 0, limit: int = 50) -> List[dict]:
+        """Página de posts criados (do cliente, se informado), mais novos primeiro"""
+        return self.posts.query(client_id, offset, limit)["items"]
     
     def get_client_profile(self, client_id: str) -> Optional[dict]:
         """Retorna perfil de um cliente"""
@@ -4,7 +4,9 @@ Agente de gestão de tráfego pago.
 """
 
 from .base import Agent, AgentConfig
+from .prompts import PromptPrefix
 from typing import Optional, List, Dict
+import uuid
 
 
 class TrafficAgent(Agent):
@@ -25,24 +27,24 @@ class TrafficAgent(Agent):
             "keywords": config.get("keywords", []),
             "interests": config.get("interests", [])
         }
+        # Os prefixos montados com a configuração antiga deixam de valer
+        self.prompts.invalidate(client_id)
     
-    async def create_campaign(self, objective: str, client_id: Optional[str] = None) -> dict:
-        """Cria sugestão de campanha"""
-        
-        config = self.client_configs.get(client_id, {})
-        
-        prompt = f"""Crie uma campanha de tráfego pago com o objetivo: {objective}
-
-"""
-        if config:
-            prompt += f"""
+    def _campaign_prefix(self, client_id: Optional[str]) -> PromptPrefix:
+        """Parte fixa do prompt de campanha do cliente: configuração e formato"""
+        def build() -> str:
+            config = self.client_configs.get(client_id, {})
+            prefix = "Você cria campanhas de tráfego pago.\n"
+            if config:
+                prefix += f"""
 Cliente: {config.get('name', '')}
 Público-alvo: {config.get('target_audience', 'A definir')}
 Orçamento: R$ {config.get('budget', 'A definir')}
 Plataformas: {', '.join(config.get('platforms', ['Meta Ads']))}
+Palavras-chave: {', '.join(config.get('keywords', []))}
+Interesses: {', '.join(config.get('interests', []))}
 """
-        
-        prompt += """
+            prefix += """
 Retorne no formato:
 NOME DA CAMPANHA: [nome criativo]
 OBJETIVO: [objetivo da campanha]
@@ -54,12 +56,25 @@ COPY DO ANÚNCIO: [texto do anúncio]
 CTA: [call to action]
 ORÇAMENTO SUGERIDO: [valor diário]
 """
-        
-        response = await self.process_message(prompt)
+            return prefix
+        return self.prompts.get("campaign", client_id, build)
+    
+    async def create_campaign(self, objective: str, client_id: Optional[str] = None) -> dict:
+        """Cria sugestão de campanha (contexto isolado, prefixo do cliente em cache)"""
+        prefix = self._campaign_prefix(client_id)
+        request = f"Crie uma campanha de tráfego pago com o objetivo: {objective}\n"
+        request += self._references(client_id, objective, ("ad", "document"))
+        response = await self.run_task(prefix, request)
         
         campaign = {
+            "id": f"campaign_{uuid.uuid4().hex[:12]}",
+            "type": "ad",
+            "title": objective,
             "objective": objective,
             "client_id": client_id,
+            "agent_id": self.id,
+            "agent_name": self.name,
+            "prompt_version": prefix.version,
             "content": response,
             "status": "pending_approval"
         }
@@ -4,59 +4,191 @@ Agente de atendimento via WhatsApp.
 """
 
 from .base import Agent, AgentConfig
-from typing import Optional, List, Dict
+from .intents import IntentMatcher
+from .leads import LeadStore
+from .mailbox import MailboxDispatcher
+from llm.deadline import deadline_scope, deadline_since
+from llm.scheduler import INTERACTIVE
+from typing import Optional, List, Dict, Callable
+import os
+import time
+
+# Resposta de WhatsApp depois disso já não serve para o contato
+WHATSAPP_REPLY_TIMEOUT = float(os.getenv("WHATSAPP_REPLY_TIMEOUT", "20"))
+# Contatos atendidos ao mesmo tempo por agente
+WHATSAPP_MAX_CONCURRENCY = int(os.getenv("WHATSAPP_MAX_CONCURRENCY", "64"))
+# Silêncio (s) que encerra uma rajada de mensagens do mesmo contato (0 desliga).
+# Cada valor acima de 0 soma essa espera a toda resposta, mesmo à mensagem
+# única. Com 0, uma mensagem que chega durante a geração ainda cancela e
+# junta o turno, mas a que chega logo depois já vira outra resposta.
+WHATSAPP_COALESCE_WINDOW = float(os.getenv("WHATSAPP_COALESCE_WINDOW", "0"))
+# Conversa parada há mais que isso (s) volta a receber a saudação por script
+WHATSAPP_GREETING_IDLE = float(os.getenv("WHATSAPP_GREETING_IDLE", "21600"))
 
 
 class WhatsAppAgent(Agent):
     """Agente especializado em atendimento WhatsApp"""
     
+    # Tem um contato esperando do outro lado: passa à frente dos jobs em lote
+    default_priority = INTERACTIVE
+    
     def __init__(self, **kwargs):
         super().__init__(**kwargs)
+        # Contato esperando: vale pagar uma chamada extra para cortar a cauda
+        if "config" not in kwargs:
+            self.config.hedge = True
         self.conversations: Dict[str, List[dict]] = {}  # phone -> messages
-        self.qualified_leads: List[dict] = []
+        # Um lead por telefone, com pontuação somada e índices por cliente
+        self.leads = LeadStore()
+        # Callback opcional chamado quando um lead muda (persistência, outros workers)
+        self.lead_sink: Optional[Callable[[dict], None]] = None
         self.scripts: Dict[str, str] = {
             "greeting": "Olá! 👋 Bem-vindo! Como posso ajudá-lo hoje?",
             "qualification": "Para entender melhor suas necessidades, pode me contar um pouco sobre seu negócio?",
             "closing": "Ótimo! Vou passar suas informações para nossa equipe. Entraremos em contato em breve! 🚀"
         }
+        # Saudações e FAQ respondidas por script, sem chamar o LLM
+        self.intents = IntentMatcher()
+        # Uma caixa por telefone: em ordem por contato, em paralelo entre contatos
+        # Mensagens em rajada viram um turno só; mensagem nova cancela a geração em curso
+        self.mailboxes = MailboxDispatcher(
+            self._generate_contact_reply,
+            commit=self._commit_contact_turn,
+            on_error=self._commit_contact_failure,
+            max_concurrency=WHATSAPP_MAX_CONCURRENCY,
+            name=f"whatsapp_mailboxes_{self.id}",
+            coalesce_window=WHATSAPP_COALESCE_WINDOW,
+            cancel_on_new=True
+        )
     
     async def process_message(self, message: str, phone: Optional[str] = None) -> str:
         """Processa mensagem de WhatsApp"""
         
-        # Se tiver número, salva no histórico de conversas
+        # Com número, entra na caixa do contato: ordem garantida por telefone
         if phone:
-            if phone not in self.conversations:
-                self.conversations[phone] = []
-            self.conversations[phone].append({
-                "role": "user",
-                "content": message,
-                "phone": phone
-            })
-        
-        # Verifica se é lead qualificado
-        lower_msg = message.lower()
+            # O prazo começa agora e segue com a mensagem pela caixa
+            with deadline_scope(WHATSAPP_REPLY_TIMEOUT):
+                turn = await self.mailboxes.submit(phone, message)
+            return turn["response"]
         
-        # Keywords de qualificação
-        interest_keywords = ["preço", "valor", "orçamento", "quanto custa", "contratar", "interesse"]
-        if any(kw in lower_msg for kw in interest_keywords):
-            if phone:
-                self.qualified_leads.append({
-                    "phone": phone,
-                    "message": message,
-                    "qualified": True
-                })
+        match, response = self._match_script(message, self.messages_history)
+        self.intents.record(match, answered=response is not None)
+        if response is not None:
+            # Mantém o histórico do LLM coerente para as próximas mensagens
+            self.messages_history.append({"role": "user", "content": message})
+            self.messages_history.append({"role": "assistant", "content": response})
+            return response
         
-        # Processa com IA
-        response = await super().process_message(message)
+        with deadline_scope(WHATSAPP_REPLY_TIMEOUT):
+            return await super().process_message(message)
+    
+    async def reply_to_contact(self, message: str, phone: str, received_at: Optional[float] = None) -> Optional[str]:
+        """
+        Resposta a enviar para o contato. Numa rajada agrupada todas as
+        mensagens recebem o mesmo turno: só a primeira a retomar leva a
+        resposta, as demais recebem None (a resposta sai uma vez só).
+
+        O prazo de resposta conta de `received_at` (time.time() de quando a
+        mensagem chegou; sem ele, de agora) e vai com a mensagem pela caixa.
+        """
+        with deadline_since(received_at, WHATSAPP_REPLY_TIMEOUT):
+            turn = await self.mailboxes.submit(phone, message)
+        if turn.get("claimed"):
+            return None
+        turn["claimed"] = True
+        return turn["response"]
+    
+    async def _generate_contact_reply(self, phone: str, messages: List[str]) -> dict:
+        """
+        Resposta para um turno do contato (uma mensagem ou uma rajada).
+        Não altera estado: pode ser cancelada se o contato mandar mais.
+        """
+        text = "\n".join(messages)
+        match, response = self._match_script(text, self.conversations.get(phone, []))
+        answered_by_script = response is not None
+        if response is None:
+            if self._llm_available():
+                # Contexto do próprio contato, não o histórico compartilhado do agente
+                conversation = self.conversations.get(phone, [])
+                history = [{"role": m["role"], "content": m["content"]} for m in conversation[-10:]]
+                history.append({"role": "user", "content": text})
+                # O prazo veio no contexto da mensagem, marcado quando ela chegou
+                response = await self._reply(history)
+            else:
+                response = self._generate_fallback_response(text)
+        return {"response": response, "match": match, "answered_by_script": answered_by_script}
+    
+    def _commit_contact_turn(self, phone: str, messages: List[str], turn: dict):
+        """Grava o turno concluído: mensagens, leads, resposta"""
+        self._commit_contact_messages(phone, messages)
+        self.intents.record(turn["match"], answered=turn["answered_by_script"])
         
         # Salva resposta
-        if phone:
-            self.conversations[phone].append({
-                "role": "assistant",
-                "content": response
+        self.conversations[phone].append({
+            "role": "assistant",
+            "content": turn["response"],
+            "timestamp": time.time()
+        })
+        self._record_message(phone, "assistant", turn["response"], phone=phone)
+    
+    def _commit_contact_failure(self, phone: str, messages: List[str], error: Exception):
+        """Turno sem resposta (ex.: LLMError): as mensagens do contato e os leads não se perdem"""
+        self._commit_contact_messages(phone, messages)
+    
+    def _commit_contact_messages(self, phone: str, messages: List[str]):
+        """Grava as mensagens recebidas do contato e atualiza o lead"""
+        conversation = self.conversations.setdefault(phone, [])
+        for message in messages:
+            conversation.append({
+                "role": "user",
+                "content": message,
+                "phone": phone,
+                "timestamp": time.time()
             })
-        
-        return response
+            self._record_message(phone, "user", message, phone=phone)
+            
+            # Verifica se é lead qualificado
+            lead = self.leads.record(phone, message, client_id=self.client_id, agent_id=self.id)
+            if lead and self.lead_sink:
+                self.lead_sink(lead)
+    
+    def _match_script(self, message: str, history: List[dict]):
+        """
+        (match, resposta de script/FAQ) se a intenção for clara; resposta
+        None passa para o LLM. A saudação só sai por script no começo da
+        conversa: no meio dela, "tudo bem" segue com o contexto pelo LLM.
+        """
+        match = self.intents.match(message, self.client_id)
+        response = None
+        if match and match.confidence >= self.intents.answer_threshold:
+            if match.script == "greeting" and self._has_recent_turns(history):
+                return match, None
+            response = match.answer or self.scripts.get(match.script)
+        return match, response
+    
+    @staticmethod
+    def _has_recent_turns(history: List[dict]) -> bool:
+        """Última mensagem do histórico há menos de WHATSAPP_GREETING_IDLE (sem horário conta como recente)"""
+        if not history:
+            return False
+        last = history[-1].get("timestamp")
+        return last is None or time.time() - last < WHATSAPP_GREETING_IDLE
+    
+    def add_faq(self, question: str, answer: str, keywords: Optional[List[str]] = None, faq_id: Optional[str] = None) -> dict:
+        """Adiciona pergunta frequente do cliente do agente"""
+        return self.intents.add_faq(self.client_id, question, answer, keywords, faq_id)
+    
+    def remove_faq(self, faq_id: str) -> bool:
+        return self.intents.remove_faq(self.client_id, faq_id)
+    
+    def get_faq(self) -> List[dict]:
+        return self.intents.list_faq(self.client_id)
+    
+    def to_dict(self) -> dict:
+        data = super().to_dict()
+        data["scripts"] = self.scripts
+        data["faq"] = self.get_faq()
+        return data
     
     def get_conversation(self, phone: str) -> List[dict]:
         """Retorna histórico de conversa com um número"""
@@ -66,9 +198,16 @@ class WhatsAppAgent(Agent):
         """Retorna todas as conversas"""
         return self.conversations
     
-    def get_qualified_leads(self) -> List[dict]:
-        """Retorna leads qualificados"""
-        return self.qualified_leads
+    def get_qualified_leads(
+        self,
+        client_id: Optional[str] = None,
+        min_score: float = 0.0,
+        order: str = "score",
+        offset: int = 0,
+        limit: int = 50
+    ) -> dict:
+        """Retorna uma página de leads qualificados"""
+        return self.leads.query(client_id, min_score, order, offset, limit)
     
     def set_script(self, script_type: str, content: str):
         """Define um script de atendimento"""
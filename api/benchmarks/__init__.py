@@ -0,0 +1,4 @@
+"""
+Benchmarks Module
+Harness de carga da API com servidores stub locais (OpenAI e Replicate).
+"""
@@ -0,0 +1,435 @@
+"""
+Load Test
+Sobe a API contra os stubs locais de OpenAI/Replicate, gera uma mistura
+realista de tráfego e mede throughput, latências, lag do event loop e
+crescimento de memória.
+
+Uso (a partir de api/):
+    python -m benchmarks.loadtest --duration 30 --concurrency 50
+    python -m benchmarks.loadtest --baseline benchmarks/baseline.json
+    python -m benchmarks.loadtest --write-baseline benchmarks/baseline.json
+
+Com --baseline, termina com código 1 se algum cenário regredir além da
+tolerância (útil no CI). Compare com os mesmos parâmetros usados para
+gravar o baseline (concurrency e config no arquivo), ex.:
+    python -m benchmarks.loadtest --duration 60 --concurrency 20 --baseline benchmarks/baseline.json
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Dict, List, Optional
+
+import httpx
+
+
+API_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+DEFAULT_MIX = "chat=0.35,whatsapp=0.4,flow=0.2,image=0.05"
+
+WHATSAPP_MESSAGES = [
+    "oi", "bom dia", "quanto custa o plano mensal?", "vocês fazem tráfego pago?",
+    "queria saber o preço", "tenho uma loja de roupas e quero vender mais",
+    "qual o horário de atendimento?", "obrigado!"
+]
+
+CHAT_MESSAGES = [
+    "Crie uma legenda para o lançamento da coleção de verão",
+    "Sugira 5 hashtags para uma padaria artesanal",
+    "Analise uma campanha com CTR de 0.8% e CPC de R$ 4,50",
+    "Monte um calendário de posts para a semana do consumidor"
+]
+
+
+# ============== Processos ==============
+
+def start_process(args: List[str], env: dict, log_path: str) -> subprocess.Popen:
+    log = open(log_path, "w")
+    return subprocess.Popen(args, cwd=API_DIR, env=env, stdout=log, stderr=subprocess.STDOUT)
+
+
+async def wait_ready(url: str, timeout: float = 30.0):
+    deadline = time.time() + timeout
+    async with httpx.AsyncClient() as client:
+        while time.time() < deadline:
+            try:
+                await client.get(url, timeout=1.0)
+                return
+            except httpx.HTTPError:
+                await asyncio.sleep(0.2)
+    raise RuntimeError(f"Serviço não respondeu: {url}")
+
+
+# ============== Métricas do servidor ==============
+
+def parse_metrics(text: str) -> Dict[str, float]:
+    """Lê amostras do formato texto do Prometheus (nome{labels} -> valor)"""
+    samples = {}
+    for line in text.splitlines():
+        if not line or line.startswith("#"):
+            continue
+        name, _, value = line.rpartition(" ")
+        try:
+            samples[name] = float(value.replace("+Inf", "inf"))
+        except ValueError:
+            continue
+    return samples
+
+
+def histogram_quantile(samples: Dict[str, float], before: Dict[str, float], name: str, q: float) -> Optional[float]:
+    """
+    Quantil aproximado a partir dos buckets (diferença entre dois scrapes).
+    None se não houver buckets ou se o quantil cair acima do maior limite finito.
+    """
+    buckets = []
+    for key, value in samples.items():
+        if key.startswith(f"{name}_bucket") and 'le="' in key:
+            bound = key.split('le="')[1].split('"')[0]
+            bound = float("inf") if bound == "+Inf" else float(bound)
+            buckets.append((bound, value - before.get(key, 0)))
+    if not buckets:
+        return None
+
+    buckets.sort()
+    total = buckets[-1][1]
+    if total <= 0:
+        return 0.0
+    for bound, count in buckets:
+        if count >= q * total:
+            return bound if bound != float("inf") else None
+    return None
+
+
+# ============== Cenários ==============
+
+class LoadTest:
+    """Executa os cenários e coleta latências por tipo de tráfego"""
+
+    def __init__(self, base_url: str, mix: Dict[str, float], concurrency: int):
+        self.base_url = base_url
+        self.mix = mix
+        self.concurrency = concurrency
+        self.latencies: Dict[str, List[float]] = {name: [] for name in mix}
+        self.errors: Dict[str, int] = {name: 0 for name in mix}
+        self.flow_id: Optional[str] = None
+        self.recording = False
+
+    async def setup(self, client: httpx.AsyncClient):
+        """Cria o fluxo usado no cenário 'flow'"""
+        response = await client.post("/api/flows", json={
+            "name": "Benchmark",
+            "description": "Fluxo de atendimento usado no load test",
+            "agent_id": "whatsapp",
+            "nodes": [
+                {"id": "start", "type": "trigger", "data": {}},
+                {"id": "check", "type": "condition", "data": {"condition": "contains", "value": "preço"}},
+                {"id": "agent", "type": "agent", "data": {"agent_id": "whatsapp"}},
+                {"id": "tag", "type": "tag", "data": {"tag": "lead"}},
+                {"id": "end", "type": "end", "data": {}}
+            ],
+            "edges": [
+                {"id": "e1", "source": "start", "target": "check"},
+                {"id": "e2", "source": "check", "target": "agent", "sourceHandle": "true"},
+                {"id": "e3", "source": "check", "target": "end", "sourceHandle": "false"},
+                {"id": "e4", "source": "agent", "target": "tag", "sourceHandle": "response"},
+                {"id": "e5", "source": "tag", "target": "end"}
+            ]
+        })
+        response.raise_for_status()
+        self.flow_id = response.json()["id"]
+
+    async def _chat(self, client: httpx.AsyncClient):
+        agent_id = random.choice(["social", "traffic", "manager"])
+        return await client.post(f"/api/agents/{agent_id}/chat", json={"content": random.choice(CHAT_MESSAGES)})
+
+    async def _whatsapp(self, client: httpx.AsyncClient):
+        phone = f"55119{random.randint(0, 9999):04d}0000"
+        return await client.post("/api/agents/whatsapp/chat", json={
+            "content": random.choice(WHATSAPP_MESSAGES),
+            "phone": phone
+        })
+
+    async def _flow(self, client: httpx.AsyncClient):
+        return await client.post(f"/api/flows/{self.flow_id}/run", json={
+            "message": random.choice(WHATSAPP_MESSAGES),
+            "phone": f"55119{random.randint(0, 9999):04d}0000"
+        })
+
+    async def _image(self, client: httpx.AsyncClient):
+        return await client.post("/api/images/generate", json={
+            "prompt": "Café artesanal em mesa de madeira, luz natural",
+            "style": "realistic",
+            "client_id": f"client_{random.randint(1, 20)}"
+        })
+
+    async def _worker(self, client: httpx.AsyncClient, stop_at: float):
+        scenarios = list(self.mix)
+        weights = [self.mix[s] for s in scenarios]
+        handlers = {
+            "chat": self._chat,
+            "whatsapp": self._whatsapp,
+            "flow": self._flow,
+            "image": self._image
+        }
+
+        while time.time() < stop_at:
+            scenario = random.choices(scenarios, weights)[0]
+            start = time.perf_counter()
+            try:
+                response = await handlers[scenario](client)
+                ok = response.status_code < 400
+            except httpx.HTTPError:
+                ok = False
+            elapsed = time.perf_counter() - start
+
+            if not self.recording:
+                continue
+            if ok:
+                self.latencies[scenario].append(elapsed)
+            else:
+                self.errors[scenario] += 1
+
+    async def run(self, duration: float, warmup: float) -> dict:
+        limits = httpx.Limits(max_connections=self.concurrency, max_keepalive_connections=self.concurrency)
+        async with httpx.AsyncClient(base_url=self.base_url, timeout=120.0, limits=limits) as client:
+            await self.setup(client)
+
+            stop_at = time.time() + warmup + duration
+            workers = [asyncio.create_task(self._worker(client, stop_at)) for _ in range(self.concurrency)]
+
+            await asyncio.sleep(warmup)
+            self.recording = True
+            started = time.perf_counter()
+            metrics_before = parse_metrics((await client.get("/metrics")).text)
+
+            await asyncio.gather(*workers)
+            elapsed = time.perf_counter() - started
+            metrics_after = parse_metrics((await client.get("/metrics")).text)
+
+        return self._report(elapsed, metrics_before, metrics_after)
+
+    def _report(self, elapsed: float, before: Dict[str, float], after: Dict[str, float]) -> dict:
+        scenarios = {}
+        total = 0
+        for name, values in self.latencies.items():
+            values.sort()
+            total += len(values)
+            scenarios[name] = {
+                "requests": len(values),
+                "errors": self.errors[name],
+                "throughput_rps": round(len(values) / elapsed, 2) if elapsed else 0,
+                "p50_ms": round(percentile(values, 0.50) * 1000, 1),
+                "p95_ms": round(percentile(values, 0.95) * 1000, 1),
+                "p99_ms": round(percentile(values, 0.99) * 1000, 1)
+            }
+
+        lag_name = "agencyzen_event_loop_lag_seconds"
+        lag_count = after.get(f"{lag_name}_count", 0) - before.get(f"{lag_name}_count", 0)
+        lag_sum = after.get(f"{lag_name}_sum", 0) - before.get(f"{lag_name}_sum", 0)
+        lag_p99 = histogram_quantile(after, before, lag_name, 0.99)
+
+        memory_name = "agencyzen_process_resident_memory_bytes"
+        memory_before = before.get(memory_name, 0)
+        memory_after = after.get(memory_name, 0)
+
+        return {
+            "duration_s": round(elapsed, 1),
+            "concurrency": self.concurrency,
+            "total_requests": total,
+            "throughput_rps": round(total / elapsed, 2) if elapsed else 0,
+            "scenarios": scenarios,
+            "event_loop_lag": {
+                "mean_ms": round(lag_sum / lag_count * 1000, 2) if lag_count else None,
+                "p99_ms_upper_bound": round(lag_p99 * 1000, 2) if lag_p99 is not None else None
+            },
+            "memory": {
+                "rss_start_mb": round(memory_before / 1e6, 1),
+                "rss_end_mb": round(memory_after / 1e6, 1),
+                "growth_mb": round((memory_after - memory_before) / 1e6, 1)
+            }
+        }
+
+
+def percentile(values: List[float], q: float) -> float:
+    if not values:
+        return 0.0
+    index = min(len(values) - 1, int(round(q * (len(values) - 1))))
+    return values[index]
+
+
+def parse_mix(spec: str) -> Dict[str, float]:
+    mix = {}
+    for part in spec.split(","):
+        name, _, weight = part.partition("=")
+        if float(weight) > 0:
+            mix[name.strip()] = float(weight)
+    return mix
+
+
+# ============== Baseline ==============
+
+# Folga absoluta no p95: em cenários de poucos ms, 20% é ruído de CPU
+LATENCY_SLACK_MS = 50.0
+# Folga absoluta no crescimento do RSS: caches (conversas, posts) ainda enchendo
+# variam dezenas de MB entre execuções; vazamento passa bem disso
+MEMORY_SLACK_MB = 32.0
+
+
+def compare_with_baseline(report: dict, baseline: dict, tolerance: float) -> List[str]:
+    """Lista regressões: p95 acima ou throughput abaixo da tolerância"""
+    regressions = []
+    for name, current in report["scenarios"].items():
+        reference = baseline.get("scenarios", {}).get(name)
+        if not reference or not current["requests"]:
+            continue
+        if reference["p95_ms"] and current["p95_ms"] > reference["p95_ms"] * (1 + tolerance) + LATENCY_SLACK_MS:
+            regressions.append(f"{name}: p95 {current['p95_ms']}ms > baseline {reference['p95_ms']}ms")
+        if reference["throughput_rps"] and current["throughput_rps"] < reference["throughput_rps"] * (1 - tolerance):
+            regressions.append(
+                f"{name}: throughput {current['throughput_rps']}rps < baseline {reference['throughput_rps']}rps"
+            )
+
+    ref_lag = baseline.get("event_loop_lag", {}).get("p99_ms_upper_bound")
+    cur_lag = report["event_loop_lag"]["p99_ms_upper_bound"]
+    if ref_lag and cur_lag and cur_lag > ref_lag * (1 + tolerance):
+        regressions.append(f"event loop lag p99 {cur_lag}ms > baseline {ref_lag}ms")
+
+    ref_growth = baseline.get("memory", {}).get("growth_mb")
+    cur_growth = report["memory"]["growth_mb"]
+    if ref_growth is not None and cur_growth > max(ref_growth, 1) * (1 + tolerance) + MEMORY_SLACK_MB:
+        regressions.append(f"memory growth {cur_growth}MB > baseline {ref_growth}MB")
+
+    return regressions
+
+
+def print_report(report: dict):
+    print(f"\n📊 {report['total_requests']} requisições em {report['duration_s']}s "
+          f"({report['throughput_rps']} req/s, concorrência {report['concurrency']})\n")
+    print(f"{'cenário':<10} {'req':>7} {'erros':>6} {'req/s':>8} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}")
+    for name, s in report["scenarios"].items():
+        print(f"{name:<10} {s['requests']:>7} {s['errors']:>6} {s['throughput_rps']:>8} "
+              f"{s['p50_ms']:>9} {s['p95_ms']:>9} {s['p99_ms']:>9}")
+    lag = report["event_loop_lag"]
+    memory = report["memory"]
+    print(f"\nlag do event loop: média {lag['mean_ms']} ms, p99 ≤ {lag['p99_ms_upper_bound']} ms")
+    print(f"memória: {memory['rss_start_mb']} → {memory['rss_end_mb']} MB ({memory['growth_mb']:+} MB)")
+
+
+# ============== Main ==============
+
+async def run(args) -> dict:
+    tmpdir = tempfile.mkdtemp(prefix="agencyzen_bench_")
+    env = {
+        **os.environ,
+        "OPENAI_API_KEY": "stub",
+        "OPENAI_BASE_URL": f"http://127.0.0.1:{args.openai_port}/v1",
+        "REPLICATE_API_TOKEN": "stub",
+        "REPLICATE_API_BASE": f"http://127.0.0.1:{args.replicate_port}/v1",
+        "AGENCYZEN_DB": os.path.join(tmpdir, "bench.db"),
+        "AGENCYZEN_STATE_DB": os.path.join(tmpdir, "bench_state.db"),
+        "API_WORKERS": str(args.workers),
+        "LLM_TOKENS_PER_MINUTE": str(args.llm_tokens_per_minute)
+    }
+
+    processes = [
+        start_process([
+            sys.executable, "-m", "benchmarks.stub_servers", "--service", "openai",
+            "--port", str(args.openai_port), "--latency", args.llm_latency,
+            "--rate-limit-ratio", str(args.rate_limit_ratio)
+        ], env, os.path.join(tmpdir, "openai_stub.log")),
+        start_process([
+            sys.executable, "-m", "benchmarks.stub_servers", "--service", "replicate",
+            "--port", str(args.replicate_port), "--latency", args.image_latency
+        ], env, os.path.join(tmpdir, "replicate_stub.log")),
+        start_process([
+            sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1",
+            "--port", str(args.api_port), "--workers", str(args.workers), "--log-level", "warning"
+        ], env, os.path.join(tmpdir, "api.log"))
+    ]
+
+    try:
+        await wait_ready(f"http://127.0.0.1:{args.openai_port}/docs")
+        await wait_ready(f"http://127.0.0.1:{args.replicate_port}/docs")
+        await wait_ready(f"http://127.0.0.1:{args.api_port}/")
+
+        # Mesma sequência de cenários a cada execução: a vazão por cenário não varia com o sorteio
+        random.seed(args.seed)
+        test = LoadTest(f"http://127.0.0.1:{args.api_port}", parse_mix(args.mix), args.concurrency)
+        report = await test.run(args.duration, args.warmup)
+        report["config"] = {
+            "mix": args.mix,
+            "llm_latency": args.llm_latency,
+            "image_latency": args.image_latency,
+            "llm_tokens_per_minute": args.llm_tokens_per_minute,
+            "seed": args.seed,
+            "workers": args.workers
+        }
+        print(f"(logs em {tmpdir})")
+        return report
+    finally:
+        for process in processes:
+            process.terminate()
+        for process in processes:
+            try:
+                process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                process.kill()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test da API AgencyZen")
+    parser.add_argument("--duration", type=float, default=30.0)
+    parser.add_argument("--warmup", type=float, default=3.0)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--mix", default=DEFAULT_MIX, help="Pesos dos cenários: chat,whatsapp,flow,image")
+    parser.add_argument("--llm-latency", default="lognormal:0.8,0.5")
+    parser.add_argument("--image-latency", default="uniform:1,3")
+    parser.add_argument("--rate-limit-ratio", type=float, default=0.0)
+    # Os stubs não têm cota: com a cota real o teste mede só a fila do scheduler
+    parser.add_argument("--llm-tokens-per-minute", type=int, default=10_000_000)
+    parser.add_argument("--api-port", type=int, default=8100)
+    parser.add_argument("--openai-port", type=int, default=9100)
+    parser.add_argument("--replicate-port", type=int, default=9200)
+    parser.add_argument("--output", help="Salva o relatório em JSON")
+    parser.add_argument("--baseline", help="Compara com baseline e falha em regressão")
+    parser.add_argument("--write-baseline", help="Grava o relatório como novo baseline")
+    parser.add_argument("--tolerance", type=float, default=0.2)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    report = asyncio.run(run(args))
+    print_report(report)
+
+    # allow_nan=False: Infinity/NaN não são JSON válido
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2, allow_nan=False)
+
+    if args.write_baseline:
+        with open(args.write_baseline, "w") as f:
+            json.dump(report, f, indent=2, allow_nan=False)
+        print(f"\n💾 Baseline gravado em {args.write_baseline}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if baseline.get("concurrency", args.concurrency) != args.concurrency:
+            print(f"\n⚠️ Baseline gravado com concorrência {baseline['concurrency']}: a comparação não vale")
+        regressions = compare_with_baseline(report, baseline, args.tolerance)
+        if regressions:
+            print("\n❌ Regressões em relação ao baseline:")
+            for regression in regressions:
+                print(f"   - {regression}")
+            sys.exit(1)
+        print("\n✅ Sem regressões em relação ao baseline")
+
+
+if __name__ == "__main__":
+    main()
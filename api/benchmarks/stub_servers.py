@@ -0,0 +1,156 @@
+"""
+Stub Servers
+Servidores locais que imitam a API de chat completions da OpenAI e a API
+de predições do Replicate, com latência configurável.
+
+Uso:
+    python -m benchmarks.stub_servers --service openai --port 9100 --latency lognormal:0.8,0.5
+    python -m benchmarks.stub_servers --service replicate --port 9200 --latency uniform:2,6
+
+Distribuições de latência (segundos):
+    fixed:S            sempre S
+    uniform:A,B        uniforme entre A e B
+    lognormal:MED,SIG  lognormal com mediana MED e sigma SIG
+"""
+
+import argparse
+import asyncio
+import math
+import random
+import time
+import uuid
+from typing import Callable
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+
+
+def parse_latency(spec: str) -> Callable[[], float]:
+    """Converte a especificação de latência numa função de amostragem"""
+    kind, _, params = spec.partition(":")
+    values = [float(v) for v in params.split(",") if v]
+
+    if kind == "fixed":
+        return lambda: values[0]
+    if kind == "uniform":
+        low, high = values
+        return lambda: random.uniform(low, high)
+    if kind == "lognormal":
+        median, sigma = values
+        mu = math.log(median)
+        return lambda: random.lognormvariate(mu, sigma)
+    raise ValueError(f"Distribuição de latência desconhecida: {spec}")
+
+
+def create_openai_stub(latency: Callable[[], float], rate_limit_ratio: float = 0.0) -> FastAPI:
+    """App que responde /v1/chat/completions como a OpenAI"""
+    app = FastAPI(title="OpenAI stub")
+
+    @app.post("/v1/chat/completions")
+    async def chat_completions(request: Request):
+        body = await request.json()
+
+        if rate_limit_ratio and random.random() < rate_limit_ratio:
+            return JSONResponse(
+                status_code=429,
+                headers={
+                    "retry-after": "1",
+                    "x-ratelimit-remaining-requests": "0",
+                    "x-ratelimit-reset-requests": "1s"
+                },
+                content={"error": {"message": "Rate limit reached", "type": "requests", "code": "rate_limit_exceeded"}}
+            )
+
+        await asyncio.sleep(latency())
+
+        prompt_tokens = sum(len(str(m.get("content", ""))) for m in body.get("messages", [])) // 4
+        max_tokens = body.get("max_tokens") or 256
+        completion_tokens = random.randint(max(1, max_tokens // 8), max(1, max_tokens // 2))
+        content = "Resposta simulada do stub. " * max(1, completion_tokens // 6)
+
+        return {
+            "id": f"chatcmpl-{uuid.uuid4().hex}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body.get("model", "stub"),
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": content.strip()},
+                "finish_reason": "stop"
+            }],
+            "usage": {
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": completion_tokens,
+                "total_tokens": prompt_tokens + completion_tokens
+            }
+        }
+
+    return app
+
+
+def create_replicate_stub(latency: Callable[[], float]) -> FastAPI:
+    """App que imita criação e polling de predições do Replicate"""
+    app = FastAPI(title="Replicate stub")
+    predictions = {}
+
+    def _create(body: dict) -> JSONResponse:
+        prediction_id = uuid.uuid4().hex
+        predictions[prediction_id] = {
+            "ready_at": time.time() + latency(),
+            "num_outputs": body.get("input", {}).get("num_outputs", 1)
+        }
+        return JSONResponse(status_code=201, content={"id": prediction_id, "status": "starting"})
+
+    @app.post("/v1/models/{owner}/{name}/predictions")
+    async def create_model_prediction(owner: str, name: str, request: Request):
+        return _create(await request.json())
+
+    @app.post("/v1/predictions")
+    async def create_prediction(request: Request):
+        return _create(await request.json())
+
+    @app.get("/v1/predictions/{prediction_id}")
+    async def get_prediction(prediction_id: str):
+        prediction = predictions.get(prediction_id)
+        if not prediction:
+            return JSONResponse(status_code=404, content={"detail": "Not found"})
+
+        if time.time() < prediction["ready_at"]:
+            return {"id": prediction_id, "status": "processing"}
+
+        predictions.pop(prediction_id, None)
+        return {
+            "id": prediction_id,
+            "status": "succeeded",
+            "output": [
+                f"https://stub.local/images/{prediction_id}_{i}.png"
+                for i in range(prediction["num_outputs"])
+            ]
+        }
+
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Servidores stub para benchmarks")
+    parser.add_argument("--service", choices=["openai", "replicate"], required=True)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, required=True)
+    parser.add_argument("--latency", default="lognormal:0.8,0.5")
+    parser.add_argument("--rate-limit-ratio", type=float, default=0.0,
+                        help="Fração de chamadas que recebem 429 (só openai)")
+    args = parser.parse_args()
+
+    import uvicorn
+
+    latency = parse_latency(args.latency)
+    if args.service == "openai":
+        app = create_openai_stub(latency, args.rate_limit_ratio)
+    else:
+        app = create_replicate_stub(latency)
+
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
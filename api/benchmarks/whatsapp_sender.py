@@ -0,0 +1,101 @@
+"""
+WhatsApp Sender
+Remetente local que faz o papel do provedor: entrega mensagens no webhook
+da API em lotes, com reentregas (ids repetidos) e respeitando o 503 de
+fila cheia (espera o Retry-After e reentrega o lote).
+
+Uso (a partir de api/, com a API rodando):
+    python -m benchmarks.whatsapp_sender --url http://127.0.0.1:8000 --messages 5000 --contacts 500
+    python -m benchmarks.whatsapp_sender --messages 20000 --rate 2000 --redelivery-ratio 0.1
+
+No fim compara o que foi aceito com o número de mensagens únicas: nada
+pode faltar nem sobrar.
+"""
+
+import argparse
+import asyncio
+import random
+import time
+import uuid
+from typing import List
+
+import httpx
+
+from .loadtest import WHATSAPP_MESSAGES
+
+
+def build_messages(count: int, contacts: int) -> List[dict]:
+    phones = [f"5511{9000000 + i:07d}" for i in range(contacts)]
+    return [
+        {
+            "id": f"wamid.{uuid.uuid4().hex}",
+            "from": random.choice(phones),
+            "content": random.choice(WHATSAPP_MESSAGES)
+        }
+        for _ in range(count)
+    ]
+
+
+async def deliver(client: httpx.AsyncClient, url: str, batch: List[dict], totals: dict):
+    """Entrega o lote até ser aceito (como um provedor faria)"""
+    while True:
+        response = await client.post(f"{url}/api/whatsapp/webhook", json={"messages": batch})
+        if response.status_code == 503:
+            totals["backpressure"] += 1
+            await asyncio.sleep(float(response.headers.get("retry-after", "1")))
+            continue
+        response.raise_for_status()
+        result = response.json()
+        totals["accepted"] += result["accepted"]
+        totals["duplicate"] += result["duplicate"]
+        return
+
+
+async def run(args) -> dict:
+    messages = build_messages(args.messages, args.contacts)
+    totals = {"accepted": 0, "duplicate": 0, "backpressure": 0, "redelivered": 0}
+
+    async with httpx.AsyncClient(timeout=30.0) as client:
+        start = time.perf_counter()
+        interval = args.batch_size / args.rate if args.rate else 0.0
+        for i in range(0, len(messages), args.batch_size):
+            batch = messages[i:i + args.batch_size]
+            # Reentrega de mensagens já enviadas (o provedor não recebeu o 200)
+            sent = messages[:i]
+            extra = [m for m in sent if random.random() < args.redelivery_ratio][:args.batch_size]
+            totals["redelivered"] += len(extra)
+            await deliver(client, args.url, batch + extra, totals)
+            if interval:
+                await asyncio.sleep(interval)
+        elapsed = time.perf_counter() - start
+
+        stats = (await client.get(f"{args.url}/api/whatsapp/inbound")).json()
+
+    return {
+        "messages": len(messages),
+        "elapsed_s": round(elapsed, 2),
+        "rate_msgs_s": round(len(messages) / elapsed, 1) if elapsed else None,
+        **totals,
+        "missing": len(messages) - totals["accepted"],
+        "pipeline": stats
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Remetente local para o webhook de WhatsApp")
+    parser.add_argument("--url", default="http://127.0.0.1:8000")
+    parser.add_argument("--messages", type=int, default=1000)
+    parser.add_argument("--contacts", type=int, default=100)
+    parser.add_argument("--batch-size", type=int, default=50)
+    parser.add_argument("--rate", type=float, default=0.0, help="Mensagens por segundo (0 = sem limite)")
+    parser.add_argument("--redelivery-ratio", type=float, default=0.0,
+                        help="Chance de cada mensagem já enviada ser reentregue em cada lote")
+    args = parser.parse_args()
+
+    report = asyncio.run(run(args))
+    for key, value in report.items():
+        print(f"{key:>14}: {value}")
+
+
+if __name__ == "__main__":
+    main()
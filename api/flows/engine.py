@@ -6,6 +6,11 @@ Motor de execução de fluxos (estilo n8n/EvoAI).
 from typing import List, Dict, Any, Optional, Callable
 from datetime import datetime
 import asyncio
+import time
+
+from metrics.registry import FLOW_STEP_DURATION
+from llm.deadline import check_deadline, time_remaining
+from llm.errors import DeadlineExceededError
 
 
 class FlowNode:
@@ -257,7 +262,7 @@ class FlowEngine:
             
             # Executa começando pelo trigger
             current_node = trigger_node
-            context = {"input": trigger_data, "variables": {}}
+            context = {"input": trigger_data, "variables": {}, "flow_id": flow_id}
             
             while current_node:
                 result = await self._execute_node(current_node, context)
@@ -319,7 +324,18 @@ class FlowEngine:
         }
         
         handler = handlers.get(node.type, self._handle_default)
-        return await handler(node, context)
+        # Nenhum nó começa depois do prazo de quem disparou o fluxo
+        check_deadline(f"nó {node.id} ({node.type})")
+        start = time.perf_counter()
+        try:
+            return await handler(node, context)
+        finally:
+            FLOW_STEP_DURATION.observe(
+                time.perf_counter() - start,
+                flow_id=context.get("flow_id"),
+                node_type=node.type,
+                agent_id=node.data.get("agent_id")
+            )
     
     async def _handle_trigger(self, node: FlowNode, context: dict) -> dict:
         """Processa nó trigger"""
@@ -373,6 +389,9 @@ class FlowEngine:
     async def _handle_delay(self, node: FlowNode, context: dict) -> dict:
         """Processa nó de delay"""
         seconds = node.data.get("seconds", 1)
+        remaining = time_remaining()
+        if remaining is not None and seconds > remaining:
+            raise DeadlineExceededError(f"Delay de {seconds}s passa do prazo (restam {remaining:.1f}s)")
         await asyncio.sleep(seconds)
         return {"output": context.get("input", {}), "next_handle": "next"}
     
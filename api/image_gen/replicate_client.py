@@ -8,6 +8,10 @@ import os
 from typing import Optional
 import httpx
 import asyncio
+import time
+
+from metrics.registry import IMAGE_GENERATION_DURATION
+from usage.tracker import usage_tracker, BudgetExceededError
 
 
 class ImageGenerator:
@@ -30,7 +34,7 @@ class ImageGenerator:
     
     def __init__(self, api_token: Optional[str] = None):
         self.api_token = api_token or os.getenv("REPLICATE_API_TOKEN")
-        self.base_url = "https://api.replicate.com/v1"
+        self.base_url = os.getenv("REPLICATE_API_BASE", "https://api.replicate.com/v1")
         
     async def generate(
         self,
@@ -39,7 +43,8 @@ class ImageGenerator:
         style: Optional[str] = None,
         width: int = 1024,
         height: int = 1024,
-        num_outputs: int = 1
+        num_outputs: int = 1,
+        client_id: Optional[str] = None
     ) -> dict:
         """
         Gera imagem a partir de prompt.
@@ -51,10 +56,39 @@ class ImageGenerator:
             width: Largura
             height: Altura
             num_outputs: Número de imagens
+            client_id: Cliente (para métricas)
             
         Returns:
             Dict com URL da imagem gerada
         """
+        unit_price = self.get_price(model)
+        try:
+            usage_tracker.check_image_budget(client_id, unit_price * num_outputs)
+        except BudgetExceededError as e:
+            return {"success": False, "error": str(e), "budget_exceeded": True}
+        
+        start = time.perf_counter()
+        result = await self._generate(prompt, model, style, width, height, num_outputs)
+        IMAGE_GENERATION_DURATION.observe(
+            time.perf_counter() - start,
+            client_id=client_id,
+            model=model,
+            outcome="success" if result.get("success") else "error"
+        )
+        if result.get("success"):
+            usage_tracker.record_image(client_id, model, len(result["images"]), unit_price)
+        return result
+    
+    async def _generate(
+        self,
+        prompt: str,
+        model: str,
+        style: Optional[str],
+        width: int,
+        height: int,
+        num_outputs: int
+    ) -> dict:
+        """Cria a predição no Replicate e aguarda o resultado"""
         if not self.api_token:
             return {
                 "success": False,
@@ -212,6 +246,13 @@ class ImageGenerator:
             height=628  # Formato recomendado para ads
         )
     
+    def get_price(self, model: str) -> float:
+        """Preço por imagem em USD, lido de get_available_models"""
+        for info in self.get_available_models():
+            if info["id"] == model:
+                return float(info["price"].lstrip("$").split("/")[0])
+        return 0.0
+    
     def get_available_models(self) -> list:
         """Retorna modelos disponíveis"""
         return [
@@ -0,0 +1,7 @@
+"""
+Jobs Module
+"""
+
+from .manager import Job, JobManager, JobQueueFullError
+
+__all__ = ["Job", "JobManager", "JobQueueFullError"]
@@ -0,0 +1,246 @@
+"""
+Job Manager
+Execução em segundo plano de operações demoradas dos agentes
+(criação de posts, campanhas, análise de métricas).
+
+- submit() retorna na hora com o id do job
+- um pool limitado de workers consome a fila por prioridade
+- jobs podem ser cancelados (na fila ou rodando)
+- resultados ficam disponíveis até expirar o TTL
+"""
+
+import asyncio
+import itertools
+import time
+import uuid
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from metrics.registry import QUEUE_DEPTH, registry
+
+
+JOB_DURATION = registry.histogram(
+    "agencyzen_job_duration_seconds",
+    "Duração dos jobs em segundo plano",
+    ("type", "status")
+)
+
+JobHandler = Callable[[dict], Awaitable[Any]]
+
+
+class JobQueueFullError(Exception):
+    """Fila de jobs cheia"""
+
+
+class Job:
+    """Um job em segundo plano"""
+
+    def __init__(
+        self,
+        type: str,
+        params: dict,
+        priority: int = 5,
+        client_id: Optional[str] = None,
+        ttl: float = 3600.0
+    ):
+        self.id = f"job_{uuid.uuid4().hex[:16]}"
+        self.type = type
+        self.params = params
+        self.priority = priority
+        self.client_id = client_id
+        self.ttl = ttl
+        self.status = "queued"
+        self.result: Any = None
+        self.error: Optional[str] = None
+        self.created_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.task: Optional[asyncio.Task] = None
+        self.cancel_requested = False
+
+    @property
+    def done(self) -> bool:
+        return self.status in ("succeeded", "failed", "cancelled")
+
+    def expired(self, now: float) -> bool:
+        return self.done and now - (self.finished_at or now) > self.ttl
+
+    def to_dict(self) -> dict:
+        return {
+            "id": self.id,
+            "type": self.type,
+            "params": self.params,
+            "priority": self.priority,
+            "client_id": self.client_id,
+            "status": self.status,
+            "result": self.result,
+            "error": self.error,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at
+        }
+
+
+class JobManager:
+    """
+    Fila de prioridade + pool de workers.
+
+    Prioridade menor roda primeiro (0 = mais urgente). Empates saem
+    na ordem de chegada.
+
+    Uso:
+        jobs = JobManager(concurrency=4)
+        jobs.register("social.create_post", handler)
+        await jobs.start()
+        job = jobs.submit("social.create_post", {"topic": "..."})
+    """
+
+    def __init__(
+        self,
+        concurrency: int = 4,
+        max_queued: int = 1000,
+        default_ttl: float = 3600.0,
+        cleanup_interval: float = 60.0
+    ):
+        self.concurrency = concurrency
+        self.max_queued = max_queued
+        self.default_ttl = default_ttl
+        self.cleanup_interval = cleanup_interval
+
+        self.handlers: Dict[str, JobHandler] = {}
+        self.jobs: Dict[str, Job] = {}
+        # Callback assíncrono chamado a cada mudança de status
+        self.on_update: Optional[Callable[[Job], Awaitable[None]]] = None
+        # Callback assíncrono chamado quando o resultado expira
+        self.on_expire: Optional[Callable[[Job], Awaitable[None]]] = None
+
+        self._queue: Optional[asyncio.PriorityQueue] = None
+        self._sequence = itertools.count()
+        self._workers: List[asyncio.Task] = []
+        self._cleanup_task: Optional[asyncio.Task] = None
+        self._queued = 0
+
+    def register(self, job_type: str, handler: JobHandler):
+        """Registra handler para um tipo de job"""
+        self.handlers[job_type] = handler
+
+    async def start(self):
+        self._queue = asyncio.PriorityQueue()
+        self._workers = [asyncio.create_task(self._worker()) for _ in range(self.concurrency)]
+        self._cleanup_task = asyncio.create_task(self._cleanup_loop())
+
+    async def stop(self):
+        tasks = self._workers + ([self._cleanup_task] if self._cleanup_task else [])
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._workers = []
+        self._cleanup_task = None
+
+    def submit(
+        self,
+        job_type: str,
+        params: dict,
+        priority: int = 5,
+        client_id: Optional[str] = None,
+        ttl: Optional[float] = None
+    ) -> Job:
+        """Enfileira um job e retorna na hora"""
+        if job_type not in self.handlers:
+            raise ValueError(f"Tipo de job desconhecido: {job_type}")
+        if self._queued >= self.max_queued:
+            raise JobQueueFullError(f"Fila de jobs cheia ({self.max_queued})")
+
+        job = Job(job_type, params, priority, client_id, ttl or self.default_ttl)
+        self.jobs[job.id] = job
+        self._queued += 1
+        self._queue.put_nowait((priority, next(self._sequence), job.id))
+        QUEUE_DEPTH.set(self._queued, queue="jobs")
+        self._notify(job)
+        return job
+
+    def get(self, job_id: str) -> Optional[Job]:
+        return self.jobs.get(job_id)
+
+    def list(self, status: Optional[str] = None, client_id: Optional[str] = None) -> List[Job]:
+        return [
+            job for job in self.jobs.values()
+            if (not status or job.status == status) and (not client_id or job.client_id == client_id)
+        ]
+
+    def cancel(self, job_id: str) -> bool:
+        """Cancela job na fila ou em execução"""
+        job = self.jobs.get(job_id)
+        if not job or job.done:
+            return False
+
+        if job.status == "queued":
+            # Fica na heap, mas o worker descarta ao retirar
+            self._queued -= 1
+            QUEUE_DEPTH.set(self._queued, queue="jobs")
+            self._finish(job, "cancelled")
+        elif job.task:
+            job.cancel_requested = True
+            job.task.cancel()
+        return True
+
+    async def _worker(self):
+        while True:
+            _, _, job_id = await self._queue.get()
+            job = self.jobs.get(job_id)
+            if not job or job.status != "queued":
+                continue
+
+            self._queued -= 1
+            QUEUE_DEPTH.set(self._queued, queue="jobs")
+            job.status = "running"
+            job.started_at = time.time()
+            self._notify(job)
+
+            job.task = asyncio.create_task(self.handlers[job.type](job.params))
+            try:
+                job.result = await job.task
+                self._finish(job, "succeeded")
+            except asyncio.CancelledError:
+                if not job.cancel_requested:
+                    # O próprio worker foi cancelado (shutdown)
+                    raise
+                self._finish(job, "cancelled")
+            except Exception as e:
+                job.error = str(e)
+                self._finish(job, "failed")
+            finally:
+                job.task = None
+
+    def _finish(self, job: Job, status: str):
+        job.status = status
+        job.finished_at = time.time()
+        if job.started_at:
+            JOB_DURATION.observe(job.finished_at - job.started_at, type=job.type, status=status)
+        self._notify(job)
+
+    def _notify(self, job: Job):
+        if self.on_update:
+            asyncio.create_task(self.on_update(job))
+
+    async def _cleanup_loop(self):
+        """Remove resultados com TTL vencido"""
+        while True:
+            await asyncio.sleep(self.cleanup_interval)
+            now = time.time()
+            for job in [j for j in self.jobs.values() if j.expired(now)]:
+                del self.jobs[job.id]
+                if self.on_expire:
+                    try:
+                        await self.on_expire(job)
+                    except Exception as e:
+                        print(f"⚠️ Erro ao expirar job {job.id}: {e}")
+
+    def get_stats(self) -> dict:
+        by_status: Dict[str, int] = {}
+        for job in self.jobs.values():
+            by_status[job.status] = by_status.get(job.status, 0) + 1
+        return {
+            "concurrency": self.concurrency,
+            "queued": self._queued,
+            "by_status": by_status
+        }
@@ -0,0 +1,18 @@
+"""
+Knowledge Module
+"""
+
+from .embeddings import HashingEmbedder
+from .index import KnowledgeBase, VectorIndex, document_id
+from .minhash import MinHasher, LSHIndex, shingles, jaccard
+
+__all__ = [
+    "HashingEmbedder",
+    "KnowledgeBase",
+    "VectorIndex",
+    "document_id",
+    "MinHasher",
+    "LSHIndex",
+    "shingles",
+    "jaccard"
+]
@@ -0,0 +1,55 @@
+"""
+Hashing Embedder
+Vetores de texto calculados localmente, sem chamada ao provedor.
+
+- palavras, pares de palavras e trigramas de letras vão para `dim`
+  posições por hash (crc32, igual em todos os processos), com sinal
+- o mesmo texto gera o mesmo vetor em qualquer worker: os vetores
+  gravados no banco continuam valendo depois de reinícios
+- vetores normalizados: produto interno = similaridade de cosseno
+"""
+
+import zlib
+from typing import List
+
+import numpy as np
+
+from agents.intents import normalize, STOPWORDS
+
+
+class HashingEmbedder:
+    """
+    Uso:
+        embedder = HashingEmbedder(dim=512)
+        vector = embedder.embed("Promoção de verão com 20% off")
+        matrix = embedder.embed_many(["texto 1", "texto 2"])
+    """
+
+    def __init__(self, dim: int = 512):
+        self.dim = dim
+
+    def features(self, text: str) -> List[str]:
+        words = normalize(text).split()
+        content = [w for w in words if w not in STOPWORDS]
+        features = content + [f"{a} {b}" for a, b in zip(content, content[1:])]
+        # Trigramas pegam variações da mesma palavra (promo/promoção)
+        for word in content:
+            padded = f"<{word}>"
+            features.extend(padded[i:i + 3] for i in range(len(padded) - 2))
+        return features
+
+    def embed(self, text: str) -> np.ndarray:
+        vector = np.zeros(self.dim, dtype=np.float32)
+        features = self.features(text)
+        if not features:
+            return vector
+        hashes = np.fromiter((zlib.crc32(f.encode()) for f in features), dtype=np.uint32, count=len(features))
+        signs = np.where(hashes & 0x80000000, -1.0, 1.0).astype(np.float32)
+        np.add.at(vector, hashes % self.dim, signs)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def embed_many(self, texts: List[str]) -> np.ndarray:
+        if not texts:
+            return np.zeros((0, self.dim), dtype=np.float32)
+        return np.vstack([self.embed(text) for text in texts])
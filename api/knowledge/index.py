@@ -0,0 +1,345 @@
+"""
+Knowledge Index
+Base de conhecimento por cliente para montar prompts com referências.
+
+- exemplos do cliente (treinamento) e posts/anúncios aprovados viram
+  documentos com vetor (HashingEmbedder)
+- cada cliente tem uma matriz de vetores: busca exata por produto interno
+  até `ivf_threshold` documentos; acima disso, lista invertida (IVF):
+  os vetores são agrupados em centróides e a busca olha só os `nprobe`
+  grupos mais próximos da pergunta
+- inclusões e remoções são incrementais (sem reconstruir a matriz) e
+  gravadas no banco com o vetor; o load() só lê
+- o prompt recebe só os `k` trechos mais parecidos com o pedido
+"""
+
+import hashlib
+import time
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from metrics.registry import registry
+from .embeddings import HashingEmbedder
+
+
+KNOWLEDGE_SEARCHES = registry.counter(
+    "agencyzen_knowledge_searches_total",
+    "Buscas na base de conhecimento (mode=exact|ivf)",
+    ("mode",)
+)
+
+# Origem do documento -> código guardado ao lado do vetor (filtro da busca)
+SOURCES = {"example": 0, "post": 1, "ad": 2, "document": 3}
+
+
+def document_id(source: str, text: str) -> str:
+    """Id pelo conteúdo: o mesmo texto incluído de novo substitui o anterior"""
+    return f"{source}_{hashlib.sha1(text.encode()).hexdigest()[:12]}"
+
+
+class VectorIndex:
+    """Vetores de um cliente, linha a linha numa matriz float32"""
+
+    def __init__(self, dim: int, ivf_threshold: int = 4096, nprobe: int = 8):
+        self.dim = dim
+        self.ivf_threshold = ivf_threshold
+        self.nprobe = nprobe
+        self.ids: List[str] = []
+        self.docs: Dict[str, dict] = {}
+        self._rows: Dict[str, int] = {}
+        # Capacidade dobra quando enche (inclusão sem copiar a matriz toda a cada vez)
+        self._vectors = np.zeros((64, dim), dtype=np.float32)
+        self._sources = np.zeros(64, dtype=np.int8)
+        # IVF: centróides e o grupo de cada linha
+        self._centroids: Optional[np.ndarray] = None
+        self._lists = np.zeros(64, dtype=np.int32)
+        self._trained_size = 0
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    @property
+    def ivf(self) -> bool:
+        return self._centroids is not None
+
+    def upsert(self, doc: dict, vector: np.ndarray):
+        row = self._rows.get(doc["id"])
+        if row is None:
+            row = len(self.ids)
+            if row == len(self._vectors):
+                self._grow()
+            self.ids.append(doc["id"])
+            self._rows[doc["id"]] = row
+        self._vectors[row] = vector
+        self._sources[row] = SOURCES.get(doc.get("source"), SOURCES["document"])
+        self.docs[doc["id"]] = doc
+        if self._centroids is not None:
+            self._lists[row] = int(np.argmax(self._centroids @ vector))
+        # Treina ao passar do limite e de novo a cada vez que o tamanho dobra
+        if len(self.ids) >= self.ivf_threshold and len(self.ids) >= 2 * self._trained_size:
+            self.train()
+
+    def remove(self, doc_id: str) -> bool:
+        row = self._rows.pop(doc_id, None)
+        if row is None:
+            return False
+        # A última linha ocupa o lugar da removida
+        last = len(self.ids) - 1
+        if row != last:
+            moved = self.ids[last]
+            self.ids[row] = moved
+            self._rows[moved] = row
+            self._vectors[row] = self._vectors[last]
+            self._sources[row] = self._sources[last]
+            self._lists[row] = self._lists[last]
+        self.ids.pop()
+        del self.docs[doc_id]
+        if self._centroids is not None and len(self.ids) < self.ivf_threshold // 2:
+            self._centroids = None
+            self._trained_size = 0
+        return True
+
+    def _grow(self):
+        capacity = len(self._vectors) * 2
+        vectors = np.zeros((capacity, self.dim), dtype=np.float32)
+        vectors[:len(self._vectors)] = self._vectors
+        self._vectors = vectors
+        self._sources = np.resize(self._sources, capacity)
+        self._lists = np.resize(self._lists, capacity)
+
+    def train(self, iterations: int = 8, seed: int = 0):
+        """Agrupa os vetores (k-means esférico numa amostra) e distribui as linhas"""
+        n = len(self.ids)
+        vectors = self._vectors[:n]
+        nlist = max(1, int(np.sqrt(n)))
+        rng = np.random.default_rng(seed)
+        sample = vectors[rng.choice(n, min(n, nlist * 64), replace=False)]
+        centroids = sample[rng.choice(len(sample), nlist, replace=False)].copy()
+        for _ in range(iterations):
+            assign = np.argmax(sample @ centroids.T, axis=1)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, assign, sample)
+            # Grupo que ficou vazio mantém o centróide anterior
+            filled = np.bincount(assign, minlength=nlist) > 0
+            centroids[filled] = sums[filled]
+            norms = np.linalg.norm(centroids, axis=1, keepdims=True)
+            centroids /= np.where(norms == 0, 1, norms)
+        self._centroids = centroids
+        for start in range(0, n, 8192):
+            self._lists[start:start + 8192] = np.argmax(vectors[start:start + 8192] @ centroids.T, axis=1)
+        self._trained_size = n
+
+    def search(self, vector: np.ndarray, k: int = 5, sources: Optional[Iterable[str]] = None) -> List[Tuple[float, dict]]:
+        """(similaridade, documento) dos k mais próximos, do mais para o menos"""
+        n = len(self.ids)
+        if n == 0 or k <= 0:
+            return []
+        if self._centroids is None:
+            rows = None
+            scores = self._vectors[:n] @ vector
+            codes = self._sources[:n]
+        else:
+            probes = np.argsort(self._centroids @ vector)[-self.nprobe:]
+            rows = np.flatnonzero(np.isin(self._lists[:n], probes))
+            scores = self._vectors[rows] @ vector
+            codes = self._sources[rows]
+        if sources is not None:
+            scores = np.where(np.isin(codes, [SOURCES[s] for s in sources if s in SOURCES]), scores, -np.inf)
+        k = min(k, len(scores))
+        if k == 0:
+            return []
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        results = []
+        for position in top:
+            if scores[position] == -np.inf:
+                break
+            row = position if rows is None else rows[position]
+            results.append((float(scores[position]), self.docs[self.ids[row]]))
+        return results
+
+    def count_by_source(self) -> Dict[str, int]:
+        counts = np.bincount(self._sources[:len(self.ids)], minlength=len(SOURCES))
+        return {source: int(counts[code]) for source, code in SOURCES.items()}
+
+
+class KnowledgeBase:
+    """
+    Uso:
+        knowledge = KnowledgeBase(store)
+        await knowledge.load()
+        await knowledge.set_examples("acme", ["Post exemplo 1", "Post exemplo 2"])
+        await knowledge.add_documents("acme", [{"text": "Política de trocas...", "source": "document"}])
+        snippets = knowledge.retrieve("acme", "promoção de verão", k=3, sources=("example", "post"))
+    """
+
+    def __init__(
+        self,
+        store=None,
+        embedder: Optional[HashingEmbedder] = None,
+        ivf_threshold: int = 4096,
+        nprobe: int = 8,
+        snippet_chars: int = 500,
+        min_score: float = 0.05
+    ):
+        self.store = store
+        self.embedder = embedder or HashingEmbedder()
+        self.ivf_threshold = ivf_threshold
+        self.nprobe = nprobe
+        self.snippet_chars = snippet_chars
+        self.min_score = min_score
+        self.indexes: Dict[str, VectorIndex] = {}
+        # Chamado com (client_id, documentos incluídos, ids removidos) nas mudanças locais
+        self.on_change: Optional[Callable[[str, List[dict], List[str]], None]] = None
+
+    async def load(self):
+        """Lê os documentos gravados (vetores prontos; recalcula só se a dimensão mudou)"""
+        for client_id, doc, blob in await self.store.list_knowledge_docs():
+            vector = np.frombuffer(blob, dtype=np.float32) if blob else None
+            if vector is None or len(vector) != self.embedder.dim:
+                vector = self.embedder.embed(doc["text"])
+            self._index(client_id).upsert(doc, vector)
+
+    def _index(self, client_id: str) -> VectorIndex:
+        index = self.indexes.get(client_id)
+        if index is None:
+            index = VectorIndex(self.embedder.dim, self.ivf_threshold, self.nprobe)
+            self.indexes[client_id] = index
+        return index
+
+    def apply(self, client_id: str, docs: Iterable[dict] = (), removed: Iterable[str] = ()) -> List[Tuple[dict, np.ndarray]]:
+        """Aplica as mudanças só na memória (também as vindas de outros workers)"""
+        index = self._index(client_id)
+        for doc_id in removed:
+            index.remove(doc_id)
+        entries = []
+        for doc in docs:
+            vector = self.embedder.embed(doc["text"])
+            index.upsert(doc, vector)
+            entries.append((doc, vector))
+        if not len(index):
+            self.indexes.pop(client_id, None)
+        return entries
+
+    # ============== Escrita ==============
+
+    async def add_documents(self, client_id: str, docs: List[dict]) -> List[dict]:
+        """Inclui (ou substitui, pelo id) documentos do cliente"""
+        now = time.time()
+        prepared = []
+        for doc in docs:
+            text = (doc.get("text") or "").strip()
+            if not text:
+                continue
+            source = doc.get("source") if doc.get("source") in SOURCES else "document"
+            prepared.append({
+                **doc,
+                "id": doc.get("id") or document_id(source, text),
+                "source": source,
+                "text": text,
+                "created_at": doc.get("created_at", now)
+            })
+        if not prepared:
+            return []
+        entries = self.apply(client_id, prepared)
+        if self.store:
+            await self.store.save_knowledge_docs(client_id, [(doc, vector.tobytes()) for doc, vector in entries])
+        self._notify(client_id, prepared, [])
+        return prepared
+
+    async def remove_documents(self, client_id: str, doc_ids: List[str]) -> List[str]:
+        index = self.indexes.get(client_id)
+        removed = [doc_id for doc_id in doc_ids if index and doc_id in index.docs]
+        if not removed:
+            return []
+        self.apply(client_id, removed=removed)
+        if self.store:
+            await self.store.delete_knowledge_docs(client_id, removed)
+        self._notify(client_id, [], removed)
+        return removed
+
+    async def set_examples(self, client_id: str, examples: List[str]) -> dict:
+        """Substitui os exemplos do cliente (só os novos são incluídos, só os que saíram são removidos)"""
+        texts = list(dict.fromkeys(e.strip() for e in examples if e and e.strip()))
+        wanted = {document_id("example", text): text for text in texts}
+        index = self.indexes.get(client_id)
+        current = {doc_id for doc_id, doc in index.docs.items() if doc["source"] == "example"} if index else set()
+        removed = await self.remove_documents(client_id, sorted(current - wanted.keys()))
+        added = await self.add_documents(client_id, [
+            {"id": doc_id, "source": "example", "text": text}
+            for doc_id, text in wanted.items() if doc_id not in current
+        ])
+        return {"added": len(added), "removed": len(removed), "examples": len(wanted)}
+
+    async def add_approved(self, items: List[dict]) -> int:
+        """Posts e anúncios aprovados viram referência do cliente"""
+        by_client: Dict[str, List[dict]] = {}
+        for item in items:
+            if item.get("client_id") and item.get("type") in ("post", "ad") and item.get("content"):
+                by_client.setdefault(item["client_id"], []).append({
+                    "id": item["id"],
+                    "source": item["type"],
+                    "text": item["content"],
+                    "title": item.get("title")
+                })
+        added = 0
+        for client_id, docs in by_client.items():
+            added += len(await self.add_documents(client_id, docs))
+        return added
+
+    def _notify(self, client_id: str, docs: List[dict], removed: List[str]):
+        if self.on_change:
+            self.on_change(client_id, docs, removed)
+
+    # ============== Busca ==============
+
+    def search(
+        self,
+        client_id: Optional[str],
+        query: str,
+        k: int = 3,
+        sources: Optional[Iterable[str]] = None
+    ) -> List[dict]:
+        """Documentos do cliente mais parecidos com a pergunta (com `score`)"""
+        index = self.indexes.get(client_id or "")
+        if index is None or not query.strip():
+            return []
+        KNOWLEDGE_SEARCHES.inc(mode="ivf" if index.ivf else "exact")
+        results = index.search(self.embedder.embed(query), k, sources)
+        return [{**doc, "score": round(score, 4)} for score, doc in results if score >= self.min_score]
+
+    def retrieve(
+        self,
+        client_id: Optional[str],
+        query: str,
+        k: int = 3,
+        sources: Optional[Iterable[str]] = None
+    ) -> List[str]:
+        """Trechos prontos para o prompt (cortados em `snippet_chars`)"""
+        snippets = []
+        for doc in self.search(client_id, query, k, sources):
+            text = doc["text"]
+            if len(text) > self.snippet_chars:
+                text = text[:self.snippet_chars].rsplit(" ", 1)[0] + "..."
+            snippets.append(text)
+        return snippets
+
+    def get_stats(self, client_id: Optional[str] = None) -> dict:
+        if client_id is not None:
+            index = self.indexes.get(client_id)
+            if index is None:
+                return {"client_id": client_id, "documents": 0, "by_source": {s: 0 for s in SOURCES}, "ivf": False}
+            return {
+                "client_id": client_id,
+                "documents": len(index),
+                "by_source": index.count_by_source(),
+                "ivf": index.ivf,
+                "lists": len(index._centroids) if index.ivf else 0
+            }
+        return {
+            "clients": len(self.indexes),
+            "documents": sum(len(index) for index in self.indexes.values()),
+            "dim": self.embedder.dim,
+            "ivf_threshold": self.ivf_threshold
+        }
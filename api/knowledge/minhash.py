@@ -0,0 +1,123 @@
+"""
+MinHash LSH
+Textos curtos quase iguais (temas de post) sem comparar com todos.
+
+- o texto vira um conjunto de pedaços (palavras e trigramas de letras,
+  sem ordem nem acentos): "promoção de black friday" e "black friday
+  promo" dividem quase todos
+- a assinatura MinHash estima a similaridade de Jaccard entre conjuntos;
+  ela é cortada em faixas e cada faixa vira um balde (LSH)
+- a busca só compara os textos que caíram em algum balde igual ao da
+  pergunta, e confirma com a Jaccard exata dos conjuntos
+
+Com 16 faixas de 4 linhas, pares com Jaccard acima de ~0.5 quase sempre
+viram candidatos e pares abaixo de ~0.3 quase nunca.
+"""
+
+import zlib
+from typing import Dict, FrozenSet, List, Set, Tuple
+
+import numpy as np
+
+from agents.intents import normalize, STOPWORDS
+
+
+# Primo de Mersenne 2^31 - 1: a * x + b cabe em uint64 sem estourar
+PRIME = (1 << 31) - 1
+
+
+def shingles(text: str) -> FrozenSet[str]:
+    """Palavras e trigramas de letras do texto, sem ordem"""
+    words = [w for w in normalize(text).split() if w not in STOPWORDS]
+    pieces = set(words)
+    for word in words:
+        padded = f"<{word}>"
+        pieces.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return frozenset(pieces)
+
+
+def jaccard(a: FrozenSet[str], b: FrozenSet[str]) -> float:
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+
+class MinHasher:
+    """Assinaturas MinHash com permutações fixas (iguais em todos os processos)"""
+
+    def __init__(self, num_perm: int = 64, seed: int = 1):
+        self.num_perm = num_perm
+        rng = np.random.default_rng(seed)
+        self._a = rng.integers(1, PRIME, num_perm, dtype=np.uint64)[:, None]
+        self._b = rng.integers(0, PRIME, num_perm, dtype=np.uint64)[:, None]
+
+    def signature(self, pieces: FrozenSet[str]) -> np.ndarray:
+        if not pieces:
+            return np.full(self.num_perm, PRIME, dtype=np.uint64)
+        hashes = np.fromiter((zlib.crc32(p.encode()) % PRIME for p in pieces), dtype=np.uint64, count=len(pieces))
+        return ((self._a * hashes[None, :] + self._b) % PRIME).min(axis=1)
+
+
+class LSHIndex:
+    """
+    Uso:
+        index = LSHIndex()
+        index.add("post_1", "promoção de black friday")
+        index.query("black friday promo", threshold=0.5)  # [(0.75, "post_1")]
+    """
+
+    def __init__(self, hasher: MinHasher = None, bands: int = 16):
+        self.hasher = hasher or MinHasher()
+        self.bands = bands
+        self.rows = self.hasher.num_perm // bands
+        # (faixa, valores da faixa) -> chaves
+        self._buckets: Dict[Tuple[int, bytes], Set[str]] = {}
+        self._entries: Dict[str, Tuple[FrozenSet[str], List[Tuple[int, bytes]]]] = {}
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._entries
+
+    def _bands(self, pieces: FrozenSet[str]) -> List[Tuple[int, bytes]]:
+        signature = self.hasher.signature(pieces)
+        return [(band, signature[band * self.rows:(band + 1) * self.rows].tobytes()) for band in range(self.bands)]
+
+    def add(self, key: str, text: str):
+        self.remove(key)
+        pieces = shingles(text)
+        if not pieces:
+            return
+        buckets = self._bands(pieces)
+        for bucket in buckets:
+            self._buckets.setdefault(bucket, set()).add(key)
+        self._entries[key] = (pieces, buckets)
+
+    def remove(self, key: str) -> bool:
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return False
+        for bucket in entry[1]:
+            keys = self._buckets.get(bucket)
+            if keys:
+                keys.discard(key)
+                if not keys:
+                    del self._buckets[bucket]
+        return True
+
+    def query(self, text: str, threshold: float = 0.5) -> List[Tuple[float, str]]:
+        """(Jaccard, chave) dos candidatos acima do limite, do mais parecido para o menos"""
+        pieces = shingles(text)
+        if not pieces:
+            return []
+        candidates: Set[str] = set()
+        for bucket in self._bands(pieces):
+            candidates.update(self._buckets.get(bucket, ()))
+        results = []
+        for key in candidates:
+            score = jaccard(pieces, self._entries[key][0])
+            if score >= threshold:
+                results.append((score, key))
+        results.sort(reverse=True)
+        return results
@@ -0,0 +1,53 @@
+"""
+LLM Module
+"""
+
+from .client import get_client
+from .errors import (
+    LLMError,
+    LLMRateLimitError,
+    LLMTimeoutError,
+    LLMUnavailableError,
+    DeadlineExceededError
+)
+from .deadline import deadline_scope, deadline_since, current_deadline, time_remaining, check_deadline
+from .hedging import latency_tracker, hedged_call
+from .router import ModelRouter, model_router, complexity_score
+from .rate_limit import RateLimiter, rate_limiter
+from .scheduler import (
+    LLMScheduler,
+    llm_scheduler,
+    priority_scope,
+    current_priority,
+    INTERACTIVE,
+    NEAR_REAL_TIME,
+    BATCH
+)
+
+__all__ = [
+    "get_client",
+    "LLMError",
+    "LLMRateLimitError",
+    "LLMTimeoutError",
+    "LLMUnavailableError",
+    "DeadlineExceededError",
+    "deadline_scope",
+    "deadline_since",
+    "current_deadline",
+    "time_remaining",
+    "check_deadline",
+    "latency_tracker",
+    "hedged_call",
+    "ModelRouter",
+    "model_router",
+    "complexity_score",
+    "RateLimiter",
+    "rate_limiter",
+    "LLMScheduler",
+    "llm_scheduler",
+    "priority_scope",
+    "current_priority",
+    "INTERACTIVE",
+    "NEAR_REAL_TIME",
+    "BATCH"
+]
@@ -0,0 +1,27 @@
+"""
+LLM Client
+Clientes assíncronos da OpenAI reaproveitados entre chamadas
+(um por API key), mantendo o pool de conexões HTTP aberto.
+
+As retentativas do SDK ficam desligadas: quem repete é o RateLimiter,
+que conhece o prazo da chamada e os limites de cada modelo.
+"""
+
+from typing import Dict
+
+try:
+    from openai import AsyncOpenAI
+except ImportError:
+    AsyncOpenAI = None
+
+
+_clients: Dict[str, "AsyncOpenAI"] = {}
+
+
+def get_client(api_key: str) -> "AsyncOpenAI":
+    """Retorna o cliente da API key (cria na primeira vez)"""
+    client = _clients.get(api_key)
+    if client is None:
+        client = AsyncOpenAI(api_key=api_key, max_retries=0)
+        _clients[api_key] = client
+    return client
@@ -0,0 +1,62 @@
+"""
+Deadline
+Prazo de ponta a ponta carregado pelo contexto (ContextVar): definido na
+entrada (requisição HTTP, mensagem de WhatsApp) e respeitado pelos nós de
+fluxo, pela fila do scheduler e pela chamada de LLM.
+
+Prazos aninhados só encurtam: o menor sempre vale.
+"""
+
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Optional
+
+from .errors import DeadlineExceededError
+
+
+_deadline: ContextVar[Optional[float]] = ContextVar("deadline", default=None)
+
+
+@contextmanager
+def deadline_scope(seconds: Optional[float]):
+    """Limita o bloco a `seconds` (sem efeito se None ou se já houver prazo menor)"""
+    if seconds is None:
+        yield
+        return
+    deadline = time.monotonic() + seconds
+    current = _deadline.get()
+    token = _deadline.set(min(current, deadline) if current is not None else deadline)
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+
+@contextmanager
+def deadline_since(started_at: Optional[float], seconds: Optional[float]):
+    """
+    Prazo de `seconds` contado a partir de `started_at` (time.time(), ex.:
+    quando a mensagem chegou), não de agora: o tempo em filas já conta.
+    """
+    elapsed = max(time.time() - started_at, 0.0) if started_at is not None else 0.0
+    with deadline_scope(seconds - elapsed if seconds is not None else None):
+        yield
+
+
+def current_deadline() -> Optional[float]:
+    """Prazo do contexto (time.monotonic) ou None"""
+    return _deadline.get()
+
+
+def time_remaining() -> Optional[float]:
+    """Segundos até o prazo (negativo se já passou) ou None"""
+    deadline = _deadline.get()
+    return deadline - time.monotonic() if deadline is not None else None
+
+
+def check_deadline(what: str = "operação"):
+    """Levanta DeadlineExceededError se o prazo do contexto já passou"""
+    remaining = time_remaining()
+    if remaining is not None and remaining <= 0:
+        raise DeadlineExceededError(f"Prazo esgotado antes de: {what}")
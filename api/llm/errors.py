@@ -0,0 +1,43 @@
+"""
+LLM Errors
+Falhas tipadas das chamadas de LLM. Cada tipo carrega o status HTTP
+que a API devolve ao cliente.
+"""
+
+from typing import Optional
+
+
+class LLMError(Exception):
+    """Falha definitiva numa chamada de LLM"""
+
+    status_code = 502
+
+    def __init__(self, message: str, model: Optional[str] = None):
+        self.model = model
+        super().__init__(message)
+
+
+class LLMRateLimitError(LLMError):
+    """Limite do provedor (ou do limitador local) sem folga dentro do prazo"""
+
+    status_code = 429
+
+    def __init__(self, message: str, model: Optional[str] = None, retry_after: Optional[float] = None):
+        self.retry_after = retry_after
+        super().__init__(message, model)
+
+
+class LLMTimeoutError(LLMError):
+    """Prazo da chamada esgotado"""
+
+    status_code = 504
+
+
+class LLMUnavailableError(LLMError):
+    """Provedor fora do ar ou inacessível após as tentativas"""
+
+    status_code = 503
+
+
+class DeadlineExceededError(LLMTimeoutError):
+    """Prazo de ponta a ponta (requisição, mensagem) esgotado"""
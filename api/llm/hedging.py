@@ -0,0 +1,82 @@
+"""
+Hedging
+Requisições "hedged" contra a cauda de latência: se a chamada passar do
+p95 recente do modelo, uma segunda é disparada (mesmo modelo ou fallback)
+e vale a que responder primeiro. A perdedora é cancelada.
+"""
+
+import asyncio
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, Optional
+
+from metrics.registry import registry
+
+
+HEDGED_REQUESTS = registry.counter(
+    "agencyzen_llm_hedged_requests_total",
+    "Chamadas que dispararam hedge, por vencedora (winner=primary|hedge)",
+    ("model", "winner")
+)
+
+
+class LatencyTracker:
+    """Janela das latências recentes de cada modelo"""
+
+    def __init__(self, window: int = 200, min_samples: int = 20):
+        self.window = window
+        self.min_samples = min_samples
+        self._samples: Dict[str, Deque[float]] = {}
+
+    def observe(self, model: str, seconds: float):
+        samples = self._samples.get(model)
+        if samples is None:
+            samples = deque(maxlen=self.window)
+            self._samples[model] = samples
+        samples.append(seconds)
+
+    def percentile(self, model: str, q: float = 0.95) -> Optional[float]:
+        """Percentil da janela, ou None se ainda não há amostras suficientes"""
+        samples = self._samples.get(model)
+        if not samples or len(samples) < self.min_samples:
+            return None
+        ordered = sorted(samples)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+async def hedged_call(
+    primary: Callable[[], Awaitable[Any]],
+    backup: Callable[[], Awaitable[Any]],
+    delay: float,
+    model: str = ""
+) -> Any:
+    """
+    Roda `primary`; se não terminar em `delay` segundos, roda também
+    `backup` e retorna o primeiro resultado bem-sucedido.
+    """
+    first = asyncio.ensure_future(primary())
+    tasks = [first]
+    try:
+        done, _ = await asyncio.wait(tasks, timeout=delay)
+        if done:
+            return first.result()
+
+        second = asyncio.ensure_future(backup())
+        tasks.append(second)
+        pending = set(tasks)
+        error: Optional[BaseException] = None
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    HEDGED_REQUESTS.inc(model=model, winner="primary" if task is first else "hedge")
+                    return task.result()
+                error = task.exception()
+        raise error
+    finally:
+        for task in tasks:
+            if not task.done():
+                task.cancel()
+
+
+# Instância global do processo
+latency_tracker = LatencyTracker()
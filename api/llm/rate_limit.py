@@ -0,0 +1,306 @@
+"""
+LLM Rate Limit
+Limitador do lado do cliente por modelo (requisições e tokens por minuto)
+e retentativas com backoff para chamadas de LLM.
+
+- cada modelo tem dois token buckets (RPM e TPM)
+- os limites são ajustados pelos headers x-ratelimit-* da OpenAI
+- um 429 bloqueia o modelo pelo retry-after informado
+- erros transitórios são repetidos com backoff exponencial + jitter,
+  sempre dentro do prazo da chamada
+"""
+
+import asyncio
+import os
+import random
+import re
+import time
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from metrics.registry import registry
+from .errors import LLMError, LLMRateLimitError, LLMTimeoutError, LLMUnavailableError
+
+try:
+    import openai
+except ImportError:
+    openai = None
+
+
+LLM_RETRIES = registry.counter(
+    "agencyzen_llm_retries_total",
+    "Retentativas de chamadas de LLM (reason=rate_limit|timeout|unavailable)",
+    ("model", "reason")
+)
+
+LLM_RATE_LIMIT_WAIT = registry.histogram(
+    "agencyzen_llm_rate_limit_wait_seconds",
+    "Espera no limitador local antes de enviar a chamada",
+    ("model",),
+    buckets=(0.001, 0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+)
+
+_DURATION_PART = re.compile(r"(\d+(?:\.\d+)?)(ms|h|m|s)")
+_DURATION_UNITS = {"ms": 0.001, "s": 1.0, "m": 60.0, "h": 3600.0}
+
+
+def parse_reset(value: Optional[str]) -> Optional[float]:
+    """Converte '1s', '6m0s', '20ms' (headers da OpenAI) em segundos"""
+    if not value:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    parts = _DURATION_PART.findall(value)
+    if not parts:
+        return None
+    return sum(float(amount) * _DURATION_UNITS[unit] for amount, unit in parts)
+
+
+class TokenBucket:
+    """Balde que enche continuamente até a capacidade (limite por minuto)"""
+
+    def __init__(self, per_minute: float):
+        self.capacity = float(per_minute)
+        self.available = float(per_minute)
+        self._last = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.available = min(self.capacity, self.available + (now - self._last) * self.capacity / 60.0)
+        self._last = now
+
+    def wait_time(self, amount: float) -> float:
+        """Segundos até haver `amount` disponível"""
+        self._refill()
+        amount = min(amount, self.capacity)
+        if self.available >= amount:
+            return 0.0
+        return (amount - self.available) * 60.0 / self.capacity
+
+    def consume(self, amount: float):
+        self._refill()
+        self.available -= min(amount, self.capacity)
+
+    def refund(self, amount: float):
+        self._refill()
+        self.available = min(self.capacity, self.available + amount)
+
+    def sync(self, limit: Optional[float], remaining: Optional[float], reset: Optional[float]):
+        """Alinha o balde com o que o provedor informou"""
+        self._refill()
+        if limit:
+            self.capacity = float(limit)
+        if remaining is not None:
+            # O provedor conta o uso de todos os processos da conta
+            self.available = min(self.capacity, float(remaining))
+            if reset and remaining <= 0:
+                self.available = -self.capacity * min(reset, 60.0) / 60.0
+
+
+class ModelRateLimiter:
+    """Limites de um modelo"""
+
+    def __init__(self, model: str, requests_per_minute: int, tokens_per_minute: int):
+        self.model = model
+        self.requests = TokenBucket(requests_per_minute)
+        self.tokens = TokenBucket(tokens_per_minute)
+        self.blocked_until = 0.0
+        # Vira True quando o provedor informa os limites nos headers
+        self.learned = False
+
+    def wait_time(self, tokens: int) -> float:
+        return max(
+            self.blocked_until - time.monotonic(),
+            self.requests.wait_time(1),
+            self.tokens.wait_time(tokens)
+        )
+
+    async def acquire(self, tokens: int, deadline: Optional[float] = None):
+        """Espera folga para a chamada (ou falha se ela não vier antes do prazo)"""
+        start = time.monotonic()
+        while True:
+            wait = self.wait_time(tokens)
+            if wait <= 0:
+                self.requests.consume(1)
+                self.tokens.consume(tokens)
+                LLM_RATE_LIMIT_WAIT.observe(time.monotonic() - start, model=self.model)
+                return
+            if deadline is not None and time.monotonic() + wait > deadline:
+                raise LLMRateLimitError(
+                    f"Limite de requisições do modelo {self.model} sem folga dentro do prazo",
+                    self.model,
+                    retry_after=wait
+                )
+            await asyncio.sleep(wait)
+
+    def update_from_headers(self, headers):
+        """Aprende os limites reais com os headers x-ratelimit-*"""
+        if not headers or "x-ratelimit-remaining-tokens" not in headers:
+            return
+        self.learned = True
+
+        def number(name: str) -> Optional[float]:
+            try:
+                return float(headers.get(name))
+            except (TypeError, ValueError):
+                return None
+
+        self.requests.sync(
+            number("x-ratelimit-limit-requests"),
+            number("x-ratelimit-remaining-requests"),
+            parse_reset(headers.get("x-ratelimit-reset-requests"))
+        )
+        self.tokens.sync(
+            number("x-ratelimit-limit-tokens"),
+            number("x-ratelimit-remaining-tokens"),
+            parse_reset(headers.get("x-ratelimit-reset-tokens"))
+        )
+
+    def block(self, seconds: float):
+        """Pausa o modelo (ex: retry-after de um 429)"""
+        self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+
+    def get_stats(self) -> dict:
+        return {
+            "requests_per_minute": int(self.requests.capacity),
+            "available_requests": int(self.requests.available),
+            "tokens_per_minute": int(self.tokens.capacity),
+            "available_tokens": int(self.tokens.available),
+            "blocked_for": round(max(0.0, self.blocked_until - time.monotonic()), 3)
+        }
+
+
+class RateLimiter:
+    """
+    Limitadores por modelo + retentativas.
+
+    Uso:
+        response = await rate_limiter.call(
+            "gpt-4o-mini", 900,
+            lambda timeout: client.chat.completions.with_raw_response.create(..., timeout=timeout),
+            deadline=time.monotonic() + 30
+        )
+    """
+
+    def __init__(
+        self,
+        requests_per_minute: int = 500,
+        tokens_per_minute: int = 90000,
+        max_attempts: int = 4,
+        base_delay: float = 0.5,
+        max_delay: float = 8.0
+    ):
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.models: Dict[str, ModelRateLimiter] = {}
+
+    def get(self, model: str) -> ModelRateLimiter:
+        limiter = self.models.get(model)
+        if limiter is None:
+            limiter = ModelRateLimiter(model, self.requests_per_minute, self.tokens_per_minute)
+            self.models[model] = limiter
+        return limiter
+
+    async def call(
+        self,
+        model: str,
+        estimated_tokens: int,
+        request: Callable[[Optional[float]], Awaitable[Any]],
+        deadline: Optional[float] = None
+    ) -> Any:
+        """
+        Executa `request(timeout)` respeitando o limite do modelo.
+        `request` deve devolver a resposta crua (with_raw_response) para
+        que os headers de limite sejam lidos; retorna a resposta já parseada.
+        """
+        limiter = self.get(model)
+        attempt = 0
+
+        while True:
+            attempt += 1
+            await limiter.acquire(estimated_tokens, deadline)
+
+            timeout = None
+            if deadline is not None:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    raise LLMTimeoutError(f"Prazo esgotado antes de chamar {model}", model)
+
+            try:
+                raw = await request(timeout)
+            except Exception as e:
+                error, retry_after = self._classify(e, model)
+                if retry_after is not None:
+                    limiter.block(retry_after)
+                if getattr(e, "response", None) is not None:
+                    limiter.update_from_headers(e.response.headers)
+
+                # LLMError puro (ex: 400, chave inválida) não adianta repetir
+                if type(error) is not LLMError:
+                    delay = self._backoff(attempt, retry_after)
+                    can_wait = deadline is None or time.monotonic() + delay < deadline
+                    if attempt < self.max_attempts and can_wait:
+                        LLM_RETRIES.inc(model=model, reason=self._reason(error))
+                        await asyncio.sleep(delay)
+                        continue
+                if isinstance(error, LLMRateLimitError) and error.retry_after is None:
+                    error.retry_after = retry_after or self._backoff(attempt, None)
+                raise error from e
+
+            headers = getattr(raw, "headers", None)
+            limiter.update_from_headers(headers)
+            return raw.parse() if hasattr(raw, "parse") else raw
+
+    def refund(self, model: str, tokens: int):
+        """Devolve a diferença entre a estimativa e o uso real"""
+        limiter = self.models.get(model)
+        # Com headers o balde já foi alinhado ao que o provedor contou
+        if tokens > 0 and limiter and not limiter.learned:
+            limiter.tokens.refund(tokens)
+
+    def _backoff(self, attempt: int, retry_after: Optional[float]) -> float:
+        """Backoff exponencial com jitter total; respeita o retry-after do provedor"""
+        delay = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** (attempt - 1)))
+        if retry_after is not None:
+            delay = max(delay, retry_after)
+        return delay
+
+    @staticmethod
+    def _reason(error: LLMError) -> str:
+        if isinstance(error, LLMRateLimitError):
+            return "rate_limit"
+        if isinstance(error, LLMTimeoutError):
+            return "timeout"
+        return "unavailable"
+
+    @staticmethod
+    def _classify(e: Exception, model: str):
+        """Converte exceções do SDK em erros tipados; retorna (erro, retry_after)"""
+        if isinstance(e, LLMError):
+            return e, getattr(e, "retry_after", None)
+        if openai is None:
+            return LLMError(str(e), model), None
+
+        if isinstance(e, openai.RateLimitError):
+            retry_after = parse_reset(e.response.headers.get("retry-after")) if e.response is not None else None
+            return LLMRateLimitError(f"Limite do provedor atingido para {model}", model, retry_after), retry_after
+        if isinstance(e, (openai.APITimeoutError, asyncio.TimeoutError)):
+            return LLMTimeoutError(f"Tempo esgotado na chamada de {model}", model), None
+        if isinstance(e, openai.APIConnectionError):
+            return LLMUnavailableError(f"Falha de conexão com o provedor ({model})", model), None
+        if isinstance(e, openai.APIStatusError) and e.status_code >= 500:
+            return LLMUnavailableError(f"Provedor indisponível ({e.status_code}) para {model}", model), None
+        return LLMError(str(e), model), None
+
+    def get_stats(self) -> dict:
+        return {model: limiter.get_stats() for model, limiter in self.models.items()}
+
+
+rate_limiter = RateLimiter(
+    requests_per_minute=int(os.getenv("LLM_REQUESTS_PER_MINUTE", "500")),
+    tokens_per_minute=int(os.getenv("LLM_TOKENS_PER_MINUTE", "90000"))
+)
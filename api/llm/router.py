@@ -0,0 +1,195 @@
+"""
+Model Router
+Escolhe o modelo de cada chamada pelo tipo de agente, tamanho do prompt
+e um classificador local de complexidade (regras, sem chamada de rede).
+
+Tiers:
+- fast:     saudações, FAQ, respostas curtas de WhatsApp
+- standard: posts, respostas com algum raciocínio
+- advanced: estratégia de campanha, análise de métricas
+
+Precedência: override do cliente > override do agente (routing=False usa
+config.model; é o padrão de quem define um modelo) > roteamento. Respostas com baixa confiança de um tier
+barato são refeitas no tier acima (escalonamento).
+"""
+
+import re
+from typing import Dict, List, Optional
+
+from metrics.registry import registry
+
+
+FAST = "fast"
+STANDARD = "standard"
+ADVANCED = "advanced"
+
+TIERS = (FAST, STANDARD, ADVANCED)
+
+ROUTING_DECISIONS = registry.counter(
+    "agencyzen_llm_routing_decisions_total",
+    "Modelos escolhidos pelo roteador (source=route|agent|client)",
+    ("agent_type", "tier", "source")
+)
+
+ROUTING_ESCALATIONS = registry.counter(
+    "agencyzen_llm_routing_escalations_total",
+    "Respostas refeitas num tier acima por baixa confiança",
+    ("agent_type", "from_tier", "to_tier")
+)
+
+# Tier mínimo e máximo por tipo de agente
+AGENT_TIER_RANGE = {
+    "whatsapp": (FAST, STANDARD),
+    "manager": (FAST, ADVANCED),
+    "social_media": (STANDARD, ADVANCED),
+    "traffic": (STANDARD, ADVANCED)
+}
+
+# Termos que indicam pedido de raciocínio (estratégia, análise, planejamento)
+_COMPLEX_TERMS = re.compile(
+    r"\b(estrat[eé]gi\w*|campanha\w*|analis\w*|an[aá]lise\w*|planej\w*|compar\w*|"
+    r"otimiz\w*|segmenta\w*|or[cç]amento\w*|m[eé]tricas?|roi|roas|cpc|ctr|funil|"
+    r"calend[aá]rio|justifi\w*|por que|explique|detalh\w*)\b",
+    re.IGNORECASE
+)
+
+# Mensagens triviais: saudação, agradecimento, confirmação
+_TRIVIAL = re.compile(
+    r"^\s*(oi+|ol[aá]|bom dia|boa tarde|boa noite|tudo bem\??|obrigad[oa]|valeu|ok|"
+    r"sim|n[aã]o|blz|beleza|tchau|at[eé] mais)[\s!.?]*$",
+    re.IGNORECASE
+)
+
+# Sinais de resposta insegura (pede escalonamento)
+_LOW_CONFIDENCE = re.compile(
+    r"(n[aã]o tenho certeza|n[aã]o sei|n[aã]o consigo|n[aã]o posso ajudar|"
+    r"como (um )?modelo de linguagem|i'?m not sure|i don'?t know|as an ai)",
+    re.IGNORECASE
+)
+
+
+class Route:
+    """Decisão de roteamento de uma chamada"""
+
+    def __init__(self, model: str, tier: Optional[str], source: str, score: float = 0.0):
+        self.model = model
+        self.tier = tier
+        self.source = source
+        self.score = score
+
+    def to_dict(self) -> dict:
+        return {"model": self.model, "tier": self.tier, "source": self.source, "score": round(self.score, 3)}
+
+
+def complexity_score(text: str) -> float:
+    """Complexidade estimada do pedido em [0, 1]"""
+    if _TRIVIAL.match(text):
+        return 0.0
+
+    words = len(text.split())
+    score = min(words / 150.0, 0.4)
+    score += min(len(_COMPLEX_TERMS.findall(text)) * 0.15, 0.45)
+    score += min(text.count("?") * 0.05, 0.1)
+    if re.search(r"\d", text):
+        score += 0.05
+    return min(score, 1.0)
+
+
+class ModelRouter:
+    """
+    Uso:
+        route = model_router.route(agent, messages)
+        ...chamada com route.model...
+        next_route = model_router.escalate(agent, route, resposta)
+    """
+
+    def __init__(
+        self,
+        tier_models: Optional[Dict[str, str]] = None,
+        standard_threshold: float = 0.25,
+        advanced_threshold: float = 0.55
+    ):
+        self.tier_models = tier_models or {
+            FAST: "gpt-4o-mini",
+            STANDARD: "gpt-4o",
+            ADVANCED: "gpt-4-turbo"
+        }
+        self.standard_threshold = standard_threshold
+        self.advanced_threshold = advanced_threshold
+        # client_id -> modelo fixo ou {tier: modelo}
+        self.client_overrides: Dict[str, dict] = {}
+
+    def set_client_override(self, client_id: str, model: Optional[str] = None, tiers: Optional[Dict[str, str]] = None):
+        """Fixa o modelo do cliente (model) ou troca modelos por tier (tiers)"""
+        self.client_overrides[client_id] = {"model": model, "tiers": tiers or {}}
+
+    def remove_client_override(self, client_id: str):
+        self.client_overrides.pop(client_id, None)
+
+    def route(self, agent, messages: List[Dict[str, str]]) -> Route:
+        """Modelo para a próxima chamada do agente"""
+        override = self.client_overrides.get(agent.client_id) if agent.client_id else None
+        if override and override.get("model"):
+            ROUTING_DECISIONS.inc(agent_type=agent.type, tier="", source="client")
+            return Route(override["model"], None, "client")
+
+        if not agent.config.routing:
+            ROUTING_DECISIONS.inc(agent_type=agent.type, tier="", source="agent")
+            return Route(agent.config.model, None, "agent")
+
+        last_user = next((m["content"] for m in reversed(messages) if m["role"] == "user"), "")
+        score = complexity_score(last_user)
+        # Contexto longo também pede mais do modelo
+        context_chars = sum(len(m["content"]) for m in messages)
+        if context_chars > 12000:
+            score = max(score, self.advanced_threshold)
+        elif context_chars > 4000:
+            score = max(score, self.standard_threshold)
+
+        if score >= self.advanced_threshold:
+            tier = ADVANCED
+        elif score >= self.standard_threshold:
+            tier = STANDARD
+        else:
+            tier = FAST
+        tier = self._clamp(agent.type, tier)
+
+        ROUTING_DECISIONS.inc(agent_type=agent.type, tier=tier, source="route")
+        return Route(self._model_for(agent.client_id, tier), tier, "route", score)
+
+    def escalate(self, agent, route: Route, content: Optional[str]) -> Optional[Route]:
+        """Próximo tier se a resposta parecer insegura; None se está boa ou não há tier acima"""
+        if route.tier is None or route.tier == self._range(agent.type)[1]:
+            return None
+        if content and len(content.strip()) >= 2 and not _LOW_CONFIDENCE.search(content):
+            return None
+
+        next_tier = TIERS[TIERS.index(route.tier) + 1]
+        ROUTING_ESCALATIONS.inc(agent_type=agent.type, from_tier=route.tier, to_tier=next_tier)
+        return Route(self._model_for(agent.client_id, next_tier), next_tier, "escalation", route.score)
+
+    def _model_for(self, client_id: Optional[str], tier: str) -> str:
+        override = self.client_overrides.get(client_id) if client_id else None
+        if override and tier in override.get("tiers", {}):
+            return override["tiers"][tier]
+        return self.tier_models[tier]
+
+    def _range(self, agent_type: str) -> tuple:
+        return AGENT_TIER_RANGE.get(agent_type, (FAST, ADVANCED))
+
+    def _clamp(self, agent_type: str, tier: str) -> str:
+        low, high = self._range(agent_type)
+        index = min(max(TIERS.index(tier), TIERS.index(low)), TIERS.index(high))
+        return TIERS[index]
+
+    def get_stats(self) -> dict:
+        return {
+            "tier_models": self.tier_models,
+            "thresholds": {STANDARD: self.standard_threshold, ADVANCED: self.advanced_threshold},
+            "agent_tiers": AGENT_TIER_RANGE,
+            "client_overrides": self.client_overrides
+        }
+
+
+# Instância global do processo
+model_router = ModelRouter()
@@ -0,0 +1,237 @@
+"""
+LLM Scheduler
+Admissão de chamadas de LLM por prioridade, com partilha justa entre
+clientes e controle de tokens por minuto (TPM).
+
+Classes de prioridade (prioridade estrita entre elas):
+- interactive:    respostas de WhatsApp que um cliente está esperando
+- near_real_time: chat do dashboard, fluxos
+- batch:          jobs em segundo plano (posts, campanhas em lote)
+
+Dentro de cada classe, clientes dividem a vazão por peso (fair queueing
+por tags de término virtuais). Batch só é admitido se sobrar uma reserva
+de TPM para o tráfego interativo.
+"""
+
+import asyncio
+import heapq
+import itertools
+import os
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, List, Optional
+
+from metrics.registry import QUEUE_DEPTH, registry
+
+
+INTERACTIVE = "interactive"
+NEAR_REAL_TIME = "near_real_time"
+BATCH = "batch"
+
+PRIORITIES = (INTERACTIVE, NEAR_REAL_TIME, BATCH)
+
+SCHEDULER_WAIT = registry.histogram(
+    "agencyzen_llm_scheduler_wait_seconds",
+    "Tempo de espera na fila do scheduler de LLM",
+    ("priority",),
+    buckets=(0.001, 0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+)
+
+_priority: ContextVar[Optional[str]] = ContextVar("llm_priority", default=None)
+
+
+@contextmanager
+def priority_scope(priority: str):
+    """Define a prioridade das chamadas de LLM feitas dentro do bloco"""
+    token = _priority.set(priority)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+def current_priority(default: str = NEAR_REAL_TIME) -> str:
+    """Prioridade do contexto atual"""
+    return _priority.get() or default
+
+
+class Ticket:
+    """Permissão para uma chamada de LLM"""
+
+    def __init__(self, priority: str, client_id: str, tokens: int, start_tag: float, finish_tag: float):
+        self.priority = priority
+        self.client_id = client_id
+        self.tokens = tokens
+        self.start_tag = start_tag
+        self.finish_tag = finish_tag
+        self.enqueued_at = time.perf_counter()
+        self.future: Optional[asyncio.Future] = None
+        self.released = False
+
+
+class LLMScheduler:
+    """
+    Uso:
+        ticket = await llm_scheduler.acquire(INTERACTIVE, "cliente_1", 800)
+        try:
+            ...chamada...
+        finally:
+            llm_scheduler.release(ticket, tokens_reais)
+    """
+
+    def __init__(
+        self,
+        tokens_per_minute: int = 90000,
+        max_concurrency: int = 32,
+        batch_reserve_ratio: float = 0.2
+    ):
+        self.tokens_per_minute = tokens_per_minute
+        self.max_concurrency = max_concurrency
+        self.batch_reserve_ratio = batch_reserve_ratio
+        self.client_weights: Dict[str, float] = {}
+
+        self._available = float(tokens_per_minute)
+        self._last_refill = time.monotonic()
+        self._in_flight = 0
+        self._queues: Dict[str, List[tuple]] = {p: [] for p in PRIORITIES}
+        self._virtual_time: Dict[str, float] = {p: 0.0 for p in PRIORITIES}
+        self._client_finish: Dict[tuple, float] = {}
+        self._sequence = itertools.count()
+        self._wakeup: Optional[asyncio.TimerHandle] = None
+
+    def set_client_weight(self, client_id: str, weight: float):
+        """Peso relativo do cliente na divisão de vazão (padrão 1.0)"""
+        self.client_weights[client_id] = max(weight, 0.01)
+
+    def configure(
+        self,
+        tokens_per_minute: Optional[int] = None,
+        max_concurrency: Optional[int] = None
+    ):
+        """Ajusta limites em tempo de execução"""
+        if tokens_per_minute:
+            self._refill()
+            self._available = min(self._available, tokens_per_minute)
+            self.tokens_per_minute = tokens_per_minute
+        if max_concurrency:
+            self.max_concurrency = max_concurrency
+        self._dispatch()
+
+    async def acquire(self, priority: str, client_id: Optional[str], tokens: int) -> Ticket:
+        """Espera a vez da chamada e reserva os tokens estimados"""
+        if priority not in self._queues:
+            priority = NEAR_REAL_TIME
+        client = client_id or "unassigned"
+        # Pedidos maiores que o TPM inteiro nunca caberiam: limita ao TPM
+        tokens = max(1, min(tokens, self.tokens_per_minute))
+
+        # Fair queueing: cada cliente avança seu relógio em tokens/peso
+        weight = self.client_weights.get(client, 1.0)
+        start = max(self._virtual_time[priority], self._client_finish.get((priority, client), 0.0))
+        finish_tag = start + tokens / weight
+        self._client_finish[(priority, client)] = finish_tag
+
+        ticket = Ticket(priority, client, tokens, start, finish_tag)
+        ticket.future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._queues[priority], (finish_tag, next(self._sequence), ticket))
+        self._update_depth()
+        self._dispatch()
+
+        try:
+            await ticket.future
+        except asyncio.CancelledError:
+            if ticket.future.done() and not ticket.future.cancelled():
+                # Já tinha sido admitido: devolve a vaga
+                self.release(ticket, 0)
+            raise
+
+        SCHEDULER_WAIT.observe(time.perf_counter() - ticket.enqueued_at, priority=priority)
+        return ticket
+
+    def release(self, ticket: Ticket, actual_tokens: Optional[int] = None):
+        """Libera a vaga e corrige a estimativa de tokens com o uso real"""
+        if ticket.released:
+            return
+        ticket.released = True
+        self._in_flight -= 1
+        if actual_tokens is not None:
+            self._refill()
+            self._available = min(
+                float(self.tokens_per_minute),
+                self._available + ticket.tokens - actual_tokens
+            )
+        self._dispatch()
+
+    def _refill(self):
+        now = time.monotonic()
+        elapsed = now - self._last_refill
+        self._last_refill = now
+        self._available = min(
+            float(self.tokens_per_minute),
+            self._available + elapsed * self.tokens_per_minute / 60.0
+        )
+
+    def _dispatch(self):
+        """Admite o máximo possível, respeitando prioridade estrita"""
+        self._refill()
+
+        while self._in_flight < self.max_concurrency:
+            priority, queue = next(((p, q) for p, q in self._queues.items() if q), (None, None))
+            if priority is None:
+                break
+
+            finish_tag, _, ticket = queue[0]
+            if ticket.future.cancelled():
+                heapq.heappop(queue)
+                continue
+
+            reserve = self.tokens_per_minute * self.batch_reserve_ratio if priority == BATCH else 0.0
+            # Batch maior que o TPM fora da reserva nunca caberia e travaria a
+            # fila atrás dele: exige só o balde cheio
+            needed = min(ticket.tokens, self.tokens_per_minute - reserve) + reserve
+            if self._available < needed:
+                self._schedule_wakeup(needed - self._available)
+                break
+
+            heapq.heappop(queue)
+            self._available -= ticket.tokens
+            self._in_flight += 1
+            # Relógio virtual da classe = tag de início do último admitido
+            self._virtual_time[priority] = max(self._virtual_time[priority], ticket.start_tag)
+            ticket.future.set_result(True)
+
+        self._update_depth()
+
+    def _schedule_wakeup(self, missing_tokens: float):
+        """Agenda nova tentativa quando os tokens faltantes tiverem sido repostos"""
+        if self._wakeup and not self._wakeup.cancelled():
+            return
+        delay = max(0.01, missing_tokens * 60.0 / self.tokens_per_minute)
+        loop = asyncio.get_running_loop()
+
+        def wake():
+            self._wakeup = None
+            self._dispatch()
+
+        self._wakeup = loop.call_later(delay, wake)
+
+    def _update_depth(self):
+        for priority, queue in self._queues.items():
+            QUEUE_DEPTH.set(len(queue), queue=f"llm_{priority}")
+
+    def get_stats(self) -> dict:
+        self._refill()
+        return {
+            "tokens_per_minute": self.tokens_per_minute,
+            "available_tokens": int(self._available),
+            "in_flight": self._in_flight,
+            "max_concurrency": self.max_concurrency,
+            "queued": {p: len(q) for p, q in self._queues.items()}
+        }
+
+
+llm_scheduler = LLMScheduler(
+    tokens_per_minute=int(os.getenv("LLM_TOKENS_PER_MINUTE", "90000")),
+    max_concurrency=int(os.getenv("LLM_MAX_CONCURRENCY", "32"))
+)
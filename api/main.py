@@ -3,7 +3,8 @@ AgencyZen API - Backend Principal
 FastAPI server para gerenciar agentes de IA, WhatsApp e geração de imagens.
 """
 
-from fastapi import FastAPI, HTTPException, WebSocket, WebSocketDisconnect
+from fastapi import FastAPI, HTTPException, Request, WebSocket, WebSocketDisconnect
+from fastapi.responses import PlainTextResponse, JSONResponse, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
 from pydantic import BaseModel
@@ -11,18 +12,39 @@ from typing import Optional, List, Dict, Any
 import os
 import json
 import asyncio
-from datetime import datetime
+import time
+import uuid
+from datetime import date, datetime
+from functools import partial
 from dotenv import load_dotenv
 
 # Import our modules
 from agents.base import Agent, AgentConfig
 from agents.manager import ManagerAgent
+from agents.approvals import parse_priority
+from agents.policy import PolicyEngine
+from agents.content_calendar import CalendarPlanner
 from agents.whatsapp_agent import WhatsAppAgent
+from agents.mailbox import MailboxFullError
 from agents.social_agent import SocialMediaAgent
 from agents.traffic_agent import TrafficAgent
-from whatsapp.connection import WhatsAppConnection
+from knowledge.index import KnowledgeBase
+from whatsapp.manager import WhatsAppManager, WhatsAppInstanceError, DEFAULT_INSTANCE
+from whatsapp.ingestion import InboundPipeline, IngestionFullError
 from image_gen.replicate_client import ImageGenerator
-from flows.engine import FlowEngine
+from flows.engine import FlowEngine, Flow
+from storage.sqlite_store import SQLiteStore
+from state.backend import create_backend
+from usage.tracker import usage_tracker, BudgetExceededError
+from jobs.manager import JobManager, JobQueueFullError
+from llm.deadline import deadline_scope
+from llm.errors import DeadlineExceededError, LLMError, LLMRateLimitError
+from llm.rate_limit import rate_limiter
+from llm.router import model_router, ADVANCED, TIERS
+from llm.scheduler import llm_scheduler, priority_scope, BATCH
+from metrics.registry import (
+    registry, HTTP_REQUEST_DURATION, CACHE_EVENTS, QUEUE_DEPTH, monitor_event_loop_lag
+)
 
 load_dotenv()
 
@@ -41,11 +63,264 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Storage (em memória por enquanto, depois SQLite)
+@app.middleware("http")
+async def measure_requests(request: Request, call_next):
+    """Latência por rota (template, não a URL crua, para não explodir labels)"""
+    start = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        route = request.scope.get("route")
+        HTTP_REQUEST_DURATION.observe(
+            time.perf_counter() - start,
+            method=request.method,
+            route=getattr(route, "path", "unmatched"),
+            status=status
+        )
+
+# Prazo padrão de uma requisição; o cliente pode encurtar com X-Request-Timeout
+REQUEST_TIMEOUT = float(os.getenv("REQUEST_TIMEOUT", "60"))
+
+@app.middleware("http")
+async def propagate_deadline(request: Request, call_next):
+    """Abre o prazo da requisição, que desce até fluxos e chamadas de LLM"""
+    timeout = REQUEST_TIMEOUT
+    header = request.headers.get("x-request-timeout")
+    if header:
+        try:
+            timeout = min(timeout, max(0.0, float(header)))
+        except ValueError:
+            pass
+    with deadline_scope(timeout):
+        return await call_next(request)
+
+@app.exception_handler(BudgetExceededError)
+async def budget_exceeded_handler(request: Request, exc: BudgetExceededError):
+    return JSONResponse(status_code=429, content={
+        "detail": str(exc),
+        "client_id": exc.client_id,
+        "period": exc.period
+    })
+
+@app.exception_handler(MailboxFullError)
+async def mailbox_full_handler(request: Request, exc: MailboxFullError):
+    return JSONResponse(status_code=429, content={"detail": str(exc)})
+
+@app.exception_handler(IngestionFullError)
+async def ingestion_full_handler(request: Request, exc: IngestionFullError):
+    """O provedor reentrega depois; ids já aceitos são deduplicados"""
+    return JSONResponse(
+        status_code=503,
+        content={"detail": str(exc)},
+        headers={"Retry-After": str(max(1, int(exc.retry_after)))}
+    )
+
+@app.exception_handler(WhatsAppInstanceError)
+async def whatsapp_instance_handler(request: Request, exc: WhatsAppInstanceError):
+    return JSONResponse(status_code=exc.status_code, content={"detail": str(exc)})
+
+@app.exception_handler(LLMError)
+async def llm_error_handler(request: Request, exc: LLMError):
+    """429 limite, 503 provedor fora, 504 prazo esgotado, 502 demais falhas"""
+    headers = {}
+    if isinstance(exc, LLMRateLimitError) and exc.retry_after:
+        headers["Retry-After"] = str(max(1, int(exc.retry_after + 0.999)))
+    return JSONResponse(
+        status_code=exc.status_code,
+        content={"detail": str(exc), "error": type(exc).__name__, "model": exc.model},
+        headers=headers
+    )
+
+# Storage: SQLite (WAL) com cache e write-behind para mensagens.
+# agents_db guarda as instâncias vivas; a fonte de verdade é o store.
+store = SQLiteStore()
 agents_db: Dict[str, Agent] = {}
-flows_db: Dict[str, dict] = {}
-conversations_db: Dict[str, List[dict]] = {}
-whatsapp_connection: Optional[WhatsAppConnection] = None
+
+flow_engine = FlowEngine(agents=agents_db)
+
+# Regras por cliente que decidem posts/campanhas antes do Gerente
+policy_engine = PolicyEngine()
+
+# Exemplos e conteúdo aprovado de cada cliente: referências para os prompts
+knowledge = KnowledgeBase(
+    store,
+    ivf_threshold=int(os.getenv("KNOWLEDGE_IVF_THRESHOLD", "4096")),
+    snippet_chars=int(os.getenv("KNOWLEDGE_SNIPPET_CHARS", "500"))
+)
+KNOWLEDGE_TOP_K = int(os.getenv("KNOWLEDGE_TOP_K", "3"))
+
+# Tema quase igual a um post anterior: reaproveita o aprovado ou adapta (Jaccard dos temas)
+POST_REUSE_THRESHOLD = float(os.getenv("POST_REUSE_THRESHOLD", str(SocialMediaAgent.REUSE_THRESHOLD)))
+POST_ADAPT_THRESHOLD = float(os.getenv("POST_ADAPT_THRESHOLD", str(SocialMediaAgent.ADAPT_THRESHOLD)))
+
+# Estado e eventos compartilhados entre workers (STATE_BACKEND=memory|sqlite)
+state = create_backend()
+
+# Agente que atende as mensagens recebidas no WhatsApp
+WHATSAPP_AGENT_ID = os.getenv("WHATSAPP_AGENT_ID", "whatsapp")
+
+
+async def handle_inbound(message: dict):
+    """Consumidor da fila de entrada: agente responde e fluxos de mensagem rodam"""
+    phone = message["from"]
+    instance_id = message.get("instance_id", DEFAULT_INSTANCE)
+    config = manager.instances.get(instance_id) or {}
+    agent = agents_db.get(config.get("agent_id") or WHATSAPP_AGENT_ID)
+    if isinstance(agent, WhatsAppAgent):
+        # Primeira coisa: entra na caixa do contato (a ordem por telefone vem dela)
+        try:
+            reply = await agent.reply_to_contact(message["content"], phone, message.get("received_at"))
+        except DeadlineExceededError:
+            # Passou do prazo desde que chegou: a resposta já não serve ao contato
+            reply = None
+        if reply is not None and instance_id in manager.instances:
+            await manager.enqueue(instance_id, phone, reply, client_id=config.get("client_id"))
+    local = manager.local.get(instance_id)
+    if local and "seq" not in message:
+        # Veio pelo webhook: entra no histórico da instância (se for deste worker)
+        local.connection.log.append(phone, message)
+    for flow in await message_flows():
+        await flow_engine.execute_flow(flow.id, message)
+
+
+inbound = InboundPipeline(
+    handle_inbound,
+    store,
+    max_queue=int(os.getenv("WHATSAPP_INGEST_QUEUE", "10000")),
+    consumers=int(os.getenv("WHATSAPP_INGEST_CONSUMERS", "32")),
+    owner=state.worker_id,
+    owner_alive=state.worker_alive
+)
+
+# Instâncias de WhatsApp (uma por número), distribuídas entre os workers
+manager = WhatsAppManager(
+    state,
+    store,
+    outbound_settings={
+        "messages_per_minute": float(os.getenv("WHATSAPP_SEND_PER_MINUTE", "600")),
+        "per_contact_interval": float(os.getenv("WHATSAPP_CONTACT_INTERVAL", "1.0")),
+        "max_attempts": int(os.getenv("WHATSAPP_SEND_MAX_ATTEMPTS", "5"))
+    },
+    # Receber só enfileira; a conexão espera vaga se a fila estiver cheia
+    on_message=lambda message: inbound.submit(message, wait=True),
+    fake_transport=os.getenv("WHATSAPP_TRANSPORT") == "fake"
+)
+
+AGENT_CLASSES = {
+    "manager": ManagerAgent,
+    "whatsapp": WhatsAppAgent,
+    "social_media": SocialMediaAgent,
+    "traffic": TrafficAgent
+}
+
+
+def build_agent(agent_data: dict) -> Agent:
+    """Instancia o agente certo a partir de um dicionário salvo"""
+    AgentClass = AGENT_CLASSES.get(agent_data["type"], Agent)
+    agent = AgentClass(
+        id=agent_data["id"],
+        name=agent_data["name"],
+        type=agent_data["type"],
+        description=agent_data.get("description", ""),
+        system_prompt=agent_data.get("system_prompt", ""),
+        client_id=agent_data.get("client_id")
+    )
+    apply_agent_data(agent, agent_data)
+    # Mensagens de WhatsApp vão para o store sem bloquear a resposta
+    agent.message_sink = record_message
+    if isinstance(agent, ManagerAgent):
+        agent.on_queue_change = partial(on_approval_queue_change, agent.id)
+        agent.on_approved = on_items_approved
+        agent.policy = policy_engine
+    if isinstance(agent, (SocialMediaAgent, TrafficAgent)):
+        agent.knowledge = knowledge
+        agent.knowledge_top_k = KNOWLEDGE_TOP_K
+    if isinstance(agent, SocialMediaAgent):
+        agent.reuse_threshold = POST_REUSE_THRESHOLD
+        agent.adapt_threshold = POST_ADAPT_THRESHOLD
+    if isinstance(agent, WhatsAppAgent):
+        agent.lead_sink = record_lead
+    return agent
+
+
+def apply_agent_data(agent: Agent, agent_data: dict):
+    """
+    Copia a configuração salva para o agente. O estado em memória (fila de
+    aprovação, posts, conversas, caixas de entrada) fica intacto.
+    """
+    agent.name = agent_data["name"]
+    agent.description = agent_data.get("description", "")
+    agent.system_prompt = agent_data.get("system_prompt", "")
+    agent.client_id = agent_data.get("client_id")
+    agent.status = agent_data.get("status", agent.status)
+    agent.tasks_completed = agent_data.get("tasks_completed", 0)
+    config = agent_data.get("config", {})
+    agent.config.model = config.get("model", agent.config.model)
+    agent.config.temperature = config.get("temperature", agent.config.temperature)
+    agent.config.hedge = config.get("hedge", agent.config.hedge)
+    agent.config.hedge_model = config.get("hedge_model", agent.config.hedge_model)
+    agent.config.routing = config.get("routing", agent.config.routing)
+    if agent_data.get("created_at"):
+        agent.created_at = datetime.fromisoformat(agent_data["created_at"])
+    if isinstance(agent, WhatsAppAgent):
+        agent.scripts.update(agent_data.get("scripts", {}))
+        faq = {entry["id"]: entry for entry in agent_data.get("faq", [])}
+        for entry in agent.get_faq():
+            if entry["id"] not in faq:
+                agent.remove_faq(entry["id"])
+        for entry in faq.values():
+            agent.add_faq(entry["question"], entry["answer"], entry.get("keywords"), entry["id"])
+
+
+def record_lead(lead: dict):
+    """Grava o lead e avisa os outros workers"""
+    asyncio.create_task(store.save_lead(lead))
+    if state.shared:
+        asyncio.create_task(state.publish("leads", lead))
+
+
+def record_message(conversation_id: str, role: str, content: str, **kwargs) -> dict:
+    """Grava mensagem (write-behind) e avisa os outros workers"""
+    message = store.append_message(conversation_id, role, content, **kwargs)
+    if state.shared:
+        asyncio.create_task(state.publish("messages", message))
+    return message
+
+
+def on_approval_queue_change(agent_id: str, event: str, item: dict):
+    """Grava a mudança na fila (snapshot para quem inicia) e propaga para todos os workers"""
+    if event == "queued":
+        saved, decided = [item], []
+    elif event == "reviewed":
+        saved, decided = item["queued"], [d["id"] for d in item["decided"]]
+    elif event == "approved_many":
+        saved, decided = [], item["ids"]
+    else:
+        saved, decided = [], [item["id"]]
+    asyncio.create_task(store.save_approvals(agent_id, saved, decided))
+    asyncio.create_task(state.publish("approvals", {"event": event, "item": item}))
+
+
+def on_items_approved(items: List[dict]):
+    """Posts e anúncios aprovados entram na base de conhecimento do cliente"""
+    asyncio.create_task(knowledge.add_approved(items))
+
+
+def on_knowledge_change(client_id: str, docs: List[dict], removed: List[str]):
+    """Os outros workers recalculam os vetores (o embedder é determinístico)"""
+    if state.shared:
+        asyncio.create_task(state.publish("knowledge", {"client_id": client_id, "docs": docs, "removed": removed}))
+
+
+knowledge.on_change = on_knowledge_change
+
+
+async def publish_agent(action: str, agent: dict):
+    """Avisa os outros workers que um agente mudou"""
+    await state.publish("agents", {"action": action, "agent": agent})
 
 # ============== Models ==============
 
@@ -61,6 +336,8 @@ class AgentUpdate(BaseModel):
     description: Optional[str] = None
     system_prompt: Optional[str] = None
     status: Optional[str] = None
+    model: Optional[str] = None
+    routing: Optional[bool] = None  # False fixa o agente em `model` (padrão quando `model` vem junto)
 
 class FlowCreate(BaseModel):
     name: str
@@ -74,24 +351,146 @@ class MessageSend(BaseModel):
     content: str
     agent_id: str
 
+class BulkMessage(BaseModel):
+    to: str
+    content: str
+
+class BulkSend(BaseModel):
+    # Mensagens individuais, ou o mesmo conteúdo para uma lista de números
+    messages: Optional[List[BulkMessage]] = None
+    to: Optional[List[str]] = None
+    content: Optional[str] = None
+    client_id: Optional[str] = None
+
+class InstanceMessage(BaseModel):
+    to: str
+    content: str
+
+class WhatsAppInstanceCreate(BaseModel):
+    id: str
+    client_id: Optional[str] = None
+    agent_id: Optional[str] = None
+
 class ImageGenerate(BaseModel):
     prompt: str
     style: Optional[str] = "realistic"
     client_id: Optional[str] = None
 
+class BudgetUpdate(BaseModel):
+    daily_limit: Optional[float] = None
+    monthly_limit: Optional[float] = None
+    downgrade_model: str = "gpt-4o-mini"
+    soft_limit_ratio: float = 0.8
+    hard_action: str = "throttle"  # throttle, downgrade
+
+class JobCreate(BaseModel):
+    type: str  # social.create_post, social.image_prompt, traffic.create_campaign, traffic.analyze_metrics, agent.chat
+    params: dict = {}
+    priority: int = 5  # 0 = mais urgente
+    ttl: Optional[float] = None  # segundos que o resultado fica disponível
+
+class CalendarCreate(BaseModel):
+    client_id: str
+    agent_id: Optional[str] = None  # agente de social media (padrão: o primeiro)
+    start: date
+    end: date
+    topics: List[str]
+    posts_per_day: int = 1
+    weekdays: Optional[List[int]] = None  # 0 = segunda ... 6 = domingo
+
+class CalendarBatch(BaseModel):
+    calendars: List[CalendarCreate]
+
+class FAQCreate(BaseModel):
+    question: str
+    answer: str
+    keywords: List[str] = []
+
+class ScriptUpdate(BaseModel):
+    content: str
+
+class ApprovalCreate(BaseModel):
+    title: str
+    type: str = "post"
+    content: Optional[str] = None
+    client_id: Optional[str] = None
+    agent_id: Optional[str] = None
+    agent_name: Optional[str] = None
+    priority: Optional[str] = None  # urgent, high, normal, low
+    due_at: Optional[float] = None  # prazo (epoch); padrão vem do SLA da prioridade
+
+class KnowledgeExamples(BaseModel):
+    examples: List[str]  # substitui os exemplos de treinamento do cliente
+
+class KnowledgeDocument(BaseModel):
+    text: str
+    id: Optional[str] = None  # mesmo id substitui o documento
+    source: str = "document"  # example, post, ad, document
+    title: Optional[str] = None
+
+class KnowledgeDocuments(BaseModel):
+    documents: List[KnowledgeDocument]
+
+class ApprovalReject(BaseModel):
+    reason: Optional[str] = None
+
+class ApprovalReview(BaseModel):
+    client_id: Optional[str] = None
+    agent_id: Optional[str] = None
+
+class PolicyRules(BaseModel):
+    min_length: Optional[int] = None
+    max_length: Optional[int] = None
+    banned_words: List[str] = []
+    required_hashtags: List[str] = []
+    max_budget: Optional[float] = None  # teto do orçamento diário das campanhas (R$)
+    margin: float = 0.1  # tolerância que escala para revisão em vez de rejeitar
+    auto_approve: bool = True
+
+class BulkApprove(BaseModel):
+    # Filtro dos pendentes a aprovar (vazio = todos)
+    client_id: Optional[str] = None
+    agent_id: Optional[str] = None
+    type: Optional[str] = None
+    priority: Optional[str] = None  # aprova deste nível para cima
+    limit: Optional[int] = None
+
+class RoutingOverride(BaseModel):
+    model: Optional[str] = None  # modelo fixo para o cliente
+    tiers: Dict[str, str] = {}  # ou troca por tier: fast, standard, advanced
+
+class ClientWeightUpdate(BaseModel):
+    weight: float = 1.0  # fatia relativa da vazão de LLM
+
 class ConfigUpdate(BaseModel):
     openai_key: Optional[str] = None
     replicate_key: Optional[str] = None
-    model: Optional[str] = "gpt-4-turbo"
+    model: Optional[str] = None
 
 # ============== Config ==============
 
+# Cópia local da config; a versão compartilhada fica no state backend
 config_store = {
     "openai_key": os.getenv("OPENAI_API_KEY", ""),
     "replicate_key": os.getenv("REPLICATE_API_TOKEN", ""),
     "model": "gpt-4-turbo"
 }
 
+
+def apply_config(config: dict):
+    """Aplica config compartilhada no processo atual"""
+    global image_generator
+    config_store.update(config)
+    if config_store["openai_key"]:
+        os.environ["OPENAI_API_KEY"] = config_store["openai_key"]
+    if config_store["replicate_key"]:
+        os.environ["REPLICATE_API_TOKEN"] = config_store["replicate_key"]
+    # Recria o gerador com a chave nova na próxima chamada
+    image_generator = None
+    # O modelo global é o usado nos pedidos complexos (só quando a mudança o traz)
+    if config.get("model"):
+        model_router.tier_models[ADVANCED] = config["model"]
+
 @app.get("/")
 async def root():
     return {"message": "AgencyZen API v3.0", "status": "running"}
@@ -106,45 +505,41 @@ async def get_config():
 
 @app.put("/api/config")
 async def update_config(config: ConfigUpdate):
+    changes = {}
     if config.openai_key:
-        config_store["openai_key"] = config.openai_key
-        os.environ["OPENAI_API_KEY"] = config.openai_key
+        changes["openai_key"] = config.openai_key
     if config.replicate_key:
-        config_store["replicate_key"] = config.replicate_key
-        os.environ["REPLICATE_API_TOKEN"] = config.replicate_key
+        changes["replicate_key"] = config.replicate_key
     if config.model:
-        config_store["model"] = config.model
+        changes["model"] = config.model
+    
+    apply_config(changes)
+    await state.set("config", config_store)
+    await state.publish("config", changes)
     return {"status": "updated"}
 
 # ============== Agents ==============
 
 @app.get("/api/agents")
 async def list_agents():
-    return list(agents_db.values())
+    return [agent.to_dict() for agent in agents_db.values()]
 
 @app.post("/api/agents")
 async def create_agent(agent_data: AgentCreate):
     agent_id = f"agent_{datetime.now().timestamp()}"
     
-    agent_classes = {
-        "manager": ManagerAgent,
-        "whatsapp": WhatsAppAgent,
-        "social_media": SocialMediaAgent,
-        "traffic": TrafficAgent
-    }
-    
-    AgentClass = agent_classes.get(agent_data.type, Agent)
-    
-    agent = AgentClass(
-        id=agent_id,
-        name=agent_data.name,
-        type=agent_data.type,
-        description=agent_data.description,
-        system_prompt=agent_data.system_prompt,
-        client_id=agent_data.client_id
-    )
+    agent = build_agent({
+        "id": agent_id,
+        "name": agent_data.name,
+        "type": agent_data.type,
+        "description": agent_data.description,
+        "system_prompt": agent_data.system_prompt,
+        "client_id": agent_data.client_id
+    })
     
     agents_db[agent_id] = agent
+    await store.save_agent(agent.to_dict())
+    await publish_agent("saved", agent.to_dict())
     return agent.to_dict()
 
 @app.get("/api/agents/{agent_id}")
@@ -167,7 +562,15 @@ async def update_agent(agent_id: str, update: AgentUpdate):
         agent.system_prompt = update.system_prompt
     if update.status:
         agent.status = update.status
+    if update.model:
+        agent.config.model = update.model
+        # Modelo escolhido vale para o agente, a menos que peça roteamento
+        agent.config.routing = False
+    if update.routing is not None:
+        agent.config.routing = update.routing
     
+    await store.save_agent(agent.to_dict())
+    await publish_agent("saved", agent.to_dict())
     return agent.to_dict()
 
 @app.delete("/api/agents/{agent_id}")
@@ -175,22 +578,264 @@ async def delete_agent(agent_id: str):
     if agent_id not in agents_db:
         raise HTTPException(status_code=404, detail="Agent not found")
     del agents_db[agent_id]
+    await store.delete_agent(agent_id)
+    await publish_agent("deleted", {"id": agent_id})
     return {"status": "deleted"}
 
+@app.get("/api/agents/{agent_id}/prompt-cache")
+async def prompt_cache_stats(agent_id: str):
+    if agent_id not in agents_db:
+        raise HTTPException(status_code=404, detail="Agent not found")
+    return agents_db[agent_id].get_prompt_cache_stats()
+
 @app.post("/api/agents/{agent_id}/chat")
 async def chat_with_agent(agent_id: str, message: dict):
     if agent_id not in agents_db:
         raise HTTPException(status_code=404, detail="Agent not found")
     
     agent = agents_db[agent_id]
-    response = await agent.process_message(message.get("content", ""))
+    content = message.get("content", "")
+    
+    phone = message.get("phone")
+    if phone and isinstance(agent, WhatsAppAgent):
+        # Conversa de WhatsApp: o agente grava o histórico por telefone
+        response = await agent.process_message(content, phone=phone)
+        return {"response": response}
+    
+    # O histórico vem do store para ser o mesmo em qualquer worker
+    conversation_id = f"agent:{agent_id}"
+    history = await store.get_conversation(conversation_id, limit=10)
+    agent.messages_history = [{"role": m["role"], "content": m["content"]} for m in history]
+    
+    record_message(conversation_id, "user", content, agent_id=agent_id, client_id=agent.client_id)
+    response = await agent.process_message(content)
+    record_message(conversation_id, "assistant", response, agent_id=agent_id, client_id=agent.client_id)
     return {"response": response}
 
+def get_whatsapp_agent(agent_id: str) -> WhatsAppAgent:
+    agent = agents_db.get(agent_id)
+    if agent is None:
+        raise HTTPException(status_code=404, detail="Agent not found")
+    if not isinstance(agent, WhatsAppAgent):
+        raise HTTPException(status_code=400, detail="Agent is not a WhatsApp agent")
+    return agent
+
+@app.get("/api/agents/{agent_id}/faq")
+async def list_faq(agent_id: str):
+    return get_whatsapp_agent(agent_id).get_faq()
+
+@app.post("/api/agents/{agent_id}/faq")
+async def add_faq(agent_id: str, faq: FAQCreate):
+    agent = get_whatsapp_agent(agent_id)
+    entry = agent.add_faq(faq.question, faq.answer, faq.keywords)
+    await store.save_agent(agent.to_dict())
+    await publish_agent("saved", agent.to_dict())
+    return entry
+
+@app.delete("/api/agents/{agent_id}/faq/{faq_id}")
+async def delete_faq(agent_id: str, faq_id: str):
+    agent = get_whatsapp_agent(agent_id)
+    if not agent.remove_faq(faq_id):
+        raise HTTPException(status_code=404, detail="FAQ not found")
+    await store.save_agent(agent.to_dict())
+    await publish_agent("saved", agent.to_dict())
+    return {"status": "deleted"}
+
+@app.put("/api/agents/{agent_id}/scripts/{script_type}")
+async def set_script(agent_id: str, script_type: str, script: ScriptUpdate):
+    agent = get_whatsapp_agent(agent_id)
+    agent.set_script(script_type, script.content)
+    await store.save_agent(agent.to_dict())
+    await publish_agent("saved", agent.to_dict())
+    return agent.get_scripts()
+
+def get_social_agent(agent_id: str) -> SocialMediaAgent:
+    agent = agents_db.get(agent_id)
+    if agent is None:
+        raise HTTPException(status_code=404, detail="Agent not found")
+    if not isinstance(agent, SocialMediaAgent):
+        raise HTTPException(status_code=400, detail="Agent is not a social media agent")
+    return agent
+
+@app.get("/api/agents/{agent_id}/posts")
+async def list_posts(
+    agent_id: str,
+    client_id: Optional[str] = None,
+    status: Optional[str] = None,
+    offset: int = 0,
+    limit: int = 50
+):
+    """Posts criados neste worker, mais novos primeiro"""
+    agent = get_social_agent(agent_id)
+    return agent.posts.query(client_id, max(offset, 0), min(max(limit, 1), 500), status)
+
+@app.get("/api/agents/{agent_id}/posts/similar")
+async def similar_posts(agent_id: str, topic: str, client_id: Optional[str] = None):
+    """Posts com tema parecido: o que create_post(reuse=True) reaproveitaria ou adaptaria"""
+    agent = get_social_agent(agent_id)
+    matches = agent.posts.similar(topic, client_id, agent.adapt_threshold)
+    return [{"similarity": score, "post": post} for score, post in matches]
+
+@app.get("/api/agents/{agent_id}/intents")
+async def intent_stats(agent_id: str):
+    return get_whatsapp_agent(agent_id).intents.get_stats()
+
+@app.get("/api/agents/{agent_id}/leads")
+async def list_leads(
+    agent_id: str,
+    client_id: Optional[str] = None,
+    min_score: float = 0.0,
+    order: str = "score",
+    offset: int = 0,
+    limit: int = 50
+):
+    if order not in ("score", "recent"):
+        raise HTTPException(status_code=400, detail="order must be score or recent")
+    agent = get_whatsapp_agent(agent_id)
+    return agent.get_qualified_leads(client_id, min_score, order, max(offset, 0), min(max(limit, 1), 500))
+
+@app.get("/api/agents/{agent_id}/mailboxes")
+async def mailbox_stats(agent_id: str):
+    return get_whatsapp_agent(agent_id).mailboxes.get_stats()
+
+def get_manager_agent(agent_id: str) -> ManagerAgent:
+    agent = agents_db.get(agent_id)
+    if not agent:
+        raise HTTPException(status_code=404, detail="Agent not found")
+    if not isinstance(agent, ManagerAgent):
+        raise HTTPException(status_code=400, detail="Agent is not a manager agent")
+    return agent
+
+@app.get("/api/agents/{agent_id}/approvals")
+async def list_approvals(
+    agent_id: str,
+    client_id: Optional[str] = None,
+    source_agent_id: Optional[str] = None,
+    offset: int = 0,
+    limit: int = 50
+):
+    """Pendentes do mais urgente para o menos (prioridade, depois prazo)"""
+    agent = get_manager_agent(agent_id)
+    return agent.approvals.query(client_id, source_agent_id, max(offset, 0), min(max(limit, 1), 500))
+
+@app.get("/api/agents/{agent_id}/approvals/stats")
+async def approval_stats(agent_id: str):
+    return get_manager_agent(agent_id).approvals.get_stats()
+
+@app.post("/api/agents/{agent_id}/approvals")
+async def create_approval(agent_id: str, request: ApprovalCreate):
+    """Passa pela política; só o que ela não decide entra na fila"""
+    agent = get_manager_agent(agent_id)
+    item = {k: v for k, v in request.model_dump().items() if v is not None}
+    item["id"] = f"item_{uuid.uuid4().hex[:12]}"
+    try:
+        agent.review([item])
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return agent.approvals.lookup(item["id"]) or item
+
+@app.post("/api/agents/{agent_id}/approvals/review")
+async def review_approvals(agent_id: str, request: ApprovalReview):
+    """Reaplica a política aos pendentes (decide em lote o que ficou claro)"""
+    return get_manager_agent(agent_id).review_pending(request.client_id, request.agent_id)
+
+@app.get("/api/agents/{agent_id}/approvals/{item_id}")
+async def get_approval(agent_id: str, item_id: str):
+    item = get_manager_agent(agent_id).approvals.get(item_id)
+    if not item:
+        raise HTTPException(status_code=404, detail="Item not pending")
+    return item
+
+@app.post("/api/agents/{agent_id}/approvals/approve")
+async def bulk_approve(agent_id: str, request: BulkApprove):
+    agent = get_manager_agent(agent_id)
+    try:
+        max_priority = parse_priority(request.priority) if request.priority else None
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    approved = agent.approve_many(request.client_id, request.agent_id, request.type, max_priority, request.limit)
+    return {"approved": len(approved), "ids": [item["id"] for item in approved]}
+
+@app.post("/api/agents/{agent_id}/approvals/{item_id}/approve")
+async def approve_item(agent_id: str, item_id: str):
+    item = get_manager_agent(agent_id).approve(item_id)
+    if not item:
+        raise HTTPException(status_code=404, detail="Item not pending")
+    return item
+
+@app.post("/api/agents/{agent_id}/approvals/{item_id}/reject")
+async def reject_item(agent_id: str, item_id: str, request: ApprovalReject):
+    item = get_manager_agent(agent_id).reject(item_id, request.reason)
+    if not item:
+        raise HTTPException(status_code=404, detail="Item not pending")
+    return item
+
+# ============== Approval Policies ==============
+
+@app.get("/api/approval-policies")
+async def list_approval_policies():
+    return {"policies": policy_engine.get_rules(), "stats": policy_engine.get_stats()}
+
+@app.put("/api/approval-policies/{client_id}")
+async def set_approval_policy(client_id: str, rules: PolicyRules):
+    """Regras do cliente ("*" vale para clientes sem regras próprias)"""
+    if rules.margin < 0:
+        raise HTTPException(status_code=400, detail="margin must not be negative")
+    policy_engine.set_rules(client_id, rules.model_dump())
+    await state.publish("approval_policies", {"client_id": client_id, "rules": rules.model_dump()})
+    await state.set("approval_policies", policy_engine.get_rules())
+    return {"client_id": client_id, "rules": rules.model_dump()}
+
+@app.delete("/api/approval-policies/{client_id}")
+async def delete_approval_policy(client_id: str):
+    if client_id not in policy_engine.policies:
+        raise HTTPException(status_code=404, detail="Policy not found")
+    policy_engine.remove_rules(client_id)
+    await state.publish("approval_policies", {"client_id": client_id, "rules": None})
+    await state.set("approval_policies", policy_engine.get_rules())
+    return {"status": "deleted"}
+
+# ============== Knowledge ==============
+
+@app.get("/api/knowledge")
+async def knowledge_stats():
+    return {**knowledge.get_stats(), "by_client": {c: knowledge.get_stats(c) for c in knowledge.indexes}}
+
+@app.get("/api/knowledge/{client_id}")
+async def client_knowledge(client_id: str, source: Optional[str] = None, offset: int = 0, limit: int = 50):
+    """Documentos do cliente, mais novos primeiro"""
+    index = knowledge.indexes.get(client_id)
+    docs = [d for d in index.docs.values() if not source or d["source"] == source] if index else []
+    docs.sort(key=lambda d: d["created_at"], reverse=True)
+    offset, limit = max(offset, 0), min(max(limit, 1), 500)
+    return {**knowledge.get_stats(client_id), "total": len(docs), "items": docs[offset:offset + limit]}
+
+@app.put("/api/knowledge/{client_id}/examples")
+async def set_client_examples(client_id: str, request: KnowledgeExamples):
+    """Exemplos do treinamento do cliente (só os que mudaram são recalculados)"""
+    return await knowledge.set_examples(client_id, request.examples)
+
+@app.post("/api/knowledge/{client_id}/documents")
+async def add_client_documents(client_id: str, request: KnowledgeDocuments):
+    docs = await knowledge.add_documents(client_id, [d.model_dump(exclude_none=True) for d in request.documents])
+    return {"added": len(docs), "ids": [doc["id"] for doc in docs]}
+
+@app.delete("/api/knowledge/{client_id}/documents/{doc_id}")
+async def delete_client_document(client_id: str, doc_id: str):
+    if not await knowledge.remove_documents(client_id, [doc_id]):
+        raise HTTPException(status_code=404, detail="Document not found")
+    return {"status": "deleted"}
+
+@app.get("/api/knowledge/{client_id}/search")
+async def search_client_knowledge(client_id: str, q: str, k: int = 5, source: Optional[str] = None):
+    """O que entraria no prompt para este pedido"""
+    return knowledge.search(client_id, q, min(max(k, 1), 50), [source] if source else None)
+
 # ============== Flows ==============
 
 @app.get("/api/flows")
 async def list_flows():
-    return list(flows_db.values())
+    return await store.list_flows()
 
 @app.post("/api/flows")
 async def create_flow(flow_data: FlowCreate):
@@ -207,61 +852,236 @@ async def create_flow(flow_data: FlowCreate):
         "status": "active"
     }
     
-    flows_db[flow_id] = flow
+    await store.save_flow(flow)
+    await state.publish("flows", {"flow_id": flow["id"]})
     return flow
 
 @app.get("/api/flows/{flow_id}")
 async def get_flow(flow_id: str):
-    if flow_id not in flows_db:
+    flow = await store.get_flow(flow_id)
+    if not flow:
         raise HTTPException(status_code=404, detail="Flow not found")
-    return flows_db[flow_id]
+    return flow
 
 @app.put("/api/flows/{flow_id}")
 async def update_flow(flow_id: str, flow_data: FlowCreate):
-    if flow_id not in flows_db:
+    flow = await store.get_flow(flow_id)
+    if not flow:
         raise HTTPException(status_code=404, detail="Flow not found")
     
-    flows_db[flow_id].update({
+    flow = {
+        **flow,
         "name": flow_data.name,
         "description": flow_data.description,
         "nodes": flow_data.nodes,
         "edges": flow_data.edges
-    })
-    return flows_db[flow_id]
+    }
+    await store.save_flow(flow)
+    await state.publish("flows", {"flow_id": flow["id"]})
+    return flow
+
+def load_flow(flow_data: dict) -> Flow:
+    """Carrega a definição salva no motor (pode ter sido editada)"""
+    flow = Flow(
+        id=flow_data["id"],
+        name=flow_data["name"],
+        description=flow_data.get("description", ""),
+        nodes=flow_data["nodes"],
+        edges=flow_data["edges"]
+    )
+    flow_engine.flows[flow.id] = flow
+    return flow
+
+# Fluxos disparados por mensagem recebida, relidos a cada poucos segundos
+_message_flows: Dict[str, Any] = {"loaded_at": 0.0, "flows": []}
+
+async def message_flows() -> List[Flow]:
+    """Fluxos ativos cujo gatilho é `whatsapp_message`"""
+    if time.monotonic() - _message_flows["loaded_at"] > 5.0:
+        flows = []
+        for flow_data in await store.list_flows():
+            trigger = next((n for n in flow_data["nodes"] if n.get("type") == "trigger"), None)
+            if (
+                trigger and (trigger.get("data") or {}).get("event") == "whatsapp_message"
+                and flow_data.get("status", "active") == "active"
+            ):
+                flows.append(load_flow(flow_data))
+        _message_flows.update(loaded_at=time.monotonic(), flows=flows)
+    return _message_flows["flows"]
+
+@app.post("/api/flows/{flow_id}/run")
+async def run_flow(flow_id: str, trigger_data: dict):
+    flow_data = await store.get_flow(flow_id)
+    if not flow_data:
+        raise HTTPException(status_code=404, detail="Flow not found")
+    load_flow(flow_data)
+    return await flow_engine.execute_flow(flow_id, trigger_data)
 
 @app.delete("/api/flows/{flow_id}")
 async def delete_flow(flow_id: str):
-    if flow_id not in flows_db:
+    if not await store.get_flow(flow_id):
         raise HTTPException(status_code=404, detail="Flow not found")
-    del flows_db[flow_id]
+    await store.delete_flow(flow_id)
+    flow_engine.flows.pop(flow_id, None)
+    await state.publish("flows", {"flow_id": flow_id})
     return {"status": "deleted"}
 
 # ============== WhatsApp ==============
 
+def bulk_messages(request: BulkSend) -> List[dict]:
+    if request.messages:
+        messages = [m.model_dump() for m in request.messages]
+    elif request.to and request.content:
+        messages = [{"to": to, "content": request.content} for to in request.to]
+    else:
+        raise HTTPException(status_code=400, detail="Provide messages or to + content")
+    if len(messages) > 50000:
+        raise HTTPException(status_code=400, detail="At most 50000 messages per batch")
+    return messages
+
+async def require_connected(instance_id: str):
+    if not await manager.is_connected(instance_id):
+        raise HTTPException(status_code=400, detail="WhatsApp not connected")
+
+# Rotas sem instância operam na instância padrão
+
 @app.post("/api/whatsapp/connect")
 async def connect_whatsapp():
-    global whatsapp_connection
-    whatsapp_connection = WhatsAppConnection()
-    qr_code = await whatsapp_connection.generate_qr()
-    return {"qr_code": qr_code, "status": "waiting_scan"}
+    return await manager.call(DEFAULT_INSTANCE, "connect")
 
 @app.get("/api/whatsapp/status")
 async def whatsapp_status():
-    if whatsapp_connection:
-        return {"connected": whatsapp_connection.is_connected}
-    return {"connected": False}
+    return {"connected": await manager.is_connected(DEFAULT_INSTANCE)}
 
 @app.post("/api/whatsapp/send")
 async def send_whatsapp(message: MessageSend):
-    if not whatsapp_connection or not whatsapp_connection.is_connected:
-        raise HTTPException(status_code=400, detail="WhatsApp not connected")
-    
-    result = await whatsapp_connection.send_message(message.to, message.content)
-    return result
+    await require_connected(DEFAULT_INSTANCE)
+    queued = await manager.enqueue(DEFAULT_INSTANCE, message.to, message.content)
+    return {"success": True, "message": queued}
+
+@app.post("/api/whatsapp/send/bulk")
+async def send_whatsapp_bulk(request: BulkSend):
+    messages = bulk_messages(request)
+    await require_connected(DEFAULT_INSTANCE)
+    return await manager.enqueue_bulk(DEFAULT_INSTANCE, messages, client_id=request.client_id)
+
+@app.post("/api/whatsapp/webhook")
+async def whatsapp_webhook(payload: dict):
+    """
+    Entrada do provedor: {"instance_id": "...", "messages": [{id, from, content,
+    timestamp}], "statuses": [{id, status}]}. Responde assim que as mensagens
+    entram na fila.
+    """
+    results = {"accepted": 0, "duplicate": 0, "statuses": 0}
+    instance_id = payload.get("instance_id") or DEFAULT_INSTANCE
+    manager.get_instance(instance_id)
+    items = payload.get("messages", [])
+    if not inbound.has_room(len(items)):
+        # Recusa o lote inteiro: na reentrega nada conta como duplicado por engano
+        raise IngestionFullError(f"Inbound queue cannot take {len(items)} messages now")
+    for item in items:
+        if not item.get("from") or "content" not in item:
+            raise HTTPException(status_code=400, detail="Messages need from and content")
+        message = {
+            "id": item.get("id"),
+            "from": item["from"],
+            "content": item["content"],
+            "timestamp": item.get("timestamp") or datetime.now().isoformat(),
+            "status": "received",
+            "instance_id": instance_id
+        }
+        if not message["id"]:
+            del message["id"]
+        results[await inbound.submit(message)] += 1
+    for receipt in payload.get("statuses", []):
+        if await manager.update_status(receipt["id"], receipt["status"]):
+            results["statuses"] += 1
+    return results
+
+@app.get("/api/whatsapp/inbound")
+async def whatsapp_inbound_stats():
+    return inbound.get_stats()
+
+@app.get("/api/whatsapp/outbound")
+async def whatsapp_outbound_stats():
+    """Fila de envio da instância padrão (veja /instances para as demais)"""
+    status = await manager.call(DEFAULT_INSTANCE, "status")
+    return status["outbound"]
+
+@app.get("/api/whatsapp/outbound/{message_id}")
+async def get_whatsapp_outbound(message_id: str):
+    message = await manager.get_outbound(message_id)
+    if not message:
+        raise HTTPException(status_code=404, detail="Message not found")
+    return message
+
+@app.get("/api/whatsapp/batches/{batch_id}")
+async def get_whatsapp_batch(batch_id: str):
+    batch = await manager.get_batch(batch_id)
+    if not batch:
+        raise HTTPException(status_code=404, detail="Batch not found")
+    return batch
+
+@app.get("/api/whatsapp/messages/{phone}")
+async def get_whatsapp_messages(phone: str, before: Optional[int] = None, limit: int = 50):
+    """Histórico do contato na instância padrão, paginado por cursor"""
+    return await manager.call(DEFAULT_INSTANCE, "messages", phone=phone, before=before, limit=min(max(limit, 1), 200))
+
+# ============== WhatsApp: instâncias ==============
+
+@app.get("/api/whatsapp/instances")
+async def list_whatsapp_instances():
+    return await manager.list_instances()
+
+@app.post("/api/whatsapp/instances")
+async def register_whatsapp_instance(instance: WhatsAppInstanceCreate):
+    if instance.agent_id and instance.agent_id not in agents_db:
+        raise HTTPException(status_code=404, detail="Agent not found")
+    return await manager.register(instance.id, client_id=instance.client_id, agent_id=instance.agent_id)
+
+@app.delete("/api/whatsapp/instances/{instance_id}")
+async def delete_whatsapp_instance(instance_id: str):
+    await manager.unregister(instance_id)
+    return {"status": "deleted"}
+
+@app.post("/api/whatsapp/instances/{instance_id}/connect")
+async def connect_whatsapp_instance(instance_id: str):
+    return await manager.call(instance_id, "connect")
+
+@app.post("/api/whatsapp/instances/{instance_id}/disconnect")
+async def disconnect_whatsapp_instance(instance_id: str):
+    return await manager.call(instance_id, "disconnect")
+
+@app.get("/api/whatsapp/instances/{instance_id}/status")
+async def whatsapp_instance_status(instance_id: str):
+    return await manager.call(instance_id, "status")
+
+@app.post("/api/whatsapp/instances/{instance_id}/send")
+async def send_whatsapp_instance(instance_id: str, message: InstanceMessage):
+    await require_connected(instance_id)
+    config = manager.get_instance(instance_id)
+    queued = await manager.enqueue(instance_id, message.to, message.content, client_id=config.get("client_id"))
+    return {"success": True, "message": queued}
+
+@app.post("/api/whatsapp/instances/{instance_id}/send/bulk")
+async def send_whatsapp_instance_bulk(instance_id: str, request: BulkSend):
+    messages = bulk_messages(request)
+    await require_connected(instance_id)
+    client_id = request.client_id or manager.get_instance(instance_id).get("client_id")
+    return await manager.enqueue_bulk(instance_id, messages, client_id=client_id)
+
+@app.get("/api/whatsapp/instances/{instance_id}/messages/{phone}")
+async def get_whatsapp_instance_messages(instance_id: str, phone: str, before: Optional[int] = None, limit: int = 50):
+    return await manager.call(instance_id, "messages", phone=phone, before=before, limit=min(max(limit, 1), 200))
+
+@app.get("/api/whatsapp/shards")
+async def whatsapp_shards():
+    """Workers vivos e quais instâncias cada um hospeda"""
+    return manager.get_shards()
 
 @app.get("/api/whatsapp/conversations")
 async def get_conversations():
-    return conversations_db
+    return await store.list_phone_conversations()
 
 # ============== Image Generation ==============
 
@@ -279,10 +1099,308 @@ async def generate_image(request: ImageGenerate):
     
     result = await image_generator.generate(
         prompt=request.prompt,
-        style=request.style
+        style=request.style,
+        client_id=request.client_id
     )
     return result
 
+# ============== Background Jobs ==============
+
+job_manager = JobManager(concurrency=int(os.getenv("JOB_WORKERS", "4")))
+
+
+def batch_job(handler):
+    """Chamadas de LLM feitas pelo job entram na classe batch do scheduler"""
+    async def run(params: dict):
+        with priority_scope(BATCH):
+            return await handler(params)
+    return run
+
+
+def get_job_agent(params: dict, agent_class) -> Agent:
+    """Agente indicado no job (ou o primeiro do tipo certo)"""
+    agent = agents_db.get(params.get("agent_id", ""))
+    if agent is None:
+        agent = next((a for a in agents_db.values() if isinstance(a, agent_class)), None)
+    if not isinstance(agent, agent_class):
+        raise ValueError(f"Nenhum agente do tipo {agent_class.__name__} disponível")
+    return agent
+
+def submit_for_approval(item: dict) -> dict:
+    """Entrega o conteúdo gerado ao Gerente (a política decide o que puder)"""
+    manager = next((a for a in agents_db.values() if isinstance(a, ManagerAgent)), None)
+    if manager:
+        manager.review([item])
+    return item
+
+async def job_create_post(params: dict):
+    agent = get_job_agent(params, SocialMediaAgent)
+    post = await agent.create_post(params["topic"], params.get("client_id"), params.get("reuse", False))
+    return submit_for_approval(post)
+
+async def job_image_prompt(params: dict):
+    agent = get_job_agent(params, SocialMediaAgent)
+    return await agent.generate_image_prompt(params["description"], params.get("client_id"))
+
+async def job_create_campaign(params: dict):
+    agent = get_job_agent(params, TrafficAgent)
+    return submit_for_approval(await agent.create_campaign(params["objective"], params.get("client_id")))
+
+async def job_analyze_metrics(params: dict):
+    agent = get_job_agent(params, TrafficAgent)
+    return await agent.analyze_metrics(params.get("metrics", {}))
+
+async def job_agent_chat(params: dict):
+    agent = get_job_agent(params, Agent)
+    return await agent.process_message(params.get("content", ""))
+
+# Calendário de conteúdo: posts gerados em paralelo vão direto para aprovação
+calendar_planner = CalendarPlanner(
+    store,
+    concurrency=int(os.getenv("CALENDAR_CONCURRENCY", "8")),
+    on_post=submit_for_approval,
+    owner=state.worker_id
+)
+
+job_manager.register("social.create_post", batch_job(job_create_post))
+job_manager.register("social.image_prompt", batch_job(job_image_prompt))
+job_manager.register("traffic.create_campaign", batch_job(job_create_campaign))
+job_manager.register("traffic.analyze_metrics", batch_job(job_analyze_metrics))
+job_manager.register("agent.chat", batch_job(job_agent_chat))
+
+
+async def on_job_update(job):
+    """Publica o status do job no state backend e nos WebSockets"""
+    data = job.to_dict()
+    await state.set(f"job:{job.id}", data)
+    await state.publish("ws", json.dumps({"type": "job", "job": data}))
+
+async def on_job_expire(job):
+    await state.delete(f"job:{job.id}")
+
+job_manager.on_update = on_job_update
+job_manager.on_expire = on_job_expire
+
+
+@app.post("/api/jobs", status_code=202)
+async def submit_job(request: JobCreate):
+    try:
+        job = job_manager.submit(
+            request.type,
+            request.params,
+            priority=request.priority,
+            client_id=request.params.get("client_id"),
+            ttl=request.ttl
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except JobQueueFullError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    return {"job_id": job.id, "status": job.status}
+
+@app.get("/api/jobs")
+async def list_jobs(status: Optional[str] = None, client_id: Optional[str] = None):
+    return {
+        "jobs": [job.to_dict() for job in job_manager.list(status, client_id)],
+        "stats": job_manager.get_stats()
+    }
+
+@app.get("/api/jobs/{job_id}")
+async def get_job(job_id: str):
+    job = job_manager.get(job_id)
+    if job:
+        return job.to_dict()
+    # Pode ter sido aceito por outro worker
+    data = await state.get(f"job:{job_id}")
+    if not data:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return data
+
+@app.delete("/api/jobs/{job_id}")
+async def cancel_job(job_id: str):
+    if job_manager.get(job_id):
+        if not job_manager.cancel(job_id):
+            raise HTTPException(status_code=409, detail="Job already finished")
+        return {"status": "cancelling"}
+    
+    if not await state.get(f"job:{job_id}"):
+        raise HTTPException(status_code=404, detail="Job not found")
+    await state.publish("jobs_cancel", {"job_id": job_id})
+    return {"status": "cancelling"}
+
+# ============== Content Calendar ==============
+
+async def start_calendar(request: CalendarCreate) -> dict:
+    if request.posts_per_day < 1 or any(d not in range(7) for d in request.weekdays or []):
+        raise HTTPException(status_code=400, detail="posts_per_day >= 1 and weekdays in 0..6")
+    try:
+        agent = get_job_agent({"agent_id": request.agent_id or ""}, SocialMediaAgent)
+        return await calendar_planner.start(
+            agent, request.client_id, request.start, request.end,
+            request.topics, request.posts_per_day, request.weekdays
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@app.post("/api/calendar", status_code=202)
+async def create_calendar(request: CalendarCreate):
+    """Gera o calendário em segundo plano; acompanhe por /stream"""
+    return await start_calendar(request)
+
+@app.post("/api/calendar/batch", status_code=202)
+async def create_calendars(request: CalendarBatch):
+    """Vários clientes de uma vez (todos dividem o mesmo limite de concorrência)"""
+    return [await start_calendar(calendar) for calendar in request.calendars]
+
+@app.get("/api/calendar")
+async def list_calendars(client_id: Optional[str] = None, limit: int = 100):
+    return await calendar_planner.list(client_id, min(max(limit, 1), 500))
+
+@app.get("/api/calendar/{run_id}")
+async def get_calendar(run_id: str):
+    run = await calendar_planner.get(run_id)
+    if not run:
+        raise HTTPException(status_code=404, detail="Calendar not found")
+    return run
+
+@app.get("/api/calendar/{run_id}/stream")
+async def stream_calendar(run_id: str):
+    """NDJSON: um evento por post pronto (ou falha), na ordem em que terminam"""
+    if not await calendar_planner.get(run_id, include_posts=False):
+        raise HTTPException(status_code=404, detail="Calendar not found")
+    
+    async def events():
+        async for event in calendar_planner.stream(run_id):
+            yield json.dumps(event, ensure_ascii=False) + "\n"
+    
+    return StreamingResponse(events(), media_type="application/x-ndjson")
+
+@app.post("/api/calendar/{run_id}/resume", status_code=202)
+async def resume_calendar(run_id: str):
+    """Refaz só os slots sem post (falhas, cancelamento ou reinício)"""
+    run = await calendar_planner.get(run_id, include_posts=False)
+    if not run:
+        raise HTTPException(status_code=404, detail="Calendar not found")
+    try:
+        agent = get_job_agent({"agent_id": run["agent_id"]}, SocialMediaAgent)
+        return await calendar_planner.resume(run_id, agent)
+    except ValueError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+
+@app.delete("/api/calendar/{run_id}")
+async def cancel_calendar(run_id: str):
+    if calendar_planner.cancel(run_id):
+        return {"status": "cancelling"}
+    run = await calendar_planner.get(run_id, include_posts=False)
+    if not run:
+        raise HTTPException(status_code=404, detail="Calendar not found")
+    if run["status"] != "running":
+        raise HTTPException(status_code=409, detail="Calendar already finished")
+    await state.publish("calendar_cancel", {"run_id": run_id})
+    return {"status": "cancelling"}
+
+# ============== Usage & Budgets ==============
+
+@app.get("/api/usage")
+async def get_usage(
+    client_id: Optional[str] = None,
+    agent_id: Optional[str] = None,
+    day_from: Optional[str] = None,
+    day_to: Optional[str] = None,
+    group_by: str = "day,client_id,agent_id"
+):
+    return await usage_tracker.get_usage(
+        client_id=client_id,
+        agent_id=agent_id,
+        day_from=day_from,
+        day_to=day_to,
+        group_by=tuple(c.strip() for c in group_by.split(","))
+    )
+
+@app.get("/api/usage/clients/{client_id}")
+async def get_client_usage(client_id: str):
+    return usage_tracker.get_budget_status(client_id)
+
+@app.put("/api/usage/budgets/{client_id}")
+async def set_budget(client_id: str, budget: BudgetUpdate):
+    if budget.hard_action not in ("throttle", "downgrade"):
+        raise HTTPException(status_code=400, detail="hard_action must be throttle or downgrade")
+    saved = await usage_tracker.set_budget(client_id, **budget.model_dump())
+    await state.publish("budgets", {"client_id": client_id, "budget": saved})
+    return usage_tracker.get_budget_status(client_id)
+
+@app.delete("/api/usage/budgets/{client_id}")
+async def delete_budget(client_id: str):
+    await usage_tracker.remove_budget(client_id)
+    await state.publish("budgets", {"client_id": client_id, "budget": None})
+    return {"status": "deleted"}
+
+# ============== LLM Scheduler ==============
+
+@app.get("/api/llm/scheduler")
+async def get_scheduler_stats():
+    return {
+        **llm_scheduler.get_stats(),
+        "client_weights": llm_scheduler.client_weights,
+        "rate_limits": rate_limiter.get_stats()
+    }
+
+@app.put("/api/llm/clients/{client_id}/weight")
+async def set_client_weight(client_id: str, request: ClientWeightUpdate):
+    if request.weight <= 0:
+        raise HTTPException(status_code=400, detail="weight must be positive")
+    llm_scheduler.set_client_weight(client_id, request.weight)
+    await state.publish("llm_weights", {"client_id": client_id, "weight": request.weight})
+    await state.set("llm_weights", llm_scheduler.client_weights)
+    return {"client_id": client_id, "weight": llm_scheduler.client_weights[client_id]}
+
+# ============== Model Routing ==============
+
+@app.get("/api/llm/routing")
+async def get_routing():
+    return model_router.get_stats()
+
+@app.put("/api/llm/routing/clients/{client_id}")
+async def set_routing_override(client_id: str, override: RoutingOverride):
+    unknown = set(override.tiers) - set(TIERS)
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown tiers: {sorted(unknown)}")
+    if not override.model and not override.tiers:
+        raise HTTPException(status_code=400, detail="model or tiers is required")
+    model_router.set_client_override(client_id, override.model, override.tiers)
+    await state.set("llm_routing", model_router.client_overrides)
+    await state.publish("llm_routing", {"client_id": client_id, "override": model_router.client_overrides[client_id]})
+    return model_router.client_overrides[client_id]
+
+@app.delete("/api/llm/routing/clients/{client_id}")
+async def delete_routing_override(client_id: str):
+    model_router.remove_client_override(client_id)
+    await state.set("llm_routing", model_router.client_overrides)
+    await state.publish("llm_routing", {"client_id": client_id, "override": None})
+    return {"status": "deleted"}
+
+# ============== Metrics ==============
+
+def collect_queue_metrics():
+    """Atualiza gauges (e contadores dos caches) lidos na hora do scrape"""
+    for name, cache in (("flows", store.flows_cache), ("conversations", store.conversations_cache)):
+        # Os caches contam por conta própria: o contador avança o que mudou desde o último scrape
+        for result, total in (("hit", cache.hits), ("miss", cache.misses)):
+            CACHE_EVENTS.inc(total - CACHE_EVENTS.get(cache=name, result=result), cache=name, result=result)
+    
+    QUEUE_DEPTH.set(store.pending_count, queue="store_write_behind")
+    QUEUE_DEPTH.set(len(connected_clients), queue="websocket_clients")
+    QUEUE_DEPTH.set(
+        sum(len(a.approvals) for a in agents_db.values() if isinstance(a, ManagerAgent)),
+        queue="approvals"
+    )
+
+registry.add_collector(collect_queue_metrics)
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4")
+
 # ============== WebSocket for Real-time ==============
 
 connected_clients: List[WebSocket] = []
@@ -294,12 +1412,141 @@ async def websocket_endpoint(websocket: WebSocket):
     try:
         while True:
             data = await websocket.receive_text()
-            # Broadcast to all clients
-            for client in connected_clients:
-                await client.send_text(data)
+            # Broadcast para os clientes de todos os workers
+            await state.publish("ws", data)
     except WebSocketDisconnect:
         connected_clients.remove(websocket)
 
+
+async def broadcast_local(data: str):
+    """Envia texto para os WebSockets conectados neste worker"""
+    for client in list(connected_clients):
+        try:
+            await client.send_text(data)
+        except Exception:
+            if client in connected_clients:
+                connected_clients.remove(client)
+
+# ============== Cross-worker Events ==============
+
+async def on_ws_event(event: dict):
+    await broadcast_local(event["data"])
+
+async def on_config_event(event: dict):
+    if not state.is_local(event):
+        apply_config(event["data"])
+
+async def on_agents_event(event: dict):
+    if state.is_local(event):
+        return
+    data = event["data"]
+    if data["action"] == "deleted":
+        agents_db.pop(data["agent"]["id"], None)
+    else:
+        existing = agents_db.get(data["agent"]["id"])
+        if existing is not None and existing.type == data["agent"]["type"]:
+            # Só a configuração vem no evento: o estado em memória do agente continua
+            apply_agent_data(existing, data["agent"])
+        else:
+            agents_db[data["agent"]["id"]] = build_agent(data["agent"])
+
+async def on_leads_event(event: dict):
+    if state.is_local(event):
+        return
+    agent = agents_db.get(event["data"].get("agent_id") or "")
+    if isinstance(agent, WhatsAppAgent):
+        agent.leads.apply(event["data"])
+
+async def on_messages_event(event: dict):
+    if not state.is_local(event):
+        store.apply_remote_message(event["data"])
+
+def apply_post_decisions(event: str, item: dict):
+    """Status dos posts acompanha a decisão do Gerente (base para reaproveitar)"""
+    if event == "approved_many":
+        decisions = [(post_id, "approved") for post_id in item["ids"]]
+    elif event == "reviewed":
+        decisions = [(decided["id"], decided["status"]) for decided in item["decided"]]
+    elif event in ("approved", "rejected"):
+        decisions = [(item["id"], event)]
+    else:
+        return
+    for agent in agents_db.values():
+        if isinstance(agent, SocialMediaAgent):
+            for post_id, status in decisions:
+                agent.posts.set_status(post_id, status)
+
+async def on_approvals_event(event: dict):
+    data = event["data"]
+    if not state.is_local(event):
+        for agent in agents_db.values():
+            if isinstance(agent, ManagerAgent):
+                agent.apply_queue_change(data["event"], data["item"])
+    apply_post_decisions(data["event"], data["item"])
+    await broadcast_local(json.dumps({"type": "approval", **data}))
+
+async def on_budgets_event(event: dict):
+    if not state.is_local(event):
+        usage_tracker.apply_budget(event["data"]["client_id"], event["data"]["budget"])
+
+async def on_llm_weights_event(event: dict):
+    if not state.is_local(event):
+        llm_scheduler.set_client_weight(event["data"]["client_id"], event["data"]["weight"])
+
+async def on_calendar_cancel_event(event: dict):
+    calendar_planner.cancel(event["data"]["run_id"])
+
+async def on_approval_policies_event(event: dict):
+    if state.is_local(event):
+        return
+    data = event["data"]
+    if data["rules"] is None:
+        policy_engine.remove_rules(data["client_id"])
+    else:
+        policy_engine.set_rules(data["client_id"], data["rules"])
+
+async def on_knowledge_event(event: dict):
+    if state.is_local(event):
+        return
+    data = event["data"]
+    knowledge.apply(data["client_id"], data["docs"], data["removed"])
+
+async def on_llm_routing_event(event: dict):
+    if state.is_local(event):
+        return
+    data = event["data"]
+    if data["override"]:
+        model_router.set_client_override(data["client_id"], data["override"]["model"], data["override"]["tiers"])
+    else:
+        model_router.remove_client_override(data["client_id"])
+
+async def on_flows_event(event: dict):
+    # Os flows ficam num LRU por worker: quem não gravou descarta a cópia
+    _message_flows["loaded_at"] = 0.0
+    if not state.is_local(event):
+        flow_id = event["data"]["flow_id"]
+        store.flows_cache.delete(flow_id)
+        flow_engine.flows.pop(flow_id, None)
+
+async def on_jobs_cancel_event(event: dict):
+    if not state.is_local(event):
+        job_manager.cancel(event["data"]["job_id"])
+
+state.subscribe("ws", on_ws_event)
+state.subscribe("jobs_cancel", on_jobs_cancel_event)
+state.subscribe("llm_weights", on_llm_weights_event)
+state.subscribe("llm_routing", on_llm_routing_event)
+state.subscribe("budgets", on_budgets_event)
+state.subscribe("config", on_config_event)
+state.subscribe("agents", on_agents_event)
+state.subscribe("messages", on_messages_event)
+state.subscribe("leads", on_leads_event)
+state.subscribe("approvals", on_approvals_event)
+state.subscribe("approval_policies", on_approval_policies_event)
+state.subscribe("calendar_cancel", on_calendar_cancel_event)
+state.subscribe("knowledge", on_knowledge_event)
+state.subscribe("flows", on_flows_event)
+
 # ============== Startup ==============
 
 @app.on_event("startup")
@@ -336,19 +1583,73 @@ async def startup():
         }
     ]
     
+    await state.open()
+    await store.open()
+    await usage_tracker.start(store)
+    await job_manager.start()
+    
+    asyncio.create_task(monitor_event_loop_lag())
+    
+    shared_config = await state.get("config")
+    if shared_config:
+        apply_config(shared_config)
+    
+    # O limite de TPM é da conta inteira: cada worker fica com a sua parte
+    workers = int(os.getenv("API_WORKERS", "1"))
+    if state.shared and workers > 1:
+        llm_scheduler.configure(tokens_per_minute=max(1, llm_scheduler.tokens_per_minute // workers))
+    for client_id, weight in (await state.get("llm_weights") or {}).items():
+        llm_scheduler.set_client_weight(client_id, weight)
+    for client_id, override in (await state.get("llm_routing") or {}).items():
+        model_router.set_client_override(client_id, override["model"], override["tiers"])
+    for client_id, rules in (await state.get("approval_policies") or {}).items():
+        policy_engine.set_rules(client_id, rules)
+    
+    await knowledge.load()
+    
+    saved_agents = await store.list_agents()
+    for agent_data in saved_agents:
+        agents_db[agent_data["id"]] = build_agent(agent_data)
+    
     for agent_data in default_agents:
-        agent_classes = {
-            "manager": ManagerAgent,
-            "whatsapp": WhatsAppAgent,
-            "social_media": SocialMediaAgent,
-            "traffic": TrafficAgent
-        }
-        AgentClass = agent_classes.get(agent_data["type"], Agent)
-        agent = AgentClass(**agent_data)
+        if agent_data["id"] in agents_db:
+            continue
+        agent = build_agent(agent_data)
         agents_db[agent_data["id"]] = agent
+        await store.save_agent(agent.to_dict())
+    
+    for agent in agents_db.values():
+        if isinstance(agent, WhatsAppAgent):
+            for lead in await store.list_leads(agent.id):
+                agent.leads.apply(lead)
+        if isinstance(agent, ManagerAgent):
+            # A fila só circula por eventos: quem inicia parte do snapshot gravado
+            for item in await store.list_approvals(agent.id):
+                agent.approvals.add(item)
     
-    print("✅ AgencyZen API started with default agents")
+    # Depois dos agentes: as pendentes de antes do reinício já são entregues a eles
+    await inbound.start()
+    await calendar_planner.recover(state.worker_alive)
+    # Assume as instâncias deste worker (depois de ouvir os outros)
+    await manager.start()
+    
+    print(f"✅ AgencyZen API started with {len(agents_db)} agents ({state.worker_id})")
+
+@app.on_event("shutdown")
+async def shutdown():
+    await job_manager.stop()
+    await calendar_planner.stop()
+    await manager.stop()
+    await inbound.stop()
+    for agent in agents_db.values():
+        if isinstance(agent, WhatsAppAgent):
+            await agent.mailboxes.close()
+    await usage_tracker.stop()
+    await store.close()
+    await state.close()
 
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8000)
+    # Com API_WORKERS > 1 o estado vai para o backend compartilhado (SQLite local)
+    workers = int(os.getenv("API_WORKERS", "1"))
+    uvicorn.run("main:app", host="0.0.0.0", port=8000, workers=workers)
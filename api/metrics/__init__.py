@@ -0,0 +1,7 @@
+"""
+Metrics Module
+"""
+
+from .registry import Counter, Gauge, Histogram, MetricsRegistry, registry
+
+__all__ = ["Counter", "Gauge", "Histogram", "MetricsRegistry", "registry"]
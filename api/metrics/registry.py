@@ -0,0 +1,325 @@
+"""
+Metrics Registry
+Contadores, gauges e histogramas em processo, exportados no formato
+texto do Prometheus (endpoint /metrics).
+
+Atualizar uma métrica é só somar num dicionário: barato o bastante para
+ficar no caminho de cada requisição e de cada chamada de LLM.
+"""
+
+import asyncio
+import os
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Optional, Tuple
+
+
+# Buckets em segundos: cobre de requisições rápidas a chamadas de LLM/imagem
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Tuple[str, ...], values: Tuple[str, ...], extra: str = "") -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class Metric:
+    """Base das métricas com labels"""
+
+    type = "untyped"
+
+    def __init__(self, name: str, help: str, labelnames: Tuple[str, ...] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+
+    def _key(self, labels: dict) -> Tuple[str, ...]:
+        return tuple(str(labels.get(n) or "") for n in self.labelnames)
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.type}"]
+        lines.extend(self._samples())
+        return lines
+
+    def _samples(self) -> List[str]:
+        raise NotImplementedError
+
+
+class Counter(Metric):
+    """Contador monotônico"""
+
+    type = "counter"
+
+    def __init__(self, name: str, help: str, labelnames: Tuple[str, ...] = ()):
+        super().__init__(name, help, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        self._values[key] = self._values.get(key, 0) + amount
+
+    def get(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0)
+
+    def _samples(self) -> List[str]:
+        return [
+            f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+            for key, value in self._values.items()
+        ]
+
+
+class Gauge(Metric):
+    """Valor que sobe e desce (filas, conexões)"""
+
+    type = "gauge"
+
+    def __init__(self, name: str, help: str, labelnames: Tuple[str, ...] = ()):
+        super().__init__(name, help, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def set(self, value: float, **labels):
+        self._values[self._key(labels)] = value
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+    def get(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0)
+
+    def _samples(self) -> List[str]:
+        return [
+            f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+            for key, value in self._values.items()
+        ]
+
+
+class Histogram(Metric):
+    """Histograma com buckets fixos"""
+
+    type = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        help: str,
+        labelnames: Tuple[str, ...] = (),
+        buckets: Tuple[float, ...] = DEFAULT_BUCKETS
+    ):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # key -> [contagem por bucket (+Inf no fim), soma, total]
+        self._series: Dict[Tuple[str, ...], list] = {}
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        series = self._series.get(key)
+        if series is None:
+            series = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            self._series[key] = series
+        series[0][bisect_left(self.buckets, value)] += 1
+        series[1] += value
+        series[2] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        """Mede a duração do bloco em segundos"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def get_count(self, **labels) -> int:
+        series = self._series.get(self._key(labels))
+        return series[2] if series else 0
+
+    def _samples(self) -> List[str]:
+        lines = []
+        for key, (counts, total_sum, count) in self._series.items():
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                le = f'le="{_format_value(bound)}"'
+                lines.append(
+                    f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {cumulative}"
+                )
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(total_sum)}")
+            lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+
+class MetricsRegistry:
+    """
+    Registro de métricas do processo.
+
+    Collectors são funções chamadas na hora do scrape para atualizar
+    gauges que são mais baratos de ler do que de manter (tamanho de filas,
+    hits de cache).
+    """
+
+    def __init__(self):
+        self._metrics: Dict[str, Metric] = {}
+        self._collectors: List[Callable[[], None]] = []
+
+    def _get_or_create(self, cls, name: str, help: str, labelnames, **kwargs) -> Metric:
+        metric = self._metrics.get(name)
+        if metric is None:
+            metric = cls(name, help, tuple(labelnames), **kwargs)
+            self._metrics[name] = metric
+        elif not isinstance(metric, cls):
+            raise ValueError(f"Métrica '{name}' já registrada com outro tipo")
+        return metric
+
+    def counter(self, name: str, help: str, labelnames: Tuple[str, ...] = ()) -> Counter:
+        return self._get_or_create(Counter, name, help, labelnames)
+
+    def gauge(self, name: str, help: str, labelnames: Tuple[str, ...] = ()) -> Gauge:
+        return self._get_or_create(Gauge, name, help, labelnames)
+
+    def histogram(
+        self,
+        name: str,
+        help: str,
+        labelnames: Tuple[str, ...] = (),
+        buckets: Optional[Tuple[float, ...]] = None
+    ) -> Histogram:
+        return self._get_or_create(
+            Histogram, name, help, labelnames, buckets=buckets or DEFAULT_BUCKETS
+        )
+
+    def add_collector(self, collector: Callable[[], None]):
+        """Registra função executada antes de cada exportação"""
+        self._collectors.append(collector)
+
+    def render(self) -> str:
+        """Exporta todas as métricas no formato texto do Prometheus"""
+        for collector in self._collectors:
+            try:
+                collector()
+            except Exception as e:
+                print(f"⚠️ Erro em collector de métricas: {e}")
+
+        lines = []
+        for metric in self._metrics.values():
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+# Registro global do processo
+registry = MetricsRegistry()
+
+# ============== Métricas da aplicação ==============
+
+HTTP_REQUEST_DURATION = registry.histogram(
+    "agencyzen_http_request_duration_seconds",
+    "Latência das requisições HTTP por rota",
+    ("method", "route", "status")
+)
+
+LLM_REQUEST_DURATION = registry.histogram(
+    "agencyzen_llm_request_duration_seconds",
+    "Latência das chamadas de LLM",
+    ("agent_id", "client_id", "model")
+)
+
+LLM_REQUESTS = registry.counter(
+    "agencyzen_llm_requests_total",
+    "Chamadas de LLM por resultado",
+    ("agent_id", "client_id", "model", "outcome")
+)
+
+LLM_TOKENS = registry.counter(
+    "agencyzen_llm_tokens_total",
+    "Tokens consumidos (direction=input|output|cached_input; cached_input é parte de input)",
+    ("agent_id", "client_id", "model", "direction")
+)
+
+SPEND = registry.counter(
+    "agencyzen_spend_usd_total",
+    "Custo estimado em USD (kind=llm|image)",
+    ("client_id", "model", "kind")
+)
+
+BUDGET_ACTIONS = registry.counter(
+    "agencyzen_budget_actions_total",
+    "Chamadas rebaixadas ou bloqueadas por orçamento (action=downgrade|throttle)",
+    ("client_id", "action")
+)
+
+FLOW_STEP_DURATION = registry.histogram(
+    "agencyzen_flow_step_duration_seconds",
+    "Duração de cada nó executado em fluxos",
+    ("flow_id", "node_type", "agent_id")
+)
+
+IMAGE_GENERATION_DURATION = registry.histogram(
+    "agencyzen_image_generation_duration_seconds",
+    "Duração das gerações de imagem",
+    ("client_id", "model", "outcome"),
+    buckets=(1.0, 2.5, 5.0, 10.0, 20.0, 30.0, 45.0, 60.0, 90.0)
+)
+
+CACHE_EVENTS = registry.counter(
+    "agencyzen_cache_events_total",
+    "Hits e misses dos caches (result=hit|miss)",
+    ("cache", "result")
+)
+
+QUEUE_DEPTH = registry.gauge(
+    "agencyzen_queue_depth",
+    "Itens aguardando em filas internas",
+    ("queue",)
+)
+
+EVENT_LOOP_LAG = registry.histogram(
+    "agencyzen_event_loop_lag_seconds",
+    "Atraso do event loop em relação ao sleep agendado",
+    buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+)
+
+PROCESS_MEMORY = registry.gauge(
+    "agencyzen_process_resident_memory_bytes",
+    "Memória residente do processo"
+)
+
+
+async def monitor_event_loop_lag(interval: float = 0.25):
+    """Mede periodicamente quanto o loop demora a acordar de um sleep"""
+    loop = asyncio.get_running_loop()
+    while True:
+        start = loop.time()
+        await asyncio.sleep(interval)
+        EVENT_LOOP_LAG.observe(max(0.0, loop.time() - start - interval))
+
+
+def collect_process_memory():
+    """Lê a memória residente em /proc (Linux); ignora em outros sistemas"""
+    try:
+        with open("/proc/self/statm") as f:
+            resident_pages = int(f.read().split()[1])
+        PROCESS_MEMORY.set(resident_pages * os.sysconf("SC_PAGE_SIZE"))
+    except (OSError, ValueError, AttributeError):
+        pass
+
+
+registry.add_collector(collect_process_memory)
@@ -0,0 +1,7 @@
+"""
+State Module
+"""
+
+from .backend import StateBackend, MemoryStateBackend, SQLiteStateBackend, create_backend
+
+__all__ = ["StateBackend", "MemoryStateBackend", "SQLiteStateBackend", "create_backend"]
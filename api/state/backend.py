@@ -0,0 +1,255 @@
+"""
+State Backend
+Estado compartilhado e eventos entre processos (workers do uvicorn).
+
+- MemoryStateBackend: um único processo, sem dependências.
+- SQLiteStateBackend: vários workers na mesma máquina, compartilhando
+  um arquivo SQLite (modo WAL). Eventos são gravados numa tabela e
+  cada worker faz polling do que ainda não viu.
+"""
+
+import asyncio
+import json
+import os
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+import aiosqlite
+
+
+EventCallback = Callable[[dict], Awaitable[None]]
+
+
+class StateBackend:
+    """
+    Interface de estado compartilhado.
+
+    Chave/valor para estado (config, status do WhatsApp...) e
+    publish/subscribe para eventos (broadcast de WebSocket, fila de aprovação).
+    Eventos publicados são entregues a todos os workers, inclusive o de origem.
+    """
+
+    # Indica se o estado é visto por outros processos
+    shared = False
+
+    def __init__(self):
+        self.worker_id = f"worker_{os.getpid()}"
+        self._subscribers: Dict[str, List[EventCallback]] = {}
+
+    async def open(self):
+        """Inicializa o backend"""
+
+    async def close(self):
+        """Finaliza o backend"""
+
+    async def get(self, key: str, default: Any = None) -> Any:
+        raise NotImplementedError
+
+    async def set(self, key: str, value: Any):
+        raise NotImplementedError
+
+    async def delete(self, key: str):
+        raise NotImplementedError
+
+    async def publish(self, channel: str, data: Any):
+        raise NotImplementedError
+
+    def subscribe(self, channel: str, callback: EventCallback):
+        """Registra callback assíncrono para um canal"""
+        self._subscribers.setdefault(channel, []).append(callback)
+
+    async def _dispatch(self, event: dict):
+        """Entrega evento aos callbacks locais do canal"""
+        for callback in self._subscribers.get(event["channel"], []):
+            try:
+                await callback(event)
+            except Exception as e:
+                print(f"⚠️ Erro no handler de '{event['channel']}': {e}")
+
+    def _make_event(self, channel: str, data: Any) -> dict:
+        return {
+            "channel": channel,
+            "origin": self.worker_id,
+            "data": data,
+            "timestamp": time.time()
+        }
+
+    def is_local(self, event: dict) -> bool:
+        """Indica se o evento foi publicado por este worker"""
+        return event.get("origin") == self.worker_id
+
+    def worker_alive(self, worker_id: str) -> bool:
+        """Indica se o worker ainda está rodando (os workers ficam na mesma máquina)"""
+        if worker_id == self.worker_id:
+            return True
+        if not self.shared:
+            return False
+        try:
+            os.kill(int(worker_id.rsplit("_", 1)[1]), 0)
+        except (ValueError, IndexError, ProcessLookupError):
+            return False
+        except PermissionError:
+            pass
+        return True
+
+
+class MemoryStateBackend(StateBackend):
+    """Backend em memória (um único worker)"""
+
+    def __init__(self):
+        super().__init__()
+        self._data: Dict[str, Any] = {}
+
+    async def get(self, key: str, default: Any = None) -> Any:
+        return self._data.get(key, default)
+
+    async def set(self, key: str, value: Any):
+        self._data[key] = value
+
+    async def delete(self, key: str):
+        self._data.pop(key, None)
+
+    async def publish(self, channel: str, data: Any):
+        await self._dispatch(self._make_event(channel, data))
+
+
+class SQLiteStateBackend(StateBackend):
+    """
+    Backend compartilhado via arquivo SQLite local.
+
+    Cada worker abre sua própria conexão. Eventos publicados são entregues
+    na hora ao próprio worker e, para os demais, via polling da tabela events.
+    """
+
+    shared = True
+
+    def __init__(
+        self,
+        path: Optional[str] = None,
+        poll_interval: float = 0.05,
+        event_ttl: float = 60.0
+    ):
+        super().__init__()
+        self.path = path or os.getenv("AGENCYZEN_STATE_DB", "agencyzen_state.db")
+        self.poll_interval = poll_interval
+        self.event_ttl = event_ttl
+        self.db: Optional[aiosqlite.Connection] = None
+        self._last_event_id = 0
+        self._poll_task: Optional[asyncio.Task] = None
+
+    async def open(self):
+        self.db = await aiosqlite.connect(self.path, cached_statements=64)
+        await self.db.execute("PRAGMA journal_mode=WAL")
+        await self.db.execute("PRAGMA synchronous=NORMAL")
+        await self.db.execute("PRAGMA busy_timeout=5000")
+        await self.db.executescript("""
+            CREATE TABLE IF NOT EXISTS kv (
+                key TEXT PRIMARY KEY,
+                value TEXT NOT NULL,
+                updated_at REAL NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS events (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                channel TEXT NOT NULL,
+                origin TEXT NOT NULL,
+                data TEXT NOT NULL,
+                created_at REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_events_created ON events(created_at);
+        """)
+        await self.db.commit()
+
+        # Começa do fim: eventos antigos não são reentregues
+        async with self.db.execute("SELECT COALESCE(MAX(id), 0) FROM events") as cursor:
+            row = await cursor.fetchone()
+        self._last_event_id = row[0]
+
+        self._poll_task = asyncio.create_task(self._poll_loop())
+
+    async def close(self):
+        if self._poll_task:
+            self._poll_task.cancel()
+            try:
+                await self._poll_task
+            except asyncio.CancelledError:
+                pass
+            self._poll_task = None
+        if self.db:
+            await self.db.close()
+            self.db = None
+
+    async def get(self, key: str, default: Any = None) -> Any:
+        async with self.db.execute("SELECT value FROM kv WHERE key = ?", (key,)) as cursor:
+            row = await cursor.fetchone()
+        return json.loads(row[0]) if row else default
+
+    async def set(self, key: str, value: Any):
+        await self.db.execute(
+            "INSERT INTO kv (key, value, updated_at) VALUES (?, ?, ?) "
+            "ON CONFLICT(key) DO UPDATE SET value=excluded.value, updated_at=excluded.updated_at",
+            (key, json.dumps(value), time.time())
+        )
+        await self.db.commit()
+
+    async def delete(self, key: str):
+        await self.db.execute("DELETE FROM kv WHERE key = ?", (key,))
+        await self.db.commit()
+
+    async def publish(self, channel: str, data: Any):
+        event = self._make_event(channel, data)
+        await self.db.execute(
+            "INSERT INTO events (channel, origin, data, created_at) VALUES (?, ?, ?, ?)",
+            (channel, event["origin"], json.dumps(data), event["timestamp"])
+        )
+        await self.db.commit()
+        await self._dispatch(event)
+
+    async def _poll_loop(self):
+        """Busca eventos de outros workers e limpa os antigos"""
+        last_cleanup = time.time()
+        while True:
+            await asyncio.sleep(self.poll_interval)
+            try:
+                async with self.db.execute(
+                    "SELECT id, channel, origin, data, created_at FROM events "
+                    "WHERE id > ? ORDER BY id LIMIT 500",
+                    (self._last_event_id,)
+                ) as cursor:
+                    rows = await cursor.fetchall()
+
+                for row in rows:
+                    self._last_event_id = row[0]
+                    if row[2] == self.worker_id:
+                        continue
+                    await self._dispatch({
+                        "channel": row[1],
+                        "origin": row[2],
+                        "data": json.loads(row[3]),
+                        "timestamp": row[4]
+                    })
+
+                now = time.time()
+                if now - last_cleanup > self.event_ttl:
+                    await self.db.execute(
+                        "DELETE FROM events WHERE created_at < ?", (now - self.event_ttl,)
+                    )
+                    await self.db.commit()
+                    last_cleanup = now
+            except Exception as e:
+                print(f"⚠️ Erro no polling de eventos: {e}")
+
+
+def create_backend(kind: Optional[str] = None) -> StateBackend:
+    """
+    Cria o backend configurado.
+
+    STATE_BACKEND=memory|sqlite. Se não definido, usa sqlite quando
+    API_WORKERS > 1 e memória caso contrário.
+    """
+    if not kind:
+        workers = int(os.getenv("API_WORKERS", "1"))
+        kind = os.getenv("STATE_BACKEND", "sqlite" if workers > 1 else "memory")
+
+    if kind == "sqlite":
+        return SQLiteStateBackend()
+    return MemoryStateBackend()
@@ -0,0 +1,7 @@
+"""
+Storage Module
+"""
+
+from .sqlite_store import SQLiteStore, LRUCache
+
+__all__ = ["SQLiteStore", "LRUCache"]
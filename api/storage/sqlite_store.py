@@ -0,0 +1,854 @@
+"""
+SQLite Store
+Persistência do estado da API em SQLite (modo WAL).
+
+- Agentes e fluxos são gravados direto (baixo volume).
+- Mensagens de conversa passam por um buffer write-behind e são gravadas
+  em lote por uma task em segundo plano, fora do caminho da requisição.
+- Leituras quentes saem de um cache LRU limitado.
+"""
+
+import asyncio
+import json
+import os
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+
+import aiosqlite
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS agents (
+    id TEXT PRIMARY KEY,
+    type TEXT NOT NULL,
+    client_id TEXT,
+    data TEXT NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_agents_client ON agents(client_id);
+
+CREATE TABLE IF NOT EXISTS flows (
+    id TEXT PRIMARY KEY,
+    agent_id TEXT,
+    data TEXT NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_flows_agent ON flows(agent_id);
+
+CREATE TABLE IF NOT EXISTS messages (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    conversation_id TEXT NOT NULL,
+    phone TEXT,
+    agent_id TEXT,
+    client_id TEXT,
+    role TEXT NOT NULL,
+    content TEXT NOT NULL,
+    created_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_messages_conversation ON messages(conversation_id, id);
+CREATE INDEX IF NOT EXISTS idx_messages_phone ON messages(phone, id);
+CREATE INDEX IF NOT EXISTS idx_messages_agent ON messages(agent_id, id);
+CREATE INDEX IF NOT EXISTS idx_messages_client ON messages(client_id, id);
+
+CREATE TABLE IF NOT EXISTS usage (
+    day TEXT NOT NULL,
+    client_id TEXT NOT NULL,
+    agent_id TEXT NOT NULL,
+    model TEXT NOT NULL,
+    requests INTEGER NOT NULL DEFAULT 0,
+    input_tokens INTEGER NOT NULL DEFAULT 0,
+    output_tokens INTEGER NOT NULL DEFAULT 0,
+    images INTEGER NOT NULL DEFAULT 0,
+    cost REAL NOT NULL DEFAULT 0,
+    PRIMARY KEY (day, client_id, agent_id, model)
+);
+CREATE INDEX IF NOT EXISTS idx_usage_client ON usage(client_id, day);
+CREATE INDEX IF NOT EXISTS idx_usage_agent ON usage(agent_id, day);
+
+CREATE TABLE IF NOT EXISTS budgets (
+    client_id TEXT PRIMARY KEY,
+    data TEXT NOT NULL,
+    updated_at REAL NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS leads (
+    agent_id TEXT NOT NULL,
+    phone TEXT NOT NULL,
+    client_id TEXT,
+    score REAL NOT NULL,
+    last_seen REAL NOT NULL,
+    data TEXT NOT NULL,
+    PRIMARY KEY (agent_id, phone)
+);
+CREATE INDEX IF NOT EXISTS idx_leads_client ON leads(client_id, score);
+
+CREATE TABLE IF NOT EXISTS outbound (
+    id TEXT PRIMARY KEY,
+    instance_id TEXT NOT NULL,
+    batch_id TEXT,
+    client_id TEXT,
+    to_phone TEXT NOT NULL,
+    status TEXT NOT NULL,
+    provider_id TEXT,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_outbound_status ON outbound(instance_id, status, created_at);
+CREATE INDEX IF NOT EXISTS idx_outbound_batch ON outbound(batch_id, status);
+CREATE INDEX IF NOT EXISTS idx_outbound_provider ON outbound(provider_id);
+
+CREATE TABLE IF NOT EXISTS whatsapp_instances (
+    id TEXT PRIMARY KEY,
+    client_id TEXT,
+    data TEXT NOT NULL,
+    updated_at REAL NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS inbound (
+    id TEXT PRIMARY KEY,
+    phone TEXT,
+    owner TEXT,
+    received_at REAL NOT NULL,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_inbound_received ON inbound(received_at);
+
+CREATE TABLE IF NOT EXISTS calendar_runs (
+    id TEXT PRIMARY KEY,
+    client_id TEXT,
+    owner TEXT,
+    status TEXT NOT NULL,
+    updated_at REAL NOT NULL,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_calendar_runs_client ON calendar_runs(client_id, updated_at);
+
+CREATE TABLE IF NOT EXISTS calendar_posts (
+    run_id TEXT NOT NULL,
+    slot_id TEXT NOT NULL,
+    data TEXT NOT NULL,
+    PRIMARY KEY (run_id, slot_id)
+);
+
+CREATE TABLE IF NOT EXISTS approvals (
+    id TEXT PRIMARY KEY,
+    agent_id TEXT NOT NULL,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_approvals_agent ON approvals(agent_id);
+
+CREATE TABLE IF NOT EXISTS knowledge_docs (
+    client_id TEXT NOT NULL,
+    id TEXT NOT NULL,
+    source TEXT NOT NULL,
+    vector BLOB,
+    data TEXT NOT NULL,
+    PRIMARY KEY (client_id, id)
+);
+"""
+
+# SQL fixo e parametrizado: o sqlite3 mantém os statements preparados em cache
+SQL_UPSERT_AGENT = (
+    "INSERT INTO agents (id, type, client_id, data, updated_at) VALUES (?, ?, ?, ?, ?) "
+    "ON CONFLICT(id) DO UPDATE SET type=excluded.type, client_id=excluded.client_id, "
+    "data=excluded.data, updated_at=excluded.updated_at"
+)
+SQL_DELETE_AGENT = "DELETE FROM agents WHERE id = ?"
+SQL_LIST_AGENTS = "SELECT data FROM agents ORDER BY updated_at"
+SQL_UPSERT_FLOW = (
+    "INSERT INTO flows (id, agent_id, data, updated_at) VALUES (?, ?, ?, ?) "
+    "ON CONFLICT(id) DO UPDATE SET agent_id=excluded.agent_id, "
+    "data=excluded.data, updated_at=excluded.updated_at"
+)
+SQL_DELETE_FLOW = "DELETE FROM flows WHERE id = ?"
+SQL_GET_FLOW = "SELECT data FROM flows WHERE id = ?"
+SQL_LIST_FLOWS = "SELECT data FROM flows ORDER BY updated_at"
+SQL_INSERT_MESSAGE = (
+    "INSERT INTO messages (conversation_id, phone, agent_id, client_id, role, content, created_at) "
+    "VALUES (?, ?, ?, ?, ?, ?, ?)"
+)
+SQL_CONVERSATION_TAIL = (
+    "SELECT conversation_id, phone, agent_id, client_id, role, content, created_at "
+    "FROM messages WHERE conversation_id = ? ORDER BY id DESC LIMIT ?"
+)
+SQL_ADD_USAGE = (
+    "INSERT INTO usage (day, client_id, agent_id, model, requests, input_tokens, output_tokens, images, cost) "
+    "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?) "
+    "ON CONFLICT(day, client_id, agent_id, model) DO UPDATE SET "
+    "requests=requests+excluded.requests, input_tokens=input_tokens+excluded.input_tokens, "
+    "output_tokens=output_tokens+excluded.output_tokens, images=images+excluded.images, "
+    "cost=cost+excluded.cost"
+)
+SQL_SPEND_SINCE = "SELECT client_id, SUM(cost) FROM usage WHERE day >= ? GROUP BY client_id"
+SQL_UPSERT_BUDGET = (
+    "INSERT INTO budgets (client_id, data, updated_at) VALUES (?, ?, ?) "
+    "ON CONFLICT(client_id) DO UPDATE SET data=excluded.data, updated_at=excluded.updated_at"
+)
+SQL_DELETE_BUDGET = "DELETE FROM budgets WHERE client_id = ?"
+SQL_LIST_BUDGETS = "SELECT client_id, data FROM budgets"
+SQL_UPSERT_LEAD = (
+    "INSERT INTO leads (agent_id, phone, client_id, score, last_seen, data) VALUES (?, ?, ?, ?, ?, ?) "
+    "ON CONFLICT(agent_id, phone) DO UPDATE SET client_id=excluded.client_id, score=excluded.score, "
+    "last_seen=excluded.last_seen, data=excluded.data"
+)
+SQL_LIST_LEADS = "SELECT data FROM leads WHERE agent_id = ?"
+SQL_UPSERT_OUTBOUND = (
+    "INSERT INTO outbound (id, instance_id, batch_id, client_id, to_phone, status, provider_id, created_at, updated_at, data) "
+    "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?) "
+    "ON CONFLICT(id) DO UPDATE SET status=excluded.status, provider_id=excluded.provider_id, "
+    "updated_at=excluded.updated_at, data=excluded.data"
+)
+SQL_PENDING_OUTBOUND = (
+    "SELECT data FROM outbound WHERE instance_id = ? AND status IN ('queued', 'sending') ORDER BY created_at"
+)
+SQL_PENDING_OUTBOUND_BATCH = (
+    "SELECT data FROM outbound WHERE instance_id = ? AND batch_id = ? AND status IN ('queued', 'sending') "
+    "ORDER BY created_at"
+)
+SQL_GET_OUTBOUND = "SELECT data FROM outbound WHERE id = ?"
+SQL_GET_OUTBOUND_BY_PROVIDER = "SELECT data FROM outbound WHERE provider_id = ?"
+SQL_COUNT_OUTBOUND_BATCH = "SELECT status, COUNT(*) FROM outbound WHERE batch_id = ? GROUP BY status"
+SQL_UPSERT_WHATSAPP_INSTANCE = (
+    "INSERT INTO whatsapp_instances (id, client_id, data, updated_at) VALUES (?, ?, ?, ?) "
+    "ON CONFLICT(id) DO UPDATE SET client_id=excluded.client_id, data=excluded.data, updated_at=excluded.updated_at"
+)
+SQL_DELETE_WHATSAPP_INSTANCE = "DELETE FROM whatsapp_instances WHERE id = ?"
+SQL_LIST_WHATSAPP_INSTANCES = "SELECT data FROM whatsapp_instances ORDER BY id"
+SQL_INSERT_INBOUND = "INSERT OR IGNORE INTO inbound (id, phone, owner, received_at, data) VALUES (?, ?, ?, ?, ?)"
+SQL_DELETE_INBOUND = "DELETE FROM inbound WHERE id = ?"
+SQL_CLAIM_INBOUND = "UPDATE inbound SET owner = ? WHERE id = ?"
+SQL_PENDING_INBOUND = "SELECT owner, data FROM inbound ORDER BY received_at LIMIT ?"
+SQL_UPSERT_CALENDAR_RUN = (
+    "INSERT INTO calendar_runs (id, client_id, owner, status, updated_at, data) VALUES (?, ?, ?, ?, ?, ?) "
+    "ON CONFLICT(id) DO UPDATE SET owner=excluded.owner, status=excluded.status, "
+    "updated_at=excluded.updated_at, data=excluded.data"
+)
+SQL_GET_CALENDAR_RUN = "SELECT owner, data FROM calendar_runs WHERE id = ?"
+SQL_LIST_CALENDAR_RUNS = "SELECT owner, data FROM calendar_runs ORDER BY updated_at DESC LIMIT ?"
+SQL_LIST_CLIENT_CALENDAR_RUNS = (
+    "SELECT owner, data FROM calendar_runs WHERE client_id = ? ORDER BY updated_at DESC LIMIT ?"
+)
+SQL_RUNNING_CALENDAR_RUNS = "SELECT owner, data FROM calendar_runs WHERE status = 'running'"
+SQL_INSERT_CALENDAR_POST = "INSERT OR REPLACE INTO calendar_posts (run_id, slot_id, data) VALUES (?, ?, ?)"
+SQL_LIST_CALENDAR_POSTS = "SELECT data FROM calendar_posts WHERE run_id = ?"
+SQL_UPSERT_APPROVAL = "INSERT OR REPLACE INTO approvals (id, agent_id, data) VALUES (?, ?, ?)"
+SQL_DELETE_APPROVAL = "DELETE FROM approvals WHERE id = ?"
+SQL_LIST_APPROVALS = "SELECT data FROM approvals WHERE agent_id = ?"
+SQL_UPSERT_KNOWLEDGE_DOC = (
+    "INSERT OR REPLACE INTO knowledge_docs (client_id, id, source, vector, data) VALUES (?, ?, ?, ?, ?)"
+)
+SQL_DELETE_KNOWLEDGE_DOC = "DELETE FROM knowledge_docs WHERE client_id = ? AND id = ?"
+SQL_LIST_KNOWLEDGE_DOCS = "SELECT client_id, data, vector FROM knowledge_docs"
+SQL_LIST_PHONES = (
+    "SELECT phone, MAX(id) AS last_id FROM messages WHERE phone IS NOT NULL "
+    "GROUP BY phone ORDER BY last_id DESC LIMIT ?"
+)
+
+
+class LRUCache:
+    """Cache LRU simples com limite de itens"""
+
+    def __init__(self, max_items: int = 1024):
+        self.max_items = max_items
+        self._data: "OrderedDict[str, Any]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: str) -> Optional[Any]:
+        if key in self._data:
+            self._data.move_to_end(key)
+            self.hits += 1
+            return self._data[key]
+        self.misses += 1
+        return None
+
+    def set(self, key: str, value: Any):
+        self._data[key] = value
+        self._data.move_to_end(key)
+        while len(self._data) > self.max_items:
+            self._data.popitem(last=False)
+
+    def delete(self, key: str):
+        self._data.pop(key, None)
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._data
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+class SQLiteStore:
+    """
+    Backend de armazenamento em SQLite.
+
+    Uso:
+        store = SQLiteStore("agencyzen.db")
+        await store.open()
+        store.append_message("5511999999999", "user", "oi", phone="5511999999999")
+        await store.close()
+    """
+
+    def __init__(
+        self,
+        path: Optional[str] = None,
+        cache_size: int = 1024,
+        conversation_tail: int = 50,
+        flush_interval: float = 0.5,
+        flush_batch_size: int = 500
+    ):
+        self.path = path or os.getenv("AGENCYZEN_DB", "agencyzen.db")
+        self.conversation_tail = conversation_tail
+        self.flush_interval = flush_interval
+        self.flush_batch_size = flush_batch_size
+
+        self.db: Optional[aiosqlite.Connection] = None
+        self.flows_cache = LRUCache(cache_size)
+        self.conversations_cache = LRUCache(cache_size)
+
+        self._pending_messages: List[tuple] = []
+        # conversation_id -> mensagens que chegaram enquanto a conversa era lida do banco
+        self._loading: Dict[str, List[List[dict]]] = {}
+        self._flush_event: Optional[asyncio.Event] = None
+        self._flush_task: Optional[asyncio.Task] = None
+        self._write_lock: Optional[asyncio.Lock] = None
+        self.messages_flushed = 0
+
+    async def open(self):
+        """Abre conexão, aplica pragmas e cria o schema"""
+        self._flush_event = asyncio.Event()
+        self._write_lock = asyncio.Lock()
+        self.db = await aiosqlite.connect(self.path, cached_statements=256)
+        await self.db.execute("PRAGMA journal_mode=WAL")
+        await self.db.execute("PRAGMA synchronous=NORMAL")
+        await self.db.execute("PRAGMA busy_timeout=5000")
+        await self.db.executescript(SCHEMA)
+        await self.db.commit()
+        self._flush_task = asyncio.create_task(self._flush_loop())
+
+    async def close(self):
+        """Grava o que estiver pendente e fecha a conexão"""
+        if self._flush_task:
+            self._flush_task.cancel()
+            try:
+                await self._flush_task
+            except asyncio.CancelledError:
+                pass
+            self._flush_task = None
+        await self.flush()
+        if self.db:
+            await self.db.close()
+            self.db = None
+
+    # ============== Agents ==============
+
+    async def save_agent(self, agent: dict):
+        """Insere ou atualiza um agente"""
+        async with self._write_lock:
+            await self.db.execute(SQL_UPSERT_AGENT, (
+                agent["id"],
+                agent.get("type", ""),
+                agent.get("client_id"),
+                json.dumps(agent),
+                time.time()
+            ))
+            await self.db.commit()
+
+    async def delete_agent(self, agent_id: str):
+        """Remove um agente"""
+        async with self._write_lock:
+            await self.db.execute(SQL_DELETE_AGENT, (agent_id,))
+            await self.db.commit()
+
+    async def list_agents(self) -> List[dict]:
+        """Retorna todos os agentes salvos"""
+        async with self.db.execute(SQL_LIST_AGENTS) as cursor:
+            rows = await cursor.fetchall()
+        return [json.loads(row[0]) for row in rows]
+
+    # ============== Flows ==============
+
+    async def save_flow(self, flow: dict):
+        """Insere ou atualiza um fluxo"""
+        async with self._write_lock:
+            await self.db.execute(SQL_UPSERT_FLOW, (
+                flow["id"],
+                flow.get("agent_id"),
+                json.dumps(flow),
+                time.time()
+            ))
+            await self.db.commit()
+        self.flows_cache.set(flow["id"], flow)
+
+    async def delete_flow(self, flow_id: str):
+        """Remove um fluxo"""
+        async with self._write_lock:
+            await self.db.execute(SQL_DELETE_FLOW, (flow_id,))
+            await self.db.commit()
+        self.flows_cache.delete(flow_id)
+
+    async def get_flow(self, flow_id: str) -> Optional[dict]:
+        """Retorna fluxo por ID (cache primeiro)"""
+        flow = self.flows_cache.get(flow_id)
+        if flow is not None:
+            return flow
+
+        async with self.db.execute(SQL_GET_FLOW, (flow_id,)) as cursor:
+            row = await cursor.fetchone()
+        if not row:
+            return None
+
+        flow = json.loads(row[0])
+        self.flows_cache.set(flow_id, flow)
+        return flow
+
+    async def list_flows(self) -> List[dict]:
+        """Retorna todos os fluxos"""
+        async with self.db.execute(SQL_LIST_FLOWS) as cursor:
+            rows = await cursor.fetchall()
+        return [json.loads(row[0]) for row in rows]
+
+    # ============== Messages ==============
+
+    def append_message(
+        self,
+        conversation_id: str,
+        role: str,
+        content: str,
+        phone: Optional[str] = None,
+        agent_id: Optional[str] = None,
+        client_id: Optional[str] = None
+    ) -> dict:
+        """
+        Registra mensagem sem bloquear: vai para o buffer write-behind
+        e para o cache da conversa. A gravação acontece em lote.
+        """
+        message = {
+            "conversation_id": conversation_id,
+            "phone": phone,
+            "agent_id": agent_id,
+            "client_id": client_id,
+            "role": role,
+            "content": content,
+            "created_at": time.time()
+        }
+
+        self._pending_messages.append((
+            conversation_id, phone, agent_id, client_id, role, content, message["created_at"]
+        ))
+
+        self._track_message(message)
+
+        if self._flush_event and len(self._pending_messages) >= self.flush_batch_size:
+            self._flush_event.set()
+
+        return message
+
+    def apply_remote_message(self, message: dict):
+        """
+        Atualiza o cache com mensagem gravada por outro worker.
+        Só mexe em conversas já em cache; a gravação é feita pelo worker de origem.
+        """
+        self._track_message(message)
+
+    def _track_message(self, message: dict):
+        """Leva a mensagem ao cache da conversa e às leituras em andamento"""
+        conversation_id = message["conversation_id"]
+        if conversation_id in self.conversations_cache:
+            tail = self.conversations_cache.get(conversation_id)
+            tail.append(message)
+            del tail[:-self.conversation_tail]
+        for arrived in self._loading.get(conversation_id, ()):
+            arrived.append(message)
+
+    async def get_conversation(self, conversation_id: str, limit: Optional[int] = None) -> List[dict]:
+        """Retorna as últimas mensagens de uma conversa"""
+        limit = min(limit or self.conversation_tail, self.conversation_tail)
+
+        tail = self.conversations_cache.get(conversation_id)
+        if tail is None:
+            tail = await self._load_conversation(conversation_id)
+
+        return tail[-limit:]
+
+    async def _load_conversation(self, conversation_id: str) -> List[dict]:
+        """
+        Lê a conversa do banco e põe no cache. O que chegar durante a leitura
+        (local ou de outro worker) é juntado ao resultado sem duplicar.
+        """
+        arrived: List[dict] = []
+        self._loading.setdefault(conversation_id, []).append(arrived)
+        try:
+            # Garante que o que está no buffer já esteja no banco antes de ler
+            await self.flush()
+            async with self.db.execute(
+                SQL_CONVERSATION_TAIL, (conversation_id, self.conversation_tail)
+            ) as cursor:
+                rows = await cursor.fetchall()
+        finally:
+            # Por identidade: listas vazias de outras leituras são iguais a esta
+            loading = [buffer for buffer in self._loading[conversation_id] if buffer is not arrived]
+            if loading:
+                self._loading[conversation_id] = loading
+            else:
+                del self._loading[conversation_id]
+
+        # Outra leitura da mesma conversa terminou antes e já está em dia
+        if conversation_id in self.conversations_cache:
+            return self.conversations_cache.get(conversation_id)
+
+        tail = [self._row_to_message(row) for row in reversed(rows)]
+        seen = {self._message_key(message) for message in tail}
+        tail += [message for message in arrived if self._message_key(message) not in seen]
+        del tail[:-self.conversation_tail]
+        self.conversations_cache.set(conversation_id, tail)
+        return tail
+
+    async def list_phone_conversations(self, limit: int = 100) -> Dict[str, List[dict]]:
+        """Retorna as conversas de WhatsApp mais recentes (phone -> mensagens)"""
+        await self.flush()
+        async with self.db.execute(SQL_LIST_PHONES, (limit,)) as cursor:
+            rows = await cursor.fetchall()
+
+        conversations = {}
+        for row in rows:
+            phone = row[0]
+            conversations[phone] = await self.get_conversation(phone)
+        return conversations
+
+    async def flush(self):
+        """Grava em lote as mensagens pendentes"""
+        if not self._pending_messages or not self.db:
+            return
+
+        batch = self._pending_messages
+        self._pending_messages = []
+
+        try:
+            async with self._write_lock:
+                await self.db.executemany(SQL_INSERT_MESSAGE, batch)
+                await self.db.commit()
+        except Exception:
+            # Devolve o lote ao buffer para a próxima tentativa
+            self._pending_messages = batch + self._pending_messages
+            raise
+        self.messages_flushed += len(batch)
+
+    async def _flush_loop(self):
+        """Task de write-behind: grava por intervalo ou quando o lote enche"""
+        while True:
+            try:
+                await asyncio.wait_for(self._flush_event.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._flush_event.clear()
+            try:
+                await self.flush()
+            except Exception as e:
+                print(f"⚠️ Erro ao gravar mensagens: {e}")
+
+    # ============== Usage ==============
+
+    async def add_usage(self, rows: List[tuple]):
+        """Soma incrementos de uso (day, client, agent, model, requests, in, out, images, cost)"""
+        if not rows:
+            return
+        async with self._write_lock:
+            await self.db.executemany(SQL_ADD_USAGE, rows)
+            await self.db.commit()
+
+    async def get_spend_since(self, day: str) -> Dict[str, float]:
+        """Custo total por cliente a partir de um dia (YYYY-MM-DD)"""
+        async with self.db.execute(SQL_SPEND_SINCE, (day,)) as cursor:
+            rows = await cursor.fetchall()
+        return {row[0]: row[1] or 0.0 for row in rows}
+
+    async def query_usage(
+        self,
+        client_id: Optional[str] = None,
+        agent_id: Optional[str] = None,
+        day_from: Optional[str] = None,
+        day_to: Optional[str] = None,
+        group_by: tuple = ("day", "client_id", "agent_id")
+    ) -> List[dict]:
+        """Consulta uso agregado com filtros opcionais"""
+        allowed = {"day", "client_id", "agent_id", "model"}
+        columns = [c for c in group_by if c in allowed]
+
+        conditions, params = [], []
+        for column, value in (("client_id", client_id), ("agent_id", agent_id)):
+            if value:
+                conditions.append(f"{column} = ?")
+                params.append(value)
+        if day_from:
+            conditions.append("day >= ?")
+            params.append(day_from)
+        if day_to:
+            conditions.append("day <= ?")
+            params.append(day_to)
+
+        select = ", ".join(columns + [
+            "SUM(requests)", "SUM(input_tokens)", "SUM(output_tokens)", "SUM(images)", "SUM(cost)"
+        ])
+        sql = f"SELECT {select} FROM usage"
+        if conditions:
+            sql += " WHERE " + " AND ".join(conditions)
+        if columns:
+            sql += f" GROUP BY {', '.join(columns)} ORDER BY {', '.join(columns)}"
+
+        async with self.db.execute(sql, params) as cursor:
+            rows = await cursor.fetchall()
+
+        results = []
+        for row in rows:
+            item = dict(zip(columns, row[:len(columns)]))
+            requests, input_tokens, output_tokens, images, cost = row[len(columns):]
+            item.update({
+                "requests": requests or 0,
+                "input_tokens": input_tokens or 0,
+                "output_tokens": output_tokens or 0,
+                "images": images or 0,
+                "cost": round(cost or 0.0, 6)
+            })
+            results.append(item)
+        return results
+
+    async def save_budget(self, client_id: str, budget: dict):
+        """Insere ou atualiza orçamento de um cliente"""
+        async with self._write_lock:
+            await self.db.execute(SQL_UPSERT_BUDGET, (client_id, json.dumps(budget), time.time()))
+            await self.db.commit()
+
+    async def delete_budget(self, client_id: str):
+        """Remove orçamento de um cliente"""
+        async with self._write_lock:
+            await self.db.execute(SQL_DELETE_BUDGET, (client_id,))
+            await self.db.commit()
+
+    async def list_budgets(self) -> Dict[str, dict]:
+        """Retorna orçamentos (client_id -> budget)"""
+        async with self.db.execute(SQL_LIST_BUDGETS) as cursor:
+            rows = await cursor.fetchall()
+        return {row[0]: json.loads(row[1]) for row in rows}
+
+    # ============== Leads ==============
+
+    async def save_lead(self, lead: dict):
+        """Insere ou atualiza o lead (um por agente e telefone)"""
+        async with self._write_lock:
+            await self.db.execute(SQL_UPSERT_LEAD, (
+                lead.get("agent_id") or "",
+                lead["phone"],
+                lead.get("client_id"),
+                lead["score"],
+                lead["last_seen"],
+                json.dumps(lead)
+            ))
+            await self.db.commit()
+
+    async def list_leads(self, agent_id: str) -> List[dict]:
+        async with self.db.execute(SQL_LIST_LEADS, (agent_id,)) as cursor:
+            rows = await cursor.fetchall()
+        return [json.loads(row[0]) for row in rows]
+
+    # ============== Outbound ==============
+
+    async def save_outbound(self, messages: List[dict]):
+        """Insere ou atualiza mensagens de saída numa única transação"""
+        if not messages:
+            return
+        rows = [
+            (
+                m["id"], m.get("instance_id", "default"), m.get("batch_id"), m.get("client_id"), m["to"], m["status"],
+                m.get("provider_id"), m["created_at"], m["updated_at"], json.dumps(m)
+            )
+            for m in messages
+        ]
+        async with self._write_lock:
+            await self.db.executemany(SQL_UPSERT_OUTBOUND, rows)
+            await self.db.commit()
+
+    async def list_pending_outbound(self, instance_id: str, batch_id: Optional[str] = None) -> List[dict]:
+        if batch_id:
+            query, params = SQL_PENDING_OUTBOUND_BATCH, (instance_id, batch_id)
+        else:
+            query, params = SQL_PENDING_OUTBOUND, (instance_id,)
+        async with self.db.execute(query, params) as cursor:
+            rows = await cursor.fetchall()
+        return [json.loads(row[0]) for row in rows]
+
+    async def get_outbound(self, message_id: str) -> Optional[dict]:
+        async with self.db.execute(SQL_GET_OUTBOUND, (message_id,)) as cursor:
+            row = await cursor.fetchone()
+        return json.loads(row[0]) if row else None
+
+    async def get_outbound_by_provider_id(self, provider_id: str) -> Optional[dict]:
+        async with self.db.execute(SQL_GET_OUTBOUND_BY_PROVIDER, (provider_id,)) as cursor:
+            row = await cursor.fetchone()
+        return json.loads(row[0]) if row else None
+
+    async def count_outbound_by_status(self, batch_id: str) -> Dict[str, int]:
+        async with self.db.execute(SQL_COUNT_OUTBOUND_BATCH, (batch_id,)) as cursor:
+            rows = await cursor.fetchall()
+        return {status: count for status, count in rows}
+
+    # ============== WhatsApp instances ==============
+
+    async def save_whatsapp_instance(self, instance: dict):
+        async with self._write_lock:
+            await self.db.execute(SQL_UPSERT_WHATSAPP_INSTANCE, (
+                instance["id"], instance.get("client_id"), json.dumps(instance), time.time()
+            ))
+            await self.db.commit()
+
+    async def delete_whatsapp_instance(self, instance_id: str):
+        async with self._write_lock:
+            await self.db.execute(SQL_DELETE_WHATSAPP_INSTANCE, (instance_id,))
+            await self.db.commit()
+
+    async def list_whatsapp_instances(self) -> List[dict]:
+        async with self.db.execute(SQL_LIST_WHATSAPP_INSTANCES) as cursor:
+            rows = await cursor.fetchall()
+        return [json.loads(row[0]) for row in rows]
+
+    # ============== Inbound ==============
+
+    async def save_inbound(self, messages: List[dict], owner: str):
+        """Grava mensagens recebidas ainda não processadas (ids repetidos são ignorados)"""
+        rows = [(m["id"], m.get("from"), owner, m["received_at"], json.dumps(m)) for m in messages]
+        async with self._write_lock:
+            await self.db.executemany(SQL_INSERT_INBOUND, rows)
+            await self.db.commit()
+
+    async def complete_inbound(self, message_ids: List[str]):
+        """Remove as mensagens já processadas"""
+        async with self._write_lock:
+            await self.db.executemany(SQL_DELETE_INBOUND, [(i,) for i in message_ids])
+            await self.db.commit()
+
+    async def claim_inbound(self, message_ids: List[str], owner: str):
+        """Passa mensagens pendentes para outro worker"""
+        async with self._write_lock:
+            await self.db.executemany(SQL_CLAIM_INBOUND, [(owner, i) for i in message_ids])
+            await self.db.commit()
+
+    async def list_pending_inbound(self, limit: int) -> List[tuple]:
+        """(worker dono, mensagem) das pendentes, das mais antigas para as mais novas"""
+        async with self.db.execute(SQL_PENDING_INBOUND, (limit,)) as cursor:
+            rows = await cursor.fetchall()
+        return [(row[0], json.loads(row[1])) for row in rows]
+
+    # ============== Calendar ==============
+
+    async def save_calendar_run(self, run: dict, owner: str):
+        """Grava o estado da execução (sem os posts, que vão um a um)"""
+        async with self._write_lock:
+            await self.db.execute(SQL_UPSERT_CALENDAR_RUN, (
+                run["id"], run.get("client_id"), owner, run["status"], time.time(), json.dumps(run)
+            ))
+            await self.db.commit()
+
+    async def get_calendar_run(self, run_id: str) -> Optional[tuple]:
+        """(worker dono, execução) ou None"""
+        async with self.db.execute(SQL_GET_CALENDAR_RUN, (run_id,)) as cursor:
+            row = await cursor.fetchone()
+        return (row[0], json.loads(row[1])) if row else None
+
+    async def list_calendar_runs(self, client_id: Optional[str] = None, limit: int = 100) -> List[tuple]:
+        if client_id:
+            query, params = SQL_LIST_CLIENT_CALENDAR_RUNS, (client_id, limit)
+        else:
+            query, params = SQL_LIST_CALENDAR_RUNS, (limit,)
+        async with self.db.execute(query, params) as cursor:
+            rows = await cursor.fetchall()
+        return [(row[0], json.loads(row[1])) for row in rows]
+
+    async def list_running_calendar_runs(self) -> List[tuple]:
+        async with self.db.execute(SQL_RUNNING_CALENDAR_RUNS) as cursor:
+            rows = await cursor.fetchall()
+        return [(row[0], json.loads(row[1])) for row in rows]
+
+    async def save_calendar_post(self, run_id: str, slot_id: str, post: dict):
+        async with self._write_lock:
+            await self.db.execute(SQL_INSERT_CALENDAR_POST, (run_id, slot_id, json.dumps(post)))
+            await self.db.commit()
+
+    async def list_calendar_posts(self, run_id: str) -> List[dict]:
+        async with self.db.execute(SQL_LIST_CALENDAR_POSTS, (run_id,)) as cursor:
+            rows = await cursor.fetchall()
+        return [json.loads(row[0]) for row in rows]
+
+    # ============== Approvals ==============
+
+    async def save_approvals(self, agent_id: str, items: List[dict], decided_ids: List[str]):
+        """Atualiza a fila pendente do Gerente: grava os novos e apaga os decididos"""
+        async with self._write_lock:
+            await self.db.executemany(SQL_UPSERT_APPROVAL, [(i["id"], agent_id, json.dumps(i)) for i in items])
+            await self.db.executemany(SQL_DELETE_APPROVAL, [(i,) for i in decided_ids])
+            await self.db.commit()
+
+    async def list_approvals(self, agent_id: str) -> List[dict]:
+        """Itens pendentes do Gerente (snapshot para quem inicia)"""
+        async with self.db.execute(SQL_LIST_APPROVALS, (agent_id,)) as cursor:
+            rows = await cursor.fetchall()
+        return [json.loads(row[0]) for row in rows]
+
+    # ============== Knowledge ==============
+
+    async def save_knowledge_docs(self, client_id: str, entries: List[tuple]):
+        """Grava (documento, vetor em bytes) do cliente"""
+        rows = [(client_id, doc["id"], doc["source"], vector, json.dumps(doc)) for doc, vector in entries]
+        async with self._write_lock:
+            await self.db.executemany(SQL_UPSERT_KNOWLEDGE_DOC, rows)
+            await self.db.commit()
+
+    async def delete_knowledge_docs(self, client_id: str, doc_ids: List[str]):
+        async with self._write_lock:
+            await self.db.executemany(SQL_DELETE_KNOWLEDGE_DOC, [(client_id, i) for i in doc_ids])
+            await self.db.commit()
+
+    async def list_knowledge_docs(self) -> List[tuple]:
+        """(cliente, documento, vetor em bytes) de todos os clientes"""
+        async with self.db.execute(SQL_LIST_KNOWLEDGE_DOCS) as cursor:
+            rows = await cursor.fetchall()
+        return [(row[0], json.loads(row[1]), row[2]) for row in rows]
+
+    @staticmethod
+    def _message_key(message: dict) -> tuple:
+        return (message["created_at"], message["role"], message["content"])
+
+    def _row_to_message(self, row) -> dict:
+        return {
+            "conversation_id": row[0],
+            "phone": row[1],
+            "agent_id": row[2],
+            "client_id": row[3],
+            "role": row[4],
+            "content": row[5],
+            "created_at": row[6]
+        }
+
+    @property
+    def pending_count(self) -> int:
+        """Mensagens no buffer aguardando gravação"""
+        return len(self._pending_messages)
+
+    def get_stats(self) -> dict:
+        """Retorna estatísticas do armazenamento"""
+        return {
+            "path": self.path,
+            "pending_messages": self.pending_count,
+            "messages_flushed": self.messages_flushed,
+            "flows_cache": {
+                "size": len(self.flows_cache),
+                "hits": self.flows_cache.hits,
+                "misses": self.flows_cache.misses
+            },
+            "conversations_cache": {
+                "size": len(self.conversations_cache),
+                "hits": self.conversations_cache.hits,
+                "misses": self.conversations_cache.misses
+            }
+        }
@@ -0,0 +1,30 @@
+"""
+Configuração dos testes: rodam a partir de api/, sem LLM nem arquivos fora
+de um diretório temporário.
+"""
+
+import os
+import sys
+import tempfile
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+_tmp = tempfile.mkdtemp(prefix="agencyzen-tests-")
+os.environ["AGENCYZEN_DB"] = os.path.join(_tmp, "agencyzen.db")
+os.environ["WHATSAPP_LOG_DIR"] = os.path.join(_tmp, "whatsapp_log")
+os.environ["WHATSAPP_SESSION_DIR"] = os.path.join(_tmp, "whatsapp_sessions")
+os.environ["STATE_BACKEND"] = "memory"
+# Sem chave os agentes respondem com o fallback local
+os.environ.pop("OPENAI_API_KEY", None)
+
+
+@pytest.fixture
+def client():
+    """App inteira (startup e shutdown) com o banco temporário"""
+    from fastapi.testclient import TestClient
+    import main
+
+    with TestClient(main.app) as test_client:
+        yield test_client
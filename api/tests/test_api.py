@@ -0,0 +1,33 @@
+def test_list_agents_is_serializable(client):
+    response = client.get("/api/agents")
+
+    assert response.status_code == 200
+    agents = {agent["id"]: agent for agent in response.json()}
+    assert {"manager", "whatsapp", "social", "traffic"} <= agents.keys()
+    assert "approvals" not in agents["manager"]
+
+
+def test_create_approval_returns_queued_item(client):
+    response = client.post("/api/agents/manager/approvals", json={"title": "Post", "content": "Texto", "priority": "high"})
+
+    assert response.status_code == 200
+    item = response.json()
+    assert item["status"] == "pending"
+    assert client.get(f"/api/agents/manager/approvals/{item['id']}").json()["title"] == "Post"
+
+
+
+def flow_cache_misses(client) -> float:
+    text = client.get("/metrics").text
+    assert "# TYPE agencyzen_cache_events_total counter" in text
+    line = next(l for l in text.splitlines() if l.startswith('agencyzen_cache_events_total{cache="flows",result="miss"}'))
+    return float(line.rsplit(" ", 1)[1])
+
+
+def test_cache_events_are_exported_as_counter(client):
+    before = flow_cache_misses(client)
+    client.get("/api/flows/nao_existe")
+    client.get("/api/flows/nao_existe")
+
+    assert flow_cache_misses(client) == before + 2
+    assert flow_cache_misses(client) == before + 2
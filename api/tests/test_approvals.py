@@ -0,0 +1,128 @@
+import asyncio
+
+import pytest
+
+from agents.approvals import ApprovalStore, PRIORITIES
+from agents.manager import ManagerAgent
+from agents.policy import PolicyEngine
+
+
+def make_manager(policy=None):
+    manager = ManagerAgent(id="manager", name="Gerente", type="manager", description="", system_prompt="")
+    manager.policy = policy
+    return manager
+
+
+def test_queue_orders_by_priority_then_due_date():
+    approvals = ApprovalStore()
+    approvals.add({"id": "low", "priority": "low"}, now=100)
+    approvals.add({"id": "late", "priority": "high", "due_at": 500}, now=100)
+    approvals.add({"id": "soon", "priority": "high", "due_at": 200}, now=100)
+    approvals.add({"id": "urgent", "priority": "urgent"}, now=100)
+
+    assert [item["id"] for item in approvals.query()["items"]] == ["urgent", "soon", "late", "low"]
+    assert approvals.first()["id"] == "urgent"
+    assert approvals.select(max_priority=PRIORITIES["high"]) == ["urgent", "soon", "late"]
+
+
+def test_add_copies_the_item():
+    approvals = ApprovalStore()
+    post = {"id": "post_1", "status": "pending_approval", "client_id": "acme"}
+
+    queued = approvals.add(post)
+
+    assert post == {"id": "post_1", "status": "pending_approval", "client_id": "acme"}
+    assert queued is not post
+    assert queued["status"] == "pending"
+
+
+def test_indexes_by_client_and_agent_with_pagination():
+    approvals = ApprovalStore()
+    for n in range(30):
+        approvals.add({"id": f"i{n}", "client_id": f"c{n % 3}", "agent_id": f"a{n % 2}"}, now=n)
+
+    page = approvals.query(client_id="c0", offset=5, limit=3)
+    assert page["total"] == 10
+    assert [item["id"] for item in page["items"]] == ["i15", "i18", "i21"]
+    assert approvals.query(client_id="c0", agent_id="a0")["total"] == 5
+
+    approvals.decide("i15", "approved")
+    assert approvals.query(client_id="c0")["total"] == 9
+    assert approvals.lookup("i15")["status"] == "approved"
+    assert approvals.decide("i15", "approved") is None
+
+
+def test_policy_decides_clear_items_and_queues_the_rest():
+    policy = PolicyEngine()
+    policy.set_rules("acme", {"banned_words": ["grátis"], "max_length": 100})
+    manager = make_manager(policy)
+    approved = []
+    manager.on_approved = approved.extend
+    items = [
+        {"id": "ok", "client_id": "acme", "type": "post", "content": "Promoção de verão", "status": "pending_approval"},
+        {"id": "bad", "client_id": "acme", "type": "post", "content": "Frete gratis hoje", "status": "pending_approval"},
+        {"id": "edge", "client_id": "acme", "type": "post", "content": "x" * 105, "status": "pending_approval"},
+    ]
+
+    result = manager.review(items)
+
+    assert result == {"approved": 1, "rejected": 1, "queued": 1}
+    assert list(manager.approvals.items) == ["edge"]
+    assert [item["id"] for item in approved] == ["ok"]
+    # Os dicts de quem gerou (ex.: PostIndex) não mudam
+    assert all(item["status"] == "pending_approval" and "policy" not in item for item in items)
+
+
+def test_approve_many_notifies_once_per_batch():
+    manager = make_manager()
+    events = []
+    manager.on_queue_change = lambda event, item: events.append(event)
+    for n in range(5):
+        manager.add_to_queue({"id": f"i{n}", "type": "post" if n % 2 else "ad"})
+
+    approved = manager.approve_many(item_type="post")
+
+    assert [item["id"] for item in approved] == ["i1", "i3"]
+    assert events.count("approved_many") == 1
+    assert len(manager.approvals) == 3
+
+
+def test_banned_words_keep_doubled_letters():
+    policy = PolicyEngine()
+    policy.set_rules("acme", {"banned_words": ["carro"]})
+
+    cheap, car = (
+        policy.evaluate({"client_id": "acme", "type": "post", "content": content})[0]
+        for content in ("Nada caro por aqui", "Leve seu carro hoje")
+    )
+
+    assert cheap == "approve"
+    assert car == "reject"
+
+
+@pytest.mark.parametrize("message", ["aprovar todos", "Approve all!", "  aprovar   TODOS. "])
+def test_exact_command_approves_the_whole_queue(message):
+    manager = make_manager()
+    for i in range(3):
+        manager.add_to_queue({"id": f"post_{i}"})
+
+    reply = asyncio.run(manager.process_message(message))
+
+    assert reply == "✅ 3 itens aprovados."
+    assert not manager.approvals
+
+
+@pytest.mark.parametrize("message", [
+    "não aprovar todos",
+    "should I approve all?",
+    "vamos aprovar todos amanhã",
+])
+def test_sentence_citing_the_whole_queue_approves_nothing(message):
+    manager = make_manager()
+    for i in range(3):
+        manager.add_to_queue({"id": f"post_{i}"})
+
+    reply = asyncio.run(manager.process_message(message))
+
+    assert "aprovar todos" in reply
+    assert len(manager.approvals) == 3
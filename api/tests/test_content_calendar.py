@@ -0,0 +1,92 @@
+import asyncio
+from datetime import date
+
+from agents.content_calendar import CalendarPlanner, plan_slots
+from llm.deadline import current_deadline, deadline_scope
+from storage.sqlite_store import SQLiteStore
+
+
+class FakeSocialAgent:
+    """generate_post sem LLM; registra o prazo visto e pode falhar em temas escolhidos"""
+
+    id = "social"
+
+    def __init__(self, delay: float = 0.0, fail_topics=()):
+        self.delay = delay
+        self.fail_topics = set(fail_topics)
+        self.deadlines = []
+        self.calls = 0
+
+    async def generate_post(self, topic, client_id=None, publish_on=None):
+        self.calls += 1
+        self.deadlines.append(current_deadline())
+        await asyncio.sleep(self.delay)
+        if topic in self.fail_topics:
+            raise RuntimeError("falhou")
+        return {"id": f"post_{self.calls}", "topic": topic, "client_id": client_id, "content": topic}
+
+
+def run_with_store(tmp_path, scenario):
+    async def main():
+        store = SQLiteStore(str(tmp_path / "calendar.db"))
+        await store.open()
+        try:
+            return await scenario(store)
+        finally:
+            await store.close()
+    return asyncio.run(main())
+
+
+async def wait_finished(planner, run_id):
+    events = [event async for event in planner.stream(run_id)]
+    assert events[-1]["type"] == "done"
+    return events
+
+
+def test_plan_slots_rotates_topics_and_filters_weekdays():
+    slots = plan_slots(date(2026, 11, 2), date(2026, 11, 8), ["a", "b"], weekdays=[0, 2, 4])
+
+    assert [slot["date"] for slot in slots] == ["2026-11-02", "2026-11-04", "2026-11-06"]
+    assert [slot["topic"] for slot in slots] == ["a", "b", "a"]
+
+
+def test_run_does_not_inherit_request_deadline(tmp_path):
+    agent = FakeSocialAgent(delay=0.02)
+
+    async def scenario(store):
+        planner = CalendarPlanner(store, concurrency=2, retry_delay=0)
+        # Como o POST /api/calendar: prazo curto, execução continua depois dele
+        with deadline_scope(0.05):
+            run = await planner.start(agent, "acme", date(2026, 11, 1), date(2026, 11, 10), ["promo"])
+        events = await wait_finished(planner, run["id"])
+        return events[-1]["run"]
+
+    summary = run_with_store(tmp_path, scenario)
+
+    assert summary["status"] == "completed"
+    assert summary["done"] == 10
+    assert agent.deadlines == [None] * 10
+
+
+def test_resume_regenerates_only_missing_slots(tmp_path):
+    agent = FakeSocialAgent(fail_topics={"ruim"})
+
+    async def scenario(store):
+        planner = CalendarPlanner(store, concurrency=4, max_attempts=1, retry_delay=0)
+        run = await planner.start(agent, "acme", date(2026, 11, 1), date(2026, 11, 6), ["bom", "ruim"])
+        events = await wait_finished(planner, run["id"])
+        first = events[-1]["run"]
+
+        calls = agent.calls
+        agent.fail_topics.clear()
+        await planner.resume(run["id"], agent)
+        await wait_finished(planner, run["id"])
+        return first, agent.calls - calls, await planner.get(run["id"])
+
+    first, regenerated, final = run_with_store(tmp_path, scenario)
+
+    assert first["status"] == "partial"
+    assert (first["done"], first["failed"]) == (3, 3)
+    assert regenerated == 3
+    assert final["status"] == "completed"
+    assert [post["slot_id"] for post in final["posts"]] == [f"2026-11-0{d}#0" for d in range(1, 7)]
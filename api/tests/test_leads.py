@@ -0,0 +1,33 @@
+import pytest
+
+from agents.leads import LeadMatcher, LeadStore
+
+
+@pytest.mark.parametrize("message, expected", [
+    ("qual o preço?", ["preco"]),
+    ("quais os preços?", ["preco"]),
+    ("quais valores?", ["valor"]),
+    ("preciso de orçamentos", ["orcamento"]),
+    ("estou interessado", ["interess"]),
+    ("quanto custam os planos?", ["quanto custa"]),
+    ("quero contratar", ["contrat"]),
+])
+def test_plural_and_inflected_forms_match(message, expected):
+    score, found = LeadMatcher().match(message)
+
+    assert found == expected
+    assert score > 0
+
+
+def test_keywords_only_match_at_word_start():
+    assert LeadMatcher().match("o desvalorizado contrabaixo") == (0, [])
+
+
+def test_lead_accumulates_score_per_phone():
+    leads = LeadStore()
+    leads.record("5511", "quais os preços?", now=1)
+    lead = leads.record("5511", "estou interessado em contratar", now=2)
+
+    assert lead["hits"] == 2
+    assert lead["score"] == 3 + 2 + 4
+    assert leads.query(order="score")["total"] == 1
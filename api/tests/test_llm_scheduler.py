@@ -0,0 +1,36 @@
+import asyncio
+
+from llm.scheduler import BATCH, LLMScheduler
+
+
+def test_oversized_batch_ticket_does_not_block_the_queue():
+    async def scenario():
+        scheduler = LLMScheduler(tokens_per_minute=1000, batch_reserve_ratio=0.2)
+        # Estima mais que os 800 tokens fora da reserva
+        big = await asyncio.wait_for(scheduler.acquire(BATCH, "acme", 900), 1)
+        small = asyncio.create_task(scheduler.acquire(BATCH, "acme", 100))
+        await asyncio.sleep(0.01)
+        scheduler.release(big, 0)
+        small = await asyncio.wait_for(small, 1)
+        scheduler.release(small, 0)
+        return big, small
+
+    big, small = asyncio.run(scenario())
+
+    assert big.tokens == 900
+    assert small.tokens == 100
+
+
+def test_batch_keeps_the_interactive_reserve():
+    async def scenario():
+        scheduler = LLMScheduler(tokens_per_minute=1000, batch_reserve_ratio=0.2)
+        first = await scheduler.acquire(BATCH, "acme", 500)
+        second = asyncio.create_task(scheduler.acquire(BATCH, "acme", 400))
+        await asyncio.sleep(0.01)
+        admitted = second.done()
+        second.cancel()
+        scheduler.release(first, 0)
+        return admitted
+
+    # Sobram 500 tokens: 400 + reserva de 200 não cabem
+    assert asyncio.run(scenario()) is False
@@ -0,0 +1,22 @@
+from benchmarks.loadtest import histogram_quantile, parse_metrics
+
+
+METRICS = """
+# TYPE agencyzen_event_loop_lag_seconds histogram
+agencyzen_event_loop_lag_seconds_bucket{le="0.01"} 90
+agencyzen_event_loop_lag_seconds_bucket{le="0.1"} 98
+agencyzen_event_loop_lag_seconds_bucket{le="+Inf"} 100
+"""
+
+
+def test_quantile_within_finite_buckets():
+    samples = parse_metrics(METRICS)
+
+    assert histogram_quantile(samples, {}, "agencyzen_event_loop_lag_seconds", 0.9) == 0.01
+    assert histogram_quantile(samples, {}, "agencyzen_event_loop_lag_seconds", 0.95) == 0.1
+
+
+def test_quantile_above_last_bucket_is_none():
+    samples = parse_metrics(METRICS)
+
+    assert histogram_quantile(samples, {}, "agencyzen_event_loop_lag_seconds", 0.99) is None
@@ -0,0 +1,214 @@
+import asyncio
+import contextvars
+
+import pytest
+
+from agents.mailbox import MailboxDispatcher, MailboxFullError
+
+
+request_id = contextvars.ContextVar("request_id", default=None)
+
+
+class Recorder:
+    """Handler que registra as chamadas (key, itens do turno), a concorrência e o contexto"""
+
+    def __init__(self, delay: float = 0.01):
+        self.delay = delay
+        self.calls = []
+        self.running = 0
+        self.max_running = 0
+        self.contexts = []
+
+    async def __call__(self, key, items):
+        self.running += 1
+        self.max_running = max(self.max_running, self.running)
+        self.contexts.append(request_id.get())
+        try:
+            await asyncio.sleep(self.delay)
+            self.calls.append((key, list(items)))
+            return "+".join(items)
+        finally:
+            self.running -= 1
+
+
+def test_messages_of_a_contact_are_processed_in_order():
+    handler = Recorder()
+
+    async def scenario():
+        dispatcher = MailboxDispatcher(handler, idle_timeout=0.05)
+        futures = [dispatcher.submit("5511", f"m{i}") for i in range(5)]
+        results = await asyncio.gather(*futures)
+        await dispatcher.close()
+        return results
+
+    assert asyncio.run(scenario()) == [f"m{i}" for i in range(5)]
+    assert handler.calls == [("5511", [f"m{i}"]) for i in range(5)]
+    assert handler.max_running == 1
+
+
+def test_contacts_run_in_parallel_up_to_the_limit():
+    handler = Recorder(delay=0.02)
+
+    async def scenario():
+        dispatcher = MailboxDispatcher(handler, max_concurrency=3, idle_timeout=0.05)
+        await asyncio.gather(*(dispatcher.submit(f"55{i}", "oi") for i in range(6)))
+        await dispatcher.close()
+
+    asyncio.run(scenario())
+
+    assert handler.max_running == 3
+    assert len(handler.calls) == 6
+
+
+def test_full_mailbox_rejects_new_messages():
+    handler = Recorder(delay=0.05)
+
+    async def scenario():
+        dispatcher = MailboxDispatcher(handler, max_pending=2, idle_timeout=0.05)
+        dispatcher.submit("5511", "m0")
+        dispatcher.submit("5511", "m1")
+        with pytest.raises(MailboxFullError):
+            dispatcher.submit("5511", "m2")
+        await dispatcher.close()
+
+    asyncio.run(scenario())
+
+
+def test_handler_runs_in_the_sender_context():
+    handler = Recorder()
+
+    async def send(dispatcher, value):
+        request_id.set(value)
+        return await dispatcher.submit("5511", value)
+
+    async def scenario():
+        dispatcher = MailboxDispatcher(handler, idle_timeout=0.05)
+        await asyncio.gather(send(dispatcher, "a"), send(dispatcher, "b"))
+        await dispatcher.close()
+
+    asyncio.run(scenario())
+
+    assert handler.contexts == ["a", "b"]
+
+
+def test_handler_error_reaches_only_that_turn():
+    async def handler(key, items):
+        if items == ["ruim"]:
+            raise ValueError("falhou")
+        return items[0]
+
+    async def scenario():
+        dispatcher = MailboxDispatcher(handler, idle_timeout=0.05)
+        bad, good = dispatcher.submit("5511", "ruim"), dispatcher.submit("5511", "bom")
+        results = await asyncio.gather(bad, good, return_exceptions=True)
+        await dispatcher.close()
+        return results
+
+    bad, good = asyncio.run(scenario())
+
+    assert isinstance(bad, ValueError)
+    assert good == "bom"
+
+
+def test_failed_turn_calls_on_error_instead_of_commit():
+    async def handler(key, items):
+        raise ValueError("falhou")
+
+    committed, failed = [], []
+
+    async def scenario():
+        dispatcher = MailboxDispatcher(
+            handler, idle_timeout=0.05,
+            commit=lambda key, items, result: committed.append(items),
+            on_error=lambda key, items, error: failed.append((items, str(error)))
+        )
+        results = await asyncio.gather(dispatcher.submit("5511", "oi"), return_exceptions=True)
+        await dispatcher.close()
+        return results
+
+    (result,) = asyncio.run(scenario())
+
+    assert isinstance(result, ValueError)
+    assert committed == []
+    assert failed == [(["oi"], "falhou")]
+
+
+def test_burst_becomes_a_single_turn():
+    handler = Recorder()
+    committed = []
+
+    async def scenario():
+        dispatcher = MailboxDispatcher(
+            handler, idle_timeout=0.05, coalesce_window=0.05,
+            commit=lambda key, items, result: committed.append(items)
+        )
+        futures = [dispatcher.submit("5511", "oi")]
+        for text in ("tudo bem?", "quero um orçamento"):
+            await asyncio.sleep(0.01)
+            futures.append(dispatcher.submit("5511", text))
+        results = await asyncio.gather(*futures)
+        await dispatcher.close()
+        return results
+
+    results = asyncio.run(scenario())
+
+    assert results == ["oi+tudo bem?+quero um orçamento"] * 3
+    assert handler.calls == [("5511", ["oi", "tudo bem?", "quero um orçamento"])]
+    assert committed == [["oi", "tudo bem?", "quero um orçamento"]]
+
+
+def test_new_message_cancels_generation_and_commits_once():
+    handler = Recorder(delay=0.05)
+    committed = []
+
+    async def scenario():
+        dispatcher = MailboxDispatcher(
+            handler, idle_timeout=0.05, cancel_on_new=True,
+            commit=lambda key, items, result: committed.append(items)
+        )
+        first = dispatcher.submit("5511", "oi")
+        await asyncio.sleep(0.02)
+        second = dispatcher.submit("5511", "preço?")
+        results = await asyncio.gather(first, second)
+        await dispatcher.close()
+        return results
+
+    results = asyncio.run(scenario())
+
+    assert results == ["oi+preço?", "oi+preço?"]
+    # A primeira geração foi descartada antes de terminar
+    assert handler.calls == [("5511", ["oi", "preço?"])]
+    assert committed == [["oi", "preço?"]]
+
+
+def test_cancelled_generation_does_not_call_on_error():
+    handler = Recorder(delay=0.05)
+    failed = []
+
+    async def scenario():
+        dispatcher = MailboxDispatcher(
+            handler, idle_timeout=0.05, cancel_on_new=True,
+            on_error=lambda key, items, error: failed.append(items)
+        )
+        first = dispatcher.submit("5511", "oi")
+        await asyncio.sleep(0.02)
+        second = dispatcher.submit("5511", "preço?")
+        await asyncio.gather(first, second)
+        await dispatcher.close()
+
+    asyncio.run(scenario())
+
+    assert failed == []
+
+
+def test_without_window_each_message_is_its_own_turn():
+    handler = Recorder()
+
+    async def scenario():
+        dispatcher = MailboxDispatcher(handler, idle_timeout=0.05)
+        results = await asyncio.gather(*(dispatcher.submit("5511", f"m{i}") for i in range(3)))
+        await dispatcher.close()
+        return results
+
+    assert asyncio.run(scenario()) == ["m0", "m1", "m2"]
+    assert handler.calls == [("5511", ["m0"]), ("5511", ["m1"]), ("5511", ["m2"])]
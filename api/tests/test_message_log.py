@@ -0,0 +1,83 @@
+import asyncio
+import os
+
+from whatsapp.message_log import MessageLog
+
+
+def fill(log, phone, count, start=0):
+    for i in range(start, start + count):
+        log.append(phone, {"from": phone, "content": f"m{i}"})
+
+
+def contents(page):
+    return [m["content"] for m in page["items"]]
+
+
+def run_with_log(tmp_path, scenario, **kwargs):
+    async def main():
+        log = MessageLog(str(tmp_path), **kwargs)
+        await log.open()
+        try:
+            return await scenario(log)
+        finally:
+            await log.close()
+    return asyncio.run(main())
+
+
+def test_old_messages_are_paged_from_disk(tmp_path):
+    async def scenario(log):
+        fill(log, "5511", 10)
+        first = await log.page("5511", limit=4)
+        second = await log.page("5511", before=first["next_cursor"], limit=4)
+        return first, second
+
+    first, second = run_with_log(tmp_path, scenario, tail_size=3, segment_size=4)
+
+    assert contents(first) == ["m6", "m7", "m8", "m9"]
+    assert contents(second) == ["m2", "m3", "m4", "m5"]
+
+
+def test_append_does_not_touch_the_disk(tmp_path):
+    directory = tmp_path / "log"
+
+    async def scenario(log):
+        fill(log, "5511", 10)
+        before_flush = os.listdir(directory) if os.path.isdir(directory) else []
+        await log.flush()
+        return before_flush, os.listdir(directory)
+
+    before_flush, after_flush = run_with_log(directory, scenario, tail_size=3, segment_size=4)
+
+    assert before_flush == []
+    assert len(after_flush) == 2
+
+
+def test_history_survives_restart(tmp_path):
+    async def first_run(log):
+        fill(log, "5511", 10)
+        fill(log, "5522", 2)
+
+    run_with_log(tmp_path, first_run, tail_size=3, segment_size=4)
+    segments = set(os.listdir(tmp_path))
+
+    async def second_run(log):
+        fill(log, "5511", 5, start=10)
+        return await log.page("5511", limit=100), await log.page("5522", limit=100), log.count("5511")
+
+    first, second, count = run_with_log(tmp_path, second_run, tail_size=3, segment_size=4)
+
+    assert segments <= set(os.listdir(tmp_path))
+    assert contents(first) == [f"m{i}" for i in range(15)]
+    assert contents(second) == ["m0", "m1"]
+    assert count == 15
+
+
+def test_retention_drops_only_the_oldest_segments(tmp_path):
+    async def scenario(log):
+        fill(log, "5511", 9)
+        return await log.page("5511", limit=100), os.listdir(tmp_path)
+
+    page, files = run_with_log(tmp_path, scenario, tail_size=1, segment_size=2, max_segments=2)
+
+    assert contents(page) == ["m4", "m5", "m6", "m7", "m8"]
+    assert len(files) == 2
@@ -0,0 +1,36 @@
+from agents.base import Agent, AgentConfig
+from llm.router import ADVANCED, ModelRouter
+
+
+def make_agent(config=None):
+    return Agent("a1", "Agente", "social_media", "", "", config=config)
+
+
+def test_explicit_model_is_used_without_routing():
+    route = ModelRouter().route(make_agent(AgentConfig(model="gpt-4o")), [{"role": "user", "content": "oi"}])
+
+    assert (route.model, route.source) == ("gpt-4o", "agent")
+
+
+def test_agents_without_model_are_routed():
+    config = AgentConfig()
+    route = ModelRouter().route(make_agent(config), [{"role": "user", "content": "oi"}])
+
+    assert config.routing
+    assert route.source == "route"
+    assert AgentConfig(model="gpt-4o", routing=True).routing
+
+
+def test_setting_agent_model_pins_it(client):
+    response = client.put("/api/agents/social", json={"model": "gpt-4o"})
+
+    assert response.json()["config"] == {**response.json()["config"], "model": "gpt-4o", "routing": False}
+
+
+def test_config_update_without_model_keeps_advanced_tier(client):
+    import main
+
+    main.model_router.tier_models[ADVANCED] = "modelo-avancado"
+    client.put("/api/config", json={"replicate_key": "r8_x"})
+
+    assert main.model_router.tier_models[ADVANCED] == "modelo-avancado"
@@ -0,0 +1,68 @@
+import asyncio
+
+from storage.sqlite_store import SQLiteStore
+
+
+def run_with_store(tmp_path, scenario):
+    async def main():
+        store = SQLiteStore(str(tmp_path / "store.db"), conversation_tail=100, flush_interval=0.01)
+        await store.open()
+        try:
+            return await scenario(store)
+        finally:
+            await store.close()
+    return asyncio.run(main())
+
+
+def test_messages_arriving_during_load_reach_the_cache(tmp_path):
+    async def scenario(store):
+        for i in range(3):
+            store.append_message("c1", "user", f"antes {i}")
+        await store.flush()
+
+        load = asyncio.create_task(store.get_conversation("c1"))
+        sent = 0
+        while not load.done():
+            if sent < 20:
+                store.append_message("c1", "assistant", f"durante {sent}")
+                sent += 1
+            await asyncio.sleep(0)
+        await load
+        return sent, [m["content"] for m in await store.get_conversation("c1")]
+
+    sent, contents = run_with_store(tmp_path, scenario)
+
+    assert sent > 0
+    assert contents == [f"antes {i}" for i in range(3)] + [f"durante {i}" for i in range(sent)]
+
+
+def test_remote_message_already_saved_is_not_duplicated(tmp_path):
+    async def scenario(store):
+        # Simula o outro worker: a mensagem já está no banco e o evento chega durante a leitura
+        message = store.append_message("c2", "user", "oi")
+        await store.flush()
+        load = asyncio.create_task(store.get_conversation("c2"))
+        await asyncio.sleep(0)
+        store.apply_remote_message(dict(message))
+        await load
+        return [m["content"] for m in await store.get_conversation("c2")]
+
+    assert run_with_store(tmp_path, scenario) == ["oi"]
+
+
+def test_concurrent_loads_of_a_conversation(tmp_path):
+    async def scenario(store):
+        # A primeira leitura grava o buffer; a segunda não tem o que gravar e termina antes
+        store.append_message("c3", "user", "oi")
+        first = asyncio.create_task(store.get_conversation("c3"))
+        await asyncio.sleep(0)
+        second = asyncio.create_task(store.get_conversation("c3"))
+        await second
+        store.append_message("c3", "assistant", "olá")
+        await first
+        return [m["content"] for m in await store.get_conversation("c3")], store._loading
+
+    contents, loading = run_with_store(tmp_path, scenario)
+
+    assert contents == ["oi", "olá"]
+    assert loading == {}
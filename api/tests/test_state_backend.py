@@ -0,0 +1,124 @@
+import asyncio
+import time
+
+from state.backend import MemoryStateBackend, SQLiteStateBackend
+from storage.sqlite_store import SQLiteStore
+
+
+def test_memory_backend_kv_and_local_events():
+    async def scenario():
+        backend = MemoryStateBackend()
+        received = []
+
+        async def on_event(event):
+            received.append(event)
+
+        backend.subscribe("agents", on_event)
+        await backend.set("config", {"model": "x"})
+        value = await backend.get("config")
+        await backend.delete("config")
+        await backend.publish("agents", {"action": "saved"})
+        return backend, value, await backend.get("config", "nada"), received
+
+    backend, value, deleted, received = asyncio.run(scenario())
+
+    assert value == {"model": "x"}
+    assert deleted == "nada"
+    assert [event["data"] for event in received] == [{"action": "saved"}]
+    assert backend.is_local(received[0])
+
+
+def test_sqlite_backend_shares_state_and_events_between_workers(tmp_path):
+    async def scenario():
+        path = str(tmp_path / "state.db")
+        first, second = SQLiteStateBackend(path, poll_interval=0.01), SQLiteStateBackend(path, poll_interval=0.01)
+        second.worker_id = "worker_outro"
+        await first.open()
+        await second.open()
+        received = []
+
+        async def on_event(event):
+            received.append(event)
+
+        second.subscribe("approvals", on_event)
+        try:
+            await first.set("llm_weights", {"acme": 2})
+            await first.publish("approvals", {"event": "queued"})
+            deadline = time.monotonic() + 2
+            while not received and time.monotonic() < deadline:
+                await asyncio.sleep(0.01)
+            return await second.get("llm_weights"), received, second
+        finally:
+            await first.close()
+            await second.close()
+
+    weights, received, second = asyncio.run(scenario())
+
+    assert weights == {"acme": 2}
+    assert [event["data"] for event in received] == [{"event": "queued"}]
+    assert not second.is_local(received[0])
+
+
+def test_store_keeps_pending_approvals_snapshot(tmp_path):
+    async def scenario():
+        store = SQLiteStore(str(tmp_path / "store.db"))
+        await store.open()
+        try:
+            await store.save_approvals("manager", [{"id": "a"}, {"id": "b"}], [])
+            await store.save_approvals("manager", [{"id": "c"}], ["a"])
+            await store.save_approvals("outro", [{"id": "d"}], [])
+            return await store.list_approvals("manager")
+        finally:
+            await store.close()
+
+    assert sorted(item["id"] for item in asyncio.run(scenario())) == ["b", "c"]
+
+
+def test_remote_agent_save_keeps_in_memory_state(client):
+    import main
+
+    manager = main.agents_db["manager"]
+    item = client.portal.call(manager.add_to_queue, {"id": "item_remoto", "title": "Post"})
+    data = {**manager.to_dict(), "name": "Gerente Novo"}
+
+    client.portal.call(main.on_agents_event, {"origin": "worker_outro", "data": {"action": "saved", "agent": data}})
+
+    assert main.agents_db["manager"] is manager
+    assert manager.name == "Gerente Novo"
+    assert manager.approvals.lookup(item["id"])["status"] == "pending"
+
+
+def test_approval_queue_survives_restart():
+    from fastapi.testclient import TestClient
+    import main
+
+    with TestClient(main.app) as client:
+        kept = client.post("/api/agents/manager/approvals", json={"title": "Antes do reinício"}).json()
+        rejected = client.post("/api/agents/manager/approvals", json={"title": "Decidido"}).json()
+        client.post(f"/api/agents/manager/approvals/{rejected['id']}/reject", json={"reason": "não"})
+        # As gravações rodam em tasks: espera o store alcançar a fila
+        deadline = time.monotonic() + 2
+        while time.monotonic() < deadline:
+            saved = {i["id"] for i in client.portal.call(main.store.list_approvals, "manager")}
+            if saved == set(main.agents_db["manager"].approvals.items):
+                break
+            time.sleep(0.01)
+
+    with TestClient(main.app) as client:
+        assert client.get(f"/api/agents/manager/approvals/{kept['id']}").json()["title"] == "Antes do reinício"
+        assert client.get(f"/api/agents/manager/approvals/{rejected['id']}").status_code == 404
+
+
+def test_remote_flow_change_evicts_cached_flow(client):
+    import main
+
+    flow = client.post("/api/flows", json={"name": "Boas-vindas", "description": "", "nodes": [], "edges": [], "agent_id": "manager"}).json()
+    assert client.get(f"/api/flows/{flow['id']}").status_code == 200
+    # Outro worker removeu o flow direto no banco e avisou pelo canal
+    client.portal.call(main.store.delete_flow, flow["id"])
+    main.store.flows_cache.set(flow["id"], flow)
+
+    client.portal.call(main.on_flows_event, {"origin": "worker_outro", "data": {"flow_id": flow["id"]}})
+
+    assert main.store.flows_cache.get(flow["id"]) is None
+    assert client.get(f"/api/flows/{flow['id']}").status_code == 404
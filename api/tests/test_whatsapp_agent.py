@@ -0,0 +1,85 @@
+import asyncio
+import time
+
+import pytest
+
+from agents.whatsapp_agent import WHATSAPP_REPLY_TIMEOUT, WhatsAppAgent
+from llm.deadline import deadline_since, time_remaining
+from llm.errors import LLMError
+
+
+class DeadlineRecordingAgent(WhatsAppAgent):
+    """Agente com LLM falso: registra quanto restava do prazo na geração"""
+
+    def __init__(self):
+        super().__init__(id="wa", name="WhatsApp", type="whatsapp", description="", system_prompt="")
+        self.mailboxes.coalesce_window = 0
+        self.remaining = []
+
+    def _llm_available(self) -> bool:
+        return True
+
+    async def _reply(self, history):
+        self.remaining.append(time_remaining())
+        return "resposta"
+
+
+class FailingAgent(DeadlineRecordingAgent):
+    """Agente cujo LLM sempre falha"""
+
+    async def _reply(self, history):
+        raise LLMError("indisponível")
+
+
+def test_failed_reply_keeps_contact_messages_and_lead():
+    agent = FailingAgent()
+    leads = []
+    agent.lead_sink = leads.append
+
+    with pytest.raises(LLMError):
+        asyncio.run(agent.reply_to_contact("quero contratar, qual o preço do pacote completo?", "5511"))
+
+    assert [m["role"] for m in agent.conversations["5511"]] == ["user"]
+    assert [lead["phone"] for lead in leads] == ["5511"]
+    assert agent.leads.leads["5511"]["qualified"]
+
+
+def test_greeting_script_only_opens_the_conversation():
+    agent = DeadlineRecordingAgent()
+
+    async def scenario():
+        first = await agent.reply_to_contact("oiii, tudo bem?", "5511")
+        await agent.reply_to_contact("qual o prazo de entrega do pedido 42", "5511")
+        again = await agent.reply_to_contact("tudo bem?", "5511")
+        return first, again
+
+    first, again = asyncio.run(scenario())
+
+    assert first == agent.scripts["greeting"]
+    # No meio da conversa a saudação vai para o LLM, com o contexto
+    assert again == "resposta"
+
+
+def test_reply_deadline_counts_from_when_the_message_arrived():
+    agent = DeadlineRecordingAgent()
+
+    async def scenario():
+        # Ficou 15s na fila de entrada antes de chegar ao agente
+        return await agent.reply_to_contact("qual o prazo de entrega do pedido 42", "5511", time.time() - 15)
+
+    assert asyncio.run(scenario()) == "resposta"
+    assert WHATSAPP_REPLY_TIMEOUT - 15 - 1 < agent.remaining[0] <= WHATSAPP_REPLY_TIMEOUT - 15
+
+
+def test_reply_without_arrival_time_gets_the_full_deadline():
+    agent = DeadlineRecordingAgent()
+
+    asyncio.run(agent.reply_to_contact("qual o prazo de entrega do pedido 42", "5511"))
+
+    assert WHATSAPP_REPLY_TIMEOUT - 1 < agent.remaining[0] <= WHATSAPP_REPLY_TIMEOUT
+
+
+@pytest.mark.parametrize("started_ago, expected", [(0, 10), (4, 6), (-5, 10)])
+def test_deadline_since_discounts_elapsed_time(started_ago, expected):
+    with deadline_since(time.time() - started_ago, 10):
+        assert expected - 0.5 < time_remaining() <= expected
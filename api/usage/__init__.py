@@ -0,0 +1,7 @@
+"""
+Usage Module
+"""
+
+from .tracker import UsageTracker, BudgetExceededError, usage_tracker, MODEL_PRICING
+
+__all__ = ["UsageTracker", "BudgetExceededError", "usage_tracker", "MODEL_PRICING"]
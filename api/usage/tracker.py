@@ -0,0 +1,326 @@
+"""
+Usage Tracker
+Contabilidade de tokens e custo por cliente, com orçamento.
+
+O uso é somado em memória a cada chamada e gravado em lote no SQLite
+periodicamente. Orçamentos por cliente (diário e/ou mensal):
+- acima do limite suave (ex: 80%): troca para um modelo mais barato
+- acima do limite: bloqueia (BudgetExceededError) ou só rebaixa,
+  conforme hard_action
+"""
+
+import asyncio
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from metrics.registry import SPEND, BUDGET_ACTIONS
+
+
+# USD por 1M de tokens (entrada, saída)
+MODEL_PRICING = {
+    "gpt-4-turbo": (10.0, 30.0),
+    "gpt-4": (30.0, 60.0),
+    "gpt-4o": (2.5, 10.0),
+    "gpt-4o-mini": (0.15, 0.6),
+    "gpt-3.5-turbo": (0.5, 1.5)
+}
+
+# Tokens de entrada servidos do cache de prompt do provedor pagam esta fração
+CACHED_INPUT_RATE = 0.5
+
+DEFAULT_DOWNGRADE_MODEL = "gpt-4o-mini"
+
+# Uso sem cliente associado (ex: agentes padrão)
+UNASSIGNED = "unassigned"
+
+
+class BudgetExceededError(Exception):
+    """Cliente estourou o orçamento e está bloqueado"""
+
+    def __init__(self, client_id: str, period: str, spent: float, limit: float):
+        self.client_id = client_id
+        self.period = period
+        self.spent = spent
+        self.limit = limit
+        label = {"day": "diário", "month": "mensal"}.get(period, period)
+        super().__init__(
+            f"Orçamento {label} do cliente {client_id} esgotado "
+            f"(US$ {spent:.4f} de US$ {limit:.2f})"
+        )
+
+
+class UsageTracker:
+    """
+    Agrega uso por (dia, cliente, agente, modelo).
+
+    Uso:
+        await usage_tracker.start(store)
+        model = usage_tracker.resolve_model("cliente_1", "gpt-4-turbo")
+        usage_tracker.record_completion("cliente_1", "social", model, 1200, 300)
+    """
+
+    def __init__(self, flush_interval: float = 5.0):
+        self.flush_interval = flush_interval
+        self.store = None
+        self.budgets: Dict[str, dict] = {}
+
+        # (day, client, agent, model) -> [requests, in, out, images, cost]
+        self._pending: Dict[tuple, list] = {}
+        # Gasto conhecido (banco + pendente) no dia e no mês correntes
+        self._spend_day: Dict[str, float] = {}
+        self._spend_month: Dict[str, float] = {}
+        self._current_day = self._today()
+        self._flush_task: Optional[asyncio.Task] = None
+
+    # ============== Ciclo de vida ==============
+
+    async def start(self, store):
+        """Carrega orçamentos e gastos do banco e inicia o flush periódico"""
+        self.store = store
+        self.budgets = await store.list_budgets()
+        await self._refresh_spend()
+        self._flush_task = asyncio.create_task(self._flush_loop())
+
+    async def stop(self):
+        if self._flush_task:
+            self._flush_task.cancel()
+            try:
+                await self._flush_task
+            except asyncio.CancelledError:
+                pass
+            self._flush_task = None
+        await self.flush()
+
+    # ============== Registro ==============
+
+    def estimate_cost(self, model: str, input_tokens: int, output_tokens: int, cached_tokens: int = 0) -> float:
+        """Custo em USD de uma chamada (modelos desconhecidos usam o preço do gpt-4-turbo)"""
+        input_price, output_price = self._pricing(model)
+        # cached_tokens faz parte de input_tokens, com desconto
+        billed_input = input_tokens - cached_tokens * (1 - CACHED_INPUT_RATE)
+        return (billed_input * input_price + output_tokens * output_price) / 1_000_000
+
+    def record_completion(
+        self,
+        client_id: Optional[str],
+        agent_id: str,
+        model: str,
+        input_tokens: int,
+        output_tokens: int,
+        cached_tokens: int = 0
+    ) -> float:
+        """Registra uma chamada de LLM e retorna o custo estimado"""
+        cost = self.estimate_cost(model, input_tokens, output_tokens, cached_tokens)
+        self._add(client_id, agent_id, model, 1, input_tokens, output_tokens, 0, cost)
+        SPEND.inc(cost, client_id=client_id or UNASSIGNED, model=model, kind="llm")
+        return cost
+
+    def record_image(self, client_id: Optional[str], model: str, count: int, unit_price: float) -> float:
+        """Registra imagens geradas e retorna o custo"""
+        cost = count * unit_price
+        self._add(client_id, "image_generator", model, 1, 0, 0, count, cost)
+        SPEND.inc(cost, client_id=client_id or UNASSIGNED, model=model, kind="image")
+        return cost
+
+    def _add(self, client_id, agent_id, model, requests, input_tokens, output_tokens, images, cost):
+        self._roll_day()
+        client = client_id or UNASSIGNED
+        key = (self._current_day, client, agent_id or "", model)
+        entry = self._pending.get(key)
+        if entry is None:
+            entry = [0, 0, 0, 0, 0.0]
+            self._pending[key] = entry
+        entry[0] += requests
+        entry[1] += input_tokens
+        entry[2] += output_tokens
+        entry[3] += images
+        entry[4] += cost
+
+        self._spend_day[client] = self._spend_day.get(client, 0.0) + cost
+        self._spend_month[client] = self._spend_month.get(client, 0.0) + cost
+
+    # ============== Orçamento ==============
+
+    def get_spend(self, client_id: str) -> dict:
+        """Gasto do cliente no dia e no mês"""
+        self._roll_day()
+        return {
+            "day": round(self._spend_day.get(client_id, 0.0), 6),
+            "month": round(self._spend_month.get(client_id, 0.0), 6)
+        }
+
+    def get_budget_status(self, client_id: str) -> dict:
+        """Orçamento, gasto e situação (ok, downgraded, exceeded)"""
+        budget = self.budgets.get(client_id)
+        spend = self.get_spend(client_id)
+        return {
+            "client_id": client_id,
+            "budget": budget,
+            "spend": spend,
+            "status": self._status(client_id, budget, spend)[0] if budget else "ok"
+        }
+
+    def _status(self, client_id: str, budget: dict, spend: dict):
+        """Retorna (status, período, gasto, limite) do pior período"""
+        worst = ("ok", None, 0.0, 0.0)
+        for period, limit_key in (("day", "daily_limit"), ("month", "monthly_limit")):
+            limit = budget.get(limit_key)
+            if not limit:
+                continue
+            spent = spend[period]
+            if spent >= limit:
+                return ("exceeded", period, spent, limit)
+            if spent >= limit * budget.get("soft_limit_ratio", 0.8):
+                worst = ("downgraded", period, spent, limit)
+        return worst
+
+    def resolve_model(self, client_id: Optional[str], model: str) -> str:
+        """
+        Aplica o orçamento antes de uma chamada de LLM.
+        Retorna o modelo a usar ou levanta BudgetExceededError.
+        """
+        budget = self.budgets.get(client_id) if client_id else None
+        if not budget:
+            return model
+
+        status, period, spent, limit = self._status(client_id, budget, self.get_spend(client_id))
+        if status == "ok":
+            return model
+
+        if status == "exceeded" and budget.get("hard_action", "throttle") == "throttle":
+            BUDGET_ACTIONS.inc(client_id=client_id, action="throttle")
+            raise BudgetExceededError(client_id, period, spent, limit)
+
+        downgrade_model = budget.get("downgrade_model", DEFAULT_DOWNGRADE_MODEL)
+        if downgrade_model != model:
+            BUDGET_ACTIONS.inc(client_id=client_id, action="downgrade")
+        return downgrade_model
+
+    def check_image_budget(self, client_id: Optional[str], estimated_cost: float):
+        """Bloqueia geração de imagem se ela passaria do limite"""
+        budget = self.budgets.get(client_id) if client_id else None
+        if not budget:
+            return
+
+        spend = self.get_spend(client_id)
+        for period, limit_key in (("day", "daily_limit"), ("month", "monthly_limit")):
+            limit = budget.get(limit_key)
+            if limit and spend[period] + estimated_cost > limit:
+                BUDGET_ACTIONS.inc(client_id=client_id, action="throttle")
+                raise BudgetExceededError(client_id, period, spend[period], limit)
+
+    async def set_budget(
+        self,
+        client_id: str,
+        daily_limit: Optional[float] = None,
+        monthly_limit: Optional[float] = None,
+        downgrade_model: str = DEFAULT_DOWNGRADE_MODEL,
+        soft_limit_ratio: float = 0.8,
+        hard_action: str = "throttle"
+    ) -> dict:
+        """Define orçamento do cliente (USD)"""
+        budget = {
+            "daily_limit": daily_limit,
+            "monthly_limit": monthly_limit,
+            "downgrade_model": downgrade_model,
+            "soft_limit_ratio": soft_limit_ratio,
+            "hard_action": hard_action
+        }
+        self.budgets[client_id] = budget
+        if self.store:
+            await self.store.save_budget(client_id, budget)
+        return budget
+
+    async def remove_budget(self, client_id: str):
+        self.budgets.pop(client_id, None)
+        if self.store:
+            await self.store.delete_budget(client_id)
+
+    def apply_budget(self, client_id: str, budget: Optional[dict]):
+        """Atualiza orçamento vindo de outro worker (sem gravar)"""
+        if budget:
+            self.budgets[client_id] = budget
+        else:
+            self.budgets.pop(client_id, None)
+
+    # ============== Consulta e flush ==============
+
+    async def get_usage(
+        self,
+        client_id: Optional[str] = None,
+        agent_id: Optional[str] = None,
+        day_from: Optional[str] = None,
+        day_to: Optional[str] = None,
+        group_by: tuple = ("day", "client_id", "agent_id")
+    ) -> List[dict]:
+        """Uso agregado (grava o pendente antes de consultar)"""
+        await self.flush()
+        return await self.store.query_usage(client_id, agent_id, day_from, day_to, group_by)
+
+    async def flush(self):
+        """Grava os incrementos pendentes e recarrega os gastos"""
+        if not self.store or not self._pending:
+            return
+
+        batch = self._pending
+        self._pending = {}
+        rows = [key + tuple(values) for key, values in batch.items()]
+        try:
+            await self.store.add_usage(rows)
+        except Exception:
+            # Devolve ao pendente para a próxima tentativa
+            for key, values in batch.items():
+                entry = self._pending.setdefault(key, [0, 0, 0, 0, 0.0])
+                for i, value in enumerate(values):
+                    entry[i] += value
+            raise
+        await self._refresh_spend()
+
+    async def _refresh_spend(self):
+        """Gasto = total no banco (todos os workers) + pendente local"""
+        self._roll_day()
+        month_start = self._current_day[:8] + "01"
+        spend_day = await self.store.get_spend_since(self._current_day)
+        spend_month = await self.store.get_spend_since(month_start)
+
+        for (day, client, _, _), values in self._pending.items():
+            if day == self._current_day:
+                spend_day[client] = spend_day.get(client, 0.0) + values[4]
+            if day >= month_start:
+                spend_month[client] = spend_month.get(client, 0.0) + values[4]
+
+        self._spend_day = spend_day
+        self._spend_month = spend_month
+
+    async def _flush_loop(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush()
+            except Exception as e:
+                print(f"⚠️ Erro ao gravar uso: {e}")
+
+    def _roll_day(self):
+        today = self._today()
+        if today != self._current_day:
+            if today[:7] != self._current_day[:7]:
+                self._spend_month = {}
+            self._spend_day = {}
+            self._current_day = today
+
+    def _pricing(self, model: str) -> tuple:
+        if model in MODEL_PRICING:
+            return MODEL_PRICING[model]
+        # Versões datadas (ex: gpt-4o-mini-2024-07-18) usam o preço da família
+        for name in sorted(MODEL_PRICING, key=len, reverse=True):
+            if model.startswith(name):
+                return MODEL_PRICING[name]
+        return MODEL_PRICING["gpt-4-turbo"]
+
+    @staticmethod
+    def _today() -> str:
+        return datetime.now().strftime("%Y-%m-%d")
+
+
+# Instância global do processo
+usage_tracker = UsageTracker()
@@ -2,6 +2,7 @@
 WhatsApp Module
 """
 
-from .connection import WhatsAppConnection, WhatsAppManager
+from .connection import WhatsAppConnection
+from .manager import WhatsAppManager
 
 __all__ = ["WhatsAppConnection", "WhatsAppManager"]
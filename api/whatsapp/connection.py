@@ -8,11 +8,69 @@ import asyncio
 import qrcode
 import io
 import base64
-from typing import Optional, Callable, Dict, List
+import time
+import uuid
+from functools import lru_cache
+from typing import Optional, Callable, List
 from datetime import datetime
 import json
 import os
 
+from .message_log import MessageLog
+
+
+# Validade de um QR Code: até lá, novas chamadas reaproveitam o mesmo token
+QR_TTL = 60.0
+
+
+@lru_cache(maxsize=256)
+def render_qr(qr_data: str) -> str:
+    """PNG em data URI do conteúdo (CPU: chamar fora do event loop)"""
+    qr = qrcode.QRCode(
+        version=1,
+        error_correction=qrcode.constants.ERROR_CORRECT_L,
+        box_size=10,
+        border=4,
+    )
+    qr.add_data(qr_data)
+    qr.make(fit=True)
+    
+    img = qr.make_image(fill_color="black", back_color="white")
+    
+    # Converte para base64
+    buffer = io.BytesIO()
+    img.save(buffer, format="PNG")
+    img_str = base64.b64encode(buffer.getvalue()).decode()
+    return f"data:image/png;base64,{img_str}"
+
+
+def _write_atomic(filepath: str, data: str):
+    """Grava num temporário e troca: quem lê nunca vê o arquivo pela metade"""
+    directory = os.path.dirname(filepath)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    tmp_path = f"{filepath}.{os.getpid()}.tmp"
+    with open(tmp_path, "w") as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, filepath)
+
+
+def _read_json(filepath: str) -> Optional[dict]:
+    try:
+        with open(filepath, "r") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def _remove(filepath: str):
+    try:
+        os.remove(filepath)
+    except FileNotFoundError:
+        pass
+
 
 class WhatsAppConnection:
     """
@@ -26,11 +84,26 @@ class WhatsAppConnection:
     Por enquanto, simula a conexão para desenvolvimento do frontend.
     """
     
-    def __init__(self):
+    def __init__(
+        self,
+        instance_id: str = "default",
+        log_dir: Optional[str] = None,
+        session_dir: Optional[str] = None
+    ):
+        self.instance_id = instance_id
         self.is_connected = False
         self.phone_number: Optional[str] = None
         self.qr_code: Optional[str] = None
-        self.messages: List[dict] = []
+        # Token da sessão de pareamento em curso (o QR é renderizado uma vez por token)
+        self.session_token: Optional[str] = None
+        self.session_expires_at = 0.0
+        # Histórico por contato: cauda em memória, o resto em disco
+        base_dir = log_dir or os.getenv("WHATSAPP_LOG_DIR", "whatsapp_log")
+        self.log = MessageLog(os.path.join(base_dir, instance_id))
+        self.session_path = os.path.join(
+            session_dir or os.getenv("WHATSAPP_SESSION_DIR", "whatsapp_sessions"),
+            f"{instance_id}.json"
+        )
         self.on_message_callback: Optional[Callable] = None
         self.session_data: Optional[dict] = None
         
@@ -38,28 +111,18 @@ class WhatsAppConnection:
         """
         Gera QR Code para conexão.
         Em produção, isso viria do whatsapp-web.js ou Baileys.
-        """
-        # Simula dados do QR Code (em produção, vem do WhatsApp)
-        qr_data = f"whatsapp://connect?session={datetime.now().timestamp()}"
         
-        # Gera imagem do QR Code
-        qr = qrcode.QRCode(
-            version=1,
-            error_correction=qrcode.constants.ERROR_CORRECT_L,
-            box_size=10,
-            border=4,
-        )
-        qr.add_data(qr_data)
-        qr.make(fit=True)
-        
-        img = qr.make_image(fill_color="black", back_color="white")
-        
-        # Converte para base64
-        buffer = io.BytesIO()
-        img.save(buffer, format="PNG")
-        img_str = base64.b64encode(buffer.getvalue()).decode()
+        Enquanto o token não expira, devolve o mesmo QR (o frontend pode
+        chamar de novo sem custo); a renderização roda numa thread.
+        """
+        if self.qr_code and time.time() < self.session_expires_at:
+            return self.qr_code
         
-        self.qr_code = f"data:image/png;base64,{img_str}"
+        # Simula dados do QR Code (em produção, vem do WhatsApp)
+        self.session_token = uuid.uuid4().hex
+        self.session_expires_at = time.time() + QR_TTL
+        qr_data = f"whatsapp://connect?session={self.session_token}"
+        self.qr_code = await asyncio.to_thread(render_qr, qr_data)
         
         # Simula espera por scan (em produção, seria evento real)
         asyncio.create_task(self._simulate_connection())
@@ -72,18 +135,35 @@ class WhatsAppConnection:
         # Em produção, isso seria um evento real do WhatsApp
         # Por enquanto, não conecta automaticamente
     
-    async def connect_with_session(self, session_data: dict) -> bool:
-        """Conecta usando sessão salva"""
+    async def connect_with_session(self, session_data: dict, persist: bool = True) -> bool:
+        """Conecta usando a sessão (com `persist`, grava para o próximo reinício)"""
         self.session_data = session_data
         self.is_connected = True
         self.phone_number = session_data.get("phone", "unknown")
+        self.qr_code = None
+        self.session_token = None
+        if persist:
+            await self.save_session()
         return True
     
-    async def disconnect(self):
-        """Desconecta do WhatsApp"""
+    async def restore_session(self) -> bool:
+        """Reconecta com a sessão gravada, se houver"""
+        if not await self.load_session():
+            return False
+        return await self.connect_with_session(self.session_data, persist=False)
+    
+    async def disconnect(self, forget_session: bool = True):
+        """
+        Desconecta do WhatsApp. Sem `forget_session` a sessão gravada
+        continua valendo (a instância só mudou de worker).
+        """
         self.is_connected = False
         self.phone_number = None
         self.session_data = None
+        self.qr_code = None
+        self.session_token = None
+        if forget_session:
+            await asyncio.to_thread(_remove, self.session_path)
     
     async def send_message(self, to: str, content: str) -> dict:
         """
@@ -101,17 +181,21 @@ class WhatsAppConnection:
             "status": "sent"
         }
         
-        self.messages.append(message)
+        self.log.append(to, message)
         
         # Em produção, aqui enviaria via whatsapp-web.js/Baileys
         
         return {"success": True, "message": message}
     
     async def get_messages(self, phone: Optional[str] = None) -> List[dict]:
-        """Retorna mensagens"""
+        """Retorna mensagens recentes (do contato ou de todos)"""
         if phone:
-            return [m for m in self.messages if m.get("to") == phone or m.get("from") == phone]
-        return self.messages
+            return (await self.log.page(phone, limit=self.log.tail_size))["items"]
+        return self.log.recent()
+    
+    async def get_messages_page(self, phone: str, before: Optional[int] = None, limit: int = 50) -> dict:
+        """Página de mensagens do contato anteriores ao cursor `before`"""
+        return await self.log.page(phone, before, limit)
     
     def set_message_handler(self, callback: Callable):
         """Define callback para novas mensagens"""
@@ -127,7 +211,7 @@ class WhatsAppConnection:
             "status": "received"
         }
         
-        self.messages.append(message)
+        self.log.append(from_phone, message)
         
         if self.on_message_callback:
             await self.on_message_callback(message)
@@ -139,48 +223,19 @@ class WhatsAppConnection:
         return {
             "connected": self.is_connected,
             "phone": self.phone_number,
-            "messages_count": len(self.messages)
+            "messages_count": self.log.total
         }
     
-    def save_session(self, filepath: str):
-        """Salva sessão para reconexão"""
+    async def save_session(self, filepath: Optional[str] = None):
+        """Salva sessão para reconexão (escrita atômica, fora do event loop)"""
         if self.session_data:
-            with open(filepath, 'w') as f:
-                json.dump(self.session_data, f)
+            data = json.dumps(self.session_data)
+            await asyncio.to_thread(_write_atomic, filepath or self.session_path, data)
     
-    def load_session(self, filepath: str) -> bool:
+    async def load_session(self, filepath: Optional[str] = None) -> bool:
         """Carrega sessão salva"""
-        if os.path.exists(filepath):
-            with open(filepath, 'r') as f:
-                self.session_data = json.load(f)
-            return True
-        return False
-
-
-class WhatsAppManager:
-    """Gerencia múltiplas conexões WhatsApp"""
-    
-    def __init__(self):
-        self.connections: Dict[str, WhatsAppConnection] = {}
-    
-    def create_connection(self, instance_id: str) -> WhatsAppConnection:
-        """Cria nova instância de conexão"""
-        conn = WhatsAppConnection()
-        self.connections[instance_id] = conn
-        return conn
-    
-    def get_connection(self, instance_id: str) -> Optional[WhatsAppConnection]:
-        """Retorna conexão existente"""
-        return self.connections.get(instance_id)
-    
-    def remove_connection(self, instance_id: str):
-        """Remove conexão"""
-        if instance_id in self.connections:
-            del self.connections[instance_id]
-    
-    def list_connections(self) -> List[dict]:
-        """Lista todas as conexões"""
-        return [
-            {"id": k, **v.get_status()} 
-            for k, v in self.connections.items()
-        ]
+        session_data = await asyncio.to_thread(_read_json, filepath or self.session_path)
+        if session_data is None:
+            return False
+        self.session_data = session_data
+        return True
@@ -0,0 +1,236 @@
+"""
+Inbound Pipeline
+Estágio de entrada das mensagens recebidas de WhatsApp (webhook ou conexão).
+
+- receber só enfileira: quem entrega a mensagem não espera o agente
+- fila limitada: cheia, o webhook responde 503 e o provedor reentrega
+  depois (backpressure em vez de perder mensagem ou estourar memória)
+- ids já vistos numa janela deslizante são ignorados (reentregas)
+- as mensagens aceitas são gravadas em lote como pendentes (com o
+  worker dono) e apagadas depois do handler; no reinício, as pendentes
+  do próprio worker ou de workers que morreram voltam para a fila
+- um pool de consumidores entrega as mensagens ao handler (agentes, fluxos)
+
+A ordem por contato fica com as caixas de entrada do WhatsAppAgent: o
+handler deve entregar a mensagem ao agente antes do primeiro await.
+"""
+
+import asyncio
+import time
+import uuid
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, List, Optional
+
+from metrics.registry import QUEUE_DEPTH, registry
+
+
+INBOUND_MESSAGES = registry.counter(
+    "agencyzen_whatsapp_inbound_total",
+    "Mensagens recebidas por resultado (result=accepted|duplicate|rejected|processed|failed)",
+    ("result",)
+)
+
+INBOUND_LAG = registry.histogram(
+    "agencyzen_whatsapp_inbound_lag_seconds",
+    "Tempo entre receber a mensagem e um consumidor pegá-la",
+    (),
+    buckets=(0.001, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 15.0, 60.0)
+)
+
+
+class IngestionFullError(Exception):
+    """Fila de entrada cheia: o remetente deve reentregar mais tarde"""
+
+    def __init__(self, message: str, retry_after: float = 1.0):
+        self.retry_after = retry_after
+        super().__init__(message)
+
+
+class SlidingWindowDeduper:
+    """Ids vistos nos últimos `window` segundos (no máximo `max_size`)"""
+
+    def __init__(self, window: float = 3600.0, max_size: int = 100000):
+        self.window = window
+        self.max_size = max_size
+        self._seen: "OrderedDict[str, float]" = OrderedDict()
+
+    def seen(self, message_id: str) -> bool:
+        """True se o id já passou; senão registra e retorna False"""
+        now = time.monotonic()
+        self._evict(now)
+        if message_id in self._seen:
+            return True
+        self._seen[message_id] = now
+        return False
+
+    def forget(self, message_id: str):
+        self._seen.pop(message_id, None)
+
+    def _evict(self, now: float):
+        cutoff = now - self.window
+        while self._seen:
+            seen_at = next(iter(self._seen.values()))
+            if seen_at >= cutoff and len(self._seen) < self.max_size:
+                break
+            self._seen.popitem(last=False)
+
+    def __len__(self) -> int:
+        return len(self._seen)
+
+
+class InboundPipeline:
+    """
+    Uso:
+        pipeline = InboundPipeline(handler, store, consumers=32)
+        await pipeline.start()
+        result = await pipeline.submit({"id": "wamid.1", "from": "5511...", "content": "oi"})
+        # "accepted" | "duplicate"  (IngestionFullError se a fila estiver cheia)
+
+    `handler(message)` é chamado por um dos consumidores; se falhar, a
+    mensagem fica pendente no banco e volta no próximo reinício.
+    `owner_alive(owner)` diz se o worker dono de uma pendente ainda roda
+    (sem ele, todas as pendentes são retomadas).
+    """
+
+    def __init__(
+        self,
+        handler: Callable[[dict], Awaitable[None]],
+        store,
+        max_queue: int = 10000,
+        consumers: int = 32,
+        dedup_window: float = 3600.0,
+        persist_batch: int = 500,
+        persist_interval: float = 0.1,
+        owner: str = "",
+        owner_alive: Optional[Callable[[str], bool]] = None
+    ):
+        self.handler = handler
+        self.store = store
+        self.max_queue = max_queue
+        self.consumers = consumers
+        self.persist_batch = persist_batch
+        self.persist_interval = persist_interval
+        self.owner = owner
+        self.owner_alive = owner_alive
+        self.deduper = SlidingWindowDeduper(dedup_window, max_size=max(max_queue * 10, 10000))
+
+        self._queue: Optional[asyncio.Queue] = None
+        self._tasks: List[asyncio.Task] = []
+        # Gravações pendentes: novas mensagens e ids já processados
+        self._to_insert: List[dict] = []
+        self._to_complete: List[str] = []
+        self._persist_event: Optional[asyncio.Event] = None
+        self._busy = 0
+        self.stats: Dict[str, int] = {"accepted": 0, "duplicate": 0, "rejected": 0, "processed": 0, "failed": 0}
+
+    async def start(self):
+        self._queue = asyncio.Queue(self.max_queue)
+        self._persist_event = asyncio.Event()
+        # Pendentes de uma execução anterior (deste worker ou de um que morreu) voltam para a fila
+        recovered = []
+        for owner, message in await self.store.list_pending_inbound(self.max_queue):
+            if owner != self.owner and self.owner_alive and self.owner_alive(owner):
+                continue
+            self.deduper.seen(message["id"])
+            self._queue.put_nowait(message)
+            recovered.append(message["id"])
+        if recovered:
+            await self.store.claim_inbound(recovered, self.owner)
+        self._tasks = [asyncio.create_task(self._consume()) for _ in range(self.consumers)]
+        self._tasks.append(asyncio.create_task(self._persist_loop()))
+        self._update_depth()
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        await self.persist()
+
+    def has_room(self, count: int) -> bool:
+        """Se cabem `count` mensagens agora (lotes do webhook entram inteiros ou nada)"""
+        return self._queue.maxsize - self._queue.qsize() >= count
+
+    async def submit(self, message: dict, wait: bool = False) -> str:
+        """
+        Aceita a mensagem para processamento. Com `wait`, espera vaga na
+        fila (remetentes locais); sem, falha na hora se estiver cheia.
+        """
+        message.setdefault("id", f"in_{uuid.uuid4().hex[:16]}")
+        message.setdefault("received_at", time.time())
+        if self.deduper.seen(message["id"]):
+            self._count("duplicate")
+            return "duplicate"
+
+        if self._queue.full() and not wait:
+            # Sem registrar o id: a reentrega precisa ser aceita
+            self.deduper.forget(message["id"])
+            self._count("rejected")
+            raise IngestionFullError(f"Fila de entrada cheia ({self.max_queue} mensagens)")
+
+        self._to_insert.append(message)
+        if len(self._to_insert) >= self.persist_batch:
+            self._persist_event.set()
+        await self._queue.put(message)
+        self._count("accepted")
+        self._update_depth()
+        return "accepted"
+
+    async def _consume(self):
+        while True:
+            message = await self._queue.get()
+            self._busy += 1
+            self._update_depth()
+            INBOUND_LAG.observe(max(0.0, time.time() - message["received_at"]))
+            try:
+                await self.handler(message)
+                self._to_complete.append(message["id"])
+                self._count("processed")
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                # Fica pendente no banco; reprocessada no reinício
+                self._count("failed")
+                print(f"⚠️ Inbound message {message['id']} failed: {e}")
+            finally:
+                self._busy -= 1
+                self._queue.task_done()
+                self._update_depth()
+
+    async def persist(self):
+        """Grava as novas mensagens e remove as já processadas (em lote)"""
+        inserts, self._to_insert = self._to_insert, []
+        completed, self._to_complete = self._to_complete, []
+        if inserts:
+            await self.store.save_inbound(inserts, self.owner)
+        if completed:
+            await self.store.complete_inbound(completed)
+
+    async def _persist_loop(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._persist_event.wait(), self.persist_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._persist_event.clear()
+            try:
+                await self.persist()
+            except Exception as e:
+                print(f"⚠️ Inbound persist failed: {e}")
+
+    def _count(self, result: str):
+        self.stats[result] += 1
+        INBOUND_MESSAGES.inc(result=result)
+
+    def _update_depth(self):
+        QUEUE_DEPTH.set(self._queue.qsize() if self._queue else 0, queue="whatsapp_inbound")
+
+    def get_stats(self) -> dict:
+        return {
+            **self.stats,
+            "queued": self._queue.qsize() if self._queue else 0,
+            "processing": self._busy,
+            "max_queue": self.max_queue,
+            "consumers": self.consumers,
+            "dedup_window_ids": len(self.deduper)
+        }
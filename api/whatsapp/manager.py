@@ -0,0 +1,491 @@
+"""
+WhatsApp Manager
+Várias instâncias de WhatsApp (um número por cliente da agência)
+distribuídas entre os workers da API por hashing consistente.
+
+- cada worker anuncia que está vivo no canal `whatsapp_members`; o anel é
+  formado pelos workers vistos nos últimos `member_ttl` segundos
+- o dono de uma instância mantém a conexão, o histórico e a fila de envio
+- operações numa instância de outro worker viram RPC pelo barramento de
+  estado (`whatsapp_rpc`); envios só gravam a mensagem e avisam o dono
+- o status de cada instância fica no chave/valor (`whatsapp_status:<id>`)
+- quando o anel muda, quem perdeu a instância a solta antes de o novo
+  dono assumir (o dono atual fica em `whatsapp_owner:<id>`)
+"""
+
+import asyncio
+import time
+import uuid
+from functools import partial
+from typing import Awaitable, Callable, Dict, List, Optional
+
+from metrics.registry import registry
+from .connection import WhatsAppConnection
+from .outbound import (
+    OutboundDispatcher, ConnectionTransport, FakeTransport, apply_receipt, new_batch_id, new_message, BULK
+)
+from .ring import HashRing
+
+
+DEFAULT_INSTANCE = "default"
+
+WHATSAPP_INSTANCES = registry.gauge(
+    "agencyzen_whatsapp_instances",
+    "Instâncias de WhatsApp hospedadas por este worker",
+    ()
+)
+
+WHATSAPP_RPC = registry.counter(
+    "agencyzen_whatsapp_rpc_total",
+    "Chamadas encaminhadas ao worker dono da instância (result=ok|error|timeout)",
+    ("action", "result")
+)
+
+
+class WhatsAppInstanceError(Exception):
+    """Falha numa operação da instância"""
+
+    status_code = 400
+
+
+class InstanceNotFoundError(WhatsAppInstanceError):
+    """Instância não registrada"""
+
+    status_code = 404
+
+
+class InstanceUnavailableError(WhatsAppInstanceError):
+    """Dono da instância fora do ar ou ainda assumindo"""
+
+    status_code = 503
+
+
+class WhatsAppInstance:
+    """Uma instância hospedada neste worker: conexão, histórico e fila de envio"""
+
+    def __init__(self, instance_id: str, store, outbound_settings: dict):
+        self.id = instance_id
+        self.connection = WhatsAppConnection(instance_id)
+        self.outbound = OutboundDispatcher(store, instance_id=instance_id, **outbound_settings)
+        self.started_at = time.time()
+
+    async def start(self, fake_transport: bool = False):
+        # Histórico que ficou no disco (reinício ou outro worker que hospedava a instância)
+        await self.connection.log.open()
+        await self.outbound.start()
+        if fake_transport:
+            # Desenvolvimento/testes: "conectada" com envios para um transporte local
+            await self.connection.connect_with_session({"phone": f"fake_{self.id}"}, persist=False)
+            await self.outbound.attach(FakeTransport())
+        else:
+            # Sessão gravada (deploy, troca de worker): volta sem novo QR
+            await self.connection.restore_session()
+            await self.outbound.attach(ConnectionTransport(self.connection))
+
+    async def stop(self, forget_session: bool = False):
+        await self.outbound.stop()
+        self.outbound.detach()
+        # Por padrão a sessão fica no disco para o próximo dono
+        await self.connection.disconnect(forget_session=forget_session)
+        await self.connection.log.close()
+
+    def get_status(self) -> dict:
+        return {
+            **self.connection.get_status(),
+            "outbound": self.outbound.get_stats(),
+            "started_at": self.started_at
+        }
+
+
+class WhatsAppManager:
+    """
+    Uso:
+        manager = WhatsAppManager(state, store, on_message=inbound.submit)
+        await manager.start()
+        await manager.register("cliente_acme", client_id="acme", agent_id="whatsapp")
+        qr = await manager.call("cliente_acme", "connect")
+        await manager.enqueue("cliente_acme", "5511999999999", "Olá!")
+    """
+
+    def __init__(
+        self,
+        state,
+        store,
+        outbound_settings: Optional[dict] = None,
+        on_message: Optional[Callable[[dict], Awaitable]] = None,
+        heartbeat_interval: float = 2.0,
+        member_ttl: float = 6.0,
+        rpc_timeout: float = 10.0,
+        fake_transport: bool = False
+    ):
+        self.state = state
+        self.store = store
+        self.outbound_settings = outbound_settings or {}
+        self.on_message = on_message
+        self.heartbeat_interval = heartbeat_interval
+        self.member_ttl = member_ttl
+        self.rpc_timeout = rpc_timeout
+        self.fake_transport = fake_transport
+
+        # Registro (todas as instâncias) e as hospedadas aqui
+        self.instances: Dict[str, dict] = {DEFAULT_INSTANCE: {"id": DEFAULT_INSTANCE}}
+        self.local: Dict[str, WhatsAppInstance] = {}
+        # worker -> último heartbeat (monotonic)
+        self.members: Dict[str, float] = {}
+        self.ring = HashRing()
+
+        self._pending_rpc: Dict[str, asyncio.Future] = {}
+        self._rebalance_lock = asyncio.Lock()
+        self._task: Optional[asyncio.Task] = None
+        # Só assume instâncias depois de conhecer os outros workers
+        self._ready = False
+        self._actions = {
+            "connect": self._action_connect,
+            "disconnect": self._action_disconnect,
+            "status": self._action_status,
+            "messages": self._action_messages
+        }
+
+        state.subscribe("whatsapp_members", self._on_member)
+        state.subscribe("whatsapp_instances", self._on_instances)
+        state.subscribe("whatsapp_rpc", self._on_rpc)
+        state.subscribe("whatsapp_rpc_reply", self._on_rpc_reply)
+        state.subscribe("whatsapp_outbound", self._on_outbound)
+
+    @property
+    def worker_id(self) -> str:
+        return self.state.worker_id
+
+    async def start(self):
+        for instance in await self.store.list_whatsapp_instances():
+            self.instances[instance["id"]] = instance
+        self._touch(self.worker_id)
+        await self._heartbeat()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        self._ready = False
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        for instance_id in list(self.local):
+            await self._release(instance_id)
+        # Os outros assumem já, sem esperar o heartbeat expirar
+        await self.state.publish("whatsapp_members", {"worker": self.worker_id, "leaving": True})
+
+    # ============== Membros e anel ==============
+
+    async def _run(self):
+        if self.state.shared:
+            # Escuta os outros workers antes de assumir qualquer instância
+            await asyncio.sleep(self.heartbeat_interval * 1.5)
+        self._ready = True
+        while True:
+            try:
+                self._expire_members()
+                await self.rebalance()
+                await self._publish_status()
+            except Exception as e:
+                print(f"⚠️ WhatsApp manager: {e}")
+            await asyncio.sleep(self.heartbeat_interval)
+            await self._heartbeat()
+
+    async def _heartbeat(self):
+        await self.state.publish("whatsapp_members", {"worker": self.worker_id})
+
+    async def _on_member(self, event: dict):
+        data = event["data"]
+        if data.get("leaving"):
+            if self.members.pop(data["worker"], None) is not None:
+                self.ring.remove(data["worker"])
+                await self.rebalance()
+        else:
+            self._touch(data["worker"])
+
+    def _touch(self, worker: str):
+        self.members[worker] = time.monotonic()
+        self.ring.add(worker)
+
+    def _expire_members(self):
+        cutoff = time.monotonic() - self.member_ttl
+        for worker, seen_at in list(self.members.items()):
+            if worker != self.worker_id and seen_at < cutoff:
+                del self.members[worker]
+                self.ring.remove(worker)
+
+    def owner_of(self, instance_id: str) -> Optional[str]:
+        return self.ring.get(instance_id)
+
+    async def rebalance(self):
+        """Assume as instâncias que passaram a ser deste worker e solta as que saíram"""
+        if not self._ready:
+            return
+        async with self._rebalance_lock:
+            # Em paralelo: depois de um deploy, todas as sessões voltam ao mesmo tempo
+            await asyncio.gather(*(
+                # Instância removida: a sessão gravada vai junto
+                self._release(instance_id, forget_session=instance_id not in self.instances)
+                for instance_id in list(self.local)
+                if instance_id not in self.instances or self.owner_of(instance_id) != self.worker_id
+            ))
+            results = await asyncio.gather(*(
+                self._claim(instance_id) for instance_id in list(self.instances)
+                if self.owner_of(instance_id) == self.worker_id and instance_id not in self.local
+            ), return_exceptions=True)
+            for error in results:
+                if isinstance(error, Exception):
+                    print(f"⚠️ WhatsApp claim failed: {error}")
+            WHATSAPP_INSTANCES.set(len(self.local))
+
+    async def _claim(self, instance_id: str):
+        current = await self.state.get(f"whatsapp_owner:{instance_id}")
+        if current and current != self.worker_id and current in self.members and self.state.worker_alive(current):
+            # Dono anterior ainda não soltou: tenta de novo no próximo heartbeat
+            return
+        instance = WhatsAppInstance(instance_id, self.store, self.outbound_settings)
+        if self.on_message:
+            instance.connection.set_message_handler(partial(self._incoming, instance_id))
+        await instance.start(self.fake_transport)
+        self.local[instance_id] = instance
+        await self.state.set(f"whatsapp_owner:{instance_id}", self.worker_id)
+        await self._publish_status(instance_id)
+
+    async def _release(self, instance_id: str, forget_session: bool = False):
+        instance = self.local.pop(instance_id, None)
+        if not instance:
+            return
+        await instance.stop(forget_session)
+        if await self.state.get(f"whatsapp_owner:{instance_id}") == self.worker_id:
+            await self.state.set(f"whatsapp_owner:{instance_id}", None)
+
+    async def _incoming(self, instance_id: str, message: dict):
+        message["instance_id"] = instance_id
+        await self.on_message(message)
+
+    async def _publish_status(self, instance_id: Optional[str] = None):
+        """Grava o status das instâncias locais no chave/valor"""
+        ids = [instance_id] if instance_id else list(self.local)
+        for local_id in ids:
+            instance = self.local.get(local_id)
+            if instance:
+                await self.state.set(f"whatsapp_status:{local_id}", {
+                    **instance.get_status(),
+                    "worker": self.worker_id,
+                    "updated_at": time.time()
+                })
+
+    # ============== Registro ==============
+
+    async def register(self, instance_id: str, client_id: Optional[str] = None, agent_id: Optional[str] = None) -> dict:
+        instance = {"id": instance_id, "client_id": client_id, "agent_id": agent_id}
+        await self.store.save_whatsapp_instance(instance)
+        await self.state.publish("whatsapp_instances", {"action": "saved", "instance": instance})
+        return instance
+
+    async def unregister(self, instance_id: str):
+        if instance_id == DEFAULT_INSTANCE:
+            raise WhatsAppInstanceError("A instância padrão não pode ser removida")
+        self._require(instance_id)
+        await self.store.delete_whatsapp_instance(instance_id)
+        await self.state.publish("whatsapp_instances", {"action": "deleted", "instance": {"id": instance_id}})
+
+    async def _on_instances(self, event: dict):
+        data = event["data"]
+        if data["action"] == "deleted":
+            self.instances.pop(data["instance"]["id"], None)
+        else:
+            self.instances[data["instance"]["id"]] = data["instance"]
+        await self.rebalance()
+
+    def get_instance(self, instance_id: str) -> dict:
+        return self._require(instance_id)
+
+    def _require(self, instance_id: str) -> dict:
+        instance = self.instances.get(instance_id)
+        if not instance:
+            raise InstanceNotFoundError(f"Instância {instance_id} não encontrada")
+        return instance
+
+    # ============== Operações ==============
+
+    async def call(self, instance_id: str, action: str, **params) -> dict:
+        """Executa a ação no worker dono da instância"""
+        self._require(instance_id)
+        if action not in self._actions:
+            raise WhatsAppInstanceError(f"Ação desconhecida: {action}")
+        if instance_id in self.local:
+            return await self._actions[action](self.local[instance_id], **params)
+
+        owner = self.owner_of(instance_id)
+        if owner is None or owner == self.worker_id:
+            raise InstanceUnavailableError(f"Instância {instance_id} ainda está sendo assumida")
+
+        request_id = uuid.uuid4().hex
+        future = asyncio.get_running_loop().create_future()
+        self._pending_rpc[request_id] = future
+        try:
+            await self.state.publish("whatsapp_rpc", {
+                "id": request_id,
+                "target": owner,
+                "instance_id": instance_id,
+                "action": action,
+                "params": params
+            })
+            reply = await asyncio.wait_for(future, self.rpc_timeout)
+        except asyncio.TimeoutError:
+            WHATSAPP_RPC.inc(action=action, result="timeout")
+            raise InstanceUnavailableError(f"Worker {owner} não respondeu para {instance_id}")
+        finally:
+            self._pending_rpc.pop(request_id, None)
+
+        if "error" in reply:
+            WHATSAPP_RPC.inc(action=action, result="error")
+            error = WhatsAppInstanceError(reply["error"])
+            error.status_code = reply.get("status_code", 500)
+            raise error
+        WHATSAPP_RPC.inc(action=action, result="ok")
+        return reply["result"]
+
+    async def _on_rpc(self, event: dict):
+        data = event["data"]
+        if data["target"] != self.worker_id:
+            return
+        reply = {"id": data["id"], "to": event["origin"]}
+        instance = self.local.get(data["instance_id"])
+        try:
+            if not instance:
+                raise InstanceUnavailableError(f"Instância {data['instance_id']} não está neste worker")
+            reply["result"] = await self._actions[data["action"]](instance, **data["params"])
+        except WhatsAppInstanceError as e:
+            reply.update(error=str(e), status_code=e.status_code)
+        except Exception as e:
+            reply.update(error=str(e), status_code=500)
+        await self.state.publish("whatsapp_rpc_reply", reply)
+
+    async def _on_rpc_reply(self, event: dict):
+        data = event["data"]
+        if data["to"] != self.worker_id:
+            return
+        future = self._pending_rpc.get(data["id"])
+        if future and not future.done():
+            future.set_result(data)
+
+    async def _action_connect(self, instance: WhatsAppInstance) -> dict:
+        if instance.connection.is_connected:
+            return {"status": "connected", "phone": instance.connection.phone_number, "worker": self.worker_id}
+        qr_code = await instance.connection.generate_qr()
+        await self._publish_status(instance.id)
+        return {"qr_code": qr_code, "status": "waiting_scan", "worker": self.worker_id}
+
+    async def _action_disconnect(self, instance: WhatsAppInstance) -> dict:
+        await instance.connection.disconnect()
+        await self._publish_status(instance.id)
+        return {"status": "disconnected"}
+
+    async def _action_status(self, instance: WhatsAppInstance) -> dict:
+        return {**instance.get_status(), "worker": self.worker_id}
+
+    async def _action_messages(self, instance: WhatsAppInstance, phone: str, before: Optional[int] = None, limit: int = 50) -> dict:
+        return await instance.connection.get_messages_page(phone, before, limit)
+
+    async def is_connected(self, instance_id: str) -> bool:
+        """Pelo status local ou pelo último publicado pelo dono"""
+        self._require(instance_id)
+        if instance_id in self.local:
+            return self.local[instance_id].connection.is_connected
+        status = await self.state.get(f"whatsapp_status:{instance_id}") or {}
+        return bool(status.get("connected"))
+
+    # ============== Envio ==============
+
+    async def enqueue(self, instance_id: str, to: str, content: str, client_id: Optional[str] = None) -> dict:
+        """Enfileira o envio pela instância (o dono é avisado se estiver em outro worker)"""
+        self._require(instance_id)
+        instance = self.local.get(instance_id)
+        if instance:
+            return await instance.outbound.enqueue(to, content, client_id=client_id)
+        message = new_message(to, content, instance_id, client_id=client_id)
+        await self.store.save_outbound([message])
+        await self.state.publish("whatsapp_outbound", {"instance_id": instance_id, "message": message})
+        return message
+
+    async def enqueue_bulk(self, instance_id: str, messages: List[dict], client_id: Optional[str] = None) -> dict:
+        self._require(instance_id)
+        instance = self.local.get(instance_id)
+        if instance:
+            return await instance.outbound.enqueue_bulk(messages, client_id=client_id)
+        batch_id = new_batch_id()
+        rows = [
+            new_message(m["to"], m["content"], instance_id, BULK, m.get("client_id", client_id), batch_id)
+            for m in messages
+        ]
+        await self.store.save_outbound(rows)
+        await self.state.publish("whatsapp_outbound", {"instance_id": instance_id, "batch_id": batch_id})
+        return {"batch_id": batch_id, "queued": len(rows)}
+
+    async def _on_outbound(self, event: dict):
+        data = event["data"]
+        instance = self.local.get(data["instance_id"])
+        # Quem publicou já agendou, se fosse o dono
+        if self.state.is_local(event) or not instance:
+            return
+        if data.get("message"):
+            instance.outbound.accept(data["message"])
+        else:
+            await instance.outbound.load_pending(data["batch_id"])
+
+    async def get_outbound(self, message_id: str) -> Optional[dict]:
+        message = await self.store.get_outbound(message_id)
+        instance = self.local.get(message["instance_id"]) if message else None
+        if instance:
+            # A versão em memória pode estar à frente do banco
+            return await instance.outbound.get_message(message_id)
+        return message
+
+    async def get_batch(self, batch_id: str) -> Optional[dict]:
+        for instance in self.local.values():
+            await instance.outbound.flush()
+        counts = await self.store.count_outbound_by_status(batch_id)
+        if not counts:
+            return None
+        return {"batch_id": batch_id, "total": sum(counts.values()), "by_status": counts}
+
+    async def update_status(self, provider_id: str, status: str) -> bool:
+        """Recibo de entrega do provedor"""
+        for instance in self.local.values():
+            await instance.outbound.flush()
+        return await apply_receipt(self.store, provider_id, status)
+
+    # ============== Consulta ==============
+
+    async def list_instances(self) -> List[dict]:
+        items = []
+        for instance_id, config in self.instances.items():
+            status = await self.state.get(f"whatsapp_status:{instance_id}") or {}
+            owner = self.owner_of(instance_id)
+            updated_at = status.get("updated_at", 0)
+            items.append({
+                **config,
+                "owner": owner,
+                "local": instance_id in self.local,
+                "connected": bool(status.get("connected")),
+                # Dono publicou status recentemente (heartbeat)
+                "healthy": status.get("worker") == owner and time.time() - updated_at < self.member_ttl,
+                "status": status
+            })
+        return items
+
+    def get_shards(self) -> dict:
+        assignment: Dict[str, List[str]] = {worker: [] for worker in self.members}
+        for instance_id in self.instances:
+            owner = self.owner_of(instance_id)
+            if owner:
+                assignment.setdefault(owner, []).append(instance_id)
+        now = time.monotonic()
+        return {
+            "worker": self.worker_id,
+            "members": {w: round(now - seen, 2) for w, seen in self.members.items()},
+            "assignment": assignment,
+            "local": list(self.local)
+        }
@@ -0,0 +1,352 @@
+"""
+Message Log
+Histórico de mensagens de uma conexão de WhatsApp, indexado por telefone.
+
+- as últimas `tail_size` mensagens de cada contato ficam em memória
+- as mais antigas vão para segmentos JSONL em disco (append-only); em
+  memória fica só (seq, segmento, offset) de cada uma
+- segmentos além de `max_segments` são apagados (retenção)
+- paginação por cursor: `before` é o seq da mensagem mais antiga já vista
+- `open()` reconstrói o índice dos segmentos já gravados (reinício, troca
+  de worker) e `close()` grava as caudas: o histórico continua no disco
+- disco fora do event loop: `append` só mexe na memória; a gravação é
+  write-behind (em lote, numa thread) e as leituras de `page` também
+  rodam numa thread
+
+Abrir uma conversa custa o mesmo com 10 ou 10 milhões de mensagens no log.
+"""
+
+import asyncio
+import json
+import os
+from array import array
+from bisect import bisect_left
+from collections import deque
+from typing import Deque, Dict, List, Optional, Tuple
+
+
+class _SpillIndex:
+    """Posições em disco das mensagens antigas de um contato (em ordem de seq)"""
+
+    __slots__ = ("seqs", "segments", "offsets")
+
+    def __init__(self):
+        self.seqs = array("q")
+        self.segments = array("q")
+        self.offsets = array("q")
+
+    def append(self, seq: int, segment: int, offset: int):
+        self.seqs.append(seq)
+        self.segments.append(segment)
+        self.offsets.append(offset)
+
+    def drop_before_segment(self, segment: int):
+        """Esquece o que estava em segmentos já apagados"""
+        cut = bisect_left(self.segments, segment)
+        if cut:
+            del self.seqs[:cut]
+            del self.segments[:cut]
+            del self.offsets[:cut]
+
+    def __len__(self) -> int:
+        return len(self.seqs)
+
+
+class MessageLog:
+    """
+    Uso:
+        log = MessageLog("whatsapp_log/default")
+        await log.open()
+        log.append("5511999999999", {"from": "5511999999999", "content": "oi"})
+        page = await log.page("5511999999999", limit=50)
+        older = await log.page("5511999999999", before=page["next_cursor"])
+        await log.close()
+    """
+
+    def __init__(
+        self,
+        directory: Optional[str] = None,
+        tail_size: int = 200,
+        segment_size: int = 10000,
+        max_segments: int = 100,
+        flush_interval: float = 0.5,
+        flush_batch_size: int = 1000
+    ):
+        # Sem diretório, o que sai da memória é descartado
+        self.directory = directory
+        self.tail_size = tail_size
+        self.segment_size = segment_size
+        self.max_segments = max_segments
+        self.flush_interval = flush_interval
+        self.flush_batch_size = flush_batch_size
+
+        self.total = 0
+        self._seq = 0
+        self._tails: Dict[str, Deque[dict]] = {}
+        self._spilled: Dict[str, _SpillIndex] = {}
+        # Últimas mensagens de todos os contatos (visão geral)
+        self._recent: Deque[dict] = deque(maxlen=tail_size)
+
+        # Saíram da cauda e ainda não foram gravadas: (telefone, mensagem)
+        self._to_write: List[Tuple[str, dict]] = []
+        self._flush_event: Optional[asyncio.Event] = None
+        self._flush_task: Optional[asyncio.Task] = None
+        # Gravação, retenção e leitura de segmentos, uma de cada vez
+        self._io_lock = asyncio.Lock()
+
+        # Só a thread de gravação mexe nestes
+        self._segment = 0
+        self._segment_count = 0
+        self._first_segment = 0
+        self._file = None
+
+    async def open(self):
+        """Indexa os segmentos deixados por uma execução anterior (nada é apagado) e inicia a gravação"""
+        if self.directory:
+            entries, segments = await asyncio.to_thread(self._scan)
+            for phone, seq, segment, offset in entries:
+                self._index_spilled(phone, seq, segment, offset)
+                self._seq = max(self._seq, seq)
+            self.total += len(entries)
+            if segments:
+                self._first_segment = segments[0]
+                # O próximo lote abre um segmento novo: os antigos não recebem mais nada
+                self._segment = segments[-1]
+        self._flush_event = asyncio.Event()
+        self._flush_task = asyncio.create_task(self._flush_loop())
+
+    async def close(self):
+        """Grava as caudas em memória (o próximo `open()` as encontra) e fecha o segmento"""
+        if self._flush_task:
+            self._flush_task.cancel()
+            try:
+                await self._flush_task
+            except asyncio.CancelledError:
+                pass
+            self._flush_task = None
+        if self.directory:
+            tails = sorted(
+                ((phone, message) for phone, tail in self._tails.items() for message in tail),
+                key=lambda entry: entry[1]["seq"]
+            )
+            self._to_write.extend(tails)
+            self._tails.clear()
+            await self.flush()
+        if self._file:
+            await asyncio.to_thread(self._file.close)
+            self._file = None
+
+    def append(self, phone: str, message: dict) -> dict:
+        """Registra a mensagem no histórico do contato (sem I/O)"""
+        self._seq += 1
+        message["seq"] = self._seq
+        tail = self._tails.get(phone)
+        if tail is None:
+            tail = self._tails[phone] = deque()
+        tail.append(message)
+        if len(tail) > self.tail_size:
+            self._spill(phone, tail.popleft())
+        self._recent.append(message)
+        self.total += 1
+        return message
+
+    async def page(self, phone: str, before: Optional[int] = None, limit: int = 50) -> dict:
+        """
+        Até `limit` mensagens do contato anteriores ao cursor, em ordem
+        cronológica. `next_cursor` é None quando não há mais nada.
+        """
+        limit = max(1, limit)
+        tail = list(self._tails.get(phone) or ())
+
+        items: List[dict] = []
+        # Mensagens recentes: do fim da cauda para trás
+        for message in reversed(tail):
+            if before is not None and message["seq"] >= before:
+                continue
+            items.append(message)
+            if len(items) == limit:
+                break
+
+        if len(items) < limit and (phone in self._spilled or self._to_write):
+            # Tudo o que está em disco (ou a caminho) é mais antigo que a cauda
+            if before is None and tail:
+                before = tail[0]["seq"]
+            items.extend(reversed(await self._read_before(phone, before, limit - len(items))))
+
+        items.reverse()
+        oldest = items[0]["seq"] if items else None
+        has_more = oldest is not None and self._has_before(phone, oldest)
+        return {"items": items, "next_cursor": oldest if has_more else None}
+
+    def recent(self, limit: Optional[int] = None) -> List[dict]:
+        """Últimas mensagens de todos os contatos"""
+        items = list(self._recent)
+        return items[-limit:] if limit else items
+
+    def count(self, phone: str) -> int:
+        spill = self._spilled.get(phone)
+        pending = sum(1 for p, _ in self._to_write if p == phone)
+        return len(self._tails.get(phone) or ()) + (len(spill) if spill else 0) + pending
+
+    def phones(self) -> List[str]:
+        return list(self._tails)
+
+    def _has_before(self, phone: str, seq: int) -> bool:
+        tail = self._tails.get(phone)
+        if tail and tail[0]["seq"] < seq:
+            return True
+        if any(p == phone and m["seq"] < seq for p, m in self._to_write):
+            return True
+        spill = self._spilled.get(phone)
+        return bool(spill) and spill.seqs[0] < seq
+
+    # ============== Disco ==============
+
+    def _spill(self, phone: str, message: dict):
+        if not self.directory:
+            return
+        self._to_write.append((phone, message))
+        if self._flush_event and len(self._to_write) >= self.flush_batch_size:
+            self._flush_event.set()
+
+    async def flush(self):
+        """Grava em lote o que saiu das caudas (numa thread) e indexa"""
+        async with self._io_lock:
+            if not self._to_write:
+                return
+            batch, self._to_write = self._to_write, []
+            previous_first = self._first_segment
+            try:
+                written, first = await asyncio.to_thread(self._write_batch, batch)
+            except Exception:
+                # Devolve o lote para a próxima tentativa
+                self._to_write = batch + self._to_write
+                raise
+            for phone, seq, segment, offset in written:
+                self._index_spilled(phone, seq, segment, offset)
+            if first != previous_first:
+                # A retenção apagou segmentos: esquece o que estava neles
+                for phone in list(self._spilled):
+                    spill = self._spilled[phone]
+                    spill.drop_before_segment(first)
+                    if not spill:
+                        del self._spilled[phone]
+
+    async def _flush_loop(self):
+        """Task de write-behind: grava por intervalo ou quando o lote enche"""
+        while True:
+            try:
+                await asyncio.wait_for(self._flush_event.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._flush_event.clear()
+            try:
+                await self.flush()
+            except Exception as e:
+                print(f"⚠️ Erro ao gravar histórico do WhatsApp: {e}")
+
+    async def _read_before(self, phone: str, before: Optional[int], count: int) -> List[dict]:
+        """Até `count` mensagens em disco do contato anteriores a `before`, em ordem"""
+        # Garante que o que está a caminho do disco já esteja no índice
+        await self.flush()
+        async with self._io_lock:
+            spill = self._spilled.get(phone)
+            if not spill:
+                return []
+            end = len(spill) if before is None else bisect_left(spill.seqs, before)
+            start = max(0, end - count)
+            positions = list(zip(spill.segments[start:end], spill.offsets[start:end]))
+            return await asyncio.to_thread(self._read, positions)
+
+    def _index_spilled(self, phone: str, seq: int, segment: int, offset: int):
+        spill = self._spilled.get(phone)
+        if spill is None:
+            spill = self._spilled[phone] = _SpillIndex()
+        spill.append(seq, segment, offset)
+
+    @staticmethod
+    def _decode(line: bytes):
+        """(telefone, mensagem) de uma linha de segmento"""
+        record = json.loads(line)
+        if "message" in record and "phone" in record:
+            return record["phone"], record["message"]
+        # Formato antigo: só a mensagem
+        return record.get("from") or record.get("to") or "", record
+
+    # As funções abaixo rodam numa thread (asyncio.to_thread)
+
+    def _scan(self) -> Tuple[List[tuple], List[int]]:
+        """(telefone, seq, segmento, offset) de cada mensagem gravada e os segmentos existentes"""
+        if not os.path.isdir(self.directory):
+            return [], []
+        prefix, suffix = "segment_", ".jsonl"
+        segments = sorted(
+            int(name[len(prefix):-len(suffix)]) for name in os.listdir(self.directory)
+            if name.startswith(prefix) and name.endswith(suffix) and name[len(prefix):-len(suffix)].isdigit()
+        )
+        entries = []
+        for segment in segments:
+            with open(self._segment_path(segment), "rb") as handle:
+                offset = 0
+                for line in handle:
+                    # Linha pela metade (queda no meio da gravação) fica de fora
+                    if line.endswith(b"\n"):
+                        phone, message = self._decode(line)
+                        entries.append((phone, message["seq"], segment, offset))
+                    offset += len(line)
+        return entries, segments
+
+    def _write_batch(self, batch: List[Tuple[str, dict]]) -> Tuple[List[tuple], int]:
+        """Grava o lote; retorna as posições gravadas e o primeiro segmento que ficou"""
+        written = []
+        for phone, message in batch:
+            if self._file is None or self._segment_count >= self.segment_size:
+                self._rotate()
+            offset = self._file.tell()
+            self._file.write(json.dumps({"phone": phone, "message": message}, ensure_ascii=False).encode() + b"\n")
+            self._segment_count += 1
+            written.append((phone, message["seq"], self._segment, offset))
+        if self._file:
+            self._file.flush()
+        return written, self._first_segment
+
+    def _rotate(self):
+        """Fecha o segmento atual, abre o próximo e aplica a retenção"""
+        if self._file:
+            self._file.close()
+        else:
+            os.makedirs(self.directory, exist_ok=True)
+        self._segment += 1
+        self._segment_count = 0
+        self._file = open(self._segment_path(self._segment), "ab")
+
+        if self._segment - self._first_segment >= self.max_segments:
+            first = self._segment - self.max_segments + 1
+            for segment in range(max(self._first_segment, 1), first):
+                try:
+                    os.remove(self._segment_path(segment))
+                except FileNotFoundError:
+                    pass
+            self._first_segment = first
+
+    def _read(self, positions: List[Tuple[int, int]]) -> List[dict]:
+        """Lê as mensagens nas posições (segmento, offset), agrupando por segmento"""
+        messages = []
+        handle = None
+        current = None
+        try:
+            for segment, offset in positions:
+                if segment != current:
+                    if handle:
+                        handle.close()
+                    handle = open(self._segment_path(segment), "rb")
+                    current = segment
+                handle.seek(offset)
+                messages.append(self._decode(handle.readline())[1])
+        finally:
+            if handle:
+                handle.close()
+        return messages
+
+    def _segment_path(self, segment: int) -> str:
+        return os.path.join(self.directory, f"segment_{segment:06d}.jsonl")
@@ -0,0 +1,432 @@
+"""
+Outbound Dispatcher
+Fila persistente de envio de mensagens de WhatsApp.
+
+- enfileirar é barato: a mensagem vai para o banco (em lote, no caso de
+  campanhas) e o envio acontece em segundo plano
+- ritmo global (mensagens por minuto, espaçadas) e intervalo mínimo por
+  destinatário, para não estourar os limites da conta
+- mensagens de atendimento passam na frente das de campanha
+- falhas transitórias são repetidas com backoff exponencial + jitter
+- cada mensagem tem status: queued, sending, sent, delivered, read, failed
+
+O envio em si fica num transporte (conexão real ou FakeTransport nos testes).
+"""
+
+import asyncio
+import heapq
+import itertools
+import random
+import time
+import uuid
+from typing import Dict, List, Optional
+
+from metrics.registry import QUEUE_DEPTH, registry
+
+
+OUTBOUND_MESSAGES = registry.counter(
+    "agencyzen_whatsapp_outbound_total",
+    "Mensagens de WhatsApp enviadas por resultado (status=sent|retry|failed)",
+    ("status",)
+)
+
+OUTBOUND_LATENCY = registry.histogram(
+    "agencyzen_whatsapp_outbound_queue_seconds",
+    "Tempo entre enfileirar e enviar a mensagem",
+    ("priority",),
+    buckets=(0.1, 0.5, 1.0, 5.0, 15.0, 60.0, 300.0, 900.0, 3600.0)
+)
+
+# Prioridades (menor passa na frente)
+INTERACTIVE = 0
+BULK = 1
+
+PRIORITY_NAMES = {INTERACTIVE: "interactive", BULK: "bulk"}
+
+# Ordem dos status: recibos atrasados não fazem a mensagem "voltar"
+STATUS_ORDER = {"queued": 0, "sending": 1, "sent": 2, "delivered": 3, "read": 4, "failed": 5}
+
+
+def new_message(
+    to: str,
+    content: str,
+    instance_id: str = "default",
+    priority: int = INTERACTIVE,
+    client_id: Optional[str] = None,
+    batch_id: Optional[str] = None
+) -> dict:
+    """Mensagem de saída pronta para gravar (qualquer worker pode criar)"""
+    now = time.time()
+    return {
+        "id": f"out_{uuid.uuid4().hex[:16]}",
+        "instance_id": instance_id,
+        "to": to,
+        "content": content,
+        "priority": priority,
+        "client_id": client_id,
+        "batch_id": batch_id,
+        "status": "queued",
+        "attempts": 0,
+        "next_attempt_at": now,
+        "provider_id": None,
+        "error": None,
+        "created_at": now,
+        "updated_at": now
+    }
+
+
+def new_batch_id() -> str:
+    return f"batch_{uuid.uuid4().hex[:12]}"
+
+
+async def apply_receipt(store, provider_id: str, status: str) -> bool:
+    """Grava o recibo do provedor (delivered, read, failed); ignora regressões"""
+    message = await store.get_outbound_by_provider_id(provider_id)
+    if not message or STATUS_ORDER.get(status, -1) <= STATUS_ORDER.get(message["status"], -1):
+        return False
+    message["status"] = status
+    message["updated_at"] = time.time()
+    await store.save_outbound([message])
+    return True
+
+
+class OutboundError(Exception):
+    """Falha de envio; `retryable` diz se vale tentar de novo"""
+
+    def __init__(self, message: str, retryable: bool = True):
+        self.retryable = retryable
+        super().__init__(message)
+
+
+class ConnectionTransport:
+    """Envia pela WhatsAppConnection do processo"""
+
+    def __init__(self, connection):
+        self.connection = connection
+
+    async def send(self, to: str, content: str) -> str:
+        result = await self.connection.send_message(to, content)
+        if not result.get("success"):
+            # Desconectado: a mensagem espera a reconexão
+            raise OutboundError(result.get("error", "Falha no envio"), retryable=True)
+        return result["message"]["id"]
+
+
+class FakeTransport:
+    """
+    Transporte local para testes e desenvolvimento.
+
+    Uso:
+        transport = FakeTransport(latency=0.05, failure_rate=0.1)
+        dispatcher.attach(transport)
+        ...
+        transport.sent  # [(to, content, provider_id), ...]
+    """
+
+    def __init__(self, latency: float = 0.0, failure_rate: float = 0.0, seed: Optional[int] = None):
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.sent: List[tuple] = []
+        self._random = random.Random(seed)
+
+    async def send(self, to: str, content: str) -> str:
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        if self._random.random() < self.failure_rate:
+            raise OutboundError("Falha simulada", retryable=True)
+        provider_id = f"fake_{uuid.uuid4().hex[:12]}"
+        self.sent.append((to, content, provider_id))
+        return provider_id
+
+
+class OutboundDispatcher:
+    """
+    Uso:
+        outbound = OutboundDispatcher(store, instance_id="cliente_1", messages_per_minute=600)
+        await outbound.start()
+        outbound.attach(ConnectionTransport(connection))  # só no worker com a conexão
+        message = await outbound.enqueue("5511999999999", "Olá!")
+        batch = await outbound.enqueue_bulk([{"to": ..., "content": ...}, ...])
+
+    Cada instância (número) tem o seu dispatcher, no worker dono da
+    conexão. Sem transporte, as mensagens só são gravadas; quem tem a
+    conexão as carrega com `load_pending()`.
+    """
+
+    def __init__(
+        self,
+        store,
+        instance_id: str = "default",
+        messages_per_minute: float = 600.0,
+        per_contact_interval: float = 1.0,
+        max_attempts: int = 5,
+        base_backoff: float = 1.0,
+        max_backoff: float = 300.0,
+        flush_interval: float = 0.5
+    ):
+        self.store = store
+        self.instance_id = instance_id
+        self.messages_per_minute = messages_per_minute
+        self.per_contact_interval = per_contact_interval
+        self.max_attempts = max_attempts
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+        self.flush_interval = flush_interval
+        self.transport = None
+
+        # Um heap por prioridade: (próxima tentativa, seq, id)
+        self._queues: Dict[int, list] = {INTERACTIVE: [], BULK: []}
+        self._messages: Dict[str, dict] = {}
+        self._seq = itertools.count()
+        self._next_send_at = 0.0
+        self._last_sent: Dict[str, float] = {}
+        # Mudanças de status ainda não gravadas (gravadas em lote)
+        self._dirty: Dict[str, dict] = {}
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self._flush_task: Optional[asyncio.Task] = None
+        self.stats = {"sent": 0, "failed": 0, "retries": 0}
+
+    async def start(self):
+        self._wakeup = asyncio.Event()
+        self._task = asyncio.create_task(self._run())
+        self._flush_task = asyncio.create_task(self._flush_loop())
+
+    async def stop(self):
+        for task in (self._task, self._flush_task):
+            if task:
+                task.cancel()
+        await asyncio.gather(*(t for t in (self._task, self._flush_task) if t), return_exceptions=True)
+        self._task = self._flush_task = None
+        await self.flush()
+
+    async def attach(self, transport):
+        """Passa a enviar por este transporte e carrega o que ficou pendente no banco"""
+        self.transport = transport
+        await self.load_pending()
+
+    def detach(self):
+        """Para de enviar; o que estava na fila continua no banco"""
+        self.transport = None
+        self._messages.clear()
+        for queue in self._queues.values():
+            queue.clear()
+        self._update_depth()
+
+    # ============== Enfileiramento ==============
+
+    async def enqueue(
+        self,
+        to: str,
+        content: str,
+        priority: int = INTERACTIVE,
+        client_id: Optional[str] = None,
+        batch_id: Optional[str] = None
+    ) -> dict:
+        """Grava a mensagem e agenda o envio"""
+        message = new_message(to, content, self.instance_id, priority, client_id, batch_id)
+        await self.store.save_outbound([message])
+        self._schedule(message)
+        return message
+
+    async def enqueue_bulk(
+        self,
+        messages: List[dict],
+        client_id: Optional[str] = None,
+        priority: int = BULK
+    ) -> dict:
+        """Enfileira uma campanha inteira com uma única gravação"""
+        batch_id = new_batch_id()
+        rows = [
+            new_message(m["to"], m["content"], self.instance_id, priority, m.get("client_id", client_id), batch_id)
+            for m in messages
+        ]
+        await self.store.save_outbound(rows)
+        for message in rows:
+            self._schedule(message)
+        return {"batch_id": batch_id, "queued": len(rows)}
+
+    async def load_pending(self, batch_id: Optional[str] = None) -> int:
+        """Agenda as mensagens pendentes do banco (reinício, envio vindo de outro worker)"""
+        if not self.transport:
+            return 0
+        loaded = 0
+        for message in await self.store.list_pending_outbound(self.instance_id, batch_id):
+            if message["id"] in self._messages:
+                continue
+            # "sending" no banco = processo caiu no meio do envio; tenta de novo
+            message["status"] = "queued"
+            self._schedule(message)
+            loaded += 1
+        return loaded
+
+    def accept(self, message: dict):
+        """Agenda uma mensagem já gravada por outro worker"""
+        if message["id"] not in self._messages:
+            self._schedule(message)
+
+    def _schedule(self, message: dict):
+        if not self.transport:
+            return
+        self._messages[message["id"]] = message
+        heapq.heappush(
+            self._queues[message["priority"]],
+            (message["next_attempt_at"], next(self._seq), message["id"])
+        )
+        self._update_depth()
+        if self._wakeup:
+            self._wakeup.set()
+
+    # ============== Envio ==============
+
+    async def _run(self):
+        while True:
+            message, wait = self._next_due()
+            if message is None:
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), wait)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            # Ritmo global: mensagens espaçadas, sem rajadas
+            now = time.time()
+            if self._next_send_at > now:
+                await asyncio.sleep(self._next_send_at - now)
+            self._next_send_at = max(now, self._next_send_at) + 60.0 / self.messages_per_minute
+            await self._send(message)
+
+    def _next_due(self):
+        """Próxima mensagem pronta (prioridade primeiro) ou quanto esperar por ela"""
+        now = time.time()
+        wait = 60.0
+        for priority in sorted(self._queues):
+            queue = self._queues[priority]
+            while queue:
+                due_at, _, message_id = queue[0]
+                message = self._messages.get(message_id)
+                if message is None or message["status"] != "queued":
+                    heapq.heappop(queue)
+                    continue
+                if due_at > now:
+                    wait = min(wait, due_at - now)
+                    break
+
+                # Mesmo destinatário há pouco tempo: adia sem contar tentativa
+                contact_ready = self._last_sent.get(message["to"], 0.0) + self.per_contact_interval
+                heapq.heappop(queue)
+                if contact_ready > now:
+                    heapq.heappush(queue, (contact_ready, next(self._seq), message_id))
+                    continue
+                return message, 0.0
+        return None, wait
+
+    async def _send(self, message: dict):
+        transport = self.transport
+        if not transport:
+            return
+        self._set_status(message, "sending")
+        message["attempts"] += 1
+        self._last_sent[message["to"]] = time.time()
+        try:
+            provider_id = await transport.send(message["to"], message["content"])
+        except asyncio.CancelledError:
+            self._set_status(message, "queued")
+            raise
+        except Exception as e:
+            retryable = e.retryable if isinstance(e, OutboundError) else True
+            message["error"] = str(e)
+            if retryable and message["attempts"] < self.max_attempts:
+                message["next_attempt_at"] = time.time() + self._backoff(message["attempts"])
+                self._set_status(message, "queued")
+                heapq.heappush(
+                    self._queues[message["priority"]],
+                    (message["next_attempt_at"], next(self._seq), message["id"])
+                )
+                self.stats["retries"] += 1
+                OUTBOUND_MESSAGES.inc(status="retry")
+            else:
+                self._set_status(message, "failed")
+                self._forget(message)
+                self.stats["failed"] += 1
+                OUTBOUND_MESSAGES.inc(status="failed")
+            return
+
+        message["provider_id"] = provider_id
+        message["error"] = None
+        self._set_status(message, "sent")
+        self._forget(message)
+        self.stats["sent"] += 1
+        OUTBOUND_MESSAGES.inc(status="sent")
+        OUTBOUND_LATENCY.observe(
+            time.time() - message["created_at"],
+            priority=PRIORITY_NAMES.get(message["priority"], str(message["priority"]))
+        )
+
+    def _backoff(self, attempt: int) -> float:
+        """Backoff exponencial com jitter total"""
+        return random.uniform(0, min(self.max_backoff, self.base_backoff * 2 ** attempt))
+
+    def _forget(self, message: dict):
+        self._messages.pop(message["id"], None)
+        self._update_depth()
+        # Evita crescer sem limite com milhares de destinatários
+        if len(self._last_sent) > 10000:
+            cutoff = time.time() - self.per_contact_interval
+            self._last_sent = {k: v for k, v in self._last_sent.items() if v > cutoff}
+
+    # ============== Status ==============
+
+    def _set_status(self, message: dict, status: str):
+        message["status"] = status
+        message["updated_at"] = time.time()
+        self._dirty[message["id"]] = message
+
+    async def update_status(self, provider_id: str, status: str) -> bool:
+        """Recibo do provedor (delivered, read, failed); ignora regressões"""
+        await self.flush()
+        return await apply_receipt(self.store, provider_id, status)
+
+    async def flush(self):
+        """Grava as mudanças de status pendentes"""
+        if not self._dirty:
+            return
+        batch = list(self._dirty.values())
+        self._dirty = {}
+        await self.store.save_outbound(batch)
+
+    async def _flush_loop(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush()
+            except Exception as e:
+                print(f"⚠️ Outbound flush failed: {e}")
+
+    # ============== Consulta ==============
+
+    async def get_message(self, message_id: str) -> Optional[dict]:
+        # A versão em memória pode estar à frente do banco
+        return self._messages.get(message_id) or self._dirty.get(message_id) or await self.store.get_outbound(message_id)
+
+    async def get_batch(self, batch_id: str) -> Optional[dict]:
+        await self.flush()
+        counts = await self.store.count_outbound_by_status(batch_id)
+        if not counts:
+            return None
+        return {"batch_id": batch_id, "total": sum(counts.values()), "by_status": counts}
+
+    def _update_depth(self):
+        for priority, queue in self._queues.items():
+            QUEUE_DEPTH.set(len(queue), queue=f"whatsapp_outbound_{PRIORITY_NAMES[priority]}")
+
+    def get_stats(self) -> dict:
+        return {
+            **self.stats,
+            "attached": self.transport is not None,
+            "pending": len(self._messages),
+            "queued": {PRIORITY_NAMES[p]: len(q) for p, q in self._queues.items()},
+            "messages_per_minute": self.messages_per_minute,
+            "per_contact_interval": self.per_contact_interval
+        }
@@ -0,0 +1,58 @@
+"""
+Hash Ring
+Hashing consistente para distribuir instâncias de WhatsApp entre workers.
+
+Cada worker ocupa `replicas` pontos no anel; uma instância pertence ao
+primeiro ponto depois do hash do seu id. Quando um worker entra ou sai,
+só as instâncias vizinhas dos seus pontos mudam de dono.
+"""
+
+import hashlib
+from bisect import bisect
+from typing import Dict, Iterable, List, Optional
+
+
+def _hash(key: str) -> int:
+    return int.from_bytes(hashlib.md5(key.encode()).digest()[:8], "big")
+
+
+class HashRing:
+    """
+    Uso:
+        ring = HashRing(["worker_1", "worker_2"])
+        ring.get("cliente_acme")  # -> "worker_2"
+    """
+
+    def __init__(self, nodes: Iterable[str] = (), replicas: int = 100):
+        self.replicas = replicas
+        self._points: List[int] = []
+        self._owners: Dict[int, str] = {}
+        self.nodes: set = set()
+        for node in nodes:
+            self.add(node)
+
+    def add(self, node: str):
+        if node in self.nodes:
+            return
+        self.nodes.add(node)
+        for i in range(self.replicas):
+            point = _hash(f"{node}#{i}")
+            self._owners[point] = node
+        self._points = sorted(self._owners)
+
+    def remove(self, node: str):
+        if node not in self.nodes:
+            return
+        self.nodes.discard(node)
+        self._owners = {p: n for p, n in self._owners.items() if n != node}
+        self._points = sorted(self._owners)
+
+    def get(self, key: str) -> Optional[str]:
+        """Worker dono da chave (None se o anel estiver vazio)"""
+        if not self._points:
+            return None
+        index = bisect(self._points, _hash(key)) % len(self._points)
+        return self._owners[self._points[index]]
+
+    def __len__(self) -> int:
+        return len(self.nodes)